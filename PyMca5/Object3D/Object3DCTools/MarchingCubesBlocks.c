@@ -0,0 +1,477 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2015 V.A. Sole, European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+/*
+   Brick-wise marching cubes and point thresholding on a regular grid.
+
+   The grid is given by its x, y and z coordinates and the values are stored
+   as values[i * ySize * zSize + j * zSize + k]. Nothing is drawn here: the
+   triangles and points are written into arrays allocated once by the caller
+   after a counting pass, so very large volumes can be processed without
+   growing buffers. Bricks whose min/max do not bracket the isosurface value
+   are skipped and bricks are shared among OpenMP threads if available.
+   Cubes with a NaN corner are skipped, leaving a hole in the isosurface
+   instead of vertices at undefined positions. No global state is used.
+*/
+#include <stdlib.h>
+#include <math.h>
+
+#ifdef _OPENMP
+#define PRAGMA_OMP(ompString) _Pragma(ompString)
+#else
+#define PRAGMA_OMP(ompString)
+#endif
+
+/* the tables are defined in MarchingCubes.c */
+extern int aiCubeEdgeFlags[256];
+extern int a2iTriangleConnectionTable[256][16];
+
+/* offsets of the 8 corners of a cube */
+static const int cornerOffset[8][3] =
+{
+	{0, 0, 0},{1, 0, 0},{1, 1, 0},{0, 1, 0},
+	{0, 0, 1},{1, 0, 1},{1, 1, 1},{0, 1, 1}
+};
+
+/* corners at the ends of each of the 12 edges */
+static const int edgeConnection[12][2] =
+{
+	{0,1}, {1,2}, {2,3}, {3,0},
+	{4,5}, {5,6}, {6,7}, {7,4},
+	{0,4}, {1,5}, {2,6}, {3,7}
+};
+
+typedef struct {
+	const float *x;
+	const float *y;
+	const float *z;
+	const float *values;
+	long xSize;
+	long ySize;
+	long zSize;
+	int  steps[3];
+	int  brickSize;
+	/* number of cubes and bricks along each axis */
+	long nCubes[3];
+	long nBricks[3];
+	float isoValue;
+} GridBlocks;
+
+static float gridValue(const GridBlocks *grid, long i, long j, long k)
+{
+	return grid->values[(i * grid->ySize + j) * grid->zSize + k];
+}
+
+/* cube indices of a brick */
+static void brickLimits(const GridBlocks *grid, long brick, long *start, long *end)
+{
+	long b[3];
+	int axis;
+
+	b[2] = brick % grid->nBricks[2];
+	b[1] = (brick / grid->nBricks[2]) % grid->nBricks[1];
+	b[0] = brick / (grid->nBricks[2] * grid->nBricks[1]);
+	for (axis = 0; axis < 3; axis++)
+	{
+		start[axis] = b[axis] * grid->brickSize;
+		end[axis] = start[axis] + grid->brickSize;
+		if (end[axis] > grid->nCubes[axis])
+			end[axis] = grid->nCubes[axis];
+	}
+}
+
+/* the 8 bit case index of the cube with first corner at cube indices c,
+   0 (no triangles) if a corner is NaN */
+static int cubeIndex(const GridBlocks *grid, long ci, long cj, long ck, float *cubeValues)
+{
+	int corner, flagIndex = 0;
+	long i, j, k;
+
+	for (corner = 0; corner < 8; corner++)
+	{
+		i = (ci + cornerOffset[corner][0]) * grid->steps[0];
+		j = (cj + cornerOffset[corner][1]) * grid->steps[1];
+		k = (ck + cornerOffset[corner][2]) * grid->steps[2];
+		cubeValues[corner] = gridValue(grid, i, j, k);
+		if (cubeValues[corner] != cubeValues[corner])
+			return 0;
+		if (cubeValues[corner] <= grid->isoValue)
+			flagIndex |= 1 << corner;
+	}
+	return flagIndex;
+}
+
+/* 0 if the isosurface cannot cross the brick */
+static int brickIsCrossed(const GridBlocks *grid, const long *start, const long *end)
+{
+	long i, j, k;
+	float value, vMin, vMax;
+
+	/* NaN values are ignored here, cubeIndex skips the cubes using them */
+	vMin = (float) HUGE_VAL;
+	vMax = (float) -HUGE_VAL;
+	for (i = start[0] * grid->steps[0]; i <= end[0] * grid->steps[0]; i += grid->steps[0])
+	{
+		for (j = start[1] * grid->steps[1]; j <= end[1] * grid->steps[1]; j += grid->steps[1])
+		{
+			for (k = start[2] * grid->steps[2]; k <= end[2] * grid->steps[2]; k += grid->steps[2])
+			{
+				value = gridValue(grid, i, j, k);
+				if (value < vMin)
+					vMin = value;
+				if (value > vMax)
+					vMax = value;
+			}
+		}
+	}
+	/* a corner is flagged when value <= isoValue */
+	return ((vMin <= grid->isoValue) && (vMax > grid->isoValue));
+}
+
+static long countTriangles(int flagIndex)
+{
+	long n = 0;
+
+	while ((n < 5) && (a2iTriangleConnectionTable[flagIndex][3 * n] >= 0))
+		n++;
+	return n;
+}
+
+/* finite difference derivative of the values along one axis,
+   one sided next to the grid borders and to NaN values */
+static float derivative(const GridBlocks *grid, int axis, long i, long j, long k)
+{
+	const float *coordinates;
+	long index[3], center, size, low, high;
+	float vLow, vHigh;
+
+	index[0] = i;
+	index[1] = j;
+	index[2] = k;
+	if (axis == 0)
+	{
+		coordinates = grid->x;
+		size = grid->xSize;
+	}
+	else if (axis == 1)
+	{
+		coordinates = grid->y;
+		size = grid->ySize;
+	}
+	else
+	{
+		coordinates = grid->z;
+		size = grid->zSize;
+	}
+	center = index[axis];
+	low = center - grid->steps[axis];
+	high = center + grid->steps[axis];
+	if (low < 0)
+		low = center;
+	if (high >= size)
+		high = center;
+	index[axis] = low;
+	vLow = gridValue(grid, index[0], index[1], index[2]);
+	index[axis] = high;
+	vHigh = gridValue(grid, index[0], index[1], index[2]);
+	index[axis] = center;
+	if (vLow != vLow)
+	{
+		low = center;
+		vLow = gridValue(grid, index[0], index[1], index[2]);
+	}
+	if (vHigh != vHigh)
+	{
+		high = center;
+		vHigh = gridValue(grid, index[0], index[1], index[2]);
+	}
+	if ((high == low) || (coordinates[high] == coordinates[low]))
+		return 0.0f;
+	return (vHigh - vLow) / (coordinates[high] - coordinates[low]);
+}
+
+/* write the triangles of one brick, return the number of triangles */
+static long fillBrick(const GridBlocks *grid, const long *start, const long *end,
+					  float *vertices, float *normals)
+{
+	long ci, cj, ck, i, j, k, nTriangles = 0;
+	int flagIndex, edgeFlags, edge, corner, axis;
+	int c0, c1, triangle;
+	float cubeValues[8], edgeVertex[12][3], edgeNormal[12][3];
+	float offset, delta, gradient0[3], gradient1[3], p0[3], p1[3], norm;
+	long index0[3], index1[3];
+
+	for (ci = start[0]; ci < end[0]; ci++)
+	for (cj = start[1]; cj < end[1]; cj++)
+	for (ck = start[2]; ck < end[2]; ck++)
+	{
+		flagIndex = cubeIndex(grid, ci, cj, ck, cubeValues);
+		edgeFlags = aiCubeEdgeFlags[flagIndex];
+		if ((edgeFlags == 0) || (flagIndex == 255))
+			continue;
+		for (edge = 0; edge < 12; edge++)
+		{
+			if (!(edgeFlags & (1 << edge)))
+				continue;
+			c0 = edgeConnection[edge][0];
+			c1 = edgeConnection[edge][1];
+			delta = cubeValues[c1] - cubeValues[c0];
+			offset = (delta == 0.0f) ? 0.5f : (grid->isoValue - cubeValues[c0]) / delta;
+			i = ci * grid->steps[0];
+			j = cj * grid->steps[1];
+			k = ck * grid->steps[2];
+			for (axis = 0; axis < 3; axis++)
+			{
+				index0[axis] = cornerOffset[c0][axis] * grid->steps[axis];
+				index1[axis] = cornerOffset[c1][axis] * grid->steps[axis];
+			}
+			index0[0] += i; index0[1] += j; index0[2] += k;
+			index1[0] += i; index1[1] += j; index1[2] += k;
+			p0[0] = grid->x[index0[0]]; p1[0] = grid->x[index1[0]];
+			p0[1] = grid->y[index0[1]]; p1[1] = grid->y[index1[1]];
+			p0[2] = grid->z[index0[2]]; p1[2] = grid->z[index1[2]];
+			norm = 0.0f;
+			for (axis = 0; axis < 3; axis++)
+			{
+				edgeVertex[edge][axis] = p0[axis] + offset * (p1[axis] - p0[axis]);
+				gradient0[axis] = derivative(grid, axis, index0[0], index0[1], index0[2]);
+				gradient1[axis] = derivative(grid, axis, index1[0], index1[1], index1[2]);
+				/* the normal points towards decreasing values */
+				edgeNormal[edge][axis] = - (gradient0[axis] + offset * (gradient1[axis] - gradient0[axis]));
+				norm += edgeNormal[edge][axis] * edgeNormal[edge][axis];
+			}
+			if (norm > 0.0f)
+			{
+				norm = (float) (1.0 / sqrt(norm));
+				for (axis = 0; axis < 3; axis++)
+					edgeNormal[edge][axis] *= norm;
+			}
+		}
+		for (triangle = 0; triangle < 5; triangle++)
+		{
+			if (a2iTriangleConnectionTable[flagIndex][3 * triangle] < 0)
+				break;
+			for (corner = 0; corner < 3; corner++)
+			{
+				edge = a2iTriangleConnectionTable[flagIndex][3 * triangle + corner];
+				for (axis = 0; axis < 3; axis++)
+				{
+					vertices[9 * nTriangles + 3 * corner + axis] = edgeVertex[edge][axis];
+					normals[9 * nTriangles + 3 * corner + axis] = edgeNormal[edge][axis];
+				}
+			}
+			nTriangles++;
+		}
+	}
+	return nTriangles;
+}
+
+static long countBrick(const GridBlocks *grid, const long *start, const long *end)
+{
+	long ci, cj, ck, nTriangles = 0;
+	float cubeValues[8];
+
+	if (!brickIsCrossed(grid, start, end))
+		return 0;
+	for (ci = start[0]; ci < end[0]; ci++)
+	for (cj = start[1]; cj < end[1]; cj++)
+	for (ck = start[2]; ck < end[2]; ck++)
+	{
+		nTriangles += countTriangles(cubeIndex(grid, ci, cj, ck, cubeValues));
+	}
+	return nTriangles;
+}
+
+static int initGrid(GridBlocks *grid, const float *x, const float *y, const float *z,
+					const float *values, long xSize, long ySize, long zSize,
+					float isoValue, const int *steps, int brickSize)
+{
+	int axis;
+	long size[3];
+
+	if ((steps[0] <= 0) || (steps[1] <= 0) || (steps[2] <= 0) || (brickSize <= 0))
+		return -1;
+	grid->x = x;
+	grid->y = y;
+	grid->z = z;
+	grid->values = values;
+	grid->xSize = size[0] = xSize;
+	grid->ySize = size[1] = ySize;
+	grid->zSize = size[2] = zSize;
+	grid->isoValue = isoValue;
+	grid->brickSize = brickSize;
+	for (axis = 0; axis < 3; axis++)
+	{
+		grid->steps[axis] = steps[axis];
+		grid->nCubes[axis] = (size[axis] > 0) ? (size[axis] - 1) / steps[axis] : 0;
+		grid->nBricks[axis] = (grid->nCubes[axis] + brickSize - 1) / brickSize;
+	}
+	return 0;
+}
+
+/*
+   First pass: count the triangles of each brick.
+   brickTriangles must hold marchingCubesBlocksNumberOfBricks() values.
+   Returns the total number of triangles or -1 on wrong input.
+*/
+long marchingCubesBlocksNumberOfBricks(long xSize, long ySize, long zSize,
+									   const int *steps, int brickSize)
+{
+	GridBlocks grid;
+
+	if (initGrid(&grid, NULL, NULL, NULL, NULL, xSize, ySize, zSize, 0.0f, steps, brickSize))
+		return -1;
+	return grid.nBricks[0] * grid.nBricks[1] * grid.nBricks[2];
+}
+
+long marchingCubesBlocksCount(const float *values, long xSize, long ySize, long zSize,
+							  float isoValue, const int *steps, int brickSize,
+							  long *brickTriangles)
+{
+	GridBlocks grid;
+	long nBricks, brick, total = 0;
+
+	if (initGrid(&grid, NULL, NULL, NULL, values, xSize, ySize, zSize, isoValue, steps, brickSize))
+		return -1;
+	nBricks = grid.nBricks[0] * grid.nBricks[1] * grid.nBricks[2];
+	PRAGMA_OMP("omp parallel for schedule(dynamic) reduction(+:total)")
+	for (brick = 0; brick < nBricks; brick++)
+	{
+		long start[3], end[3];
+		brickLimits(&grid, brick, start, end);
+		brickTriangles[brick] = countBrick(&grid, start, end);
+		total += brickTriangles[brick];
+	}
+	return total;
+}
+
+/*
+   Second pass: each brick writes its triangles at the offset given by the
+   triangles of the previous bricks. vertices and normals must hold
+   9 * total floats (3 vertices of 3 coordinates per triangle).
+*/
+void marchingCubesBlocksFill(const float *x, const float *y, const float *z,
+							 const float *values, long xSize, long ySize, long zSize,
+							 float isoValue, const int *steps, int brickSize,
+							 const long *brickTriangles, float *vertices, float *normals)
+{
+	GridBlocks grid;
+	long nBricks, brick, *offsets;
+
+	if (initGrid(&grid, x, y, z, values, xSize, ySize, zSize, isoValue, steps, brickSize))
+		return;
+	nBricks = grid.nBricks[0] * grid.nBricks[1] * grid.nBricks[2];
+	offsets = (long *) malloc((nBricks + 1) * sizeof(long));
+	if (offsets == NULL)
+		return;
+	offsets[0] = 0;
+	for (brick = 0; brick < nBricks; brick++)
+		offsets[brick + 1] = offsets[brick] + brickTriangles[brick];
+	PRAGMA_OMP("omp parallel for schedule(dynamic)")
+	for (brick = 0; brick < nBricks; brick++)
+	{
+		long start[3], end[3];
+		if (brickTriangles[brick] == 0)
+			continue;
+		brickLimits(&grid, brick, start, end);
+		fillBrick(&grid, start, end, vertices + 9 * offsets[brick],
+				  normals + 9 * offsets[brick]);
+	}
+	free(offsets);
+}
+
+/*
+   Points of the grid with values in [vMin, vMax] (NaN values excluded).
+   slabCounts must hold xSize values. If vertices is NULL, the points
+   of each x slab are counted in slabCounts and the total is returned.
+   Otherwise, using the previously obtained slabCounts, the coordinates
+   and, if colors and colorsOut are not NULL, the 4 bytes colors of the
+   selected points are written.
+*/
+#define IN_RANGE(value) (((value) >= vMin) && ((value) <= vMax))
+
+long gridPointsInRange(const float *x, const float *y, const float *z,
+					   const float *values, long xSize, long ySize, long zSize,
+					   float vMin, float vMax, long *slabCounts,
+					   const unsigned int *colors, float *vertices,
+					   unsigned int *colorsOut)
+{
+	long i, total = 0, *offsets;
+
+	if (vertices == NULL)
+	{
+		PRAGMA_OMP("omp parallel for schedule(static) reduction(+:total)")
+		for (i = 0; i < xSize; i++)
+		{
+			long n = 0, j;
+			const float *pv = values + i * ySize * zSize;
+			for (j = 0; j < ySize * zSize; j++)
+			{
+				if (IN_RANGE(pv[j]))
+					n++;
+			}
+			slabCounts[i] = n;
+			total += n;
+		}
+		return total;
+	}
+
+	offsets = (long *) malloc((xSize + 1) * sizeof(long));
+	if (offsets == NULL)
+		return -1;
+	offsets[0] = 0;
+	for (i = 0; i < xSize; i++)
+		offsets[i + 1] = offsets[i] + slabCounts[i];
+
+	PRAGMA_OMP("omp parallel for schedule(static)")
+	for (i = 0; i < xSize; i++)
+	{
+		long j, k, offset, index;
+		const float *pv;
+		offset = offsets[i];
+		index = i * ySize * zSize;
+		pv = values + index;
+		for (j = 0; j < ySize; j++)
+		{
+			for (k = 0; k < zSize; k++, pv++, index++)
+			{
+				if (!IN_RANGE(*pv))
+					continue;
+				vertices[3 * offset] = x[i];
+				vertices[3 * offset + 1] = y[j];
+				vertices[3 * offset + 2] = z[k];
+				if ((colors != NULL) && (colorsOut != NULL))
+					colorsOut[offset] = colors[index];
+				offset++;
+			}
+		}
+	}
+	total = offsets[xSize];
+	free(offsets);
+	return total;
+}
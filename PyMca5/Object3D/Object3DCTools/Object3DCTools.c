@@ -57,6 +57,8 @@ static PyObject *getGridFacetsFromVertices(PyObject *dummy, PyObject *args);
 static PyObject *testOpenGL(PyObject *dummy, PyObject *args);
 static PyObject *gridMarchingCubes(PyObject *dummy, PyObject *args);
 static PyObject *marchingCubesXYZ(PyObject *dummy, PyObject *args);
+static PyObject *gridMarchingCubesBlocks(PyObject *dummy, PyObject *args);
+static PyObject *get3DGridPointsInRange(PyObject *dummy, PyObject *args);
 static PyObject *get2DGridFromXY(PyObject *dummy, PyObject *args);
 static PyObject *draw2DGridPoints(PyObject *dummy, PyObject *args);
 static PyObject *draw2DGridLines(PyObject *dummy, PyObject *args);
@@ -3331,6 +3333,273 @@ static PyObject *marchingCubesXYZ(PyObject *self, PyObject *args)
 
 }
 
+/* convert the grid arguments of the functions below */
+static int getGridArrays(PyObject *self, PyObject *xinput, PyObject *yinput,
+						 PyObject *zinput, PyObject *vinput,
+						 PyArrayObject **xArray, PyArrayObject **yArray,
+						 PyArrayObject **zArray, PyArrayObject **valuesArray)
+{
+    struct module_state *st = GETSTATE(self);
+
+	*xArray = (PyArrayObject *)
+			PyArray_FROMANY(xinput, NPY_FLOAT, 1, 0, NPY_C_CONTIGUOUS|NPY_FORCECAST);
+	*yArray = (PyArrayObject *)
+			PyArray_FROMANY(yinput, NPY_FLOAT, 1, 0, NPY_C_CONTIGUOUS|NPY_FORCECAST);
+	*zArray = (PyArrayObject *)
+			PyArray_FROMANY(zinput, NPY_FLOAT, 1, 0, NPY_C_CONTIGUOUS|NPY_FORCECAST);
+	*valuesArray = (PyArrayObject *)
+			PyArray_FROMANY(vinput, NPY_FLOAT, 1, 0, NPY_C_CONTIGUOUS|NPY_FORCECAST);
+	if ((*xArray == NULL) || (*yArray == NULL) || (*zArray == NULL) || (*valuesArray == NULL))
+	{
+		Py_XDECREF(*xArray);
+		Py_XDECREF(*yArray);
+		Py_XDECREF(*zArray);
+		Py_XDECREF(*valuesArray);
+		PyErr_SetString(st->error, "Arguments cannot be converted to float arrays.");
+		return 0;
+	}
+	if (PyArray_SIZE(*valuesArray) != \
+		PyArray_SIZE(*xArray) * PyArray_SIZE(*yArray) * PyArray_SIZE(*zArray))
+	{
+		Py_DECREF(*xArray);
+		Py_DECREF(*yArray);
+		Py_DECREF(*zArray);
+		Py_DECREF(*valuesArray);
+		PyErr_SetString(st->error, "Number of values does not match number of vertices.");
+		return 0;
+	}
+	return 1;
+}
+
+static PyObject *gridMarchingCubesBlocks(PyObject *self, PyObject *args)
+{
+	/* input parameters */
+	/* x, y, z 1D arrays defining the grid */
+	PyObject	   *xinput, *yinput, *zinput;
+	/* array containing the values of all the points of the grid */
+	PyObject	   *vinput;
+	/* the isosurface value */
+	float		   isoValue;
+	/* the grid step */
+	int			steps[3] = {1, 1, 1};
+	/* the number of cubes along each side of a brick */
+	int			brickSize = 32;
+
+	/* called functions */
+	extern long marchingCubesBlocksNumberOfBricks(long, long, long, const int *, int);
+	extern long marchingCubesBlocksCount(const float *, long, long, long,
+										 float, const int *, int, long *);
+	extern void marchingCubesBlocksFill(const float *, const float *, const float *,
+										const float *, long, long, long,
+										float, const int *, int,
+										const long *, float *, float *);
+
+	/* local variables */
+	PyArrayObject *xArray, *yArray, *zArray, *valuesArray;
+	PyArrayObject *verticesArray, *normalsArray;
+	long		xSize, ySize, zSize, nBricks, nTriangles;
+	long		*brickTriangles;
+	npy_intp	dim[2];
+    struct module_state *st = GETSTATE(self);
+
+	if (!PyArg_ParseTuple(args, "OOOOf|(iii)i", &xinput, &yinput, &zinput, &vinput, &isoValue,\
+												&steps[0], &steps[1], &steps[2], &brickSize))
+	{
+	    PyErr_SetString(st->error, "Unable to parse arguments. At least four float arrays and one float.");
+        return NULL;
+	}
+	if ((steps[0] <= 0) || (steps[1] <= 0)|| (steps[2] <= 0) || (brickSize <= 0))
+	{
+		PyErr_SetString(st->error, "Step increments and brick size must be positive");
+		return NULL;
+	}
+	if (!getGridArrays(self, xinput, yinput, zinput, vinput,\
+					   &xArray, &yArray, &zArray, &valuesArray))
+		return NULL;
+	xSize = (long) PyArray_SIZE(xArray);
+	ySize = (long) PyArray_SIZE(yArray);
+	zSize = (long) PyArray_SIZE(zArray);
+
+	nBricks = marchingCubesBlocksNumberOfBricks(xSize, ySize, zSize, steps, brickSize);
+	brickTriangles = (long *) malloc((nBricks + 1) * sizeof(long));
+	if (brickTriangles == NULL)
+	{
+		Py_DECREF(xArray);
+		Py_DECREF(yArray);
+		Py_DECREF(zArray);
+		Py_DECREF(valuesArray);
+		return PyErr_NoMemory();
+	}
+
+	/* counting pass to allocate the output only once */
+	Py_BEGIN_ALLOW_THREADS
+	nTriangles = marchingCubesBlocksCount((float *) PyArray_DATA(valuesArray),\
+								xSize, ySize, zSize, isoValue, steps, brickSize,\
+								brickTriangles);
+	Py_END_ALLOW_THREADS
+
+	dim[0] = 3 * nTriangles;
+	dim[1] = 3;
+	verticesArray = (PyArrayObject *) PyArray_SimpleNew(2, dim, NPY_FLOAT);
+	normalsArray = (PyArrayObject *) PyArray_SimpleNew(2, dim, NPY_FLOAT);
+	if ((verticesArray == NULL) || (normalsArray == NULL))
+	{
+		Py_XDECREF(verticesArray);
+		Py_XDECREF(normalsArray);
+		Py_DECREF(xArray);
+		Py_DECREF(yArray);
+		Py_DECREF(zArray);
+		Py_DECREF(valuesArray);
+		free(brickTriangles);
+		PyErr_SetString(st->error, "Error creating output arrays");
+		return NULL;
+	}
+
+	Py_BEGIN_ALLOW_THREADS
+	if (nTriangles > 0)
+	{
+		marchingCubesBlocksFill((float *) PyArray_DATA(xArray),\
+								(float *) PyArray_DATA(yArray),\
+								(float *) PyArray_DATA(zArray),\
+								(float *) PyArray_DATA(valuesArray),\
+								xSize, ySize, zSize, isoValue, steps, brickSize,\
+								brickTriangles,\
+								(float *) PyArray_DATA(verticesArray),\
+								(float *) PyArray_DATA(normalsArray));
+	}
+	Py_END_ALLOW_THREADS
+
+	free(brickTriangles);
+	Py_DECREF(xArray);
+	Py_DECREF(yArray);
+	Py_DECREF(zArray);
+	Py_DECREF(valuesArray);
+	return Py_BuildValue("NN", verticesArray, normalsArray);
+}
+
+static PyObject *get3DGridPointsInRange(PyObject *self, PyObject *args)
+{
+	/* input parameters */
+	PyObject	   *xinput, *yinput, *zinput, *vinput;
+	float		   vMin, vMax;
+	/* optional RGBA colors of all the points of the grid */
+	PyObject	   *cinput = NULL;
+
+	/* called functions */
+	extern long gridPointsInRange(const float *, const float *, const float *,
+								  const float *, long, long, long,
+								  float, float, long *,
+								  const unsigned int *, float *, unsigned int *);
+
+	/* local variables */
+	PyArrayObject *xArray, *yArray, *zArray, *valuesArray;
+	PyArrayObject *colorArray = NULL;
+	PyArrayObject *verticesArray, *colorsOutArray = NULL;
+	long		xSize, ySize, zSize, nPoints;
+	long		*slabCounts;
+	npy_intp	dim[2];
+	unsigned int *colors = NULL, *colorsOut = NULL;
+    struct module_state *st = GETSTATE(self);
+
+	if (!PyArg_ParseTuple(args, "OOOOff|O", &xinput, &yinput, &zinput, &vinput,\
+												&vMin, &vMax, &cinput))
+	{
+	    PyErr_SetString(st->error, "Unable to parse arguments. Four float arrays and two floats.");
+        return NULL;
+	}
+	if (!getGridArrays(self, xinput, yinput, zinput, vinput,\
+					   &xArray, &yArray, &zArray, &valuesArray))
+		return NULL;
+	xSize = (long) PyArray_SIZE(xArray);
+	ySize = (long) PyArray_SIZE(yArray);
+	zSize = (long) PyArray_SIZE(zArray);
+
+	if ((cinput != NULL) && (cinput != Py_None))
+	{
+		colorArray = (PyArrayObject *)
+    					PyArray_ContiguousFromAny(cinput, NPY_UBYTE, 1, 0);
+		if ((colorArray == NULL) || \
+			(PyArray_SIZE(colorArray) != 4 * PyArray_SIZE(valuesArray)))
+		{
+			Py_XDECREF(colorArray);
+			Py_DECREF(xArray);
+			Py_DECREF(yArray);
+			Py_DECREF(zArray);
+			Py_DECREF(valuesArray);
+			PyErr_SetString(st->error, "Colors must be 4 unsigned bytes per vertex.");
+			return NULL;
+		}
+		colors = (unsigned int *) PyArray_DATA(colorArray);
+	}
+
+	slabCounts = (long *) malloc((xSize + 1) * sizeof(long));
+	if (slabCounts == NULL)
+	{
+		Py_XDECREF(colorArray);
+		Py_DECREF(xArray);
+		Py_DECREF(yArray);
+		Py_DECREF(zArray);
+		Py_DECREF(valuesArray);
+		return PyErr_NoMemory();
+	}
+
+	/* counting pass to allocate the output only once */
+	Py_BEGIN_ALLOW_THREADS
+	nPoints = gridPointsInRange(NULL, NULL, NULL, (float *) PyArray_DATA(valuesArray),\
+								xSize, ySize, zSize, vMin, vMax, slabCounts,\
+								NULL, NULL, NULL);
+	Py_END_ALLOW_THREADS
+
+	dim[0] = nPoints;
+	dim[1] = 3;
+	verticesArray = (PyArrayObject *) PyArray_SimpleNew(2, dim, NPY_FLOAT);
+	if ((verticesArray != NULL) && (colors != NULL))
+	{
+		dim[1] = 4;
+		colorsOutArray = (PyArrayObject *) PyArray_SimpleNew(2, dim, NPY_UBYTE);
+		if (colorsOutArray != NULL)
+			colorsOut = (unsigned int *) PyArray_DATA(colorsOutArray);
+	}
+	if ((verticesArray == NULL) || ((colors != NULL) && (colorsOutArray == NULL)))
+	{
+		Py_XDECREF(verticesArray);
+		Py_XDECREF(colorsOutArray);
+		Py_XDECREF(colorArray);
+		Py_DECREF(xArray);
+		Py_DECREF(yArray);
+		Py_DECREF(zArray);
+		Py_DECREF(valuesArray);
+		free(slabCounts);
+		PyErr_SetString(st->error, "Error creating output arrays");
+		return NULL;
+	}
+
+	Py_BEGIN_ALLOW_THREADS
+	if (nPoints > 0)
+	{
+		gridPointsInRange((float *) PyArray_DATA(xArray),\
+						  (float *) PyArray_DATA(yArray),\
+						  (float *) PyArray_DATA(zArray),\
+						  (float *) PyArray_DATA(valuesArray),\
+						  xSize, ySize, zSize, vMin, vMax, slabCounts,\
+						  colors, (float *) PyArray_DATA(verticesArray), colorsOut);
+	}
+	Py_END_ALLOW_THREADS
+
+	free(slabCounts);
+	Py_XDECREF(colorArray);
+	Py_DECREF(xArray);
+	Py_DECREF(yArray);
+	Py_DECREF(zArray);
+	Py_DECREF(valuesArray);
+	if (colorsOutArray == NULL)
+	{
+		Py_INCREF(Py_None);
+		return Py_BuildValue("NN", verticesArray, Py_None);
+	}
+	return Py_BuildValue("NN", verticesArray, colorsOutArray);
+}
+
 static PyObject *getGridFacetsFromVertices(PyObject *self, PyObject *args)
 {
 	/* input parameters  */
@@ -3471,6 +3740,8 @@ static PyMethodDef Object3DCToolsMethods[] = {
 	{"getVertexArrayMeshAxes", getVertexArrayMeshAxes, METH_VARARGS},
 	{"gridMarchingCubes",gridMarchingCubes, METH_VARARGS},
 	{"marchingCubesXYZ", marchingCubesXYZ,  METH_VARARGS},
+	{"gridMarchingCubesBlocks", gridMarchingCubesBlocks, METH_VARARGS},
+	{"get3DGridPointsInRange", get3DGridPointsInRange, METH_VARARGS},
 	{"getGridFacetsFromVertices", getGridFacetsFromVertices, METH_VARARGS},
 	{"testOpenGL", testOpenGL, METH_VARARGS},
 	{NULL, NULL, 0, NULL} /* sentinel */
@@ -88,6 +88,8 @@ def __init__(self, name = "3D-Array"):
         self._selected     = False
         self._vertexSelectionMode = False
         self.drawMode = 'POINT'
+        # cache of the points passing the value filter
+        self._pointsCache = None
         self.__isosurfacesDict = {}
         for i in range(5):
             self.__isosurfacesDict[i] = {}
@@ -159,6 +161,7 @@ def _setAlpha(self, alpha):
             alpha = 255
         else:
             self._alpha = int(255 * alpha)
+        self._pointsCache = None
         if self.vertexColors is None:
             return
         self.vertexColors[:, 3] = self._alpha
@@ -230,6 +233,11 @@ def setStack(self, data, x=None, y=None, z=None, xyz=None):
         old_shape = self.values.shape
         self.nVertices = self.xSize * self.ySize * self.zSize
         self.values.shape = self.nVertices, 1
+        self.vertexSelectionColors = None
+        for key in self.__isosurfacesDict.keys():
+            if self.__isosurfacesDict[key]['list'] > 0:
+                GL.glDeleteLists(self.__isosurfacesDict[key]['list'], 1)
+                self.__isosurfacesDict[key]['list'] = 0
 
         self.getColors()
         self._obtainLimits()
@@ -253,6 +261,7 @@ def getColors(self):
         self.values.shape = old_shape
         self.vertexColors.shape = self.nVertices, 4
         self.vertexColors[:, 3] = self._alpha
+        self._pointsCache = None
         #selection colors
         # if I have more than pow(2, 24) vertices
         # the vertex with number pow(2, 24) will never be selected
@@ -331,10 +340,7 @@ def drawObject(self):
                     GL.glNewList(self.__isosurfacesDict[i]['list'],
                                                  GL.GL_COMPILE)
 
-                    GL.glBegin(GL.GL_TRIANGLES)
-                    Object3DCTools.gridMarchingCubes(self._x, self._y, self._z, self.values, value, color, (1, 1, 1), 1)
-                    #Object3DCTools.gridMarchingCubes(self._x, self._y, self._z, self.values, value, None, (1, 1, 1), 1)
-                    GL.glEnd()
+                    self._drawIsosurface(value, color)
                     GL.glEndList()
                     GL.glCallList(self.__isosurfacesDict[i]['list'])
                     GL.glDisable(GL.GL_LIGHTING)
@@ -354,6 +360,40 @@ def drawObject(self):
         if DEBUG:
             print("Drawing takes ", time.time() - t0)
 
+    def _drawIsosurface(self, value, color=None):
+        """
+        Draw the isosurface at the given value as vertex arrays.
+
+        The triangles are generated brick by brick in C (multithreaded when
+        compiled with OpenMP) and are sent to OpenGL in a single call.
+        """
+        vertices, normals = Object3DCTools.gridMarchingCubesBlocks(self._x,
+                                                    self._y,
+                                                    self._z,
+                                                    self.values,
+                                                    value)
+        if DEBUG:
+            print("Isosurface %s has %d triangles" % \
+                  (value, vertices.shape[0] // 3))
+        if not vertices.shape[0]:
+            return
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glEnableClientState(GL.GL_NORMAL_ARRAY)
+        GL.glVertexPointerf(vertices)
+        GL.glNormalPointerf(normals)
+        if color is None:
+            # same coloring as the marching cubes without color
+            positive = numpy.clip(normals, 0.0, None)
+            negative = -0.5 * numpy.clip(normals, None, 0.0)
+            colors = positive + negative[:, [1, 2, 0]] + negative[:, [2, 0, 1]]
+            GL.glEnableClientState(GL.GL_COLOR_ARRAY)
+            GL.glColorPointerf(colors.astype(numpy.float32))
+        GL.glDrawArrays(GL.GL_TRIANGLES, 0, vertices.shape[0])
+        GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glDisableClientState(GL.GL_NORMAL_ARRAY)
+        if color is None:
+            GL.glDisableClientState(GL.GL_COLOR_ARRAY)
+
     def _getVertexSelectionColors(self):
         self.vertexSelectionColors = numpy.zeros((self.nVertices,4),
                                                  numpy.uint8)
@@ -380,33 +420,42 @@ def buildPointList(self, selection=False):
         if selection:
             if self.vertexSelectionColors is None:
                 self._getVertexSelectionColors()
-            if self._configuration['private']['colorfilter']:
-                tinyNumber = 1.0e-10
-                minValue = self._configuration['common']['colormap'][2] + tinyNumber
-                maxValue = self._configuration['common']['colormap'][3] - tinyNumber
-                Object3DCTools.draw3DGridPoints(self._x,
-                                           self._y,
-                                           self._z,
-                                           self.vertexSelectionColors,
-                                           self.values,
-                                           0,
-                                           [1, minValue, maxValue])
-            else:
-                Object3DCTools.draw3DGridPoints(self._x,
-                                       self._y,
-                                       self._z,
-                                       self.vertexSelectionColors,
-                                       self.values,
-                                       0,
-                                       self._configuration['private']['useminmax'])
+            colors = self.vertexSelectionColors
         else:
-            Object3DCTools.draw3DGridPoints(self._x,
-                                       self._y,
-                                       self._z,
-                                       self.vertexColors,
-                                       self.values,
-                                       self._configuration['private']['colorfilter'],
-                                       self._configuration['private']['useminmax'])
+            colors = self.vertexColors
+        if self._configuration['private']['colorfilter']:
+            tinyNumber = 1.0e-10
+            minValue = self._configuration['common']['colormap'][2] + tinyNumber
+            maxValue = self._configuration['common']['colormap'][3] - tinyNumber
+        elif self._configuration['private']['useminmax'][0]:
+            minValue = self._configuration['private']['useminmax'][1]
+            maxValue = self._configuration['private']['useminmax'][2]
+        else:
+            minValue = -numpy.inf
+            maxValue = numpy.inf
+        key = (selection, minValue, maxValue)
+        if (self._pointsCache is None) or (self._pointsCache[0] != key):
+            # only the points in range are kept and sent to OpenGL
+            self._pointsCache = None
+            vertices, pointColors = Object3DCTools.get3DGridPointsInRange( \
+                                                        self._x,
+                                                        self._y,
+                                                        self._z,
+                                                        self.values,
+                                                        minValue,
+                                                        maxValue,
+                                                        colors)
+            self._pointsCache = (key, vertices, pointColors)
+        key, vertices, pointColors = self._pointsCache
+        if not vertices.shape[0]:
+            return
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glEnableClientState(GL.GL_COLOR_ARRAY)
+        GL.glVertexPointerf(vertices)
+        GL.glColorPointerub(pointColors)
+        GL.glDrawArrays(GL.GL_POINTS, 0, vertices.shape[0])
+        GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glDisableClientState(GL.GL_COLOR_ARRAY)
 
     def buildWireList(self):
         Object3DCTools.draw3DGridLines(self._x,
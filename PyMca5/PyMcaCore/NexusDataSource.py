@@ -37,6 +37,8 @@
 from operator import itemgetter
 import re
 import posixpath
+import threading
+import weakref
 phynx = h5py
 
 if sys.version > '2.9':
@@ -47,6 +49,11 @@
 SOURCE_TYPE = "HDF5"
 DEBUG = 0
 
+# attributes with more values are not kept in the file index
+MAX_ATTRIBUTE_SIZE = 64
+# datasets of the entries kept in the file index
+ENTRY_VALUES = ['title', 'start_time', 'end_time']
+
 #sorting method
 def h5py_sorting(object_list):
     sorting_list = ['start_time', 'end_time', 'name']
@@ -97,6 +104,325 @@ def _get_number_list(txt):
     nbs= [float(w) for w in re.split(rexpr, txt) if w not in ['',' ']]
     return nbs
 
+def _toText(value):
+    if hasattr(value, "decode"):
+        try:
+            return value.decode("utf-8")
+        except UnicodeDecodeError:
+            return value.decode("latin-1")
+    return value
+
+
+class NexusFileIndex(object):
+    """
+    Metadata of the groups and datasets of an HDF5 file: children of the
+    groups, shapes and types of the datasets, small attributes and the
+    title and times of the entries.
+
+    The index is built in a background thread, one group at a time, and
+    the groups requested before being reached are indexed on demand.
+    Refreshing while the thread runs queues the new groups to it.
+    Groups reached through soft or external links are only indexed on
+    demand.
+    """
+    def __init__(self, h5file, background=True):
+        if isinstance(h5file, weakref.ProxyTypes):
+            self._file = lambda: h5file
+        else:
+            self._file = weakref.ref(h5file)
+        self._lock = threading.RLock()
+        self._thread = None
+        self._pending = []
+        self._nodes = {}
+        self._entries = []
+        self._entryIndex = {}
+        self._mtime = None
+        self.refresh(background=background)
+
+    def _getFile(self):
+        h5file = self._file()
+        if h5file is None:
+            raise IOError("File already closed")
+        return h5file
+
+    def refresh(self, background=True):
+        """
+        Index the entries added since the last call and the entries that
+        were not finished (without end time) if the file was modified.
+        """
+        h5file = self._getFile()
+        try:
+            mtime = os.path.getmtime(h5file.filename)
+        except (OSError, TypeError):
+            mtime = None
+        with self._lock:
+            names = list(h5file["/"].keys())
+            known = set(self._entries)
+            toIndex = [name for name in names if name not in known]
+            if (mtime != self._mtime) and len(self._entries):
+                for name in self._entries:
+                    info = self._nodes.get("/" + name)
+                    if (info is not None) and \
+                       ("end_time" not in info["values"]):
+                        toIndex.append(name)
+            if (not len(toIndex)) and (len(names) == len(self._entries)):
+                self._mtime = mtime
+                return
+            # forget everything below the entries to be indexed again
+            # and the entries no longer present
+            forget = set(toIndex) | (known - set(names))
+            for path in list(self._nodes.keys()):
+                items = path.split("/")
+                if (len(items) > 1) and (items[1] in forget):
+                    del self._nodes[path]
+            self._pending = [path for path in self._pending \
+                             if path.split("/")[1] not in forget]
+            self._entries = names
+            self._entryIndex = dict((name, i) for i, name in enumerate(names))
+            self._mtime = mtime
+            root = self._nodes.get("/")
+            if root is None:
+                root = self._getNodeInfo(h5file["/"])
+                self._nodes["/"] = root
+            root["children"] = names
+            for name in toIndex:
+                self._indexNode(h5file["/"], "/", name)
+            paths = ["/" + name for name in toIndex \
+                     if self._nodes["/" + name]["children"] is None]
+            if background:
+                # a running thread picks the new paths up from the queue
+                self._pending.extend(paths)
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._indexQueue)
+                    self._thread.daemon = True
+                    self._thread.start()
+                return
+        self._indexTree(paths)
+
+    def isIndexing(self):
+        thread = self._thread
+        return (thread is not None) and thread.is_alive()
+
+    def wait(self, timeout=None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _indexQueue(self):
+        """
+        Background thread: index the queued groups until the queue is empty.
+        """
+        while True:
+            with self._lock:
+                if not len(self._pending):
+                    self._thread = None
+                    return
+                path = self._pending.pop(0)
+            try:
+                children = self._indexGroup(path)
+            except:
+                # file closed or not readable, nothing else to do
+                if DEBUG:
+                    print("Indexing of %s stopped" % path)
+                with self._lock:
+                    self._pending = []
+                    self._thread = None
+                return
+            with self._lock:
+                self._pending.extend(self._getHardLinkGroups(path, children))
+
+    def _indexTree(self, paths):
+        """
+        Index all the groups below the given ones, following hard links.
+        """
+        paths = list(paths)
+        while len(paths):
+            path = paths.pop(0)
+            try:
+                children = self._indexGroup(path)
+            except:
+                # file closed or not readable, nothing else to do
+                if DEBUG:
+                    print("Indexing of %s stopped" % path)
+                return
+            paths.extend(self._getHardLinkGroups(path, children))
+
+    def _getHardLinkGroups(self, path, children):
+        """
+        Paths of the children reached through hard links still to be indexed.
+        """
+        groups = []
+        for name in children:
+            childPath = posixpath.join(path, name)
+            info = self._nodes.get(childPath)
+            if (info is not None) and (info["children"] is None) and \
+               (info["link"] == "HardLink") and \
+               (info["type"] not in ["BrokenLink"]):
+                groups.append(childPath)
+        return groups
+
+    def _indexGroup(self, path):
+        with self._lock:
+            info = self._nodes.get(path)
+            if info is None:
+                self._ensureIndexed(posixpath.dirname(path))
+                info = self._nodes.get(path)
+                if info is None:
+                    raise KeyError("%s not in file" % path)
+            if info["children"] is not None:
+                return info["children"]
+            group = self._getFile()[path]
+            children = list(group.keys())
+            for name in children:
+                self._indexNode(group, path, name)
+            info["children"] = children
+            return children
+
+    def _ensureIndexed(self, path):
+        if path in ["", "/"]:
+            return
+        if path not in self._nodes:
+            self._ensureIndexed(posixpath.dirname(path))
+        self._indexGroup(path)
+
+    def _indexNode(self, group, path, name):
+        childPath = posixpath.join(path, name)
+        try:
+            link = type(group.get(name, getlink=True)).__name__
+        except:
+            link = "Unknown"
+        try:
+            node = group[name]
+        except:
+            node = None
+        info = self._getNodeInfo(node)
+        info["link"] = link
+        if (path == "/") and (node is not None) and info["isGroup"]:
+            for key in ENTRY_VALUES:
+                try:
+                    if key in node:
+                        value = node[key][()]
+                        if hasattr(value, "shape") and len(value.shape):
+                            value = value.flat[0]
+                        info["values"][key] = _toText(value)
+                except:
+                    if DEBUG:
+                        print("Cannot read %s of %s" % (key, childPath))
+        self._nodes[childPath] = info
+
+    def _getNodeInfo(self, node):
+        info = {"type": "BrokenLink",
+                "isGroup": False,
+                "attrs": {},
+                "values": {},
+                "shape": "",
+                "dtype": "",
+                "children": [],
+                "link": "HardLink"}
+        if node is None:
+            return info
+        info["type"] = type(node).__name__
+        info["isGroup"] = isinstance(node, h5py.Group)
+        if info["isGroup"]:
+            # not indexed yet
+            info["children"] = None
+        if hasattr(node, "shape"):
+            info["shape"] = node.shape
+        if hasattr(node, "dtype"):
+            info["dtype"] = "%s" % node.dtype
+        if hasattr(node, "attrs"):
+            try:
+                for key in node.attrs:
+                    value = node.attrs[key]
+                    if numpy.size(value) <= MAX_ATTRIBUTE_SIZE:
+                        info["attrs"][key] = _toText(value)
+            except:
+                if DEBUG:
+                    print("Cannot read attributes of %s" % node.name)
+        return info
+
+    def getEntryNames(self):
+        """
+        Names of the first level groups in the order of the file.
+        """
+        return list(self._entries)
+
+    def getEntryIndex(self, name):
+        """
+        Position of an entry in the file, starting at 0.
+        """
+        if name.startswith("/"):
+            name = name[1:]
+        return self._entryIndex[name]
+
+    def getNodeInfo(self, path):
+        """
+        Dictionary with the keys "type", "isGroup", "attrs", "shape",
+        "dtype", "link", "children" (None if the group is not indexed yet)
+        and "values" (title and times of the entries).
+        """
+        if not path.startswith("/"):
+            path = "/" + path
+        with self._lock:
+            if path not in self._nodes:
+                self._ensureIndexed(posixpath.dirname(path))
+            return self._nodes[path]
+
+    def getChildren(self, path):
+        """
+        Names of the members of a group.
+        """
+        if not path.startswith("/"):
+            path = "/" + path
+        with self._lock:
+            if path == "/":
+                return list(self._entries)
+            info = self.getNodeInfo(path)
+            if not info["isGroup"]:
+                return []
+            return list(self._indexGroup(path))
+
+    def getSortedEntryNames(self):
+        """
+        Names of the entries sorted as h5py_sorting does: by start time,
+        end time or by the numbers in their names.
+        """
+        names = self.getEntryNames()
+        if len(names) < 2:
+            return names
+        first = self._nodes["/" + names[0]]
+        sortingKey = "name"
+        for key in ["start_time", "end_time"]:
+            if key in first["values"]:
+                sortingKey = key
+                break
+        try:
+            if sortingKey == "name":
+                sortingList = [(_get_number_list("/" + name), name) \
+                               for name in names]
+            else:
+                sortingList = [(self._nodes["/" + name]["values"][sortingKey],
+                                name) for name in names]
+            sortingList.sort()
+            return [x[1] for x in sortingList]
+        except:
+            print("WARNING: Default ordering")
+            print("Probably all entries do not have the key %s" % sortingKey)
+            return names
+
+
+def getFileIndex(h5file, background=True):
+    """
+    Metadata index of an opened HDF5 file, created on first use and shared
+    by all the users of the file instance.
+    """
+    index = getattr(h5file, "_fileIndex", None)
+    if index is None:
+        index = NexusFileIndex(h5file, background=background)
+        h5file._fileIndex = index
+    return index
+
+
 def get_family_pattern(filelist):
     name1 = filelist[0]
     name2 = filelist[1]
@@ -210,8 +536,17 @@ def refresh(self):
             self.__sourceNameList = [pattern]
             self._sourceObjectList=[phynxInstance]
             phynxInstance._sourceName = pattern
+        for phynxInstance in self._sourceObjectList:
+            # built in the background
+            getFileIndex(phynxInstance)
         self.__lastKeyInfo = {}
 
+    def getFileIndex(self, index=0):
+        """
+        Metadata index of the file of the given position in the source.
+        """
+        return getFileIndex(self._sourceObjectList[index])
+
     def getSourceInfo(self):
         """
         Returns a dictionary with the key "KeyList" (list of all available keys
@@ -228,7 +563,9 @@ def __getSourceInfo(self):
         i = 0
         for sourceObject in self._sourceObjectList:
             i+=1
-            nEntries = len(sourceObject["/"].keys())
+            fileIndex = getFileIndex(sourceObject)
+            fileIndex.refresh()
+            nEntries = len(fileIndex.getEntryNames())
             for n in range(nEntries):
                 SourceInfo["KeyList"].append("%d.%d" % (i,n+1))
         SourceInfo["Size"]=len(SourceInfo["KeyList"])
@@ -267,9 +604,47 @@ def __getKeyInfo(self,key):
     def getDataObject(self, key, selection=None):
         """
         key:  a string of the form %d.%d indicating the file and the entry
-              starting by 1.
-        selection: a dictionnary generated via QNexusWidget
+              starting by 1 or a list of them.
+        selection: a dictionnary generated via QNexusWidget or a list of them,
+              one per key.
+
+        If key is a list, a list of data objects is returned. The datasets
+        shared by several selections are read only once.
+        """
+        if type(key) != type([]):
+            return self._getDataObject(key, selection, {})
+        if type(selection) != type([]):
+            selection = [selection] * len(key)
+        if len(selection) != len(key):
+            raise ValueError("One selection per key is needed")
+        cache = {}
+        return [self._getDataObject(k, s, cache) \
+                for k, s in zip(key, selection)]
+
+    def _readDataset(self, phynxFile, path, cache):
         """
+        Read a dataset into memory unless it is too large.
+        """
+        cacheKey = (id(phynxFile), path)
+        if cacheKey in cache:
+            data = cache[cacheKey]
+            if isinstance(data, numpy.ndarray):
+                # every data object gets its own array
+                data = data.copy()
+            return data
+        data = phynxFile[path]
+        totalElements = 1
+        for dim in data.shape:
+            totalElements *= dim
+        if totalElements < 2.0E7:
+            try:
+                data = data[()]
+            except MemoryError:
+                pass
+        cache[cacheKey] = data
+        return data
+
+    def _getDataObject(self, key, selection, cache):
         if selection is not None:
             if 'sourcename' in selection:
                 filename  = selection['sourcename']
@@ -279,13 +654,14 @@ def getDataObject(self, key, selection=None):
                 if entry == "/":
                     entryIndex = 0
                 else:
-                    entryIndex = list(phynxFile["/"].keys()).index(entry[1:])
+                    entryIndex = getFileIndex(phynxFile).getEntryIndex(entry)
             else:
                 key_split = key.split(".")
                 fileIndex = int(key_split[0])-1
                 phynxFile =  self._sourceObjectList[fileIndex]
                 entryIndex = int(key_split[1])-1
-                entry = phynxFile["/"].keys()[entryIndex]
+                entry = "/" + \
+                        getFileIndex(phynxFile).getEntryNames()[entryIndex]
             actual_key = "%d.%d" % (fileIndex+1, entryIndex+1)
             if actual_key != key:
                 if entry != "/":
@@ -330,16 +706,7 @@ def getDataObject(self, key, selection=None):
             if not len(selection[cnt]):
                 continue
             path =  entry + selection['cntlist'][selection[cnt][0]]
-            data = phynxFile[path]
-            totalElements = 1
-            for dim in data.shape:
-                totalElements *= dim
-            if totalElements < 2.0E7:
-                try:
-                    data = phynxFile[path].value
-                except MemoryError:
-                    data = phynxFile[path]
-                    pass
+            data = self._readDataset(phynxFile, path, cache)
             if output.info['selectiontype'] == "1D":
                 if len(data.shape) == 2:
                     if min(data.shape) == 1:
@@ -363,7 +730,7 @@ def getDataObject(self, key, selection=None):
                 if len(selection[cnt]) > 1:
                     for xidx in range(1, len(selection[cnt])):
                         path =  entry + selection['cntlist'][selection[cnt][xidx]]
-                        data = phynxFile[path].value
+                        data = phynxFile[path][()]
                         output.x.append(data)
             elif cnt == 'm':
                 #only one monitor
@@ -34,6 +34,12 @@
 import os
 import numpy
 from PyMca5.PyMcaIO import EdfFile
+try:
+    from PyMca5.PyMcaIO import FitResultStore
+    from PyMca5.PyMcaIO import FitImageSink
+    HDF5SUPPORT = True
+except ImportError:
+    HDF5SUPPORT = False
 
 DEBUG = 0
 
@@ -56,10 +62,14 @@ def buildOutput(self, inputdir=None, outputdir=None, delete=None):
         partialedflist = []
         partialdatlist = []
         partialconlist = []
+        partialfitlist = []
+        partialh5list = []
         for filename in allfiles:
             if filename.endswith('000000_partial.edf'):partialedflist.append(filename)
             elif filename.endswith('000000_partial.dat'):partialdatlist.append(filename)
             elif filename.endswith('000000_partial_concentrations.txt'):partialconlist.append(filename)
+            elif filename.endswith('000000_partial_fitresults.h5'):partialfitlist.append(filename)
+            elif filename.endswith('000000_partial.h5'):partialh5list.append(filename)
 
         #IMAGES
         edfoutlist = []
@@ -100,6 +110,27 @@ def buildOutput(self, inputdir=None, outputdir=None, delete=None):
                     except:
                         print("Cannot delete file %s" % filename)
 
+        #HDF5 IMAGES
+        if len(partialh5list) and (not HDF5SUPPORT):
+            print("h5py needed to merge the HDF5 images")
+            partialh5list = []
+        for filename in partialh5list:
+            prefix = filename.replace("000000_partial.h5", "")
+            h5list = []
+            h5name = os.path.join(inputdir, filename)
+            while os.path.exists(h5name):
+                h5list.append(h5name)
+                h5name = os.path.join(inputdir, prefix + \
+                            "%06d_partial.h5" % len(h5list))
+            outfilename = os.path.join(outputdir,
+                                    filename.replace("_000000_partial", ""))
+            if os.path.exists(outfilename):
+                os.remove(outfilename)
+            FitImageSink.mergeFitImageFiles(h5list, outfilename)
+            if delete:
+                for filename in h5list:
+                    os.remove(filename)
+
         #DAT IMAGES
         datoutlist = []
         for filename in partialdatlist:
@@ -171,6 +202,29 @@ def buildOutput(self, inputdir=None, outputdir=None, delete=None):
             if delete:
                 for filename in edflist:
                     os.remove(filename)
+
+        #FIT RESULTS
+        if len(partialfitlist) and (not HDF5SUPPORT):
+            print("h5py needed to merge the fit results")
+            partialfitlist = []
+        for filename in partialfitlist:
+            # the extension contains a digit, the indexed file list
+            # cannot be obtained from the file name
+            prefix = filename.replace("000000_partial_fitresults.h5", "")
+            fitlist = []
+            fitname = os.path.join(inputdir, filename)
+            while os.path.exists(fitname):
+                fitlist.append(fitname)
+                fitname = os.path.join(inputdir, prefix + \
+                            "%06d_partial_fitresults.h5" % len(fitlist))
+            outfilename = os.path.join(outputdir,
+                                    filename.replace("_000000_partial", ""))
+            if os.path.exists(outfilename):
+                os.remove(outfilename)
+            FitResultStore.mergeFitResultStores(fitlist, outfilename)
+            if delete:
+                for filename in fitlist:
+                    os.remove(filename)
         return edfoutlist, datoutlist, outconlist
 
     def getIndexedFileList(self, filename, begin=None,end=None, skip = None, fileindex=0):
@@ -34,12 +34,28 @@
 import os
 import numpy
 import types
+import json
+import hashlib
+import binascii
 from . import DataObject
 from PyMca5.PyMcaIO import specfilewrapper as specfile
 
 SOURCE_TYPE = "SpecFile"
 DEBUG = 0
 
+# Scan index files
+# ----------------
+# SPEC files of at least SCAN_INDEX_MIN_SIZE bytes keep their scan index
+# (scan, header, data and mca offsets) and a summary of each scan (command,
+# number of points and of mca) in files next to the data file. Opening the
+# file again only analyzes the part appended since they were written.
+SCAN_INDEX = True
+SCAN_INDEX_MIN_SIZE = 4 * 1024 * 1024
+SCAN_INDEX_SUFFIX = ".pymcaidx"
+SCAN_SUMMARY_VERSION = 2
+# number of bytes at the end of the summarized part checked when reopening
+SCAN_SUMMARY_TAIL = 64
+
 # Scan types
 # ----------
 SF_EMPTY       = 0        # empty scan
@@ -50,6 +66,57 @@
 SF_UMCA        = 16       # mca number does not match pts number
 
 
+def getScanIndexFileName(filename):
+    """
+    Return the name of the file keeping the scan index of a SPEC file or
+    None if the file is too small to need one.
+
+    The index is kept in a hidden file next to the data file or, if the
+    data directory is not writable, in the cache directory of the PyMca
+    settings.
+    """
+    if not SCAN_INDEX:
+        return None
+    try:
+        if os.path.getsize(filename) < SCAN_INDEX_MIN_SIZE:
+            return None
+    except OSError:
+        return None
+    filename = os.path.abspath(filename)
+    dirname, basename = os.path.split(filename)
+    indexname = os.path.join(dirname, "." + basename + SCAN_INDEX_SUFFIX)
+    if os.path.exists(indexname) or os.access(dirname, os.W_OK):
+        return indexname
+    try:
+        import PyMca5
+        cacheDir = os.path.join(\
+            os.path.dirname(PyMca5.getDefaultSettingsFile()), "cache")
+        if not os.path.isdir(cacheDir):
+            os.mkdir(cacheDir)
+    except:
+        if DEBUG:
+            print("Cannot use the cache directory %s" % sys.exc_info()[1])
+        return None
+    if not isinstance(filename, bytes):
+        filename = filename.encode("utf-8")
+    return os.path.join(cacheDir,
+                        hashlib.md5(filename).hexdigest() + SCAN_INDEX_SUFFIX)
+
+
+def _getFileTail(filename, size):
+    """
+    Return as text the SCAN_SUMMARY_TAIL bytes preceding offset size.
+    """
+    n = min(size, SCAN_SUMMARY_TAIL)
+    f = open(filename, "rb")
+    try:
+        f.seek(size - n)
+        tail = f.read(n)
+    finally:
+        f.close()
+    return binascii.hexlify(tail).decode("ascii")
+
+
 class SpecFileDataSource(object):
     Error= "SpecFileDataError"
 
@@ -73,18 +140,28 @@ def __init__(self, nameInput):
         self.sourceType   = SOURCE_TYPE
         self.__sourceNameList = nameList
         self.__source_info_cached = None
+        self.__scanSummary = None
 
         self.refresh()
 
     def refresh(self):
         self._sourceObjectList=[]
         self.__fileHeaderList = []
+        self.__indexNameList = []
+        self.__fileSizeList = []
+        self.__fileMTimeList = []
         for name in self.__sourceNameList:
             if not os.path.exists(name):
                 raise ValueError("File %s does not exists" % name)
         for name in self.__sourceNameList:
-            self._sourceObjectList.append(specfile.Specfile(name))
+            indexName = getScanIndexFileName(name)
+            self._sourceObjectList.append(specfile.Specfile(name,
+                                                    indexfile=indexName))
             self.__fileHeaderList.append(False)
+            self.__indexNameList.append(indexName)
+            # all the scans known to the source start before this size
+            self.__fileSizeList.append(os.path.getsize(name))
+            self.__fileMTimeList.append(os.path.getmtime(name))
         self.__lastKeyInfo = {}
 
     def getSourceInfo(self):
@@ -105,11 +182,49 @@ def __getSourceInfo(self):
         source_info["KeyList"]    = scanlist
         source_info["SourceType"] = SOURCE_TYPE
 
-        num_mca=[]
-        num_pts=[]
-        commands=[]
-        sf_type=[]
-        for i in scanlist:
+        summary = self.__getScanSummary(scanlist)
+        num_mca = list(summary["NumMca"])
+        num_pts = list(summary["NumPts"])
+        commands = list(summary["Commands"])
+        source_info["FileHeader"] = self.__fileHeaderList[0]
+        source_info["NumMca"] = num_mca
+        source_info["NumPts"] = num_pts
+        source_info["Commands"] = commands
+        source_info["ScanType"] = map(self.__getScanType, num_pts, num_mca, commands)
+        self.__source_info_cached = source_info
+        return source_info
+
+    def __getScanSummary(self, scanlist):
+        """
+        Return a dictionary with the number of mca, the number of points
+        and the command of each scan in scanlist.
+
+        If the file was only appended since the last summary, kept in
+        memory or in the index files, only the last summarized scan and
+        the new ones are read.
+        """
+        index = 0
+        oldSummary = self.__scanSummary
+        if oldSummary is None:
+            oldSummary = self.__readScanSummary(index)
+        nKnown = 0
+        if (oldSummary is not None) and self.__isAppended(index, oldSummary):
+            n = len(oldSummary["KeyList"])
+            if scanlist[:n] == oldSummary["KeyList"]:
+                # the last summarized scan may have grown
+                nKnown = max(n - 1, 0)
+        if nKnown:
+            num_mca = oldSummary["NumMca"][:nKnown]
+            num_pts = oldSummary["NumPts"][:nKnown]
+            commands = oldSummary["Commands"][:nKnown]
+            self.__fileHeaderList[index] = oldSummary["FileHeader"]
+        else:
+            oldSummary = None
+            num_mca = []
+            num_pts = []
+            commands = []
+            self.__fileHeaderList[index] = False
+        for i in scanlist[nKnown:]:
             sel=self._sourceObjectList[0].select(i)
             if self.__fileHeaderList[0] == False:
                 try:
@@ -135,17 +250,98 @@ def __getSourceInfo(self):
             except:
                 n= ""
             commands.append(n)
-        source_info["FileHeader"] = self.__fileHeaderList[0]
-        source_info["NumMca"] = num_mca
-        source_info["NumPts"] = num_pts
-        source_info["Commands"] = commands
-        source_info["ScanType"] = map(self.__getScanType, num_pts, num_mca, commands)
-        self.__source_info_cached = source_info
-        return source_info
+        summary = {"Version": SCAN_SUMMARY_VERSION,
+                   "Size": self.__fileSizeList[index],
+                   "MTime": self.__fileMTimeList[index],
+                   "Tail": _getFileTail(self.__sourceNameList[index],
+                                        self.__fileSizeList[index]),
+                   "KeyList": list(scanlist),
+                   "NumMca": num_mca,
+                   "NumPts": num_pts,
+                   "Commands": commands,
+                   "FileHeader": self.__fileHeaderList[index]}
+        changed = oldSummary is None
+        if not changed:
+            for key in ["MTime", "KeyList", "NumMca", "NumPts", "Commands"]:
+                if summary[key] != oldSummary[key]:
+                    changed = True
+                    break
+        if changed:
+            self.__writeScanSummary(index, summary)
+        self.__scanSummary = summary
+        return summary
+
+    def __isAppended(self, index, summary):
+        """
+        Check the summarized part of the file is unchanged.
+        """
+        name = self.__sourceNameList[index]
+        try:
+            size = os.path.getsize(name)
+            if size < summary["Size"]:
+                return False
+            if (size == summary["Size"]) and \
+               (os.path.getmtime(name) != summary["MTime"]):
+                # rewritten in place
+                return False
+            return _getFileTail(name, summary["Size"]) == summary["Tail"]
+        except:
+            if DEBUG:
+                print("__isAppended %s" % sys.exc_info()[1])
+            return False
+
+    def __readScanSummary(self, index):
+        if self.__indexNameList[index] is None:
+            return None
+        filename = self.__indexNameList[index] + ".json"
+        if not os.path.exists(filename):
+            return None
+        try:
+            f = open(filename, "r")
+            try:
+                summary = json.load(f)
+            finally:
+                f.close()
+            if summary["Version"] != SCAN_SUMMARY_VERSION:
+                return None
+            for key in ["NumMca", "NumPts", "Commands"]:
+                if len(summary[key]) != len(summary["KeyList"]):
+                    return None
+        except:
+            if DEBUG:
+                print("__readScanSummary %s" % sys.exc_info()[1])
+            return None
+        return summary
+
+    def __writeScanSummary(self, index, summary):
+        if self.__indexNameList[index] is None:
+            return
+        filename = self.__indexNameList[index] + ".json"
+        tmpname = filename + ".tmp"
+        try:
+            f = open(tmpname, "w")
+            try:
+                json.dump(summary, f)
+            finally:
+                f.close()
+            try:
+                os.rename(tmpname, filename)
+            except OSError:
+                # Windows does not replace existing files
+                os.remove(filename)
+                os.rename(tmpname, filename)
+        except:
+            if DEBUG:
+                print("__writeScanSummary %s" % sys.exc_info()[1])
+            if os.path.exists(tmpname):
+                try:
+                    os.remove(tmpname)
+                except OSError:
+                    pass
 
     def __getScanList(self):
         aux= self._sourceObjectList[0].list().split(",")
-        newlistcount=[]
+        newlistcount={}
         newlist=[]
         for i in aux:
             if not (":" in i):
@@ -155,10 +351,8 @@ def __getScanList(self):
                 start_index=int(s[0])
                 end_index=int(s[1])
             for j in range(start_index,end_index+1):
-                newlist.append(j)
-                newlistcount.append(newlist.count(j))
-        for i in range(len(newlist)):
-            newlist[i]="%d.%d" % (newlist[i],newlistcount[i])
+                newlistcount[j] = newlistcount.get(j, 0) + 1
+                newlist.append("%d.%d" % (j, newlistcount[j]))
         return newlist
 
     def __getScanType(self, num_pts, num_mca, command):
@@ -774,10 +968,31 @@ def isUpdated(self, sourceName, key):
             return False
         if lastmodified != self.__lastKeyInfo[key]:
             self.__lastKeyInfo[key] = lastmodified
+            self.__updateSource(index)
             return True
         else:
             return False
 
+    def __updateSource(self, index):
+        """
+        Add to the source the scans appended to the file.
+        Only the appended part of the file is analyzed.
+        """
+        source = self._sourceObjectList[index]
+        if not hasattr(source, "update"):
+            # not a SPEC file
+            return
+        try:
+            source.update()
+        except:
+            if DEBUG:
+                print("__updateSource %s" % sys.exc_info()[1])
+            return
+        self.__fileSizeList[index] = \
+                                os.path.getsize(self.__sourceNameList[index])
+        self.__fileMTimeList[index] = \
+                                os.path.getmtime(self.__sourceNameList[index])
+
 source_types = { SOURCE_TYPE: SpecFileDataSource}
 
 def DataSource(name="", source_type=SOURCE_TYPE):
@@ -31,6 +31,8 @@
 __license__ = "MIT"
 __copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
 import copy
+import time
+import numpy
 from . import DataObject
 from PyMca5.PyMcaIO import spswrap as sps
 
@@ -39,12 +41,21 @@
 
 
 class SpsDataSource(object):
-    def __init__(self, name):
+    def __init__(self, name, zerocopy=False):
+        """
+        :param name: Spec version or shared memory source name
+        :param zerocopy: If True, the shared memory is read through a
+                         read-only view and only the selected data are
+                         copied into the returned data objects.
+        """
         if not isinstance(name, str):
             raise TypeError("Constructor needs string as first argument")
         self.name = name
         self.sourceName = name
         self.sourceType = SOURCE_TYPE
+        self.zeroCopy = zerocopy
+        # last update counter seen for each array
+        self._updateCounters = {}
 
     def refresh(self):
         pass
@@ -83,7 +94,11 @@ def getDataObject(self, key_list, selection=None):
                 data = DataObject.DataObject()
                 data.info = self.__getArrayInfo(key)
                 data.info['selection'] = selection
-                data.data = sps.getdata(self.name, key)
+                self._updateCounters[key] = data.info['updatecounter']
+                if self.zeroCopy:
+                    data.data = sps.getdataview(self.name, key)
+                else:
+                    data.data = sps.getdata(self.name, key)
                 if nolist:
                     if selection is not None:
                         scantest = (data.info['flag'] &
@@ -154,7 +169,7 @@ def getDataObject(self, key_list, selection=None):
                                 data.info['selection']['cntlist'] = data.info['LabelNames']
                                 selection = newSelection
                             data.data = None
-                            return data
+                            return self.__copyData(data)
                         if (key in ["XIA_DATA"]) and 'XIA' in selection:
                             if selection["XIA"]:
                                 if 'Detectors' in data.info:
@@ -162,19 +177,35 @@ def getDataObject(self, key_list, selection=None):
                                         selection['rows']['y'][i] = \
                                             data.info['Detectors'].index(selection['rows']['y'][i]) + 1
                                     del selection['XIA']
-                        return data.select(selection)
+                        return self.__copyData(data.select(selection))
                     else:
                         if data.data is not None:
                             data.info['selectiontype'] = "%dD" % len(data.data.shape)
                             if data.info['selectiontype'] == "2D":
                                 data.info["imageselection"] = True
-                        return data
+                        return self.__copyData(data)
                 else:
-                    output.append(data.select(selection))
+                    output.append(self.__copyData(data.select(selection)))
             return output
         else:
             return None
 
+    def __copyData(self, dataObject):
+        """
+        Replace the views of the shared memory by private copies because
+        the shared memory can be modified by spec at any time.
+        """
+        if not self.zeroCopy:
+            return dataObject
+        if dataObject.data is not None:
+            dataObject.data = numpy.array(dataObject.data, copy=True)
+        for attribute in ["x", "y", "m"]:
+            arrayList = getattr(dataObject, attribute, None)
+            if arrayList is not None:
+                setattr(dataObject, attribute,
+                        [numpy.array(array, copy=True) for array in arrayList])
+        return dataObject
+
     def __getSourceInfo(self):
         arraylist = []
         sourcename = self.name
@@ -337,6 +368,42 @@ def isUpdated(self, sourceName, key):
                     return True
         return False
 
+    def waitForUpdate(self, keyList, timeout=1.0):
+        """
+        Block until any of the given keys, or its environment, is updated
+        or until the timeout expires.
+
+        :param keyList: List of shared memory array names
+        :param timeout: Maximum waiting time in seconds
+        :return: List of the updated keys
+        """
+        if not sps.specrunning(self.name):
+            time.sleep(max(timeout, 0.0))
+            return []
+        arrayList = sps.getarraylist(self.name)
+        arrays = []
+        keys = []
+        for key in keyList:
+            for array in [key, key + "_ENV"]:
+                if array in arrayList:
+                    arrays.append(array)
+                    keys.append(key)
+        counters = []
+        for array in arrays:
+            if array not in self._updateCounters:
+                self._updateCounters[array] = sps.updatecounter(self.name,
+                                                                array)
+            counters.append(self._updateCounters[array])
+        newCounters = sps.waitupdate(self.name, arrays, counters, timeout)
+        updated = []
+        for i, array in enumerate(arrays):
+            if newCounters[i] in [-1, counters[i]]:
+                continue
+            self._updateCounters[array] = newCounters[i]
+            if keys[i] not in updated:
+                updated.append(keys[i])
+        return updated
+
 source_types = {SOURCE_TYPE: SpsDataSource}
 
 
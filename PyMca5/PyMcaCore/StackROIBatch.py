@@ -34,12 +34,18 @@
 Module to calculate a set of ROIs on a stack of data.
 """
 import os
+import sys
 import numpy
+import threading
+import multiprocessing
 from PyMca5.PyMcaIO import ConfigDict
 import time
 
 DEBUG = 0
 
+# number of spectra processed at once by each worker
+SPECTRA_PER_BLOCK = 1000
+
 class StackROIBatch(object):
     def __init__(self):
         self._config = {}
@@ -60,7 +66,8 @@ def setConfigurationFile(self, ffile):
     def batchROIMultipleSpectra(self, x=None, y=None,
                            configuration=None, net=True,
                            xAtMinMax=False, index=None,
-                           xLabel=None):
+                           xLabel=None, dtype=None, output=None,
+                           nThreads=None):
         """
         This method performs the actual fit. The y keyword is the only mandatory input argument.
 
@@ -71,6 +78,10 @@ def batchROIMultipleSpectra(self, x=None, y=None,
         :param xAtMinMax: if True, calculate X at maximum and minimum Y . Default is false.
         :param index: Index of dimension where to apply the ROIs.
         :param xLabel: Type of ROI to be used.
+        :param dtype: Data type of the output images. Default is numpy.float64.
+        :param output: Optional h5py group where the images are written instead of
+                       being kept in memory.
+        :param nThreads: Number of worker threads. Default is the number of CPUs.
         :return: A dictionnary with the images and the image names as keys.
         """
         if y is None:
@@ -141,83 +152,173 @@ def batchROIMultipleSpectra(self, x=None, y=None,
             txt += "three dimensional arrays supported"
             raise NotImplemented(txt)
 
-        if len(data.shape) != 3:
-            txt  = "For the time being only "
-            txt += "three dimensional arrays supported"
-            raise NotImplemented(txt)
-        totalSpectra = 1
-        for i in range(len(data.shape)):
-            if i != index:
-                totalSpectra *= data.shape[i]
-
         if x.size != data.shape[index]:
             raise NotImplemented("All the spectra should share same X axis")
 
-        jStep = min(1000, data.shape[1])
+        # channel limits and names of all the ROIs
         nRois = len(roiList)
-        iXMinList = [None] * nRois
-        iXMaxList = [None] * nRois
-        nRows = data.shape[0]
-        nColumns = data.shape[1]
+        nRows, nColumns, nChannels = data.shape
+        iXMin = numpy.zeros((nRois,), numpy.int64)
+        iXMax = numpy.zeros((nRois,), numpy.int64)
         if xAtMinMax:
-            results = numpy.zeros((nRois * 4, nRows, nColumns), numpy.float)
             names = [None] * 4 * nRois
         else:
-            results = numpy.zeros((nRois * 2, nRows, nColumns), numpy.float)
             names = [None] * 2 * nRois
-        for i in range(0, data.shape[0]):
-            #print(i)
-            #chunks of nColumns spectra
-            if i == 0:
-                chunk = numpy.zeros((jStep,
-                                     data.shape[index]),
-                                     numpy.float)
-                xData = x
-            jStart = 0
-            while jStart < data.shape[1]:
-                jEnd = min(jStart + jStep, data.shape[1])
-                chunk[:(jEnd - jStart)] = data[i, jStart: jEnd]
-                for j, roi in enumerate(roiList):
-                    if i == 0:
-                        roiType = config["ROI"]["roidict"][roi]["type"]
-                        roiLine = roi
-                        roiFrom = config["ROI"]["roidict"][roi]["from"]
-                        roiTo = config["ROI"]["roidict"][roi]["to"]
-                        if roiLine == "ICR":
-                            iXMinList[j] = 0
-                            iXMaxList[j] = data.shape[index]
-                        else:
-                            iXMinList[j] = numpy.nonzero(x <= roiFrom)[0][-1]
-                            iXMaxList[j] = numpy.nonzero(x >= roiTo)[0][0] + 1
-                        names[j] = "ROI " + roiLine
-                        names[j + nRois] = "ROI "+ roiLine + " Net"
-                        if xAtMinMax:
-                            names[j + 2 * nRois] = "ROI "+ roiLine + (" %s at Max." % roiType)
-                            names[j + 3 * nRois] = "ROI "+ roiLine + (" %s at Min." % roiType)
-                    iXMin = iXMinList[j]
-                    iXMax = iXMaxList[j]
-                    #if i == 0:
-                    #    print roi, " iXMin = ", iXMin, "iXMax = ", iXMax  
-                    tmpArray = chunk[:(jEnd - jStart), iXMin : iXMax]
-                    left = tmpArray[:, 0]
-                    right = tmpArray[:, -1]
-                    rawSum = tmpArray.sum(axis=-1, dtype=numpy.float)
-                    netSum = rawSum - (0.5 * (left + right) * (iXMax - iXMin + 1))
-                    results[j][i,:(jEnd - jStart)] = rawSum
-                    results[j + nRois][i,:(jEnd - jStart)] = netSum
-                    if xAtMinMax:
-                        # maxImage
-                        results[j + 2 * nRois][i, :(jEnd - jStart)] = \
-                                 numpy.argmax(tmpArray, axis=1) + iXMin                        
-                        # minImage
-                        results[j + 3 * nRois][i, :(jEnd - jStart)] = \
-                                 numpy.argmin(tmpArray, axis=1) + iXMin                            
-                    
-                jStart = jEnd
+        for j, roi in enumerate(roiList):
+            roiType = config["ROI"]["roidict"][roi]["type"]
+            roiLine = roi
+            roiFrom = config["ROI"]["roidict"][roi]["from"]
+            roiTo = config["ROI"]["roidict"][roi]["to"]
+            if roiLine == "ICR":
+                iXMin[j] = 0
+                iXMax[j] = nChannels
+            else:
+                iXMin[j] = numpy.nonzero(x <= roiFrom)[0][-1]
+                iXMax[j] = numpy.nonzero(x >= roiTo)[0][0] + 1
+            names[j] = "ROI " + roiLine
+            names[j + nRois] = "ROI "+ roiLine + " Net"
+            if xAtMinMax:
+                names[j + 2 * nRois] = "ROI "+ roiLine + (" %s at Max." % roiType)
+                names[j + 3 * nRois] = "ROI "+ roiLine + (" %s at Min." % roiType)
+
+        # output images
+        if dtype is None:
+            dtype = numpy.float64
+        shape = (len(names), nRows, nColumns)
+        if output is None:
+            results = numpy.zeros(shape, dtype)
+        else:
+            results = output.create_dataset("images", shape, dtype=dtype,
+                                    chunks=(1, min(nRows, 64), nColumns),
+                                    fillvalue=0)
+            output.create_dataset("names",
+                                  data=numpy.array(names).astype(numpy.string_))
+
+        # blocks of about SPECTRA_PER_BLOCK spectra
+        tasks = []
+        if nColumns >= SPECTRA_PER_BLOCK:
+            for i in range(nRows):
+                for jStart in range(0, nColumns, SPECTRA_PER_BLOCK):
+                    tasks.append((i, i + 1,
+                                  jStart, min(jStart + SPECTRA_PER_BLOCK, nColumns)))
+        else:
+            iStep = max(1, SPECTRA_PER_BLOCK // max(1, nColumns))
+            for iStart in range(0, nRows, iStep):
+                tasks.append((iStart, min(iStart + iStep, nRows), 0, nColumns))
+
+        def roiBlock(iStart, iEnd, jStart, jEnd):
+            results[:, iStart:iEnd, jStart:jEnd] = \
+                        calculateROIBlock(data[iStart:iEnd, jStart:jEnd],
+                                          iXMin, iXMax,
+                                          xAtMinMax=xAtMinMax,
+                                          dtype=dtype)
+
+        if nThreads is None:
+            nThreads = multiprocessing.cpu_count()
+        _runTasks(roiBlock, tasks, nThreads)
+        if DEBUG:
+            print("ROI images calculated in %f seconds" % (time.time() - t0))
         outputDict = {'images':results,
                       'names':names}
         return outputDict
 
+def calculateROIBlock(block, iXMin, iXMax, xAtMinMax=False, dtype=None):
+    """
+    Calculate all the ROIs of a block of spectra in a single pass.
+
+    :param block: Array of spectra. The last dimension is the channel dimension.
+    :param iXMin: 1D array with the first channel of each ROI.
+    :param iXMax: 1D array with the channel following the last one of each ROI.
+    :param xAtMinMax: if True, calculate channel at maximum and minimum.
+    :param dtype: Data type of the output. Default is numpy.float64.
+    :return: Array [nImages, ...] with the raw sums, the net sums and,
+             if requested, the channels at maximum and at minimum.
+    """
+    if dtype is None:
+        dtype = numpy.float64
+    block = numpy.asarray(block)
+    outputShape = block.shape[:-1]
+    nChannels = block.shape[-1]
+    block = block.reshape(-1, nChannels)
+    nSpectra = block.shape[0]
+    nRois = len(iXMin)
+    if xAtMinMax:
+        nImages = 4 * nRois
+    else:
+        nImages = 2 * nRois
+    result = numpy.empty((nImages, nSpectra), dtype)
+    if not nRois:
+        result.shape = (nImages,) + outputShape
+        return result
+    # sum once the segments between consecutive ROI limits, the sum of
+    # any ROI is then the difference of two cumulated segment sums
+    spanEnd = int(numpy.max(iXMax))
+    limits = numpy.unique(numpy.concatenate((iXMin, iXMax)))
+    limits = limits[limits < spanEnd]
+    segments = numpy.add.reduceat(block[:, :spanEnd], limits,
+                                  axis=1, dtype=numpy.float64)
+    cumulated = numpy.zeros((nSpectra, limits.size + 1), numpy.float64)
+    numpy.cumsum(segments, axis=1, out=cumulated[:, 1:])
+    rawSum = cumulated[:, numpy.searchsorted(limits, iXMax)] - \
+             cumulated[:, numpy.searchsorted(limits, iXMin)]
+    result[:nRois] = rawSum.T
+    # integer stacks would wrap around when adding the edges
+    left = block[:, iXMin].astype(numpy.float64)
+    right = block[:, iXMax - 1].astype(numpy.float64)
+    result[nRois:2 * nRois] = (rawSum - 0.5 * (left + right) * \
+                               (iXMax - iXMin + 1)).T
+    if xAtMinMax:
+        # the channels of all the ROIs one after the other
+        widths = iXMax - iXMin
+        starts = numpy.zeros((nRois,), numpy.int64)
+        numpy.cumsum(widths[:-1], out=starts[1:])
+        channels = numpy.arange(int(widths.sum()), dtype=numpy.int64) - \
+                   numpy.repeat(starts - iXMin, widths)
+        roiData = block[:, channels]
+        # first channel reaching the extreme value of each ROI
+        for reduction, offset in [(numpy.maximum, 2 * nRois),
+                                  (numpy.minimum, 3 * nRois)]:
+            extreme = reduction.reduceat(roiData, starts, axis=1)
+            candidates = numpy.where(roiData == \
+                                     numpy.repeat(extreme, widths, axis=1),
+                                     channels, nChannels)
+            result[offset:offset + nRois] = \
+                    numpy.minimum.reduceat(candidates, starts, axis=1).T
+    result.shape = (nImages,) + outputShape
+    return result
+
+def _runTasks(function, tasks, nThreads):
+    """
+    Call function(*task) for every task using nThreads worker threads.
+    """
+    nThreads = min(nThreads, len(tasks))
+    if nThreads < 2:
+        for task in tasks:
+            function(*task)
+        return
+    taskIterator = iter(tasks)
+    lock = threading.Lock()
+    errors = []
+    def worker():
+        while not len(errors):
+            with lock:
+                try:
+                    task = next(taskIterator)
+                except StopIteration:
+                    return
+            try:
+                function(*task)
+            except:
+                errors.append(sys.exc_info()[1])
+                return
+    threadList = [threading.Thread(target=worker) for i in range(nThreads)]
+    for thread in threadList:
+        thread.start()
+    for thread in threadList:
+        thread.join()
+    if len(errors):
+        raise errors[0]
+
 def getFileListFromPattern(pattern, begin, end, increment=None):
     if type(begin) == type(1):
         begin = [begin]
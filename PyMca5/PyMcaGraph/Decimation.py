@@ -0,0 +1,142 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2015 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+__author__ = "V.A. Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+__doc__ = """
+Min/max decimation of long curves.
+
+A MinMaxPyramid keeps, for blocks of increasing size, the indices of the
+minimum and the maximum of the curve. Serving a given X range at a given
+screen width only requires picking the level giving a few blocks
+per pixel column and returning the corresponding points. The extrema are
+actual data points, so peaks are preserved exactly at any zoom level.
+"""
+import numpy
+from . import ctools
+
+DEBUG = 0
+
+
+class MinMaxPyramid(object):
+    def __init__(self, x, y, blockSize=16):
+        """
+        :param x: Monotonically increasing abscissa
+        :type x: 1D numpy array
+        :param y: Ordinate values, same length as x
+        :type y: 1D numpy array
+        :param blockSize: Number of points per block at the finest level
+        :type blockSize: int (default 16)
+        """
+        x = numpy.asarray(x).ravel()
+        y = numpy.asarray(y).ravel()
+        if x.size != y.size:
+            raise ValueError("x and y must have the same number of points")
+        if not x.size:
+            raise ValueError("Cannot decimate an empty curve")
+        if x.size > 1:
+            if (x[1:] < x[:-1]).any():
+                raise ValueError("x must be monotonically increasing")
+        self._x = x
+        self._y = y
+        self._blockSize = max(int(blockSize), 2)
+        self._levels = []
+
+        argMin, argMax = ctools.minMaxBlocks(y, self._blockSize)
+        self._levels.append((argMin, argMax))
+        isFloat = y.dtype.kind == "f"
+        while argMin.size > 1:
+            argMin = self._combine(argMin, numpy.less, isFloat)
+            argMax = self._combine(argMax, numpy.greater, isFloat)
+            self._levels.append((argMin, argMax))
+        # curve extremes plus end points
+        self._extremes = numpy.array([0, argMin[0], argMax[0], x.size - 1],
+                                     dtype=numpy.int64)
+
+    def _combine(self, indices, better, isFloat):
+        if indices.size % 2:
+            indices = numpy.append(indices, indices[-1])
+        first = indices[0::2]
+        second = indices[1::2]
+        yFirst = self._y[first]
+        ySecond = self._y[second]
+        useSecond = better(ySecond, yFirst)
+        if isFloat:
+            useSecond |= numpy.isnan(yFirst) & ~numpy.isnan(ySecond)
+        return numpy.where(useSecond, second, first)
+
+    def getLevelBlockSize(self, level):
+        return self._blockSize * (2 ** level)
+
+    def getNumberOfLevels(self):
+        return len(self._levels)
+
+    def getIndices(self, xmin, xmax, width):
+        """
+        Indices of the points to display to render the range [xmin, xmax]
+        on width pixel columns.
+
+        One point beyond each side of the range is always included in
+        order to draw the lines crossing the borders. The end points and
+        the global extremes of the curve are always included too, so the
+        data limits of the decimated curve are those of the full curve.
+        """
+        x = self._x
+        nPoints = x.size
+        i0 = max(int(numpy.searchsorted(x, xmin, side="left")) - 1, 0)
+        i1 = min(int(numpy.searchsorted(x, xmax, side="right")) + 1, nPoints)
+        if i1 <= i0:
+            return self._extremes.copy()
+        width = max(int(width), 1)
+        nVisible = i1 - i0
+
+        # coarsest level still giving at least four blocks per pixel column
+        level = -1
+        for i in range(len(self._levels)):
+            if nVisible < 4 * width * self.getLevelBlockSize(i):
+                break
+            level = i
+        if level < 0:
+            indices = numpy.arange(i0, i1, dtype=numpy.int64)
+        else:
+            blockSize = self.getLevelBlockSize(level)
+            argMin, argMax = self._levels[level]
+            j0 = i0 // blockSize
+            j1 = (i1 - 1) // blockSize + 1
+            indices = numpy.concatenate((argMin[j0:j1], argMax[j0:j1]))
+        return numpy.unique(numpy.concatenate((indices, self._extremes)))
+
+    def getData(self, xmin, xmax, width):
+        """
+        Decimated (x, y) arrays to render the range [xmin, xmax] on width
+        pixel columns.
+        """
+        indices = self.getIndices(xmin, xmax, width)
+        return self._x[indices], self._y[indices]
@@ -0,0 +1,461 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2015 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+__author__ = "V.A. Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+__doc__ = """
+Tiled multi-resolution representation of huge images.
+
+Level 0 is the image itself (a numpy array, an HDF5 dataset or any object
+supporting shape and slicing), each following level halves the size of the
+previous one. Levels are split in square tiles computed on request from the
+four tiles below them, so only the tiles actually displayed are computed and
+at most a few tiles of the original image are in memory at any time.
+Computed tiles are kept in a bounded memory cache and, optionally, stored
+in an HDF5 group in order to be reused later on. A stored pyramid is only
+reused if it was built with the same tile size from the same source.
+
+Scalar images are reduced averaging the finite values, RGB(A) images
+averaging each channel.
+"""
+import math
+import hashlib
+import numpy
+from collections import OrderedDict
+from . import ctools
+
+DEBUG = 0
+
+
+class ImagePyramid(object):
+    def __init__(self, data, tileSize=512, h5Group=None,
+                 cacheSize=256 * 1024 * 1024):
+        """
+        :param data: (nrows, ncolumns) data or (nrows, ncolumns, RGB(A))
+                     ubyte array. HDF5 datasets are read tile by tile.
+        :type data: numpy.ndarray or h5py.Dataset
+        :param tileSize: Tile width and height in pixels
+        :type tileSize: int (default 512)
+        :param h5Group: Group in which computed tiles are stored (or None)
+        :type h5Group: h5py.Group or None (default)
+        :param cacheSize: Memory available for computed tiles in bytes
+        :type cacheSize: int
+        """
+        shape = tuple(data.shape)
+        if len(shape) == 2:
+            self._channels = None
+        elif (len(shape) == 3) and (shape[2] in [3, 4]):
+            self._channels = shape[2]
+        else:
+            raise ValueError("Expected a 2D image or an RGB(A) image")
+        if (shape[0] < 1) or (shape[1] < 1):
+            raise ValueError("Cannot build the pyramid of an empty image")
+        tileSize = int(tileSize)
+        if tileSize < 2:
+            raise ValueError("Tile size must be at least 2")
+        self._data = data
+        self._tileSize = tileSize
+        self._cacheSize = cacheSize
+        self._cache = OrderedDict()
+        self._cacheBytes = 0
+        self._minMax = None
+        self._displayFunction = None
+
+        sourceDtype = numpy.dtype(data.dtype)
+        if self._channels is not None:
+            self._dtype = sourceDtype
+        elif sourceDtype == numpy.float32:
+            self._dtype = numpy.dtype(numpy.float32)
+        else:
+            self._dtype = numpy.dtype(numpy.float64)
+        self._sourceDtype = sourceDtype
+
+        self._shapes = [shape[:2]]
+        while max(self._shapes[-1]) > tileSize:
+            rows, columns = self._shapes[-1]
+            self._shapes.append(((rows + 1) // 2, (columns + 1) // 2))
+
+        self._h5Group = h5Group
+        self._h5Done = {}
+        if h5Group is not None:
+            self._initializeH5Storage()
+
+    # Information
+    def getShape(self):
+        return tuple(self._data.shape)
+
+    def getTileSize(self):
+        return self._tileSize
+
+    def getNumberOfLevels(self):
+        return len(self._shapes)
+
+    def getLevelShape(self, level):
+        return self._shapes[level]
+
+    def getLevelDtype(self, level):
+        if level == 0:
+            return self._sourceDtype
+        return self._dtype
+
+    def getNumberOfTiles(self, level):
+        rows, columns = self._shapes[level]
+        tileSize = self._tileSize
+        return (rows + tileSize - 1) // tileSize, \
+               (columns + tileSize - 1) // tileSize
+
+    def isRGBA(self):
+        return self._channels is not None
+
+    def setDisplayFunction(self, function):
+        """
+        Set the conversion applied to the regions sent to the display.
+
+        :param function: Callable receiving a region and its position
+                         (region, level, row0, column0) and returning the
+                         array to display, typically the RGBA rendering
+                         of a scalar region, or None to display the
+                         regions themselves.
+        """
+        self._displayFunction = function
+
+    def getDisplayFunction(self):
+        return self._displayFunction
+
+    def getLevelForScale(self, scale):
+        """
+        Coarsest level keeping at least one image pixel per screen pixel.
+
+        :param scale: Number of image pixels per screen pixel
+        :type scale: float
+        """
+        if not (scale > 1.0):
+            return 0
+        level = int(math.floor(math.log(scale, 2)))
+        return min(level, len(self._shapes) - 1)
+
+    # Data access
+    def getTile(self, level, row, column):
+        """
+        Tile of the given level as a numpy array. Tiles at the right and
+        bottom borders may be smaller than the tile size.
+        """
+        if level == 0:
+            return self._getSourceTile(row, column)
+        key = (level, row, column)
+        if key in self._cache:
+            tile = self._cache.pop(key)
+            self._cache[key] = tile
+            return tile
+        tile = self._readH5Tile(level, row, column)
+        if tile is None:
+            tile = self._computeTile(level, row, column)
+            self._writeH5Tile(level, row, column, tile)
+        self._addToCache(key, tile)
+        return tile
+
+    def getRegion(self, level, row0, row1, column0, column1):
+        """
+        Region [row0:row1, column0:column1] of the given level (in pixels
+        of that level) assembled from the tiles it intersects.
+        """
+        rows, columns = self._shapes[level]
+        row0 = max(int(row0), 0)
+        row1 = min(int(row1), rows)
+        column0 = max(int(column0), 0)
+        column1 = min(int(column1), columns)
+        if (row1 <= row0) or (column1 <= column0):
+            raise ValueError("Empty region requested")
+        shape = [row1 - row0, column1 - column0]
+        if self._channels is not None:
+            shape.append(self._channels)
+        region = numpy.empty(shape, dtype=self.getLevelDtype(level))
+        tileSize = self._tileSize
+        for tileRow in range(row0 // tileSize, (row1 - 1) // tileSize + 1):
+            tileRow0 = tileRow * tileSize
+            for tileColumn in range(column0 // tileSize,
+                                    (column1 - 1) // tileSize + 1):
+                tileColumn0 = tileColumn * tileSize
+                tile = self.getTile(level, tileRow, tileColumn)
+                r0 = max(row0, tileRow0)
+                r1 = min(row1, tileRow0 + tile.shape[0])
+                c0 = max(column0, tileColumn0)
+                c1 = min(column1, tileColumn0 + tile.shape[1])
+                region[r0 - row0:r1 - row0, c0 - column0:c1 - column0] = \
+                    tile[r0 - tileRow0:r1 - tileRow0,
+                         c0 - tileColumn0:c1 - tileColumn0]
+        return region
+
+    def getLevel(self, level):
+        rows, columns = self._shapes[level]
+        return self.getRegion(level, 0, rows, 0, columns)
+
+    def getDisplayRegion(self, level, row0, row1, column0, column1):
+        """
+        Region of the given level converted by the display function.
+        """
+        region = self.getRegion(level, row0, row1, column0, column1)
+        if self._displayFunction is None:
+            return region
+        return self._displayFunction(region, level, max(int(row0), 0),
+                                     max(int(column0), 0))
+
+    def getView(self, rowRange, columnRange, width, height):
+        """
+        Region to display in order to render the given range of the image
+        on width x height screen pixels.
+
+        :param rowRange: First and last rows of the image (level 0 pixels)
+        :param columnRange: First and last columns of the image
+        :param width: Number of screen pixels available for the columns
+        :param height: Number of screen pixels available for the rows
+        :returns: (level, row0, row1, column0, column1) in pixels of the
+                  returned level, or None if the range is out of the image.
+        """
+        rows, columns = self._shapes[0]
+        row0 = max(int(math.floor(min(rowRange))), 0)
+        row1 = min(int(math.ceil(max(rowRange))), rows)
+        column0 = max(int(math.floor(min(columnRange))), 0)
+        column1 = min(int(math.ceil(max(columnRange))), columns)
+        if (row1 <= row0) or (column1 <= column0):
+            return None
+        scale = min((column1 - column0) / float(max(width, 1)),
+                    (row1 - row0) / float(max(height, 1)))
+        level = self.getLevelForScale(scale)
+        factor = 2 ** level
+        rows, columns = self._shapes[level]
+        # one pixel margin to avoid holes at the borders while panning
+        row0 = max(row0 // factor - 1, 0)
+        row1 = min((row1 + factor - 1) // factor + 1, rows)
+        column0 = max(column0 // factor - 1, 0)
+        column1 = min((column1 + factor - 1) // factor + 1, columns)
+        return level, row0, row1, column0, column1
+
+    # Statistics
+    def getMinMax(self, minPositive=False):
+        """
+        Minimum and maximum of the finite values of the image, computed
+        once tile by tile.
+
+        :returns: (min, max) or (min, minPositive, max) if minPositive is
+                  True. minPositive is None if there are no positive values.
+                  Values are None if the image has no finite values.
+        """
+        if self._channels is not None:
+            raise ValueError("No statistics for RGB(A) images")
+        if self._minMax is None:
+            self._minMax = self._computeMinMax()
+        if minPositive:
+            return self._minMax
+        return self._minMax[0], self._minMax[2]
+
+    def _computeMinMax(self):
+        dataMin = None
+        dataMinPositive = None
+        dataMax = None
+        tileRows, tileColumns = self.getNumberOfTiles(0)
+        for row in range(tileRows):
+            for column in range(tileColumns):
+                tile = self._getSourceTile(row, column)
+                if tile.dtype.kind == "f":
+                    finite = numpy.isfinite(tile)
+                    if not finite.all():
+                        tile = tile[finite]
+                        if not tile.size:
+                            continue
+                tileMin, tileMinPositive, tileMax = \
+                                    ctools.minMax(tile, minPositive=True)
+                if dataMin is None:
+                    dataMin, dataMax = tileMin, tileMax
+                else:
+                    dataMin = min(dataMin, tileMin)
+                    dataMax = max(dataMax, tileMax)
+                if tileMinPositive is not None:
+                    if dataMinPositive is None:
+                        dataMinPositive = tileMinPositive
+                    else:
+                        dataMinPositive = min(dataMinPositive,
+                                              tileMinPositive)
+        return dataMin, dataMinPositive, dataMax
+
+    # Tile computation
+    def _getSourceTile(self, row, column):
+        tileSize = self._tileSize
+        return numpy.asarray(self._data[row * tileSize:(row + 1) * tileSize,
+                                        column * tileSize:(column + 1) * tileSize])
+
+    def _computeTile(self, level, row, column):
+        # the four tiles below make a block twice the tile size
+        rows, columns = self._shapes[level - 1]
+        tileSize = self._tileSize
+        row0 = 2 * row * tileSize
+        column0 = 2 * column * tileSize
+        block = self.getRegion(level - 1,
+                               row0, min(row0 + 2 * tileSize, rows),
+                               column0, min(column0 + 2 * tileSize, columns))
+        return self._downsample(block)
+
+    def _downsample(self, block):
+        rows, columns = block.shape[:2]
+        padRows = rows % 2
+        padColumns = columns % 2
+        if self._channels is not None:
+            if padRows or padColumns:
+                block = numpy.pad(block,
+                                  ((0, padRows), (0, padColumns), (0, 0)),
+                                  mode="edge")
+            block = block.reshape(block.shape[0] // 2, 2,
+                                  block.shape[1] // 2, 2, self._channels)
+            result = block.mean(axis=(1, 3), dtype=numpy.float32)
+            if self._dtype.kind in "iu":
+                result = numpy.rint(result)
+            return result.astype(self._dtype)
+        block = numpy.asarray(block, dtype=self._dtype)
+        if padRows or padColumns:
+            block = numpy.pad(block, ((0, padRows), (0, padColumns)),
+                              mode="constant", constant_values=numpy.nan)
+        block = block.reshape(block.shape[0] // 2, 2, block.shape[1] // 2, 2)
+        finite = numpy.isfinite(block)
+        if finite.all():
+            return block.mean(axis=(1, 3), dtype=self._dtype)
+        counts = finite.sum(axis=(1, 3))
+        total = numpy.where(finite, block, 0).sum(axis=(1, 3),
+                                                  dtype=self._dtype)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            result = total / counts
+        return result.astype(self._dtype)
+
+    def _addToCache(self, key, tile):
+        self._cache[key] = tile
+        self._cacheBytes += tile.nbytes
+        while (self._cacheBytes > self._cacheSize) and (len(self._cache) > 1):
+            oldKey, oldTile = self._cache.popitem(last=False)
+            self._cacheBytes -= oldTile.nbytes
+
+    # HDF5 storage
+    def _getSourceIdentifier(self):
+        """
+        Text identifying the source data: the file and the name of HDF5
+        datasets, a checksum of a sample of the values otherwise.
+        """
+        data = self._data
+        try:
+            return "%s::%s" % (data.file.filename, data.name)
+        except AttributeError:
+            pass
+        rows, columns = self._shapes[0]
+        sample = numpy.asarray(data[::max(rows // 64, 1),
+                                    ::max(columns // 64, 1)])
+        checksum = hashlib.md5(numpy.ascontiguousarray(sample).tobytes())
+        return "md5:" + checksum.hexdigest()
+
+    def _isH5StorageValid(self, sourceId):
+        """
+        Check the pyramid stored in the group was built from the same
+        source with the same tile size.
+        """
+        attrs = self._h5Group.attrs
+        try:
+            if int(attrs["tile_size"]) != self._tileSize:
+                return False
+            if tuple(attrs["source_shape"]) != tuple(self._data.shape):
+                return False
+            if numpy.dtype(str(attrs["source_dtype"])) != self._sourceDtype:
+                return False
+            storedId = attrs["source_id"]
+            if hasattr(storedId, "decode"):
+                storedId = storedId.decode("utf-8")
+            return storedId == sourceId
+        except KeyError:
+            return False
+
+    def _initializeH5Storage(self):
+        group = self._h5Group
+        tileSize = self._tileSize
+        sourceId = self._getSourceIdentifier()
+        if not self._isH5StorageValid(sourceId):
+            # built from another source or with another tile size
+            for name in list(group.keys()):
+                if name.startswith("level"):
+                    del group[name]
+        for level in range(1, len(self._shapes)):
+            shape = list(self._shapes[level])
+            chunks = [min(tileSize, shape[0]), min(tileSize, shape[1])]
+            if self._channels is not None:
+                shape.append(self._channels)
+                chunks.append(self._channels)
+            name = "level%d" % level
+            doneName = "level%d_done" % level
+            if name in group:
+                dataset = group[name]
+                if (tuple(dataset.shape) != tuple(shape)) or \
+                   (dataset.dtype != self._dtype):
+                    raise ValueError("HDF5 group contains an incompatible "
+                                     "pyramid at level %d" % level)
+                self._h5Done[level] = group[doneName][()]
+            else:
+                if self._dtype.kind == "f":
+                    fillValue = numpy.nan
+                else:
+                    fillValue = 0
+                group.create_dataset(name,
+                                     shape=tuple(shape),
+                                     dtype=self._dtype,
+                                     chunks=tuple(chunks),
+                                     fillvalue=fillValue)
+                done = numpy.zeros(self.getNumberOfTiles(level),
+                                   dtype=numpy.uint8)
+                group.create_dataset(doneName, data=done)
+                self._h5Done[level] = done
+        group.attrs["tile_size"] = tileSize
+        group.attrs["source_shape"] = numpy.array(self._data.shape,
+                                                  dtype=numpy.int64)
+        group.attrs["source_dtype"] = self._sourceDtype.str
+        group.attrs["source_id"] = sourceId
+
+    def _readH5Tile(self, level, row, column):
+        if self._h5Group is None:
+            return None
+        if not self._h5Done[level][row, column]:
+            return None
+        tileSize = self._tileSize
+        dataset = self._h5Group["level%d" % level]
+        return dataset[row * tileSize:(row + 1) * tileSize,
+                       column * tileSize:(column + 1) * tileSize]
+
+    def _writeH5Tile(self, level, row, column, tile):
+        if self._h5Group is None:
+            return
+        tileSize = self._tileSize
+        dataset = self._h5Group["level%d" % level]
+        dataset[row * tileSize:row * tileSize + tile.shape[0],
+                column * tileSize:column * tileSize + tile.shape[1]] = tile
+        self._h5Done[level][row, column] = 1
+        self._h5Group["level%d_done" % level][row, column] = 1
@@ -44,6 +44,13 @@
 from . import PlotBase
 from . import PlotBackend
 from . import Colors
+try:
+    from . import Decimation
+    from . import ImagePyramid
+except ImportError:
+    # compiled ctools not available
+    Decimation = None
+    ImagePyramid = None
 
 DEBUG = 0
 if DEBUG:
@@ -118,6 +125,16 @@ class Plot(PlotBase.PlotBase):
     colorList = _COLORLIST
     colorDict = _COLORDICT
 
+    # curves with more points than this are sent decimated to the backend
+    # (set to None to disable decimation)
+    decimationThreshold = 65536
+    # images with more pixels than this are sent tiled to the backend
+    # (set to None to disable tiling)
+    imagePyramidThreshold = 4096 * 4096
+    # plot size in pixels used when the backend cannot tell it
+    decimationWidth = 2048
+    decimationHeight = 2048
+
     def __init__(self, parent=None, backend=None, callback=None):
         self._parent = parent
         if backend is None:
@@ -152,6 +169,10 @@ def __init__(self, parent=None, backend=None, callback=None):
         else:
             self.widget_ = widget
 
+        # decimated curves and tiled images handling
+        self._decimationDict = {}
+        self._imagePyramidDict = {}
+
         self.setCallback(callback)
 
         self.setLimits = self._plot.setLimits
@@ -224,9 +245,18 @@ def getWidgetHandle(self):
 
     def setCallback(self, callbackFunction):
         if callbackFunction is None:
-            self._plot.setCallback(self.graphCallback)
+            self._callbackFunction = self.graphCallback
         else:
-            self._plot.setCallback(callbackFunction)
+            self._callbackFunction = callbackFunction
+        self._plot.setCallback(self._plotCallback)
+
+    def _plotCallback(self, ddict):
+        # serve the decimated curves and tiled images at the new zoom
+        # before forwarding
+        if ddict.get('event', None) == 'limitsChanged':
+            self._updateDecimatedCurves(ddict['xdata'])
+            self._updateImagePyramids(ddict['xdata'], ddict['ydata'])
+        return self._callbackFunction(ddict)
 
     def graphCallback(self, ddict=None):
         """
@@ -415,6 +445,7 @@ def addCurve(self, x, y, legend=None, info=None, replace=False, replot=True,
         if replace:
             self._curveList = []
             self._curveDict = {}
+            self._decimationDict = {}
             self._colorIndex = 0
             self._styleIndex = 0
             self._plot.clearCurves()
@@ -503,20 +534,35 @@ def addCurve(self, x, y, legend=None, info=None, replace=False, replot=True,
         if selectable is None:
             selectable = info.get("plot_selectable", True)
         info["plot_selectable"] = selectable
+        if key in self._decimationDict:
+            del self._decimationDict[key]
         if len(xplot):
+            backendKw = dict(color=colorplot,
+                             symbol=info["plot_symbol"],
+                             linestyle=info["plot_linestyle"],
+                             xlabel=info["xlabel"],
+                             ylabel=info["ylabel"],
+                             yaxis=yaxis,
+                             xerror=xerror,
+                             yerror=yerror,
+                             z=info["plot_z"],
+                             selectable=info["plot_selectable"],
+                             **kw)
+            pyramid = self._getDecimationPyramid(xplot, yplot, backendKw)
+            if pyramid is not None:
+                # start with the full range, limitsChanged refines it
+                width = self._getPlotSize()[0]
+                xRange = xplot[0], xplot[-1]
+                indices = pyramid.getIndices(xRange[0], xRange[1], width)
+                self._decimationDict[key] = {'pyramid': pyramid,
+                                             'kw': backendKw,
+                                             'range': (xRange, width),
+                                             'indices': indices}
+                xplot = xplot[indices]
+                yplot = yplot[indices]
             curveHandle = self._plot.addCurve(xplot, yplot, key, info,
                                               replot=False, replace=replace,
-                                              color=colorplot,
-                            symbol=info["plot_symbol"],
-                            linestyle=info["plot_linestyle"],
-                            xlabel=info["xlabel"],
-                            ylabel=info["ylabel"],
-                            yaxis=yaxis,
-                            xerror=xerror,
-                            yerror=yerror,
-                            z=info["plot_z"],
-                            selectable=info["plot_selectable"],
-                            **kw)
+                                              **backendKw)
             info['plot_handle'] = curveHandle
         else:
             info['plot_handle'] = key
@@ -538,6 +584,114 @@ def addCurve(self, x, y, legend=None, info=None, replace=False, replot=True,
             #self.replot()
         return key
 
+    def _getDecimationPyramid(self, x, y, backendKw):
+        """
+        Min/max pyramid of the curve if it has to be decimated, None
+        otherwise.
+        """
+        if Decimation is None:
+            return None
+        if not self.decimationThreshold:
+            return None
+        if (x.ndim != 1) or (y.ndim != 1) or (x.size != y.size):
+            return None
+        if x.size <= self.decimationThreshold:
+            return None
+        # per point attributes cannot follow the decimation
+        for attribute in ["color", "xerror", "yerror"]:
+            value = backendKw[attribute]
+            if hasattr(value, "__len__") and not hasattr(value, "lower"):
+                return None
+        try:
+            return Decimation.MinMaxPyramid(x, y)
+        except (ValueError, TypeError, KeyError):
+            # not monotonic or not supported data type
+            if DEBUG:
+                print("Curve not decimated")
+            return None
+
+    def _getPlotSize(self, xRange=None, yRange=None):
+        """
+        Width and height in pixels of the given ranges or of the current
+        ones.
+        """
+        default = self.decimationWidth, self.decimationHeight
+        if type(self._plot).dataToPixel == PlotBackend.PlotBackend.dataToPixel:
+            return default
+        try:
+            if xRange is None:
+                xRange = self.getGraphXLimits()
+            if yRange is None:
+                yRange = self.getGraphYLimits()
+            x0, x1 = self._getInnerPoints(xRange, self.isXAxisLogarithmic())
+            y0, y1 = self._getInnerPoints(yRange, self.isYAxisLogarithmic())
+            pixel0 = self._plot.dataToPixel(x0, y0)
+            pixel1 = self._plot.dataToPixel(x1, y1)
+            if (pixel0 is None) or (pixel1 is None):
+                return default
+            width = int(2 * abs(pixel1[0] - pixel0[0]))
+            height = int(2 * abs(pixel1[1] - pixel0[1]))
+        except Exception:
+            if DEBUG:
+                raise
+            return default
+        if width < 1:
+            width = default[0]
+        if height < 1:
+            height = default[1]
+        return width, height
+
+    def _getInnerPoints(self, dataRange, isLog):
+        # points at one and three quarters of the range, always displayed
+        vmin, vmax = dataRange
+        if isLog and (vmin > 0) and (vmax > vmin):
+            logMin = math.log10(vmin)
+            logDelta = math.log10(vmax) - logMin
+            return pow(10., logMin + 0.25 * logDelta), \
+                   pow(10., logMin + 0.75 * logDelta)
+        return vmin + 0.25 * (vmax - vmin), vmin + 0.75 * (vmax - vmin)
+
+    def _updateDecimatedCurves(self, xRange=None):
+        """
+        Send the decimated curves to the backend at the resolution
+        required by the given X range (or the current one).
+        """
+        if not len(self._decimationDict):
+            return
+        if xRange is None:
+            xRange = self.getGraphXLimits()
+        xRange = tuple(xRange)
+        width = self._getPlotSize(xRange)[0]
+        updated = False
+        for key in list(self._decimationDict.keys()):
+            if self.isCurveHidden(key) or (key not in self._curveDict):
+                continue
+            entry = self._decimationDict[key]
+            if entry['range'] == (xRange, width):
+                continue
+            entry['range'] = (xRange, width)
+            indices = entry['pyramid'].getIndices(xRange[0], xRange[1],
+                                                  width)
+            if numpy.array_equal(indices, entry['indices']):
+                continue
+            entry['indices'] = indices
+            xplot, yplot = entry['pyramid'].getData(xRange[0], xRange[1],
+                                                    width)
+            info = self._curveDict[key][3]
+            self._plot.removeCurve(key, replot=False)
+            info['plot_handle'] = self._plot.addCurve(xplot, yplot, key,
+                                                      info,
+                                                      replot=False,
+                                                      replace=False,
+                                                      **entry['kw'])
+            if self.isActiveCurveHandlingEnabled() and \
+               (key == self.getActiveCurve(just_legend=True)):
+                # the new backend curve has to be shown as active again
+                self._plot.setActiveCurve(key, replot=False)
+            updated = True
+        if updated:
+            self.replot()
+
     def addImage(self, data, legend=None, info=None,
                  replace=True, replot=True,
                  xScale=None, yScale=None, z=None,
@@ -592,22 +746,51 @@ def addImage(self, data, legend=None, info=None,
         if z is None:
             z = info.get("plot_z", 0)
 
+        # an image already displayed keeps the current zoom
+        firstAdd = key not in self._imageDict
         if replace:
             self._imageList = []
             self._imageDict = {}
+            self._imagePyramidDict = {}
+        if key in self._imagePyramidDict:
+            del self._imagePyramidDict[key]
         if pixmap is not None:
             dataToSend = pixmap
         else:
             dataToSend = data
         if data is not None:
-            imageHandle = self._plot.addImage(dataToSend, legend=key, info=info,
-                                              replot=False, replace=replace,
-                                              xScale=xScale, yScale=yScale,
-                                              z=z,
-                                              selectable=selectable,
-                                              draggable=draggable,
-                                              colormap=colormap,
-                                              **kw)
+            backendKw = dict(info=info,
+                             xScale=xScale,
+                             yScale=yScale,
+                             z=z,
+                             selectable=selectable,
+                             draggable=draggable,
+                             colormap=colormap,
+                             **kw)
+            pyramid = self._getImagePyramid(dataToSend)
+            if pyramid is None:
+                imageHandle = self._plot.addImage(dataToSend, legend=key,
+                                                  replot=False,
+                                                  replace=replace,
+                                                  **backendKw)
+            else:
+                # colormap autoscale from the pyramid statistics
+                backendKw['colormap'] = self._getPyramidColormap(pyramid,
+                                                                 colormap)
+                entry = {'pyramid': pyramid,
+                         'kw': backendKw,
+                         'view': None}
+                self._imagePyramidDict[key] = entry
+                if firstAdd or replot:
+                    # start with the full image, limitsChanged refines it
+                    view = self._getPyramidView(entry)
+                else:
+                    # same resolution as before for the visible region
+                    view = self._getPyramidView(entry,
+                                                self.getGraphXLimits(),
+                                                self.getGraphYLimits())
+                imageHandle = self._addPyramidImage(key, entry, view,
+                                                    replace=replace)
             info['plot_handle'] = imageHandle
         else:
             info['plot_handle'] = key
@@ -628,6 +811,122 @@ def addImage(self, data, legend=None, info=None,
             #self.replot()
         return key
 
+    def _getImagePyramid(self, data):
+        """
+        Tiled pyramid of the image if it has to be sent by parts, None
+        otherwise.
+        """
+        if ImagePyramid is None:
+            return None
+        if isinstance(data, ImagePyramid.ImagePyramid):
+            return data
+        if not self.imagePyramidThreshold:
+            return None
+        shape = getattr(data, "shape", None)
+        if (shape is None) or (len(shape) not in [2, 3]):
+            return None
+        if (shape[0] * shape[1]) <= self.imagePyramidThreshold:
+            return None
+        try:
+            return ImagePyramid.ImagePyramid(data)
+        except ValueError:
+            if DEBUG:
+                print("Image not tiled")
+            return None
+
+    def _getPyramidColormap(self, pyramid, colormap):
+        """
+        Colormap with the autoscale limits taken from the pyramid, in order
+        to prevent the backend from scanning the whole image.
+        """
+        if pyramid.isRGBA() or (pyramid.getDisplayFunction() is not None):
+            # the displayed regions are not colormapped by the backend
+            return colormap
+        if colormap is None:
+            colormap = self.getDefaultColormap()
+        if (colormap is None) or (not colormap.get('autoscale', True)):
+            return colormap
+        vmin, vminPositive, vmax = pyramid.getMinMax(minPositive=True)
+        if vmin is None:
+            return colormap
+        if colormap.get('normalization', 'linear').startswith('log'):
+            if vminPositive is None:
+                return colormap
+            vmin = vminPositive
+        colormap = colormap.copy()
+        colormap['autoscale'] = False
+        colormap['vmin'] = vmin
+        colormap['vmax'] = vmax
+        return colormap
+
+    def _getPyramidView(self, entry, xRange=None, yRange=None):
+        """
+        Pyramid region needed to display the given ranges or the whole
+        image if the ranges are not given.
+        """
+        pyramid = entry['pyramid']
+        rows, columns = pyramid.getShape()[:2]
+        if (xRange is None) or (yRange is None):
+            width, height = self._getPlotSize()
+            return pyramid.getView((0, rows), (0, columns), width, height)
+        width, height = self._getPlotSize(xRange, yRange)
+        x0, xStep = entry['kw']['xScale'] or (0.0, 1.0)
+        y0, yStep = entry['kw']['yScale'] or (0.0, 1.0)
+        if (xStep == 0) or (yStep == 0):
+            return None
+        columnRange = [(x - x0) / float(xStep) for x in xRange]
+        rowRange = [(y - y0) / float(yStep) for y in yRange]
+        return pyramid.getView(rowRange, columnRange, width, height)
+
+    def _addPyramidImage(self, key, entry, view, replace=False):
+        """
+        Send to the backend the region of the pyramid described by view.
+        """
+        pyramid = entry['pyramid']
+        if view is None:
+            # nothing visible, send the coarsest level
+            level = pyramid.getNumberOfLevels() - 1
+            rows, columns = pyramid.getLevelShape(level)
+            view = level, 0, rows, 0, columns
+        level, row0, row1, column0, column1 = view
+        data = pyramid.getDisplayRegion(level, row0, row1, column0,
+                                         column1)
+        factor = 2 ** level
+        backendKw = entry['kw'].copy()
+        x0, xStep = backendKw['xScale'] or (0.0, 1.0)
+        y0, yStep = backendKw['yScale'] or (0.0, 1.0)
+        backendKw['xScale'] = [x0 + column0 * factor * xStep, factor * xStep]
+        backendKw['yScale'] = [y0 + row0 * factor * yStep, factor * yStep]
+        entry['view'] = view
+        return self._plot.addImage(data, legend=key,
+                                   replot=False, replace=replace,
+                                   **backendKw)
+
+    def _updateImagePyramids(self, xRange=None, yRange=None):
+        """
+        Send to the backend the tiled images at the resolution required
+        by the given ranges or the whole images if no range is given.
+        """
+        if not len(self._imagePyramidDict):
+            return
+        if self.isXAxisLogarithmic() or self.isYAxisLogarithmic():
+            # images are not displayed
+            return
+        updated = False
+        for key in list(self._imagePyramidDict.keys()):
+            if key not in self._imageDict:
+                continue
+            entry = self._imagePyramidDict[key]
+            view = self._getPyramidView(entry, xRange, yRange)
+            if (view is None) or (view == entry['view']):
+                continue
+            info = self._imageDict[key][2]
+            self._plot.removeImage(key, replot=False)
+            info['plot_handle'] = self._addPyramidImage(key, entry, view)
+            updated = True
+        if updated:
+            self.replot()
+
     def removeCurve(self, legend, replot=True):
         """
         Remove the curve associated to the supplied legend from the graph.
@@ -645,6 +944,8 @@ def removeCurve(self, legend, replot=True):
         if legend in self._curveDict:
             handle = self._curveDict[legend][3].get('plot_handle', None)
             del self._curveDict[legend]
+            if legend in self._decimationDict:
+                del self._decimationDict[legend]
             if handle is not None:
                 self._plot.removeCurve(handle, replot=replot)
         if not len(self._curveList):
@@ -668,6 +969,8 @@ def removeImage(self, legend, replot=True):
         if legend in self._imageDict:
             handle = self._imageDict[legend][2].get('plot_handle', None)
             del self._imageDict[legend]
+            if legend in self._imagePyramidDict:
+                del self._imagePyramidDict[legend]
             if handle is not None:
                 self._plot.removeImage(handle, replot=replot)
         return
@@ -1038,11 +1341,13 @@ def replot(self):
     def clear(self):
         self._curveList = []
         self._curveDict = {}
+        self._decimationDict = {}
         self._colorIndex = 0
         self._styleIndex = 0
         self._markerDict = {}
         self._imageList = []
         self._imageDict = {}
+        self._imagePyramidDict = {}
         self._markerList = []
         self._plot.clear()
         self.replot()
@@ -1050,6 +1355,7 @@ def clear(self):
     def clearCurves(self):
         self._curveList = []
         self._curveDict = {}
+        self._decimationDict = {}
         self._colorIndex = 0
         self._styleIndex = 0
         self._plot.clearCurves()
@@ -1061,6 +1367,7 @@ def clearImages(self):
         """
         self._imageList = []
         self._imageDict = {}
+        self._imagePyramidDict = {}
         self._plot.clearImages()
         self.replot()
         return
@@ -1086,6 +1393,8 @@ def setDataMargins(self, xMinMargin=0., xMaxMargin=0.,
     def resetZoom(self, dataMargins=None):
         if dataMargins is None:
             dataMargins = self._defaultDataMargins
+        # the backend limits have to be those of the whole images
+        self._updateImagePyramids()
         self._plot.resetZoom(dataMargins)
 
     def setXAxisAutoScale(self, flag=True):
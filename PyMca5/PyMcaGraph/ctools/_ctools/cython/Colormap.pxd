@@ -40,5 +40,23 @@ cdef extern from "Colormap.h":
                             uint8_t * RGBANaNColor,
                             uint8_t * RGBAPixmapOut) nogil
 
+    void colormapFillPixmapFused(void * data,
+                                 unsigned int type,
+                                 unsigned long length,
+                                 unsigned int autoscale,
+                                 double * startValue,
+                                 double * endValue,
+                                 unsigned int mapping,
+                                 double gamma,
+                                 uint8_t * RGBAColormap,
+                                 unsigned int colormapLength,
+                                 uint8_t * RGBANaNColor,
+                                 uint8_t * mask,
+                                 uint8_t * RGBAMaskColors,
+                                 unsigned int maskColorsLength,
+                                 unsigned int maskStartIndex,
+                                 double blendFactor,
+                                 uint8_t * RGBAPixmapOut) nogil
+
     void initFastLog10() nogil
     double fastLog10(double value) nogil
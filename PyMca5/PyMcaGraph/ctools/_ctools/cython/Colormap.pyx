@@ -31,7 +31,8 @@ cimport numpy as np
 import numpy as np
 
 
-from Colormap cimport colormapFillPixmap, initFastLog10
+from Colormap cimport colormapFillPixmap, colormapFillPixmapFused
+from Colormap cimport initFastLog10
 from Colormap cimport fastLog10 as _fastLog10
 
 from MinMax cimport getMinMax
@@ -138,5 +139,135 @@ def dataToRGBAColormap(data,
     pixmap.shape = data.shape + (4,)
     return pixmap, (c_start, c_end)
 
+# Mappings of dataToRGBAPixmap
+MAPPING_LINEAR = 0
+MAPPING_LOG10 = 1
+MAPPING_GAMMA = 2
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def dataToRGBAPixmap(data,
+                     np.ndarray[np.uint8_t, ndim=2, mode="c"] colormap,
+                     startValue=None, endValue=None,
+                     unsigned int mapping=MAPPING_LINEAR,
+                     double gamma=3.0,
+                     nanColor=None,
+                     mask=None,
+                     maskColors=None,
+                     unsigned int maskStartIndex=0,
+                     double blendFactor=0.8,
+                     out=None):
+    """Compute a pixmap from data, colormap and mask in a single pass.
+
+    Unlike dataToRGBAColormap, autoscale ignores non finite values and
+    these are displayed with nanColor.
+    No temporary array of the size of data is created.
+
+    :param numpy.ndarray data: Array of data value to convert to pixmap.
+    :param numpy.ndarray colormap: palette to use as colormap as an array of
+                                   RGBA color.
+    :param startValue: The value to map to the first color of the colormap.
+                       If None, the min of the finite data.
+    :param endValue: The value to map to the last color of the colormap.
+                     If None, the max of the finite data.
+    :param int mapping: MAPPING_LINEAR, MAPPING_LOG10 or MAPPING_GAMMA.
+    :param float gamma: The exponent of the gamma mapping.
+    :param nanColor: RGBA color to use for non finite values.
+                     If None, the first color of the colormap.
+    :param mask: None or uint8 array of mask levels with the size of data.
+    :param maskColors: RGBA colors of the mask levels as a (N, 4) array.
+    :param int maskStartIndex: The first mask level to blend.
+    :param float blendFactor: Weight of the colormap color in masked pixels.
+    :param out: None or a C contiguous uint8 array of data.size * 4 elements
+                to use as output.
+    :returns: The corresponding pixmap of RGBA pixels as an array of 4 uint8
+              with same dimensions as data and used min and max.
+    :rtype: A tuple : (pixmap , (usedMin, usedMax)).
+    """
+    #Convert float16 to float32
+    if data.dtype.str[1:] == 'f2':
+        data = np.asarray(data, dtype=np.float32)
+    if mapping > MAPPING_GAMMA:
+        raise ValueError("Unknown mapping %d" % mapping)
+
+    cdef np.ndarray c_data = np.ascontiguousarray(data)
+    cdef void * c_dataPtr = c_data.data
+    cdef unsigned long c_dataSize = c_data.size
+    cdef unsigned int c_type = _NUMPY_TO_TYPE_DESC[c_data.dtype.str[1:]]
+
+    cdef unsigned char[:, :] c_colormap = colormap
+    cdef unsigned int c_colormapLength = len(colormap)
+
+    cdef unsigned char * c_nanColorPtr = NULL
+    cdef np.ndarray c_nanColor
+    if nanColor is not None:
+        c_nanColor = np.asarray(nanColor, dtype=np.uint8, order='C')
+        c_nanColorPtr = <unsigned char *> c_nanColor.data
+
+    cdef unsigned char * c_maskPtr = NULL
+    cdef unsigned char * c_maskColorsPtr = NULL
+    cdef unsigned int c_maskColorsLength = 0
+    cdef np.ndarray c_mask
+    cdef np.ndarray c_maskColors
+    if mask is not None:
+        c_mask = np.ascontiguousarray(mask, dtype=np.uint8)
+        if c_mask.size != c_dataSize:
+            raise ValueError("Mask and data sizes differ")
+        if maskColors is None:
+            # Single level mask: black overlay
+            maskColors = np.zeros((2, 4), dtype=np.uint8)
+            maskColors[1, 3] = 255
+            maskStartIndex = max(maskStartIndex, 1)
+        c_maskColors = np.ascontiguousarray(maskColors,
+                                            dtype=np.uint8).reshape(-1, 4)
+        c_maskPtr = <unsigned char *> c_mask.data
+        c_maskColorsPtr = <unsigned char *> c_maskColors.data
+        c_maskColorsLength = len(c_maskColors)
+
+    if out is None:
+        pixmap = np.empty((c_dataSize, 4), dtype=np.uint8)
+    else:
+        pixmap = out
+        if pixmap.dtype != np.uint8 or pixmap.size != 4 * c_dataSize or \
+           not pixmap.flags['C_CONTIGUOUS']:
+            raise ValueError("Output array cannot hold the pixmap")
+        pixmap.shape = c_dataSize, 4
+    cdef unsigned char[:, :] c_pixmap = pixmap
+
+    cdef unsigned int c_autoscale = 0
+    cdef double c_start = 0.0
+    cdef double c_end = 0.0
+    if startValue is None:
+        c_autoscale |= 1
+    else:
+        c_start = startValue
+    if endValue is None:
+        c_autoscale |= 2
+    else:
+        c_end = endValue
+
+    if c_dataSize > 0:
+        with nogil:
+            colormapFillPixmapFused(c_dataPtr,
+                                    c_type,
+                                    c_dataSize,
+                                    c_autoscale,
+                                    &c_start,
+                                    &c_end,
+                                    mapping,
+                                    gamma,
+                                    &c_colormap[0, 0],
+                                    c_colormapLength,
+                                    c_nanColorPtr,
+                                    c_maskPtr,
+                                    c_maskColorsPtr,
+                                    c_maskColorsLength,
+                                    maskStartIndex,
+                                    blendFactor,
+                                    &c_pixmap[0, 0])
+
+    pixmap.shape = data.shape + (4,)
+    return pixmap, (c_start, c_end)
+
 def fastLog10(double value):
     return _fastLog10(value)
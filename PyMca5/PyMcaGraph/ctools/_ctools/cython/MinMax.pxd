@@ -26,6 +26,8 @@
 # THE SOFTWARE.
 #
 #############################################################################*/
+from libc.stdint cimport int64_t
+
 cdef extern from "MinMax.h":
     void getMinMax(void * data,
                    unsigned int type,
@@ -33,3 +35,10 @@ cdef extern from "MinMax.h":
                    double * minOut,
                    double * minPosOut,
                    double * maxOut) nogil
+
+    void getMinMaxBlocks(void * data,
+                         unsigned int type,
+                         unsigned long length,
+                         unsigned long blockSize,
+                         int64_t * argMinOut,
+                         int64_t * argMaxOut) nogil
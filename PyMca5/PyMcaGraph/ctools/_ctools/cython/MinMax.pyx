@@ -30,7 +30,8 @@ cimport cython
 cimport numpy as np
 import numpy as np
 
-from MinMax cimport getMinMax
+from libc.stdint cimport int64_t
+from MinMax cimport getMinMax, getMinMaxBlocks
 
 
 # Convert numpy dtype array-protocol string to bit field to pass to C function
@@ -94,3 +95,48 @@ def minMax(np.ndarray data, bint minPositive=False):
             getMinMax(c_dataPtr, c_type, c_dataSize,
                       &c_dataMin, NULL, &c_dataMax)
         return c_dataMin, c_dataMax
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def minMaxBlocks(np.ndarray data, unsigned long blockSize):
+    """Get the indices of min and max of consecutive blocks of data.
+
+    data is split in blocks of blockSize elements, the last block
+    being possibly shorter.
+    NaNs are ignored while computing min/max.
+    A block made only of NaNs reports its first index as min and max.
+
+    :param np.ndarray data: 1D array of data
+    :param int blockSize: Number of elements per block
+    :returns: (argMin, argMax) arrays of int64 indices in data
+    :rtype: tuple of np.ndarray
+    :raises: ValueError if data is empty or blockSize is 0
+    """
+    #Convert float16 to float32
+    if data.dtype.str[1:] == 'f2':
+        data = np.asarray(data, dtype=np.float32)
+
+    cdef np.ndarray c_data = np.ascontiguousarray(data).ravel()
+    cdef void * c_dataPtr = c_data.data
+    cdef unsigned long c_dataSize = c_data.size
+
+    if c_dataSize == 0:
+        raise ValueError("zero-size array")
+    if blockSize == 0:
+        raise ValueError("blockSize must be a positive integer")
+
+    cdef unsigned long c_nBlocks = (c_dataSize + blockSize - 1) // blockSize
+    cdef np.ndarray[np.int64_t, ndim=1] argMin = \
+        np.empty((c_nBlocks,), dtype=np.int64)
+    cdef np.ndarray[np.int64_t, ndim=1] argMax = \
+        np.empty((c_nBlocks,), dtype=np.int64)
+    cdef int64_t * c_argMinPtr = <int64_t *> argMin.data
+    cdef int64_t * c_argMaxPtr = <int64_t *> argMax.data
+
+    cdef unsigned int c_type = _NUMPY_TO_TYPE_DESC[data.dtype.str[1:]]
+
+    with nogil:
+        getMinMaxBlocks(c_dataPtr, c_type, c_dataSize, blockSize,
+                        c_argMinPtr, c_argMaxPtr)
+    return argMin, argMax
@@ -93,4 +93,66 @@ colormapFillPixmap(void * data,
                    uint8_t * RGBANaNColor,
                    uint8_t * RGBAPixmapOut);
 
+/** Mapping modes of colormapFillPixmapFused */
+#define MAPPING_LINEAR 0
+#define MAPPING_LOG10 1
+#define MAPPING_GAMMA 2
+
+/** Fill a RGBA pixmap from data, with autoscale and mask overlay.
+ *
+ * Fused version of colormapFillPixmap: the range of finite data is
+ * optionally computed, the data is mapped to the colormap and the mask
+ * is blended into the pixmap without any intermediate array.
+ * Work is shared among OpenMP threads if available.
+ *
+ * Non finite values (NaN and +/-inf) are displayed with RGBANaNColor.
+ *
+ * For log10 and gamma mapping, the autoscale range is taken from the
+ * strictly positive data, and data <= startValue gets the first color.
+ *
+ * The mask colors are blended as:
+ * pixel = pixel * blendFactor + maskColor * (1 - blendFactor)
+ * for the pixels with a mask value in [maskStartIndex, maskColorsLength).
+ *
+ * @param data Pointer to the data to convert to colormap.
+ * @param type Bit field describing the data type.
+ * @param length Number of elements in data.
+ * @param autoscale Bit field: 1 to compute startValue, 2 to compute endValue.
+ * @param startValue Pointer to the value of the first color of the colormap.
+ *        Updated with the value used when computed.
+ * @param endValue Pointer to the value of the last color of the colormap.
+ *        Updated with the value used when computed.
+ * @param mapping One of MAPPING_LINEAR, MAPPING_LOG10 or MAPPING_GAMMA.
+ * @param gamma The exponent used for MAPPING_GAMMA.
+ * @param RGBAColormap Pointer the RGBA colormap.
+ * @param colormapLength The number of values in the colormap.
+ * @param RGBANaNColor Pointer to 4 bytes describing the RGBA color
+ *        to use for non finite values.
+ *        If NULL, then the first color of the colormap is used.
+ * @param mask Pointer to length uint8 mask values or NULL.
+ * @param RGBAMaskColors Pointer to the RGBA colors of the mask levels.
+ * @param maskColorsLength The number of colors in RGBAMaskColors.
+ * @param maskStartIndex The first mask level to blend.
+ * @param blendFactor The weight of the colormap color when blending.
+ * @param RGBPixmapOut Pointer to the pixmap to fill (4 * length bytes).
+ */
+void
+colormapFillPixmapFused(void * data,
+                        unsigned int type,
+                        unsigned long length,
+                        unsigned int autoscale,
+                        double * startValue,
+                        double * endValue,
+                        unsigned int mapping,
+                        double gamma,
+                        uint8_t * RGBAColormap,
+                        unsigned int colormapLength,
+                        uint8_t * RGBANaNColor,
+                        uint8_t * mask,
+                        uint8_t * RGBAMaskColors,
+                        unsigned int maskColorsLength,
+                        unsigned int maskStartIndex,
+                        double blendFactor,
+                        uint8_t * RGBAPixmapOut);
+
 #endif /*__Colormap_H__*/
@@ -32,6 +32,8 @@
 #ifndef __MinMax_H__
 #define __MinMax_H__
 
+#include "Types.h"
+
 /** Get the min and max values of data.
  *
  * Optionally get the min positive value of data.
@@ -53,4 +55,27 @@ getMinMax(void * data,
           double * minPositiveOut,
           double * maxOut);
 
+/** Get the indices of the min and max values of each block of data.
+ *
+ * Data is split in consecutive blocks of blockSize elements, the last
+ * block being possibly shorter. NaNs are ignored, a block containing
+ * only NaNs reports its first index as min and max.
+ *
+ * @param data Pointer to the data to get min and max from.
+ * @param type Bit field describing the data type.
+ * @param length Number of elements in data.
+ * @param blockSize Number of elements per block.
+ * @param argMinOut Pointer where to store the index of the min of each
+ *        block. Must hold (length + blockSize - 1) / blockSize elements.
+ * @param argMaxOut Pointer where to store the index of the max of each
+ *        block. Same size as argMinOut.
+ */
+void
+getMinMaxBlocks(void * data,
+                unsigned int type,
+                unsigned long length,
+                unsigned long blockSize,
+                int64_t * argMinOut,
+                int64_t * argMaxOut);
+
 #endif /*__MinMax_H__*/
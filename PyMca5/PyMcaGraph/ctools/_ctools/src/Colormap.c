@@ -440,3 +440,320 @@ colormapFillPixmap(void * data,
         }
     }
 }
+
+
+/* Fused pipeline ************************************************************/
+
+/* The fused pipeline is cheap enough per pixel that threading pays off
+ * on smaller images than colormapFillPixmap: 256 * 256 elements.
+ */
+
+/** Blend a RGBA color with a mask color, channel per channel. */
+static uint32_t
+blendColor(uint32_t color, uint32_t maskColor, double blendFactor)
+{
+    uint32_t result;
+    uint8_t * in = (uint8_t *) &color;
+    uint8_t * over = (uint8_t *) &maskColor;
+    uint8_t * out = (uint8_t *) &result;
+    int channel;
+
+    for (channel=0; channel<4; channel++) {
+        out[channel] = (uint8_t) (in[channel] * blendFactor +
+                                  over[channel] * (1.0 - blendFactor));
+    }
+    return result;
+}
+
+/** Macro defining typed functions of the fused pipeline.
+ *
+ * getFiniteRange_TYPE computes min, min of strictly positive values and max
+ * of the finite data, with per thread partial results merged at the end.
+ * Returns the number of finite values found.
+ *
+ * fillPixmapFused_TYPE maps the data to the colormap and blends the mask
+ * in a single loop.
+ * See colormapFillPixmapFused in header for a description of arguments.
+ *
+ * @param TYPE The type of the input data of the function
+ * @param IS_FINITE Expression testing if value is finite.
+ */
+#define FILL_PIXMAP_FUSED_DEFINITION(TYPE, IS_FINITE)\
+static unsigned long getFiniteRange_ ## TYPE(\
+    TYPE * data,\
+    unsigned long length,\
+    double * minOut,\
+    double * minPosOut,\
+    double * maxOut)\
+{\
+    double min = HUGE_VAL;\
+    double minPos = HUGE_VAL;\
+    double max = - HUGE_VAL;\
+    unsigned long count = 0;\
+\
+    PRAGMA_OMP("omp parallel if (length > 65536)")\
+    {\
+        double threadMin = HUGE_VAL;\
+        double threadMinPos = HUGE_VAL;\
+        double threadMax = - HUGE_VAL;\
+        unsigned long threadCount = 0;\
+        long index;\
+\
+        PRAGMA_OMP("omp for schedule(static)")\
+        for (index=0; index<(long) length; index++) {\
+            double value = (double) data[index];\
+            if (IS_FINITE) {\
+                threadCount++;\
+                if (value < threadMin) {\
+                    threadMin = value;\
+                }\
+                if (value > threadMax) {\
+                    threadMax = value;\
+                }\
+                if (value > 0.0 && value < threadMinPos) {\
+                    threadMinPos = value;\
+                }\
+            }\
+        }\
+\
+        PRAGMA_OMP("omp critical")\
+        {\
+            count += threadCount;\
+            min = (threadMin < min) ? threadMin : min;\
+            max = (threadMax > max) ? threadMax : max;\
+            minPos = (threadMinPos < minPos) ? threadMinPos : minPos;\
+        }\
+    }\
+\
+    *minOut = min;\
+    *minPosOut = minPos;\
+    *maxOut = max;\
+    return count;\
+}\
+\
+static void fillPixmapFused_ ## TYPE(\
+    TYPE * data,\
+    unsigned long length,\
+    double startValue,\
+    double endValue,\
+    unsigned int mapping,\
+    double gamma,\
+    uint32_t * colormap,\
+    unsigned int colormapLength,\
+    uint32_t nanColor,\
+    uint8_t * mask,\
+    uint32_t * maskColors,\
+    unsigned int maskColorsLength,\
+    unsigned int maskStartIndex,\
+    double blendFactor,\
+    uint32_t * pixmapOut)\
+{\
+    double min, max, startMapped, endMapped, scale;\
+    unsigned int cmapMax = colormapLength - 1;\
+    long index;\
+\
+    min = (startValue < endValue) ? startValue : endValue;\
+    max = (startValue < endValue) ? endValue : startValue;\
+\
+    if (mapping != MAPPING_LINEAR && (startValue <= 0.0 || endValue <= 0.0)) {\
+        /* Same as colormapFillPixmap: use the last color */\
+        min = 0.0;\
+        max = 0.0;\
+        startMapped = 0.0;\
+        endMapped = 0.0;\
+    }\
+    else if (mapping == MAPPING_LOG10) {\
+        startMapped = fastLog10(startValue);\
+        endMapped = fastLog10(endValue);\
+    }\
+    else if (mapping == MAPPING_GAMMA) {\
+        startMapped = pow(startValue, gamma);\
+        endMapped = pow(endValue, gamma);\
+    }\
+    else {\
+        startMapped = startValue;\
+        endMapped = endValue;\
+    }\
+\
+    if (startMapped != endMapped) {\
+        scale = ((double) colormapLength) / (endMapped - startMapped);\
+    }\
+    else {\
+        scale = 0.0; /* Should never be used */\
+    }\
+\
+    PRAGMA_OMP("omp parallel for schedule(static) if (length > 65536)")\
+    for (index=0; index<(long) length; index++) {\
+        uint32_t color;\
+        double value = (double) data[index];\
+\
+        if (!(IS_FINITE)) {\
+            color = nanColor;\
+        }\
+        else if (value >= max) {\
+            color = colormap[cmapMax];\
+        }\
+        else if (value <= min) {\
+            color = colormap[0];\
+        }\
+        else {\
+            double mapped;\
+            unsigned int cmapIndex;\
+\
+            if (mapping == MAPPING_LOG10) {\
+                mapped = fastLog10(value);\
+            }\
+            else if (mapping == MAPPING_GAMMA) {\
+                mapped = pow(value, gamma);\
+            }\
+            else {\
+                mapped = value;\
+            }\
+            cmapIndex = (unsigned int) (scale * (mapped - startMapped));\
+            if (cmapIndex > cmapMax) {\
+                cmapIndex = cmapMax;\
+            }\
+            color = colormap[cmapIndex];\
+        }\
+\
+        if (mask != 0) {\
+            unsigned int level = mask[index];\
+            if (level >= maskStartIndex && level < maskColorsLength) {\
+                color = blendColor(color, maskColors[level], blendFactor);\
+            }\
+        }\
+        pixmapOut[index] = color;\
+    }\
+}
+
+#define IS_FINITE_FLOAT isfinite(value)
+#define IS_FINITE_INT 1
+
+FILL_PIXMAP_FUSED_DEFINITION(float, IS_FINITE_FLOAT)
+FILL_PIXMAP_FUSED_DEFINITION(double, IS_FINITE_FLOAT)
+
+FILL_PIXMAP_FUSED_DEFINITION(uint8_t, IS_FINITE_INT)
+FILL_PIXMAP_FUSED_DEFINITION(int8_t, IS_FINITE_INT)
+
+FILL_PIXMAP_FUSED_DEFINITION(uint16_t, IS_FINITE_INT)
+FILL_PIXMAP_FUSED_DEFINITION(int16_t, IS_FINITE_INT)
+
+FILL_PIXMAP_FUSED_DEFINITION(uint32_t, IS_FINITE_INT)
+FILL_PIXMAP_FUSED_DEFINITION(int32_t, IS_FINITE_INT)
+
+FILL_PIXMAP_FUSED_DEFINITION(uint64_t, IS_FINITE_INT)
+FILL_PIXMAP_FUSED_DEFINITION(int64_t, IS_FINITE_INT)
+
+
+#define CALL_FILL_PIXMAP_FUSED(TYPE)\
+    if (autoscale) {\
+        double min, minPos, max;\
+        if (getFiniteRange_ ## TYPE((TYPE *) data, length,\
+                                    &min, &minPos, &max) == 0) {\
+            /* No finite data */\
+            min = 0.0;\
+            minPos = 1.0;\
+            max = 1.0;\
+        }\
+        if (mapping != MAPPING_LINEAR) {\
+            /* Same as spslut: use the strictly positive range */\
+            if (min <= 0.0) {\
+                min = (minPos < HUGE_VAL) ? minPos : 1.0;\
+            }\
+            if (max < min) {\
+                max = min;\
+            }\
+        }\
+        if (autoscale & 1) {\
+            *startValue = min;\
+        }\
+        if (autoscale & 2) {\
+            *endValue = max;\
+        }\
+    }\
+    fillPixmapFused_ ## TYPE((TYPE *) data,\
+        length,\
+        *startValue,\
+        *endValue,\
+        mapping,\
+        gamma,\
+        colormap,\
+        colormapLength,\
+        nanColor,\
+        mask,\
+        maskColors,\
+        maskColorsLength,\
+        maskStartIndex,\
+        blendFactor,\
+        pixmapOut)
+
+void
+colormapFillPixmapFused(void * data,
+                        unsigned int type,
+                        unsigned long length,
+                        unsigned int autoscale,
+                        double * startValue,
+                        double * endValue,
+                        unsigned int mapping,
+                        double gamma,
+                        uint8_t * RGBAColormap,
+                        unsigned int colormapLength,
+                        uint8_t * RGBANaNColor,
+                        uint8_t * mask,
+                        uint8_t * RGBAMaskColors,
+                        unsigned int maskColorsLength,
+                        unsigned int maskStartIndex,
+                        double blendFactor,
+                        uint8_t * RGBAPixmapOut)
+{
+    uint32_t * colormap = (uint32_t *) RGBAColormap;
+    uint32_t * maskColors = (uint32_t *) RGBAMaskColors;
+    uint32_t * pixmapOut = (uint32_t *) RGBAPixmapOut;
+    uint32_t nanColor;
+
+    /* If NaN color is NULL, use the first color of the colormap */
+    nanColor = (RGBANaNColor == 0) ? colormap[0] :
+                                     *((uint32_t *) RGBANaNColor);
+    if (maskColors == 0) {
+        mask = 0;
+    }
+
+    switch (type) {
+        case (FLOATING | SIZE_32): /*float*/
+            CALL_FILL_PIXMAP_FUSED(float);
+            break;
+        case (FLOATING | SIZE_64): /*double*/
+            CALL_FILL_PIXMAP_FUSED(double);
+            break;
+
+        case (SIZE_8): /*int8_t*/
+            CALL_FILL_PIXMAP_FUSED(int8_t);
+            break;
+        case (UNSIGNED | SIZE_8): /*uint8_t*/
+            CALL_FILL_PIXMAP_FUSED(uint8_t);
+            break;
+
+        case (SIZE_16): /*int16_t*/
+            CALL_FILL_PIXMAP_FUSED(int16_t);
+            break;
+        case (UNSIGNED | SIZE_16): /*uint16_t*/
+            CALL_FILL_PIXMAP_FUSED(uint16_t);
+            break;
+
+        case (SIZE_32): /*int32_t*/
+            CALL_FILL_PIXMAP_FUSED(int32_t);
+            break;
+        case (UNSIGNED | SIZE_32): /*uint32_t*/
+            CALL_FILL_PIXMAP_FUSED(uint32_t);
+            break;
+
+        case (SIZE_64): /*int64_t*/
+            CALL_FILL_PIXMAP_FUSED(int64_t);
+            break;
+        case (UNSIGNED | SIZE_64): /*uint64_t*/
+            CALL_FILL_PIXMAP_FUSED(uint64_t);
+            break;
+        default:
+            break;
+    }
+}
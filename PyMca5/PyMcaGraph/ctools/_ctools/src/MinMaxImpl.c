@@ -37,6 +37,12 @@
 #define isnan(v) _isnan(v)
 #endif
 
+#ifdef _OPENMP
+#define PRAGMA_OMP(ompString) _Pragma(ompString)
+#else
+#define PRAGMA_OMP(ompString)
+#endif /* _OPENMP */
+
 /* To support NaN, for floating type, we skip all first NaN data
  * If all data is NaNs: min/max are NaNs
  * Else min/max are computed ignoring NaNs,
@@ -175,3 +181,136 @@ getMinMax(void * data,
             break;
     }
 }
+
+
+/* Block-wise min/max indices.
+ *
+ * For each block of blockSize consecutive elements the indices of the
+ * min and max are stored. NaNs are skipped, a block made only of NaNs
+ * reports its first index for both min and max.
+ */
+#define IS_NAN_FLOAT(value) isnan(value)
+#define IS_NAN_INT(value) 0
+
+#define GET_MINMAX_BLOCKS_DEFINITION(TYPE, IS_NAN)\
+static void getMinMaxBlocks_ ## TYPE(TYPE * data,\
+                 unsigned long length,\
+                 unsigned long blockSize,\
+                 int64_t * argMin,\
+                 int64_t * argMax)\
+{\
+    long nBlocks = (long) ((length + blockSize - 1) / blockSize);\
+    long block;\
+\
+    PRAGMA_OMP("omp parallel for schedule(static) if (length > 1048576)")\
+    for (block = 0; block < nBlocks; block++) {\
+        unsigned long index = ((unsigned long) block) * blockSize;\
+        unsigned long end = index + blockSize;\
+        unsigned long iMin, iMax;\
+        TYPE tmpMin, tmpMax;\
+\
+        if (end > length) {\
+            end = length;\
+        }\
+        iMin = index;\
+        iMax = index;\
+        for (; index < end; index++) {\
+            if (!IS_NAN(data[index])) {\
+                iMin = index;\
+                iMax = index;\
+                break;\
+            }\
+        }\
+        tmpMin = data[iMin];\
+        tmpMax = data[iMax];\
+        for (; index < end; index++) {\
+            TYPE value = data[index];\
+            if (value < tmpMin) {\
+                tmpMin = value;\
+                iMin = index;\
+            }\
+            if (value > tmpMax) {\
+                tmpMax = value;\
+                iMax = index;\
+            }\
+        }\
+        argMin[block] = (int64_t) iMin;\
+        argMax[block] = (int64_t) iMax;\
+    }\
+}
+
+
+GET_MINMAX_BLOCKS_DEFINITION(float, IS_NAN_FLOAT)
+GET_MINMAX_BLOCKS_DEFINITION(double, IS_NAN_FLOAT)
+
+GET_MINMAX_BLOCKS_DEFINITION(int8_t, IS_NAN_INT)
+GET_MINMAX_BLOCKS_DEFINITION(uint8_t, IS_NAN_INT)
+
+GET_MINMAX_BLOCKS_DEFINITION(int16_t, IS_NAN_INT)
+GET_MINMAX_BLOCKS_DEFINITION(uint16_t, IS_NAN_INT)
+
+GET_MINMAX_BLOCKS_DEFINITION(int32_t, IS_NAN_INT)
+GET_MINMAX_BLOCKS_DEFINITION(uint32_t, IS_NAN_INT)
+
+GET_MINMAX_BLOCKS_DEFINITION(int64_t, IS_NAN_INT)
+GET_MINMAX_BLOCKS_DEFINITION(uint64_t, IS_NAN_INT)
+
+
+#define CALL_GET_MINMAX_BLOCKS(TYPE)\
+    getMinMaxBlocks_ ## TYPE((TYPE *) data,\
+        length,\
+        blockSize,\
+        argMinOut,\
+        argMaxOut)
+
+
+void
+getMinMaxBlocks(void * data,
+                unsigned int type,
+                unsigned long length,
+                unsigned long blockSize,
+                int64_t * argMinOut,
+                int64_t * argMaxOut)
+{
+    if (blockSize == 0) {
+        return;
+    }
+    switch (type) {
+        case (FLOATING | SIZE_32): /*float*/
+            CALL_GET_MINMAX_BLOCKS(float);
+            break;
+        case (FLOATING | SIZE_64): /*double*/
+            CALL_GET_MINMAX_BLOCKS(double);
+            break;
+
+        case (SIZE_8): /*int8_t*/
+            CALL_GET_MINMAX_BLOCKS(int8_t);
+            break;
+        case (UNSIGNED | SIZE_8): /*uint8_t*/
+           CALL_GET_MINMAX_BLOCKS(uint8_t);
+           break;
+
+        case (SIZE_16): /*int16_t*/
+            CALL_GET_MINMAX_BLOCKS(int16_t);
+            break;
+        case (UNSIGNED | SIZE_16): /*uint16_t*/
+            CALL_GET_MINMAX_BLOCKS(uint16_t);
+            break;
+
+        case (SIZE_32): /*int32_t*/
+            CALL_GET_MINMAX_BLOCKS(int32_t);
+            break;
+        case (UNSIGNED | SIZE_32): /*uint32_t*/
+            CALL_GET_MINMAX_BLOCKS(uint32_t);
+            break;
+
+        case (SIZE_64): /*int64_t*/
+            CALL_GET_MINMAX_BLOCKS(int64_t);
+            break;
+        case (UNSIGNED | SIZE_64): /*uint64_t*/
+            CALL_GET_MINMAX_BLOCKS(uint64_t);
+            break;
+        default:
+            break;
+    }
+}
@@ -224,6 +224,36 @@ def testMinMaxInf(self):
                             dtype=dtype)
             self._testMinMaxVsNumpy(data)
 
+    def testMinMaxBlocks(self):
+        """Test C block-wise min/max indices vs Numpy.
+        """
+        self._log("testMinMaxBlocks")
+        blockSize = 16
+        for size in self.SIZES:
+            for dtype in self.DTYPES:
+                data = np.arange(size, dtype=dtype)
+                np.random.shuffle(data)
+                argMin, argMax = ctools.minMaxBlocks(data, blockSize)
+                nBlocks = (size + blockSize - 1) // blockSize
+                self.assertEqual(argMin.size, nBlocks)
+                self.assertEqual(argMax.size, nBlocks)
+                for block in range(nBlocks):
+                    blockData = data[block * blockSize:
+                                     (block + 1) * blockSize]
+                    self.assertEqual(data[argMin[block]], blockData.min())
+                    self.assertEqual(data[argMax[block]], blockData.max())
+
+        for dtype in self.FLOATING_DTYPES:
+            # NaN are ignored, all NaN block reports its first index
+            data = np.array((float('nan'), 1.0, -1.0, float('nan'),
+                             float('nan'), float('nan')), dtype=dtype)
+            argMin, argMax = ctools.minMaxBlocks(data, 4)
+            self.assertEqual(list(argMin), [2, 4])
+            self.assertEqual(list(argMax), [1, 4])
+
+        with self.assertRaises(ValueError):
+            ctools.minMaxBlocks(np.array((), dtype=np.float64), 16)
+
 
 # main ########################################################################
 
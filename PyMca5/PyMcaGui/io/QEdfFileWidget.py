@@ -51,6 +51,7 @@
 from PyMca5 import PyMcaDirs
 from . import SpecFileDataInfo
 from PyMca5 import spslut
+from PyMca5.PyMcaGui import MaskImageTools
 COLORMAPLIST = [spslut.GREYSCALE, spslut.REVERSEGREY, spslut.TEMP,
                 spslut.RED, spslut.GREEN, spslut.BLUE, spslut.MANY]
 
@@ -906,95 +907,32 @@ def selectColormap(self):
         self.colormapDialog.show()
 
     def getPixmapFromData(self, data, colormap):
-        finiteData = numpy.isfinite(data)
-        goodData = finiteData.min()
-
-        if self.colormapDialog is not None:
-            minData = self.colormapDialog.dataMin
-            maxData = self.colormapDialog.dataMax
-        else:
-            if goodData:
-                minData = data.min()
-                maxData = data.max()
-            else:
-                tmpData = data[finiteData]
-                if tmpData.size > 0:
-                    minData = tmpData.min()
-                    maxData = tmpData.max()
-                else:
-                    minData = None
-                    maxData = None
-                tmpData = None
+        # non finite data are ignored by the autoscale and shown in white
         if colormap is None:
-            if minData is None:
-                (pixmap,size,minmax)= spslut.transform(\
-                                data,
-                                (1,0),
-                                (self.__defaultColormapType,3.0),
-                                "RGBX",
-                                self.__defaultColormap,
-                                1,
-                                (0, 1),
-                                (0, 255), 1)
+            colormapName = COLORMAPLIST[MaskImageTools.DEFAULT_COLORMAP_INDEX]
+            if MaskImageTools.DEFAULT_COLORMAP_LOG_FLAG:
+                colormapType = spslut.LOG
+            else:
+                colormapType = spslut.LINEAR
+            if self.colormapDialog is not None:
+                valueRange = (self.colormapDialog.dataMin,
+                              self.colormapDialog.dataMax)
             else:
-                (pixmap,size,minmax)= spslut.transform(\
-                                data,
-                                (1,0),
-                                (self.__defaultColormapType,3.0),
-                                "RGBX",
-                                self.__defaultColormap,
-                                0,
-                                (minData,maxData),
-                                (0, 255), 1)
+                valueRange = None
         else:
             if len(colormap) < 7:
                 colormap.append(spslut.LINEAR)
-            if goodData:
-                (pixmap,size,minmax)= spslut.transform(\
-                                data,
-                                (1,0),
-                                (colormap[6],3.0),
-                                "RGBX",
-                                COLORMAPLIST[int(str(colormap[0]))],
-                                colormap[1],
-                                (colormap[2],colormap[3]),
-                                (0,255), 1)
-            elif colormap[1]:
-                #autoscale
-                if minData is None:
-                    (pixmap,size,minmax)= spslut.transform(\
-                                data,
-                                (1,0),
-                                (self.__defaultColormapType,3.0),
-                                "RGBX",
-                                self.__defaultColormap,
-                                1,
-                                (0, 1),
-                                (0, 255), 1)
-                else:
-                    (pixmap,size,minmax)= spslut.transform(\
-                                data,
-                                (1,0),
-                                (colormap[6],3.0),
-                                "RGBX",
-                                COLORMAPLIST[int(str(colormap[0]))],
-                                0,
-                                (minData,maxData),
-                                (0,255), 1)
+            colormapName = COLORMAPLIST[int(str(colormap[0]))]
+            colormapType = colormap[6]
+            if colormap[1]:
+                valueRange = None
             else:
-                (pixmap,size,minmax)= spslut.transform(\
-                                data,
-                                (1,0),
-                                (colormap[6],3.0),
-                                "RGBX",
-                                COLORMAPLIST[int(str(colormap[0]))],
-                                colormap[1],
-                                (colormap[2],colormap[3]),
-                                (0,255), 1)
-
+                valueRange = (colormap[2], colormap[3])
+        pixmap, minmax = MaskImageTools.getPixmapFromColormap(data,
+                                                colormapName,
+                                                mapping=colormapType,
+                                                valueRange=valueRange)
         pixmap.shape = [data.shape[0], data.shape[1], 4]
-        if not goodData:
-            pixmap[finiteData < 1] = 255
         return pixmap
 
     def updateColormap(self, *var):
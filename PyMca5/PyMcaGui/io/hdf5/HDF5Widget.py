@@ -51,6 +51,7 @@ def h5open(filename):
         return h5py.File(filename, "r")
 
 from PyMca5.PyMcaGui import PyMcaQt as qt
+from PyMca5.PyMcaCore import NexusDataSource
 safe_str = qt.safe_str
 
 if hasattr(qt, 'QStringList'):
@@ -196,6 +197,20 @@ def children(self):
         if not self.hasChildren:
             return []
 
+        if (not self._children) and (self._index is not None):
+            # use the metadata index of the file instead of the file
+            try:
+                if self.name == "/":
+                    names = self._index.getSortedEntryNames()
+                else:
+                    names = self._index.getChildren(self.name)
+                self._children = [H5NodeProxy(self.file, None, self,
+                                      path=posixpath.join(self.name, name))
+                                  for name in names]
+            except:
+                if DEBUG:
+                    raise
+                self._children = []
         if not self._children:
             # obtaining the lock here is necessary, otherwise application can
             # freeze if navigating tree while data is processing
@@ -290,6 +305,10 @@ def __init__(self, ffile, node, parent=None, path=None):
         if 1:#with ffile.plock:
             self._file = ffile
             self._parent = parent
+            self._index = getattr(parent, "_index", None)
+            if (node is None) and (self._index is not None):
+                self._initFromIndex(path)
+                return
             if hasattr(node, '_posixPath'):
                 self._name = node._posixPath
             else:
@@ -331,6 +350,20 @@ def __init__(self, ffile, node, parent=None, path=None):
             else:
                 self._shape = ""
 
+    def _initFromIndex(self, path):
+        info = self._index.getNodeInfo(path)
+        self._name = path
+        self._type = info["type"]
+        for cname in ['class', 'NX_class']:
+            if cname in info["attrs"]:
+                self._type = "%s" % info["attrs"][cname]
+                break
+        self._hasChildren = info["isGroup"]
+        self._children = []
+        self._dtype = info["dtype"]
+        self._shape = info["shape"]
+        self._title = info["values"].get("title", None)
+
     def clearChildren(self):
         self._children = []
         self._hasChildren = False
@@ -358,6 +391,15 @@ def __init__(self, ffile, parent=None):
         super(H5FileProxy, self).__init__(ffile, ffile, parent)
         self._name = ffile.name
         self._filename = self.file.name
+        self._index = None
+        if isinstance(ffile, h5py.File):
+            try:
+                self._index = NexusDataSource.getFileIndex(ffile)
+                self._index.refresh()
+            except:
+                if DEBUG:
+                    raise
+                self._index = None
 
     def close(self):
         if 1: # with self.file.plock:
@@ -407,6 +449,8 @@ def data(self, index, role):
             if showtitle:
                 if hasattr(item, 'type'):
                     if item.type in ["Entry", "NXentry"]:
+                        if getattr(item, "_title", None) is not None:
+                            return MyQVariant("%s" % item._title)
                         children = item.children
                         names = [posixpath.basename(o.name) for o in children]
                         if "title" in names:
@@ -35,12 +35,25 @@
 import numpy
 
 from PyMca5 import spslut
+from PyMca5.PyMcaGraph import ctools
+from PyMca5.PyMcaGraph.ctools import pnpoly
 COLORMAP_LIST = [spslut.GREYSCALE, spslut.REVERSEGREY, spslut.TEMP,
                  spslut.RED, spslut.GREEN, spslut.BLUE, spslut.MANY]
 
 DEFAULT_COLORMAP_INDEX = 2
 DEFAULT_COLORMAP_LOG_FLAG = False
 
+# color used for non finite data
+NAN_COLOR = numpy.array([255, 255, 255, 255], dtype=numpy.uint8)
+
+# spslut mapping to ctools mapping
+_MAPPING_DICT = {spslut.LINEAR: ctools.MAPPING_LINEAR,
+                 spslut.LOG: ctools.MAPPING_LOG10,
+                 spslut.GAMMA: ctools.MAPPING_GAMMA}
+
+_COLORMAP_LUT_DICT = {}
+_COLORMAP_LUT_SIZE = 65536
+
 def convertToRowAndColumn(x, y, shape, xScale=None, yScale=None, safe=True):
     """
     Convert from plot coordinates to image row and column.
@@ -66,6 +79,215 @@ def convertToRowAndColumn(x, y, shape, xScale=None, yScale=None, safe=True):
         r = int(r)
     return r, c
 
+def getPolygonMask(points, shape, xScale=None, yScale=None, border=True):
+    """
+    Calculate the pixels of an image inside a polygon. Only the pixels in
+    the bounding box of the polygon are checked.
+
+    :param points: Polygon vertices in plot coordinates.
+    :type points: Numpy ndarray of shape (n_vertices, 2).
+    :param shape: Image shape (rows, columns).
+    :param xScale: Origin and size of the pixels along columns.
+    :param yScale: Origin and size of the pixels along rows.
+    :param border: Flag to indicate if a point on a vertex is inside.
+    :returns: None if the polygon does not overlap the image, otherwise a
+              tuple ((row0, row1, column0, column1), mask) with the mask of
+              the image region [row0:row1, column0:column1].
+    """
+    if xScale is None:
+        xScale = [0, 1]
+    if yScale is None:
+        yScale = [0, 1]
+    points = numpy.asarray(points, dtype=numpy.float64)
+    if (xScale[1] == 0) or (yScale[1] == 0):
+        return None
+
+    def _getRange(values, scale, size):
+        indices = (numpy.array([values.min(), values.max()]) - scale[0]) /\
+                  float(scale[1])
+        # one pixel margin, pnpoly decides
+        first = max(int(numpy.floor(indices.min())) - 1, 0)
+        last = min(int(numpy.ceil(indices.max())) + 2, size)
+        return first, last
+
+    column0, column1 = _getRange(points[:, 0], xScale, shape[1])
+    row0, row1 = _getRange(points[:, 1], yScale, shape[0])
+    if (column1 <= column0) or (row1 <= row0):
+        return None
+    x = xScale[0] + xScale[1] * numpy.arange(column0, column1)
+    y = yScale[0] + yScale[1] * numpy.arange(row0, row1)
+    Z = numpy.zeros(((row1 - row0), (column1 - column0), 2))
+    Z[:, :, 0] = x[numpy.newaxis, :]
+    Z[:, :, 1] = y[:, numpy.newaxis]
+    Z.shape = -1, 2
+    mask = pnpoly(points, Z, border)
+    mask.shape = (row1 - row0), (column1 - column0)
+    return (row0, row1, column0, column1), mask
+
+class PointGridIndex(object):
+    """
+    Uniform grid spatial index of a set of 2D points. Points are sorted by
+    grid cell in order to get the points of a rectangular region of cells
+    as a few contiguous slices.
+    """
+    def __init__(self, x, y, pointsPerCell=16):
+        """
+        :param x: X coordinates of the points
+        :type x: Numpy ndarray
+        :param y: Y coordinates of the points, same size as x
+        :type y: Numpy ndarray
+        :param pointsPerCell: Average number of points per cell
+        :type pointsPerCell: int, default 16
+        """
+        x = numpy.asarray(x, dtype=numpy.float64).reshape(-1)
+        y = numpy.asarray(y, dtype=numpy.float64).reshape(-1)
+        if x.size != y.size:
+            raise ValueError("x and y must have the same size")
+        self.x = x
+        self.y = y
+        finite = numpy.nonzero(numpy.isfinite(x) & numpy.isfinite(y))[0]
+        nCells = max(int(numpy.sqrt(finite.size / float(pointsPerCell))), 1)
+        self._nCells = min(nCells, 4096)
+        if finite.size:
+            self._xMin = x[finite].min()
+            self._yMin = y[finite].min()
+            self._xStep = (x[finite].max() - self._xMin) / self._nCells
+            self._yStep = (y[finite].max() - self._yMin) / self._nCells
+        else:
+            self._xMin = self._yMin = 0.0
+            self._xStep = self._yStep = 0.0
+        column = self._getCell(x[finite], self._xMin, self._xStep)
+        row = self._getCell(y[finite], self._yMin, self._yStep)
+        key = row * self._nCells + column
+        order = numpy.argsort(key, kind="mergesort")
+        # point indices sorted by cell and start of each cell
+        self._indices = finite[order]
+        self._starts = numpy.searchsorted(key[order],
+                                          numpy.arange(self._nCells ** 2 + 1))
+
+    def _getCell(self, values, vMin, step):
+        if step <= 0:
+            return numpy.zeros(values.shape, dtype=numpy.int64)
+        cell = numpy.floor((values - vMin) / step).astype(numpy.int64)
+        return numpy.clip(cell, 0, self._nCells - 1)
+
+    def getCandidates(self, xMin, xMax, yMin, yMax):
+        """
+        Indices of the points in the cells overlapping the given region.
+        The returned points may lay outside the region.
+        """
+        if not self._indices.size:
+            return self._indices
+        cells = self._getCell(numpy.array([xMin, xMax], dtype=numpy.float64),
+                              self._xMin, self._xStep)
+        column0, column1 = cells.min(), cells.max() + 1
+        cells = self._getCell(numpy.array([yMin, yMax], dtype=numpy.float64),
+                              self._yMin, self._yStep)
+        row0, row1 = cells.min(), cells.max() + 1
+        slices = []
+        for row in range(row0, row1):
+            start = self._starts[row * self._nCells + column0]
+            end = self._starts[row * self._nCells + column1]
+            if end > start:
+                slices.append(self._indices[start:end])
+        if not len(slices):
+            return self._indices[:0]
+        return numpy.concatenate(slices)
+
+    def getPointsInPolygon(self, points, border=True):
+        """
+        Indices of the points inside the given polygon.
+
+        :param points: Polygon vertices
+        :type points: Numpy ndarray of shape (n_vertices, 2)
+        :param border: Flag to indicate if a point on a vertex is inside.
+        """
+        points = numpy.asarray(points, dtype=numpy.float64)
+        xMin, yMin = points.min(axis=0)
+        xMax, yMax = points.max(axis=0)
+        candidates = self.getCandidates(xMin, xMax, yMin, yMax)
+        x = self.x[candidates]
+        y = self.y[candidates]
+        inBox = (x >= xMin) & (x <= xMax) & (y >= yMin) & (y <= yMax)
+        candidates = candidates[inBox]
+        if not candidates.size:
+            return candidates
+        Z = numpy.zeros((candidates.size, 2), numpy.float64)
+        Z[:, 0] = self.x[candidates]
+        Z[:, 1] = self.y[candidates]
+        inside = pnpoly(points, Z, border)
+        return candidates[inside > 0]
+
+def getColormapLUT(colormapName, bgrx=False):
+    """
+    Return a spslut palette as an array of RGBA values (or BGRA values if
+    bgrx is True) usable by ctools.
+    """
+    key = (colormapName, bool(bgrx))
+    if key not in _COLORMAP_LUT_DICT:
+        # spslut rounds to a 65536 levels palette while ctools truncates:
+        # sample spslut at the bin centers to reproduce its output
+        ramp = (numpy.arange(_COLORMAP_LUT_SIZE, dtype=numpy.float64) + 0.5)
+        ramp *= 255. / _COLORMAP_LUT_SIZE
+        ramp.shape = 1, -1
+        (lut, size, minmax) = spslut.transform(ramp,
+                                               (1, 0),
+                                               (spslut.LINEAR, 3.0),
+                                               "BGRX" if bgrx else "RGBX",
+                                               colormapName,
+                                               0,
+                                               (0, 255),
+                                               (0, 255), 1)
+        lut = numpy.array(lut, dtype=numpy.uint8).reshape(-1, 4)
+        lut[:, 3] = 255
+        _COLORMAP_LUT_DICT[key] = lut
+    return _COLORMAP_LUT_DICT[key]
+
+def getPixmapFromColormap(data, colormapName, mapping=spslut.LINEAR,
+                          valueRange=None, mask=None, colors=None,
+                          maskStartIndex=1, nanColor=NAN_COLOR,
+                          bgrx=False):
+    """
+    Equivalent of spslut.transform followed by the mask overlay of
+    applyMaskToImage, performed in a single multithreaded pass.
+
+    :param data: Data values
+    :type data: Numpy array
+    :param colormapName: One of the spslut palettes of COLORMAP_LIST
+    :param mapping: spslut.LINEAR, spslut.LOG or spslut.GAMMA
+    :param valueRange: None to autoscale on the finite data or
+                       (min, max) values to be mapped
+    :param mask: Numpy array of mask levels or None (default)
+    :param colors: Array of dimension (n_colors, 4) of RGBA mask colors
+    :param maskStartIndex: First mask level to blend into the pixmap
+    :param nanColor: RGBA color of non finite values
+    :param bgrx: Produce BGRA pixels instead of RGBA ones
+    :returns: Tuple (pixmap of shape data.shape + (4,), (usedMin, usedMax))
+    """
+    if mapping not in _MAPPING_DICT:
+        raise ValueError("Unknown colormap mapping %s" % mapping)
+    mapping = _MAPPING_DICT[mapping]
+    if valueRange is None:
+        vmin, vmax = None, None
+    else:
+        vmin, vmax = valueRange
+        if (mapping != ctools.MAPPING_LINEAR) and (vmin <= 0):
+            # as spslut, use the minimum positive value
+            vmin = None
+    if (nanColor is not None) and bgrx:
+        nanColor = numpy.asarray(nanColor)[[2, 1, 0, 3]]
+    if (colors is not None) and bgrx:
+        colors = numpy.asarray(colors)[:, [2, 1, 0, 3]]
+    return ctools.dataToRGBAPixmap(data,
+                                   getColormapLUT(colormapName, bgrx),
+                                   vmin,
+                                   vmax,
+                                   mapping=mapping,
+                                   nanColor=nanColor,
+                                   mask=mask,
+                                   maskColors=colors,
+                                   maskStartIndex=maskStartIndex)
+
 def getPixmapFromData(ndarray, colormap=None, mask=None, colors=None):
     """
     Calculate a colormap and apply a mask (given as a set of unsigned ints) to
@@ -94,119 +316,57 @@ def getPixmapFromData(ndarray, colormap=None, mask=None, colors=None):
 
     # deal with numpy masked arrays
     if hasattr(ndarray, 'mask'):
-        data = ndarray.data[:]
+        data = ndarray.data
     else:
-        data = ndarray[:]
+        data = ndarray
 
     if len(oldShape) == 1:
-        data.shape = -1, 1
+        data = data.reshape(-1, 1)
     elif len(oldShape) != 2:
         raise TypeError("Input array must be of dimension 2 got %d" % \
                                 len(oldShape))
 
-    # deal with non finite data
-    finiteData = numpy.isfinite(data)
-    goodData = finiteData.min()
-
-    if goodData:
-        minData = data.min()
-        maxData = data.max()
-    else:
-        tmpData = data[finiteData]
-        if tmpData.size > 0:
-            minData = tmpData.min()
-            maxData = tmpData.max()
-        else:
-            minData = None
-            maxData = None
-        tmpData = None
-
-    # apply colormap
     if colormap is None:
         colormapName = COLORMAP_LIST[min(DEFAULT_COLORMAP_INDEX,
                                     len(COLORMAP_LIST) - 1)]
         if DEFAULT_COLORMAP_LOG_FLAG:
-            colormapScaling = spslut.log
+            colormapScaling = spslut.LOG
         else:
             colormapScaling = spslut.LINEAR
-        if minData is None:
-            (pixmap, size, minmax)= spslut.transform(\
-                            data,
-                            (1,0),
-                            (colormapScaling, 3.0),
-                            "RGBX",
-                            colormapName,
-                            1,
-                            (0, 1),
-                            (0, 255), 1)
-        else:
-            (pixmap, size, minmax)= spslut.transform(\
-                            data,
-                            (1,0),
-                            (colormapScaling,3.0),
-                            "RGBX",
-                            colormapName,
-                            0,
-                            (minData,maxData),
-                            (0, 255), 1)
+        valueRange = None
     else:
         if len(colormap) < 7:
             print("Missing colormap log flag assuming linear")
             colormap.append(spslut.LINEAR)
-        if goodData:
-            (pixmap, size, minmax)= spslut.transform(\
-                            data,
-                            (1,0),
-                            (colormap[6],3.0),
-                            "RGBX",
-                            COLORMAP_LIST[int(str(colormap[0]))],
-                            colormap[1],
-                            (colormap[2],colormap[3]),
-                            (0, 255), 1)
-        elif colormap[1]:
-            #autoscale
-            if minData is None:
-                colormapName = COLORMAP_LIST[min(DEFAULT_COLORMAP_INDEX,
-                                            len(COLORMAP_LIST) - 1)]
-                colormapScaling = DEFAULT_COLORMAP_LOG_FLAG
-                (pixmap, size, minmax)= spslut.transform(\
-                            data,
-                            (1,0),
-                            (colormapScaling, 3.0),
-                            "RGBX",
-                            colormapName,
-                            1,
-                            (0, 1),
-                            (0, 255), 1)
-            else:
-                (pixmap, size, minmax)= spslut.transform(\
-                            data,
-                            (1,0),
-                            (colormap[6],3.0),
-                            "RGBX",
-                            COLORMAP_LIST[int(str(colormap[0]))],
-                            0,
-                            (minData, maxData),
-                            (0,255), 1)
+        colormapName = COLORMAP_LIST[int(str(colormap[0]))]
+        colormapScaling = colormap[6]
+        if colormap[1]:
+            # autoscale on the finite data
+            valueRange = None
         else:
-            (pixmap, size, minmax)= spslut.transform(\
-                            data,
-                            (1,0),
-                            (colormap[6],3.0),
-                            "RGBX",
-                            COLORMAP_LIST[int(str(colormap[0]))],
-                            colormap[1],
-                            (colormap[2],colormap[3]),
-                            (0,255), 1)
-
-    # make sure alpha is set
-    pixmap.shape = -1, 4
-    pixmap[:, 3] = 255
-    pixmap.shape = list(data.shape) + [4]
-    if not goodData:
-        pixmap[finiteData < 1] = 255
+            valueRange = colormap[2], colormap[3]
+
+    # same mask conventions as applyMaskToImage
+    maskStartIndex = 0
     if mask is not None:
-        return applyMaskToImage(pixmap, mask, colors=colors, copy=False)
+        mask = mask.reshape(data.shape)
+        maxValue = mask.max()
+        maskStartIndex = mask.min()
+        if colors is None:
+            if maxValue == 1:
+                maskStartIndex = 1
+                colors = numpy.zeros((2, 4), dtype=numpy.uint8)
+                colors[1, 3] = 255
+            else:
+                raise ValueError(\
+                    "Different mask levels require color list input")
+    pixmap, minmax = getPixmapFromColormap(data,
+                                           colormapName,
+                                           mapping=colormapScaling,
+                                           valueRange=valueRange,
+                                           mask=mask,
+                                           colors=colors,
+                                           maskStartIndex=maskStartIndex)
     return pixmap
 
 
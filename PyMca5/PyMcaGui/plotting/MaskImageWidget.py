@@ -30,8 +30,9 @@
 import sys
 import os
 import numpy
-from PyMca5.PyMcaGraph.ctools import pnpoly
+from PyMca5.PyMcaGraph import ImagePyramid
 from . import RGBCorrelatorGraph
+from .MaskImageTools import getPolygonMask, getPixmapFromColormap
 from . import ColormapDialog
 qt = RGBCorrelatorGraph.qt
 
@@ -92,6 +93,7 @@ def __init__(self, parent = None, rgbwidget=None, backend=None, selection=True,
         self.__pixmap0 = None
         self.__pixmap = None
         self.__image = None
+        self.__imagePyramid = None
         self._xScale = None
         self._yScale = None
 
@@ -1202,6 +1204,7 @@ def getSelectionMask(self):
 
     def setImageData(self, data, clearmask=False, xScale=None, yScale=None):
         self.__image = None
+        self.__imagePyramid = None
         self._xScale = xScale
         self._yScale = yScale
         if data is None:
@@ -1215,9 +1218,7 @@ def setImageData(self, data, clearmask=False, xScale=None, yScale=None):
         if clearmask:
             self.__selectionMask = None
         if self.colormapDialog is not None:
-            goodData = self.__imageData[numpy.isfinite(self.__imageData)]
-            minData = goodData.min()
-            maxData = goodData.max()
+            minData, maxData = self._getImageDataMinMax()
             if self.colormapDialog.autoscale:
                 self.colormapDialog.setDisplayedMinValue(minData)
                 self.colormapDialog.setDisplayedMaxValue(maxData)
@@ -1226,6 +1227,61 @@ def setImageData(self, data, clearmask=False, xScale=None, yScale=None):
             self.plotImage(update = True)
             self.graphWidget._zoomReset(replot=True)
 
+    def _getImageDataMinMax(self):
+        data = self.__imageData
+        pyramid = self._getImagePyramid()
+        if pyramid is not None:
+            # huge image, avoid copying all the finite values
+            minData, maxData = pyramid.getMinMax()
+            if minData is not None:
+                return minData, maxData
+        goodData = data[numpy.isfinite(data)]
+        return goodData.min(), goodData.max()
+
+    def _getImagePyramid(self):
+        """
+        Tiled pyramid of the image data if the image is too large to be
+        colormapped at once, None otherwise.
+        """
+        if self.__imagePyramid is not None:
+            return self.__imagePyramid
+        data = self.__imageData
+        threshold = self.graph.imagePyramidThreshold
+        if (self.__image is not None) or (data is None) or \
+           (not threshold) or hasattr(data, 'mask'):
+            return None
+        if (data.ndim != 2) or (data.size <= threshold):
+            return None
+        self.__imagePyramid = ImagePyramid.ImagePyramid(data)
+        self.__imagePyramid.setDisplayFunction(self._getPyramidPixmap)
+        return self.__imagePyramid
+
+    def _getPyramidPixmap(self, region, level, row0, column0):
+        """
+        Colormap and mask the displayed region of a huge image.
+        """
+        colormapName, colormapType, valueRange = \
+                                        self.__getColormapParameters()
+        if valueRange is None:
+            valueRange = self.__imagePyramid.getMinMax()
+            if valueRange[0] is None:
+                valueRange = None
+        pixmap0, minmax = getPixmapFromColormap(region,
+                                                colormapName,
+                                                mapping=colormapType,
+                                                valueRange=valueRange)
+        pixmap0.shape = [region.shape[0], region.shape[1], 4]
+        if self.__selectionMask is None:
+            return pixmap0
+        # the mask pixel at the origin of each pixel of the level
+        factor = 2 ** level
+        selectionMask = self.__selectionMask[ \
+                row0 * factor:(row0 + region.shape[0]) * factor:factor,
+                column0 * factor:(column0 + region.shape[1]) * factor:factor]
+        pixmap = pixmap0.copy()
+        self.__applyMaskToPixmap(pixmap, pixmap0, selectionMask)
+        return pixmap
+
     def getImageData(self):
         return self.__imageData
 
@@ -1275,20 +1331,43 @@ def setQImage(self, qimage, width, height, clearmask=False, data=None):
         self._xScale = None
         self._yScale = None
         self.__pixmap0 = pixmap
+        self.__imagePyramid = None
         if clearmask:
             self.__selectionMask = None
         self.plotImage(update = True)
         self.graphWidget._zoomReset(replot=True)
 
-    def plotImage(self, update=True):
+    def plotImage(self, update=True, region=None):
+        """
+        :param update: Recalculate the pixmap from the image data
+        :type update: boolean, default True
+        :param region: (row0, row1, column0, column1) limits of the only
+                       part of the mask changed since last call (or None)
+        :type region: tuple or None (default)
+        """
         if self.__imageData is None:
             self.graphWidget.graph.clear()
             return
 
+        pyramid = self._getImagePyramid()
+        if pyramid is not None:
+            # only the displayed part of the image is colormapped
+            self.__pixmap = None
+            self.__pixmap0 = None
+            self.graphWidget.graph.addImage(pyramid,
+                                            "image",
+                                            xScale=self._xScale,
+                                            yScale=self._yScale,
+                                            replot=False)
+            self.graphWidget.graph.replot()
+            self.updateProfileSelectionWindow()
+            return
+
         if update:
             self.getPixmapFromData()
             self.__pixmap0 = self.__pixmap.copy()
-        self.__applyMaskToImage()
+            region = None
+        self.__applyMaskToImage(region=region)
 
         # replot=False as it triggers a zoom reset in Plot.py
         self.graphWidget.graph.addImage(self.__pixmap,
@@ -1300,7 +1379,6 @@ def plotImage(self, update=True):
         self.updateProfileSelectionWindow()
 
     def getPixmapFromData(self):
-        colormap = self.colormap
         if self.__image is not None:
             self.__pixmap = self.__pixmap0.copy()
             return
@@ -1310,98 +1388,43 @@ def getPixmapFromData(self):
         else:
             data = self.__imageData
 
-        finiteData = numpy.isfinite(data)
-        goodData = finiteData.min()
+        colormapName, colormapType, valueRange = \
+                                        self.__getColormapParameters()
+        self.__pixmap, minmax = getPixmapFromColormap(data,
+                                                      colormapName,
+                                                      mapping=colormapType,
+                                                      valueRange=valueRange)
+        self.__pixmap.shape = [data.shape[0], data.shape[1], 4]
+        return self.__pixmap
 
-        if self.colormapDialog is not None:
-            minData = self.colormapDialog.dataMin
-            maxData = self.colormapDialog.dataMax
-        else:
-            if goodData:
-                minData = data.min()
-                maxData = data.max()
-            else:
-                tmpData = data[finiteData]
-                if tmpData.size > 0:
-                    minData = tmpData.min()
-                    maxData = tmpData.max()
-                else:
-                    minData = None
-                    maxData = None
-                tmpData = None
+    def __getColormapParameters(self):
+        colormap = self.colormap
+        # non finite data are ignored by the autoscale and shown in white
         if colormap is None:
-            if minData is None:
-                (self.__pixmap,size,minmax)= spslut.transform(\
-                                data,
-                                (1,0),
-                                (self.__defaultColormapType,3.0),
-                                "RGBX",
-                                self.__defaultColormap,
-                                1,
-                                (0, 1),
-                                (0, 255), 1)
+            colormapName = self.__defaultColormap
+            colormapType = self.__defaultColormapType
+            if self.colormapDialog is not None:
+                valueRange = (self.colormapDialog.dataMin,
+                              self.colormapDialog.dataMax)
             else:
-                (self.__pixmap,size,minmax)= spslut.transform(\
-                                data,
-                                (1,0),
-                                (self.__defaultColormapType,3.0),
-                                "RGBX",
-                                self.__defaultColormap,
-                                0,
-                                (minData,maxData),
-                                (0, 255), 1)
+                valueRange = None
         else:
             if len(colormap) < 7:
                 colormap.append(spslut.LINEAR)
-            if goodData:
-                (self.__pixmap,size,minmax)= spslut.transform(\
-                                data,
-                                (1,0),
-                                (colormap[6],3.0),
-                                "RGBX",
-                                COLORMAPLIST[int(str(colormap[0]))],
-                                colormap[1],
-                                (colormap[2],colormap[3]),
-                                (0,255), 1)
-            elif colormap[1]:
-                #autoscale
-                if minData is None:
-                    (self.__pixmap,size,minmax)= spslut.transform(\
-                                data,
-                                (1,0),
-                                (self.__defaultColormapType,3.0),
-                                "RGBX",
-                                self.__defaultColormap,
-                                1,
-                                (0, 1),
-                                (0, 255), 1)
-                else:
-                    (self.__pixmap,size,minmax)= spslut.transform(\
-                                data,
-                                (1,0),
-                                (colormap[6],3.0),
-                                "RGBX",
-                                COLORMAPLIST[int(str(colormap[0]))],
-                                0,
-                                (minData,maxData),
-                                (0,255), 1)
+            colormapName = COLORMAPLIST[int(str(colormap[0]))]
+            colormapType = colormap[6]
+            if colormap[1]:
+                valueRange = None
             else:
-                (self.__pixmap,size,minmax)= spslut.transform(\
-                                data,
-                                (1,0),
-                                (colormap[6],3.0),
-                                "RGBX",
-                                COLORMAPLIST[int(str(colormap[0]))],
-                                colormap[1],
-                                (colormap[2],colormap[3]),
-                                (0,255), 1)
-
-        self.__pixmap.shape = [data.shape[0], data.shape[1], 4]
-        if not goodData:
-            self.__pixmap[finiteData < 1] = 255
-        return self.__pixmap
+                valueRange = (colormap[2], colormap[3])
+        return colormapName, colormapType, valueRange
 
     def getPixmap(self, original=True):
+        if (self.__pixmap is None) and (self.__imageData is not None):
+            # huge images are only colormapped on request
+            self.getPixmapFromData()
+            self.__pixmap0 = self.__pixmap.copy()
+            self.__applyMaskToImage()
         if original:
             if self.__pixmap0 is None:
                 return self.__pixmap
@@ -1512,23 +1535,40 @@ def __applyMaskToImageOLD(self):
                     self.__pixmap[tmpMask,3]    = 0xff
         return
 
-    def __applyMaskToImage(self):
+    def __applyMaskToImage(self, region=None):
+        """
+        Apply the selection mask to the pixmap. If region, a tuple
+        (row0, row1, column0, column1), is given, only that part of the
+        pixmap is updated and the rest is supposed to be up to date.
+        """
         if self.__selectionMask is None:
             return
         #if not self.__selectionFlag:
         #    print("Return because of selection flag")
         #    return
+        if region is None:
+            view = (slice(None), slice(None))
+        else:
+            view = (slice(region[0], region[1]), slice(region[2], region[3]))
+        self.__applyMaskToPixmap(self.__pixmap[view],
+                                 self.__pixmap0[view],
+                                 self.__selectionMask[view])
+
+    def __applyMaskToPixmap(self, pixmap, pixmap0, selectionMask):
+        """
+        Set pixmap to pixmap0 modified according to the selection mask.
+        """
         if self._selectionColors is not None:
-            self.__pixmap = self.__pixmap0.copy()
+            pixmap[:] = pixmap0
             for i in range(1, self._maxNRois + 1):
                 color = self._selectionColors[i - 1].copy()
-                self.__pixmap[self.__selectionMask == i] = color
+                pixmap[selectionMask == i] = color
             return
         if self._maxNRois < 2:
-            alteration = (1 - (0.2 * self.__selectionMask))
+            alteration = (1 - (0.2 * selectionMask))
         else:
-            alteration = (1 - (0.2 * (self.__selectionMask > 0))) - \
-                         0.1 * (self.__selectionMask == self._roiTags[self._nRoi - 1])
+            alteration = (1 - (0.2 * (selectionMask > 0))) - \
+                         0.1 * (selectionMask == self._roiTags[self._nRoi - 1])
         if self.colormap is None:
             if DEBUG:
                 print("Colormap is None")
@@ -1537,97 +1577,95 @@ def __applyMaskToImage(self):
                     if DEBUG:
                         print("__applyMaskToImage CASE 1")
                     for i in range(4):
-                        self.__pixmap[:,:,i]  = (self.__pixmap0[:,:,i] *\
+                        pixmap[:,:,i]  = (pixmap0[:,:,i] *\
                                 alteration).astype(numpy.uint8)
                 else:
                     if DEBUG:
                         print("__applyMaskToImage CASE 2")
-                    self.__pixmap = self.__pixmap0.copy()
-                    tmp = self.__selectionMask > 0
-                    self.__pixmap[tmp, 0] = 0x40
-                    self.__pixmap[tmp, 2] = 0x70
-                    self.__pixmap[tmp, 3] = 0x40
+                    pixmap[:] = pixmap0
+                    tmp = selectionMask > 0
+                    pixmap[tmp, 0] = 0x40
+                    pixmap[tmp, 2] = 0x70
+                    pixmap[tmp, 3] = 0x40
                     if self._maxNRois > 1:
-                        roiTag = (self.__selectionMask == self._roiTags[self._nRoi - 1])
-                        self.__pixmap[roiTag, 0] = 2*0x40
-                        self.__pixmap[roiTag, 2] = 2*0x70
-                        self.__pixmap[roiTag, 3] = 2*0x40
+                        roiTag = (selectionMask == self._roiTags[self._nRoi - 1])
+                        pixmap[roiTag, 0] = 2*0x40
+                        pixmap[roiTag, 2] = 2*0x70
+                        pixmap[roiTag, 3] = 2*0x40
             else:
                 if self.__defaultColormap > 1:
                     if DEBUG:
                         print("__applyMaskToImage CASE 3")
-                    self.__pixmap = self.__pixmap0.copy()
+                    pixmap[:] = pixmap0
                     for i in range(3):
-                        self.__pixmap[:,:,i]  = (self.__pixmap0[:,:,i] *\
-                                                     alteration)
+                        pixmap[:,:,i]  = (pixmap0[:,:,i] * alteration)
                     if 0:
                         #this is to recolor non finite points
                         tmpMask = numpy.isfinite(self.__imageData)
                         goodData = numpy.isfinite(self.__imageData).min()
                         if not goodData:
                             for i in range(3):
-                                self.__pixmap[:,:,i] *= tmpMask
+                                pixmap[:,:,i] *= tmpMask
                 else:
                     if DEBUG:
                         print("__applyMaskToImage CASE 4")
-                    self.__pixmap = self.__pixmap0.copy()
-                    self.__pixmap[self.__selectionMask>0,0]    = 0x40
-                    self.__pixmap[self.__selectionMask>0,2]    = 0x70
-                    self.__pixmap[self.__selectionMask>0,3]    = 0x40
+                    pixmap[:] = pixmap0
+                    pixmap[selectionMask>0,0]    = 0x40
+                    pixmap[selectionMask>0,2]    = 0x70
+                    pixmap[selectionMask>0,3]    = 0x40
                     if self._maxNRois > 1:
-                        self.__pixmap[self.__selectionMask==self._nRoi,0]    = 2*0x40
-                        self.__pixmap[self.__selectionMask==self._nRoi,2]    = 2*0x70
-                        self.__pixmap[self.__selectionMask==self._nRoi,3]    = 2*0x40
+                        pixmap[selectionMask==self._nRoi,0]    = 2*0x40
+                        pixmap[selectionMask==self._nRoi,2]    = 2*0x70
+                        pixmap[selectionMask==self._nRoi,3]    = 2*0x40
 
                     if 0:
                         #this is to recolor non finite points
                         tmpMask = ~numpy.isfinite(self.__imageData)
                         badData = numpy.isfinite(self.__imageData).max()
                         if badData:
-                            self.__pixmap[tmpMask,0]    = 0x00
-                            self.__pixmap[tmpMask,1]    = 0xff
-                            self.__pixmap[tmpMask,2]    = 0xff
-                            self.__pixmap[tmpMask,3]    = 0xff
+                            pixmap[tmpMask,0]    = 0x00
+                            pixmap[tmpMask,1]    = 0xff
+                            pixmap[tmpMask,2]    = 0xff
+                            pixmap[tmpMask,3]    = 0xff
         elif int(str(self.colormap[0])) > 1:     #color
             if DEBUG:
                 print("__applyMaskToImage CASE 5")
             for i in range(3):
-                self.__pixmap[:,:,i]  = (self.__pixmap0[:,:,i] * alteration)
+                pixmap[:,:,i]  = (pixmap0[:,:,i] * alteration)
             if 0:
                 tmpMask = numpy.isfinite(self.__imageData)
                 goodData = numpy.isfinite(self.__imageData).min()
                 if not goodData:
                     if not goodData:
                         for i in range(3):
-                            self.__pixmap[:,:,i] *= tmpMask
+                            pixmap[:,:,i] *= tmpMask
         elif self._maxNRois > 1:
             if DEBUG:
                 print("__applyMaskToImage CASE 6")
-            tmp  = 1 - (self.__selectionMask>0)
-            tmp2 = (self.__selectionMask == self._roiTags[self._nRoi - 1])
-            self.__pixmap[:, :, 2] = (0x70 * (self.__selectionMask>0) + \
+            tmp  = 1 - (selectionMask>0)
+            tmp2 = (selectionMask == self._roiTags[self._nRoi - 1])
+            pixmap[:, :, 2] = (0x70 * (selectionMask>0) + \
                                       0x70 * tmp2) +\
-                                      tmp * self.__pixmap0[:,:,2]
-            self.__pixmap[:,:, 3] = (0x40 * (self.__selectionMask>0)   + 0x40 * tmp2) +\
-                                      tmp * self.__pixmap0[:,:,3]
+                                      tmp * pixmap0[:,:,2]
+            pixmap[:,:, 3] = (0x40 * (selectionMask>0)   + 0x40 * tmp2) +\
+                                      tmp * pixmap0[:,:,3]
         else:
             if DEBUG:
                 print("__applyMaskToImage CASE 7")
-            self.__pixmap = self.__pixmap0.copy()
-            tmp  = 1 - self.__selectionMask
-            self.__pixmap[:, :, 2] = (0x70 * self.__selectionMask) +\
-                                  tmp * self.__pixmap0[:,:,2]
-            self.__pixmap[:, :, 3] = (0x40 * self.__selectionMask) +\
-                                  tmp * self.__pixmap0[:,:,3]
+            pixmap[:] = pixmap0
+            tmp  = 1 - selectionMask
+            pixmap[:, :, 2] = (0x70 * selectionMask) +\
+                                  tmp * pixmap0[:,:,2]
+            pixmap[:, :, 3] = (0x40 * selectionMask) +\
+                                  tmp * pixmap0[:,:,3]
             if 0:
                 tmpMask = ~numpy.isfinite(self.__imageData)
                 badData = numpy.isfinite(self.__imageData).max()
                 if badData:
-                    self.__pixmap[tmpMask,0]    = 0x00
-                    self.__pixmap[tmpMask,1]    = 0xff
-                    self.__pixmap[tmpMask,2]    = 0xff
-                    self.__pixmap[tmpMask,3]    = 0xff
-        return
+                    pixmap[tmpMask,0]    = 0x00
+                    pixmap[tmpMask,1]    = 0xff
+                    pixmap[tmpMask,2]    = 0xff
+                    pixmap[tmpMask,3]    = 0xff
 
     def selectColormap(self):
         if self.__imageData is None:
@@ -1799,23 +1837,22 @@ def _handlePolygonMask(self, ddict):
         else:
             print("Cannot handle polygon mask")
             return
-        x = self._xScale[0] + self._xScale[1] * numpy.arange(imageShape[1])
-        y = self._yScale[0] + self._yScale[1] * numpy.arange(imageShape[0])
-        X, Y = numpy.meshgrid(x, y)
-        X.shape = -1
-        Y.shape = -1
-        Z = numpy.zeros((imageShape[1]*imageShape[0], 2))
-        Z[:, 0] = X
-        Z[:, 1] = Y
-        X = None
-        Y = None
-        mask = pnpoly(ddict['points'][:-1], Z, 1)
-        mask.shape = imageShape
+        # only the pixels in the bounding box of the polygon are checked
+        result = getPolygonMask(ddict['points'][:-1], imageShape,
+                                xScale=self._xScale, yScale=self._yScale)
+        if result is None:
+            # polygon outside the image
+            return
+        region, mask = result
+        row0, row1, column0, column1 = region
         if self.__selectionMask is None:
-            self.__selectionMask = mask
+            self.__selectionMask = numpy.zeros(imageShape, numpy.uint8)
+            self.__selectionMask[row0:row1, column0:column1] = mask
+            region = None
         else:
-            self.__selectionMask[mask==1] = self._roiTags[self._nRoi - 1]
-        self.plotImage(update = False)
+            self.__selectionMask[row0:row1, column0:column1][mask==1] = \
+                                            self._roiTags[self._nRoi - 1]
+        self.plotImage(update=False, region=region)
         #inform the other widgets
         self._emitMaskChangedSignal()
 
@@ -1823,6 +1860,8 @@ def _graphSignal(self, ddict, ownsignal = None):
         if ownsignal is None:
             ownsignal = True
         emitsignal = False
+        # part of the mask changed, None means all of it
+        region = None
         if self.__imageData is None:
             if ddict['event'] == "drawingFinished":
                 label = ddict['parameters']['label']
@@ -1873,6 +1912,8 @@ def _graphSignal(self, ddict, ownsignal = None):
             if self.__selectionMask is None:
                 self.__selectionMask = numpy.zeros(self.__imageData.shape,
                                  numpy.uint8)
+            else:
+                region = (j1, j2, i1, i2)
             if self.__eraseMode:
                 self.__selectionMask[j1:j2, i1:i2] = 0
             else:
@@ -1950,6 +1991,8 @@ def _graphSignal(self, ddict, ownsignal = None):
                 if self.__selectionMask is None:
                     self.__selectionMask = numpy.zeros(self.__imageData.shape,
                                      numpy.uint8)
+                else:
+                    region = (rowMin, rowMax, columnMin, columnMax)
                 if self.__eraseMode:
                     self.__selectionMask[rowMin:rowMax, columnMin:columnMax] = 0
                 else:
@@ -1957,7 +2000,7 @@ def _graphSignal(self, ddict, ownsignal = None):
                 emitsignal = True
         if emitsignal:
             #should this be made by the parent?
-            self.plotImage(update = False)
+            self.plotImage(update=False, region=region)
 
             #inform the other widgets
             self._emitMaskChangedSignal()
@@ -40,7 +40,6 @@
 import sys
 import os
 import numpy
-from PyMca5.PyMcaGraph.ctools import pnpoly
 DEBUG = 0
 
 from . import PlotWindow
@@ -82,6 +81,7 @@ def __init__(self, parent=None, backend=None, plugins=False, newplot=False,
         self._buildAdditionalSelectionMenuDict()
         self._selectionCurve = None
         self._selectionMask = None
+        self._selectionIndex = None
         self._selectionColors = numpy.zeros((len(self.colorList), 4), numpy.uint8)
         self._alphaLevel = None
         for i in range(len(self.colorList)):
@@ -313,6 +313,8 @@ def setSelectionCurveData(self, x, y, legend=None, info=None,
                       color=color, symbol=symbol, selectable=selectable,z=0,
                       **kw)
         self._selectionCurve = legend
+        # the spatial index is built on first polygon selection
+        self._selectionIndex = None
 
         # if view mode, draw the image
         if self._plotViewMode == "density":
@@ -407,7 +409,7 @@ def getSelectionMask(self):
                 self._selectionMask = numpy.zeros(x.shape, numpy.uint8)
         return self._selectionMask
 
-    def _updatePlot(self, replot=True, replace=True):
+    def _updatePlot(self, replot=True, replace=True, rois=None):
         if self._selectionCurve is None:
             return
         x0, y0, legend, info = self.getCurve(self._selectionCurve)
@@ -443,6 +445,9 @@ def _updatePlot(self, replot=True, replace=True):
                 else:
                     useAlpha = False
                 for i in range(1, self._maxNRois + 1):
+                    if (rois is not None) and (i not in rois):
+                        # this selection did not change
+                        continue
                     xMask = x[tmpMask == i]
                     yMask = y[tmpMask == i]
                     if xMask.size < 1:
@@ -524,13 +529,18 @@ def _handlePolygonMask(self, points):
             currentMask = numpy.zeros(y.shape, dtype=numpy.uint8)
             if value == 0:
                 return
-        Z = numpy.zeros((y.size, 2), numpy.float64)
-        Z[:, 0] = x
-        Z[:, 1] = y
-        mask = pnpoly(points, Z, 1)
-        mask.shape = currentMask.shape
-        currentMask[mask > 0] = value
-        self.setSelectionMask(currentMask, plot=True)
+        if (self._selectionIndex is None) or \
+           (self._selectionIndex.x.size != x.size):
+            self._selectionIndex = MaskImageTools.PointGridIndex(x, y)
+        inside = self._selectionIndex.getPointsInPolygon(points)
+        maskView = currentMask[:]
+        maskView.shape = -1
+        # only the selections gaining or losing points have to be redrawn
+        rois = set(numpy.unique(maskView[inside]).tolist())
+        rois.add(value)
+        maskView[inside] = value
+        self.setSelectionMask(currentMask, plot=False)
+        self._updatePlot(rois=rois)
         self._emitMaskChangedSignal()
 
     def graphCallback(self, ddict):
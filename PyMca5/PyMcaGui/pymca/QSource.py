@@ -55,6 +55,9 @@ def __init__(self):
         self.surveyDict = {}
         self.selections = {}
         self._pollTime = 0.7 #700 ms
+        # minimum time between consecutive update events when the
+        # source notifies the updates (sources with waitForUpdate)
+        self._minUpdateInterval = 0.020
         self.pollerThreadId = None
 
     def setPollTime(self, pollTime):
@@ -126,6 +129,8 @@ def dataObjectDestroyed(ref, dataObjectKey=key, dataObjectRef=reference):
 
     def __run(self):
         #print "RUN"
+        # sources able to block until their data change do not need polling
+        waitForUpdate = getattr(self, "waitForUpdate", None)
         while len(self.surveyDict) > 0:
             #for key in self.surveyDict is dangerous
             # runtime error: dictionnary changed during iteration
@@ -133,12 +138,20 @@ def __run(self):
             if DEBUG:
                 print("In loop")
             dummy = list(self.surveyDict.keys())
+            if waitForUpdate is None:
+                updatedKeys = None
+            else:
+                updatedKeys = waitForUpdate(dummy, self._pollTime)
             eventsToPost = {}
             #for key in self.surveyDict:
             for key in dummy:
                 if key not in eventsToPost: 
                     eventsToPost[key] = []
-                if self.isUpdated(self.sourceName, key):
+                if updatedKeys is None:
+                    updated = self.isUpdated(self.sourceName, key)
+                else:
+                    updated = key in updatedKeys
+                if updated:
                     if DEBUG:
                         print(self.sourceName,key,"is updated")
                     try:
@@ -167,8 +180,11 @@ def __run(self):
             for key in eventsToPost:
                 for event in eventsToPost[key]:
                     qt.QApplication.postEvent(self, event)
-            qt.QApplication.instance().processEvents()
-            time.sleep(self._pollTime)
+            # posted events are delivered by the main thread event loop
+            if waitForUpdate is None:
+                time.sleep(self._pollTime)
+            elif len(updatedKeys):
+                time.sleep(self._minUpdateInterval)
             if DEBUG:
                 print("woke up")
 
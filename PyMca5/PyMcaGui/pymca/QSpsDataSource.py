@@ -46,10 +46,13 @@ class QSpsDataSource(QSource.QSource):
     """
     def __init__(self, sourceName):
         QSource.QSource.__init__(self)
-        self.__dataSource = SpsDataSource.SpsDataSource(sourceName)
+        # only the selected data are copied from the shared memory
+        self.__dataSource = SpsDataSource.SpsDataSource(sourceName,
+                                                        zerocopy=True)
         #easy speed up by making a local reference
         self.sourceName = self.__dataSource.sourceName
         self.isUpdated  = self.__dataSource.isUpdated
+        self.waitForUpdate = self.__dataSource.waitForUpdate
         self.sourceType = self.__dataSource.sourceType
         self.getKeyInfo = self.__dataSource.getKeyInfo
         self.refresh    = self.__dataSource.refresh
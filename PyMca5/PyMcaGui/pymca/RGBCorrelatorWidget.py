@@ -36,7 +36,9 @@
 from PyMca5.PyMcaGui.pymca import RGBImageCalculator
 from PyMca5 import spslut
 from PyMca5.PyMcaGui import IconDict
+from PyMca5.PyMcaGui import MaskImageTools
 from PyMca5.PyMcaIO import ArraySave
+from PyMca5.PyMcaIO import TextTable
 from PyMca5 import PyMcaDirs
 from PyMca5.PyMcaCore import EdfFileDataSource
 from PyMca5.PyMcaGui.pymca import ExternalImagesWindow
@@ -431,23 +433,20 @@ def getColorImage(self, image, colormap,
             raise ValueError("Unknown color scheme %s" % colormap)
 
         if (datamin is None) or (datamax is None):
-            #spslut already calculates min and max
-            #tmp = numpy.ravel(image)
-            (image_buffer, size, minmax)= spslut.transform(image,
-                                     (1,0),
-                                     (self.colormapType,3.0),
-                                      self.bgrx, colormap,
-                                      1,
-                                      (0,1), (0,255),arrayflag)
-                                     #(min(tmp),max(tmp)))
+            valueRange = None
         else:
-            (image_buffer, size, minmax)= spslut.transform(image,
-                                     (1,0),
-                                     (self.colormapType,3.0),
-                                      self.bgrx, colormap,
-                                      0,
-                                     (datamin, datamax),
-                                     (0,255), arrayflag)
+            valueRange = (datamin, datamax)
+        # same output as spslut.transform in a single pass
+        pixmap, minmax = MaskImageTools.getPixmapFromColormap(image,
+                                        colormap,
+                                        mapping=self.colormapType,
+                                        valueRange=valueRange,
+                                        bgrx=(self.bgrx == "BGRX"))
+        size = image.shape[1], image.shape[0]
+        if arrayflag:
+            image_buffer = pixmap.reshape(image.shape[0], -1)
+        else:
+            image_buffer = pixmap.tobytes()
 
         return image_buffer, size, minmax
 
@@ -873,7 +872,7 @@ def addFileList(self, filelist = None, filterused=""):
                         self.addImage(dataObject.data,
                                     os.path.basename(fname)+" "+title)
                 elif filterused.upper().startswith("TEXTIMAGE"):
-                    data = numpy.loadtxt(fname)
+                    data = TextTable.readTable(fname)
                     self.addImage(data, os.path.basename(fname))
                 else:
                     if len(fname) < 5:
@@ -894,84 +893,10 @@ def addFileList(self, filelist = None, filterused=""):
 
     def addBatchDatFile(self, filename, ignoresigma=None, csv=False):
         self.outputDir = os.path.dirname(filename)
-        if 1 or csv:
-            if 0:
-                #This works but is potentially slow
-                f = open("filename")
-                lines = f.readlines()
-                f.close()
-                for i in range(len(lines)):
-                    lines[i] = lines[i].replace('"','')
-                    lines[i] = lines[i].replace(",","  ")
-                    lines[i] = lines[i].replace(";","  ")
-                labels = lines[0].replace("\n","").split("  ")
-            else:
-                if sys.platform == "win32":
-                    f = open(filename, "rb")
-                else:
-                    f = open(filename, "r")
-                lines =f.read()
-                f.close()
-                if sys.version < '3.0':
-                    pass
-                else:
-                    lines = lines.decode()
-                lines = lines.replace("\r","\n")
-                lines = lines.replace("\n\n","\n")
-                lines = lines.replace(",","  ")
-                lines = lines.replace("\t","  ")
-                lines = lines.replace(";","  ")
-                lines = lines.replace('"','')
-                lines = lines.split("\n")
-                labels = lines[0].replace("\n","").split("  ")
-        else:
-            # This does not work when opening under linux
-            # .dat files generated under windows (\r problem)
-            f = open(filename)
-            lines = f.readlines()
-            f.close()
-            labels = lines[0].replace("\n","").split("  ")
-        i = 1
-        while (not len( lines[-i].replace("\n",""))):
-               i += 1
-        nlabels = len(labels)
-        nrows = len(lines) - i
-        if ignoresigma is None:
-            iterationList = [2]
-            if len(labels) > 4:
-                for i in range(3, len(labels)):
-                    if len(labels[i]) <= 5:
-                        iterationList.append(i)
-                    elif labels[i] == ("s("+labels[i-1]+")"):
-                        continue
-                    else:
-                        iterationList.append(i)
-            else:
-                iterationList = range(2, nlabels)
-        elif ignoresigma:
-            iterationList = [2]
-            if len(labels) > 4:
-                for i in range(3, len(labels)):
-                    if len(labels[i]) <= 5:
-                        iterationList.append(i)
-                    elif labels[i] == ("s("+labels[i-1]+")"):
-                        continue
-                    else:
-                        iterationList.append(i)
-            else:
-                iterationList = range(2, nlabels)
-        else:
-            iterationList = range(2, nlabels)
-        totalArray = numpy.zeros((nrows, nlabels), numpy.float)
-        for i in range(nrows):
-            totalArray[i, :] = [float(x) for x in lines[i+1].split()]
-
-        nrows = int(max(totalArray[:,0]) + 1)
-        ncols = int(max(totalArray[:,1]) + 1)
-        singleArray = numpy.zeros((nrows* ncols, 1), numpy.float)
-        for i in iterationList:
-            singleArray[:, 0] = totalArray[:,i] * 1
-            self.addImage(numpy.resize(singleArray, (nrows, ncols)), labels[i])
+        labels, images = TextTable.readBatchImages(filename,
+                                                   ignoresigma=ignoresigma)
+        for label, image in zip(labels, images):
+            self.addImage(image, label)
 
     def _isEdf(self, filename):
         f = open(filename, 'rb')
@@ -48,9 +48,20 @@
 except ImportError:
     HDF5 = False
 
+try:
+    import hdf5plugin
+except:
+    hdf5plugin = None
+
 
 DEBUG = 0
 
+# target size in bytes of the HDF5 chunks
+CHUNK_BYTES = 1024 * 1024
+
+# size in bytes of the blocks of data reordered in memory when writing
+BLOCK_BYTES = 64 * 1024 * 1024
+
 
 def getDate():
     localtime = time.localtime()
@@ -270,11 +281,141 @@ def openHDF5File(name, mode='a', **kwargs):
     return h5file
 
 
+def getChunkShape(shape, dtype, mcaindex=-1, access="spectrum",
+                  chunkbytes=None):
+    """
+    Chunk shape of a dataset for the intended access pattern.
+
+    With the "spectrum" access every chunk contains complete spectra of a
+    tile of pixels, as read by the fits or the PCA. With the "image" access
+    every chunk contains complete images (or complete rows if the images do
+    not fit) of one or more channels. Spectra and image rows are never
+    split, even if larger than the target size.
+
+    :param shape: shape of the dataset
+    :param dtype: data type of the dataset
+    :param mcaindex: index of the spectral axis of the dataset
+    :param access: "spectrum" or "image"
+    :param chunkbytes: target chunk size in bytes, default CHUNK_BYTES
+    :return: tuple with the chunk shape
+    """
+    if chunkbytes is None:
+        chunkbytes = CHUNK_BYTES
+    ndim = len(shape)
+    mcaindex = list(range(ndim))[mcaindex]
+    if access == "spectrum":
+        contiguous = [mcaindex]
+    elif access == "image":
+        contiguous = [i for i in range(ndim) if i != mcaindex]
+    else:
+        raise ValueError("Unknown access pattern <%s>" % access)
+    others = [i for i in range(ndim) if i not in contiguous]
+    chunk = [1] * ndim
+    budget = max(1, chunkbytes // numpy.dtype(dtype).itemsize)
+    # the axes read as a whole are filled starting by the fastest one,
+    # that is never split
+    for i, axis in enumerate(contiguous[::-1]):
+        if i == 0:
+            chunk[axis] = max(1, shape[axis])
+        else:
+            chunk[axis] = max(1, min(shape[axis], budget))
+        budget = max(1, budget // chunk[axis])
+    # the remaining size is shared as evenly as possible
+    others.sort(key=lambda axis: shape[axis])
+    for i, axis in enumerate(others):
+        side = int(budget ** (1.0 / (len(others) - i)) + 1.0e-6)
+        chunk[axis] = max(1, min(shape[axis], side))
+        budget = max(1, budget // chunk[axis])
+    # avoid a small last chunk along each axis
+    for axis in range(ndim):
+        if chunk[axis] < shape[axis]:
+            nChunks = (shape[axis] + chunk[axis] - 1) // chunk[axis]
+            chunk[axis] = (shape[axis] + nChunks - 1) // nChunks
+    return tuple(int(x) for x in chunk)
+
+
+def getCompressionOptions(compression):
+    """
+    Keyword arguments of h5py create_dataset for a compression request.
+
+    :param compression: None or False for no compression, "fast" for the
+        fastest compressor available (blosc lz4 when hdf5plugin is
+        installed, lzf otherwise) or any compression accepted by h5py.
+        True, "gzip" and gzip levels are combined with the shuffle filter.
+    :return: dictionary
+    """
+    if not compression:
+        return {}
+    if compression == "fast":
+        if hdf5plugin is not None:
+            try:
+                return dict(hdf5plugin.Blosc(cname="lz4", clevel=5,
+                                             shuffle=hdf5plugin.Blosc.SHUFFLE))
+            except:
+                if DEBUG:
+                    print("Cannot use blosc compression")
+        return {"compression": "lzf", "shuffle": True}
+    if (compression is True) or (compression == "gzip"):
+        return {"compression": "gzip", "shuffle": True}
+    if isinstance(compression, int):
+        return {"compression": "gzip", "compression_opts": compression,
+                "shuffle": True}
+    return {"compression": compression}
+
+
+def _getBlockSize(nItems, itemBytes, chunk=None):
+    """
+    Number of items written at once, multiple of the chunk size if any.
+    """
+    n = max(1, BLOCK_BYTES // max(1, itemBytes))
+    if chunk:
+        n = max(1, n // chunk) * chunk
+    return min(n, nItems)
+
+
+def _createDataset(group, name, shape, dtype, mcaindex=-1, access="spectrum",
+                   compression=None, chunkbytes=None):
+    """
+    Chunked and compressed dataset if compression is requested, contiguous
+    dataset otherwise.
+    """
+    options = getCompressionOptions(compression)
+    if options:
+        chunks = getChunkShape(shape, dtype, mcaindex=mcaindex,
+                               access=access, chunkbytes=chunkbytes)
+        if DEBUG:
+            print("Saving compressed dataset with chunks %s" % (chunks,))
+        return group.require_dataset(name,
+                                     shape=shape,
+                                     dtype=dtype,
+                                     chunks=chunks,
+                                     **options)
+    if DEBUG:
+        print("Saving not compressed and not chunked dataset")
+    return group.require_dataset(name,
+                                 shape=shape,
+                                 dtype=dtype,
+                                 compression=None)
+
+
 def getHDF5FileInstanceAndBuffer(filename, shape,
                                  buffername="data",
                                  dtype=numpy.float32,
                                  interpretation=None,
-                                 compression=None):
+                                 compression=None,
+                                 access=None):
+    """
+    Create an HDF5 file with an empty dataset to be filled by the caller.
+
+    :param filename: name of the output file
+    :param shape: shape of the dataset
+    :param buffername: name of the dataset
+    :param dtype: data type of the dataset
+    :param interpretation: "spectrum" if the last axis is the spectral axis
+    :param compression: see getCompressionOptions
+    :param access: "spectrum" or "image", default set by the interpretation
+    :return: HDF5 file instance and dataset
+    """
     if not HDF5:
         raise IOError('h5py does not seem to be installed in your system')
 
@@ -301,36 +442,16 @@ def getHDF5FileInstanceAndBuffer(filename, shape,
     elif nxData.attrs['NX_class'] == 'NXdata'.encode('utf-8'):
         #should I raise an error?
         pass
-    if compression:
-        if DEBUG:
-            print("Saving compressed and chunked dataset")
-        chunk1 = int(shape[1] / 10)
-        if chunk1 == 0:
-            chunk1 = shape[1]
-        for i in [11, 10, 8, 7, 5, 4]:
-            if (shape[1] % i) == 0:
-                chunk1 = int(shape[1] / i)
-                break
-        chunk2 = int(shape[2] / 10)
-        if chunk2 == 0:
-            chunk2 = shape[2]
-        for i in [11, 10, 8, 7, 5, 4]:
-            if (shape[2] % i) == 0:
-                chunk2 = int(shape[2] / i)
-                break
-        data = nxData.require_dataset(buffername,
-                           shape=shape,
-                           dtype=dtype,
-                           chunks=(1, chunk1, chunk2),
-                           compression=compression)
+    if interpretation == "spectrum":
+        mcaindex = -1
     else:
-        #no chunking
-        if DEBUG:
-            print("Saving not compressed and not chunked dataset")
-        data = nxData.require_dataset(buffername,
-                           shape=shape,
-                           dtype=dtype,
-                           compression=None)
+        mcaindex = 0
+    if access is None:
+        access = "image" if mcaindex == 0 else "spectrum"
+    data = _createDataset(nxData, buffername, shape, dtype,
+                          mcaindex=mcaindex,
+                          access=access,
+                          compression=compression)
     data.attrs['signal'] = numpy.int32(1)
     if interpretation is not None:
         data.attrs['interpretation'] = interpretation.encode('utf-8')
@@ -400,7 +521,25 @@ def save3DArrayAsMonochromaticTiff(data, filename,
 
 # it should be used to name the data that for the time being is named 'data'.
 def save3DArrayAsHDF5(data, filename, axes=None, labels=None, dtype=None, mode='nexus',
-                      mcaindex=-1, interpretation=None, compression=None):
+                      mcaindex=-1, interpretation=None, compression=None,
+                      access=None):
+    """
+    Save a 3D array into an HDF5 file.
+
+    :param data: 3D array
+    :param filename: name of the output file
+    :param axes: list of axes values or None
+    :param labels: list of axes labels or None
+    :param dtype: output data type, default the data type of the input
+    :param mode: "nexus", "nexus+", "simplest" or "simple"
+    :param mcaindex: index of the spectral axis of the input
+    :param interpretation: "spectrum" or "image" to save a stack of spectra
+        or a stack of images whatever the order of the input
+    :param compression: see getCompressionOptions
+    :param access: intended access pattern, "spectrum" or "image", used to
+        choose the chunks of compressed datasets. Default set by the
+        interpretation.
+    """
     if not HDF5:
         raise IOError('h5py does not seem to be installed in your system')
     if (mcaindex == 0) and (interpretation in ["spectrum", None]):
@@ -416,6 +555,14 @@ def save3DArrayAsHDF5(data, filename, axes=None, labels=None, dtype=None, mode='
         shape = data.shape
     if dtype is None:
         dtype = data.dtype
+    if interpretation in ["image"]:
+        datasetMcaIndex = 0
+    elif modify:
+        datasetMcaIndex = -1
+    else:
+        datasetMcaIndex = mcaindex
+    if access is None:
+        access = "image" if interpretation in ["image"] else "spectrum"
     if mode.lower() in ['nexus', 'nexus+']:
         #raise IOError, 'NeXus data saving not implemented yet'
         if os.path.exists(filename):
@@ -441,126 +588,37 @@ def save3DArrayAsHDF5(data, filename, axes=None, labels=None, dtype=None, mode='
         elif nxData.attrs['NX_class'] != 'NXdata'.encode('utf-8'):
             #should I raise an error?
             pass
-        if modify:
-            if interpretation in ["image", "image".encode('utf-8')]:
-                if compression:
-                    if DEBUG:
-                        print("Saving compressed and chunked dataset")
-                    #risk of taking a 10 % more space in disk
-                    chunk1 = int(shape[1] / 10)
-                    if chunk1 == 0:
-                        chunk1 = shape[1]
-                    for i in [11, 10, 8, 7, 5, 4]:
-                        if (shape[1] % i) == 0:
-                            chunk1 = int(shape[1] / i)
-                            break
-                    chunk2 = int(shape[2] / 10)
-                    for i in [11, 10, 8, 7, 5, 4]:
-                        if (shape[2] % i) == 0:
-                            chunk2 = int(shape[2] / i)
-                            break
-                    dset = nxData.require_dataset('data',
-                                       shape=shape,
-                                       dtype=dtype,
-                                       chunks=(1, chunk1, chunk2),
-                                       compression=compression)
-                else:
-                    if DEBUG:
-                        print("Saving not compressed and not chunked dataset")
-                    #print not compressed -> Not chunked
-                    dset = nxData.require_dataset('data',
-                                       shape=shape,
-                                       dtype=dtype,
-                                       compression=None)
-                for i in range(data.shape[-1]):
-                    tmp = data[:, :, i:i + 1]
-                    tmp.shape = 1, shape[1], shape[2]
-                    dset[i, 0:shape[1], :] = tmp
-                    print("Saved item %d of %d" % (i + 1, data.shape[-1]))
-            elif 0:
-                #if I do not match the input and output shapes it takes ages
-                #to save the images as spectra. However, it is much faster
-                #when performing spectra operations.
-                dset = nxData.require_dataset('data',
-                               shape=shape,
-                               dtype=dtype,
-                               chunks=(1, shape[1], shape[2]))
-                for i in range(data.shape[1]):  # shape[0]
-                    chunk = numpy.zeros((1, data.shape[2], data.shape[0]),
-                                        dtype)
-                    for k in range(data.shape[0]):  # shape[2]
-                        if 0:
-                            tmpData = data[k:k + 1]
-                            for j in range(data.shape[2]):  # shape[1]
-                                tmpData.shape = data.shape[1], data.shape[2]
-                                chunk[0, j, k] = tmpData[i, j]
-                        else:
-                            tmpData = data[k:k + 1, i, :]
-                            tmpData.shape = -1
-                            chunk[0, :, k] = tmpData
-                    print("Saving item %d of %d" % (i, data.shape[1]))
-                    dset[i, :, :] = chunk
-            else:
-                #if I do not match the input and output shapes it takes ages
-                #to save the images as spectra. This is a very fast saving, but
-                #the performance is awful when reading.
-                if compression:
-                    if DEBUG:
-                        print("Saving compressed and chunked dataset")
-                    dset = nxData.require_dataset('data',
-                               shape=shape,
-                               dtype=dtype,
-                               chunks=(shape[0], shape[1], 1),
-                               compression=compression)
-                else:
-                    if DEBUG:
-                        print("Saving not compressed and not chunked dataset")
-                    dset = nxData.require_dataset('data',
-                               shape=shape,
-                               dtype=dtype,
-                               compression=None)
-                for i in range(data.shape[0]):
-                    tmp = data[i:i + 1, :, :]
-                    tmp.shape = shape[0], shape[1], 1
-                    dset[:, :, i:i + 1] = tmp
+        dset = _createDataset(nxData, 'data', shape, dtype,
+                              mcaindex=datasetMcaIndex,
+                              access=access,
+                              compression=compression)
+        if dset.chunks is None:
+            chunks = None
         else:
-            if compression:
-                if DEBUG:
-                    print("Saving compressed and chunked dataset")
-                chunk1 = int(shape[1] / 10)
-                if chunk1 == 0:
-                    chunk1 = shape[1]
-                for i in [11, 10, 8, 7, 5, 4]:
-                    if (shape[1] % i) == 0:
-                        chunk1 = int(shape[1] / i)
-                        break
-                chunk2 = int(shape[2] / 10)
-                if chunk2 == 0:
-                    chunk2 = shape[2]
-                for i in [11, 10, 8, 7, 5, 4]:
-                    if (shape[2] % i) == 0:
-                        chunk2 = int(shape[2] / i)
-                        break
-                if DEBUG:
-                    print("Used chunk size = (1, %d, %d)" % (chunk1, chunk2))
-                dset = nxData.require_dataset('data',
-                               shape=shape,
-                               dtype=dtype,
-                               chunks=(1, chunk1, chunk2),
-                               compression=compression)
-            else:
-                if DEBUG:
-                    print("Saving not compressed and notchunked dataset")
-                dset = nxData.require_dataset('data',
-                               shape=shape,
-                               dtype=dtype,
-                               compression=None)
-            tmpData = numpy.zeros((1, data.shape[1], data.shape[2]),
-                                  data.dtype)
-            for i in range(data.shape[0]):
-                tmpData[0:1] = data[i:i + 1]
-                dset[i:i + 1] = tmpData[0:1]
-                print("Saved item %d of %d" % (i + 1, data.shape[0]))
+            chunks = dset.chunks[0]
+        # number of items of the first axis of the output written at once
+        n = _getBlockSize(shape[0],
+                          shape[1] * shape[2] * data.dtype.itemsize,
+                          chunks)
+        if modify and (interpretation in ["image"]):
+            # stack of spectra saved as stack of images
+            for i in range(0, shape[0], n):
+                dset[i:i + n] = numpy.transpose(data[:, :, i:i + n],
+                                                (2, 0, 1))
+                print("Saved item %d of %d" % (min(i + n, shape[0]),
+                                               shape[0]))
+        elif modify:
+            # stack of images saved as stack of spectra
+            for i in range(0, shape[0], n):
+                dset[i:i + n] = numpy.transpose(data[:, i:i + n, :],
+                                                (1, 2, 0))
+                print("Saved item %d of %d" % (min(i + n, shape[0]),
+                                               shape[0]))
+        else:
+            for i in range(0, shape[0], n):
+                dset[i:i + n] = data[i:i + n]
+                print("Saved item %d of %d" % (min(i + n, shape[0]),
+                                               shape[0]))
 
         dset.attrs['signal'] = "1".encode('utf-8')
         if interpretation is not None:
@@ -605,13 +663,16 @@ def save3DArrayAsHDF5(data, filename, axes=None, labels=None, dtype=None, mode='
             except:
                 raise IOError("Cannot overwrite existing file!")
         hdf = h5py.File(filename, 'a')
-        if compression:
+        options = getCompressionOptions(compression)
+        if options:
             hdf.require_dataset('data',
                            shape=shape,
                            dtype=dtype,
                            data=data,
-                           chunks=(1, shape[1], shape[2]),
-                           compression=compression)
+                           chunks=getChunkShape(shape, dtype,
+                                                mcaindex=mcaindex,
+                                                access=access),
+                           **options)
         else:
             hdf.require_dataset('data',
                            shape=shape,
@@ -0,0 +1,142 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+__author__ = "V.A. Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+__doc__ = """
+Read arrays stored as raw binary data.
+
+The map readers describe where their data are (offset, shape, byte order
+and, for data interleaved with other information, the strides in bytes)
+and get them in a single numpy operation instead of unpacking them value
+by value. The data can also be memory mapped to be read on demand.
+"""
+import numpy
+
+
+def _getDtype(dtype, byteorder=None):
+    """
+    :param byteorder: "<" little endian, ">" big endian or None for native
+    """
+    dtype = numpy.dtype(dtype)
+    if byteorder is not None:
+        dtype = dtype.newbyteorder(byteorder)
+    return dtype
+
+
+def _getRequiredSize(dtype, shape, offset, strides):
+    if strides is None:
+        size = dtype.itemsize
+        for n in shape:
+            size *= n
+    else:
+        size = dtype.itemsize
+        for n, stride in zip(shape, strides):
+            if n == 0:
+                return offset
+            size += (n - 1) * stride
+    return offset + size
+
+
+def _toNative(array):
+    """
+    Contiguous copy of the array in native byte order.
+    """
+    return numpy.array(array, dtype=array.dtype.newbyteorder("="), order="C")
+
+
+def fromBuffer(buffer, dtype, shape, offset=0, strides=None, byteorder=None,
+               copy=True):
+    """
+    Get an array from a block of memory.
+
+    :param buffer: bytes or any object exposing the buffer interface
+    :param dtype: data type of the stored values
+    :param shape: shape of the array
+    :param offset: position in bytes of the first value
+    :param strides: optional strides in bytes to skip interleaved information
+    :param byteorder: "<" little endian, ">" big endian or None for native
+    :param copy: if True, return a contiguous array in native byte order,
+                 else a view of the buffer
+    :return: the array
+    """
+    dtype = _getDtype(dtype, byteorder)
+    shape = tuple([int(n) for n in shape])
+    if strides is not None:
+        strides = tuple([int(n) for n in strides])
+    nBytes = numpy.frombuffer(buffer, dtype=numpy.uint8).size
+    if _getRequiredSize(dtype, shape, offset, strides) > nBytes:
+        raise IOError("Not enough data for an array of shape %s" % (shape,))
+    array = numpy.ndarray(shape, dtype=dtype, buffer=buffer,
+                          offset=offset, strides=strides)
+    if copy:
+        return _toNative(array)
+    return array
+
+
+def fromFile(filename, dtype, shape, offset=0, strides=None, byteorder=None,
+             mmap=False):
+    """
+    Get an array from a file.
+
+    :param filename: name of the file
+    :param dtype: data type of the stored values
+    :param shape: shape of the array
+    :param offset: position in bytes of the first value
+    :param strides: optional strides in bytes to skip interleaved information
+    :param byteorder: "<" little endian, ">" big endian or None for native
+    :param mmap: if True, return a read only view of the memory mapped file.
+                 The values are read when used.
+    :return: the array, in native byte order unless memory mapped
+    """
+    dtype = _getDtype(dtype, byteorder)
+    shape = tuple([int(n) for n in shape])
+    if mmap:
+        buffer = numpy.memmap(filename, dtype=numpy.uint8, mode="r")
+        return fromBuffer(buffer, dtype, shape, offset=offset,
+                          strides=strides, copy=False)
+    nBytes = _getRequiredSize(dtype, shape, offset, strides) - offset
+    f = open(filename, "rb")
+    try:
+        f.seek(offset)
+        if strides is None:
+            count = nBytes // dtype.itemsize
+            array = numpy.fromfile(f, dtype=dtype, count=count)
+            if array.size != count:
+                raise IOError("Not enough data for an array of shape %s" % \
+                              (shape,))
+            array.shape = shape
+            if not dtype.isnative:
+                array = _toNative(array)
+            return array
+        buffer = f.read(nBytes)
+    finally:
+        f.close()
+    return fromBuffer(buffer, dtype, shape, strides=strides)
@@ -31,10 +31,16 @@
 __license__ = "MIT"
 __copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
 import sys
+import os
+import re
 if sys.version < '3.0':
     import ConfigParser
+    # the fast parser follows the Python 3 configparser rules
+    USE_FAST_PARSER = False
 else:
     import configparser as ConfigParser
+    from collections import OrderedDict
+    USE_FAST_PARSER = True
 try:
     import numpy
     USE_NUMPY = True
@@ -42,6 +48,184 @@
     # do not use numpy, use lists
     USE_NUMPY = False
 
+# maximum number of files kept in the parsed files cache
+CACHE_SIZE = 64
+
+_SECTION_RE = re.compile(r"\[(?P<header>.+)\]")
+_OPTION_RE = re.compile(r"(?P<option>.*?)\s*(?P<vi>=|:)\s*(?P<value>.*)$")
+_CACHE = {}
+
+
+class _ParserFallback(Exception):
+    """
+    Raised when a file needs the configparser module to be read
+    """
+    pass
+
+
+def _parseString(sstr):
+    # only numbers, inf and nan can be converted
+    if (not sstr) or (sstr[0].isalpha() and (sstr[0] not in "iInN")):
+        return sstr
+    try:
+        return int(sstr)
+    except ValueError:
+        try:
+            return float(sstr)
+        except ValueError:
+            return sstr
+
+
+def _parseLine(line):
+    if line.find(',') != -1:
+        if line.endswith(','):
+            if ',' in line[:-1]:
+                return [_parseString(sstr.strip())
+                        for sstr in line[:-1].split(',')]
+            else:
+                return [_parseString(line[:-1].strip())]
+        else:
+            return [_parseString(sstr.strip())
+                    for sstr in line.split(',')]
+    else:
+        return _parseString(line.strip())
+
+
+def _parseData(data):
+    if len(data):
+        if data.find(',') == -1:
+            # it is not a list
+            if USE_NUMPY and (data[0] == '[') and (data[-1] == ']'):
+                # this looks as an array
+                try:
+                    return numpy.array(data[1:-1].split(), dtype=numpy.float64)
+                except ValueError:
+                    try:
+                        if (data[2] == '[') and (data[-3] == ']'):
+                            nrows = len(data[3:-3].split('] ['))
+                            indata = data[3:-3].replace('] [', ' ')
+                            indata = numpy.array(indata.split(),
+                                                 dtype=numpy.float64)
+                            indata.shape = nrows, -1
+                            return indata
+                    except ValueError:
+                        pass
+    dataline = [line for line in data.splitlines()]
+    if len(dataline) == 1:
+        return _parseLine(dataline[0])
+    else:
+        return [_parseLine(line) for line in dataline]
+
+
+def _copyValue(value):
+    if isinstance(value, list):
+        return [_copyValue(item) for item in value]
+    if USE_NUMPY and isinstance(value, numpy.ndarray):
+        return value.copy()
+    return value
+
+
+def _parseFile(filename):
+    """
+    Parse an ini file following the rules of the configparser module as
+    used by ConfigDict: no inline comments, case sensitive options, strict
+    mode and multiline values.
+
+    Return the list of (section, [(option, value), ...]) with the values
+    already converted. Raise _ParserFallback when the file needs the
+    configparser module (DEFAULT section, interpolation or errors).
+    """
+    sectionList = []
+    sectionDict = {}
+    current = None
+    sectname = None
+    optname = None
+    indentLevel = 0
+    fp = open(filename)
+    try:
+        for line in fp:
+            value = line.strip()
+            if not value:
+                # empty lines are part of multiline values
+                if (current is not None) and optname:
+                    current[optname].append('')
+                continue
+            if value[0] in "#;":
+                continue
+            curIndentLevel = len(line) - len(line.lstrip())
+            if (current is not None) and optname and \
+               (curIndentLevel > indentLevel):
+                # continuation line
+                current[optname].append(value)
+                continue
+            indentLevel = curIndentLevel
+            match = _SECTION_RE.match(value)
+            if match:
+                sectname = match.group('header')
+                if (sectname == 'DEFAULT') or (sectname in sectionDict):
+                    raise _ParserFallback(sectname)
+                current = OrderedDict()
+                sectionDict[sectname] = current
+                sectionList.append((sectname, current))
+                optname = None
+                continue
+            if current is None:
+                raise _ParserFallback("Missing section header")
+            match = _OPTION_RE.match(value)
+            if (match is None) or (not match.group('option')):
+                raise _ParserFallback(line)
+            optname = match.group('option').rstrip()
+            if optname in current:
+                raise _ParserFallback(optname)
+            current[optname] = [match.group('value').strip()]
+    finally:
+        fp.close()
+    parsed = []
+    for sectname, options in sectionList:
+        optionList = []
+        for optname in options:
+            data = '\n'.join(options[optname]).rstrip()
+            if '%' in data:
+                # interpolation
+                raise _ParserFallback(data)
+            optionList.append((optname, _parseData(data)))
+        parsed.append((sectname, optionList))
+    return parsed
+
+
+def _getParsedFile(filename, cache=True):
+    """
+    Return the parsed contents of the file using the cache when the
+    modification time and the size of the file did not change.
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        # configparser silently ignores files that cannot be read
+        return []
+    stamp = (getattr(stat, "st_mtime_ns", stat.st_mtime), stat.st_size)
+    key = os.path.abspath(filename)
+    if cache:
+        entry = _CACHE.get(key, None)
+        if (entry is not None) and (entry[0] == stamp):
+            return entry[1]
+    try:
+        parsed = _parseFile(filename)
+    except (IOError, OSError):
+        return []
+    if cache:
+        if len(_CACHE) >= CACHE_SIZE:
+            _CACHE.clear()
+        _CACHE[key] = (stamp, parsed)
+    return parsed
+
+
+def clearCache():
+    """
+    Forget all the parsed files
+    """
+    _CACHE.clear()
+
 
 class ConfigDict(dict):
     def __init__(self, defaultdict=None, initdict=None, filelist=None):
@@ -88,16 +272,33 @@ def getlastfile(self):
     def __convert(self, option):
         return option
 
-    def read(self, filelist, sections=None):
+    def read(self, filelist, sections=None, cache=True):
         """
         read the input filename into the internal dictionary
+
+        :param filelist: File name or list of file names
+        :param sections: Optional list of sections to be read
+        :param cache: If True (default), reuse the contents of files
+                      already read if their modification time and size
+                      did not change
         """
         filelist = self.__tolist(filelist)
         sections = self.__tolist(sections)
-        cfg = ConfigParser.ConfigParser()
-        cfg.optionxform = self.__convert
-        cfg.read(filelist)
-        self.__read(cfg, sections)
+        parsedList = None
+        if USE_FAST_PARSER:
+            try:
+                parsedList = [_getParsedFile(ffile, cache=cache)
+                              for ffile in filelist]
+            except _ParserFallback:
+                parsedList = None
+        if parsedList is None:
+            cfg = ConfigParser.ConfigParser()
+            cfg.optionxform = self.__convert
+            cfg.read(filelist)
+            self.__read(cfg, sections)
+        else:
+            for parsed in parsedList:
+                self.__readParsed(parsed, sections)
 
         for ffile in filelist:
             self.filelist.append([ffile, sections])
@@ -121,53 +322,28 @@ def __read(self, cfg, sections=None):
             for opt in cfg.options(sect):
                 ddict[opt] = self.__parse_data(cfg.get(sect, opt))
 
+    def __readParsed(self, parsed, sections=None):
+        for sect, options in parsed:
+            if (sections is not None) and (sect not in sections):
+                continue
+            ddict = self
+            for subsectw in sect.split('.'):
+                subsect = subsectw.replace("_|_", ".")
+                if not (subsect in ddict):
+                    ddict[subsect] = {}
+                ddict = ddict[subsect]
+            for opt, value in options:
+                # the parsed values can be shared through the cache
+                ddict[opt] = _copyValue(value)
+
     def __parse_data(self, data):
-        if len(data):
-            if data.find(',') == -1:
-                # it is not a list
-                if USE_NUMPY and (data[0] == '[') and (data[-1] == ']'):
-                    # this looks as an array
-                    try:
-                        return numpy.array([float(x) for x in data[1:-1].split()])
-                    except ValueError:
-                        try:
-                            if (data[2] == '[') and (data[-3] == ']'):
-                                nrows = len(data[3:-3].split('] ['))
-                                indata = data[3:-3].replace('] [', ' ')
-                                indata = numpy.array([float(x) for x in
-                                                      indata.split()])
-                                indata.shape = nrows, -1
-                                return indata
-                        except ValueError:
-                            pass
-        dataline = [line for line in data.splitlines()]
-        if len(dataline) == 1:
-            return self.__parse_line(dataline[0])
-        else:
-            return [self.__parse_line(line) for line in dataline]
+        return _parseData(data)
 
     def __parse_line(self, line):
-        if line.find(',') != -1:
-            if line.endswith(','):
-                if ',' in line[:-1]:
-                    return [self.__parse_string(sstr.strip())
-                            for sstr in line[:-1].split(',')]
-                else:
-                    return [self.__parse_string(line[:-1].strip())]
-            else:
-                return [self.__parse_string(sstr.strip())
-                        for sstr in line.split(',')]
-        else:
-            return self.__parse_string(line.strip())
+        return _parseLine(line)
 
     def __parse_string(self, sstr):
-        try:
-            return int(sstr)
-        except ValueError:
-            try:
-                return float(sstr)
-            except ValueError:
-                return sstr
+        return _parseString(sstr)
 
     def tostring(self, sections=None):
         import StringIO
@@ -200,8 +376,16 @@ def __write(self, fp, ddict, sections=None, secthead=None):
         for key in valkey:
             if USE_NUMPY:
                 if isinstance(ddict[key], numpy.ndarray):
+                    array = ddict[key]
+                    if (array.ndim == 1) and \
+                       (array.dtype.kind in "biu" or \
+                        array.dtype == numpy.float64):
+                        # same text as the numpy scalars but faster
+                        values = map(str, array.tolist())
+                    else:
+                        values = [str(val) for val in array]
                     fp.write('%s =' % key + ' [ ' +
-                             ' '.join([str(val) for val in ddict[key]]) +
+                             ' '.join(values) +
                              ' ]\n')
                     continue
             fp.write('%s = %s\n' % (key, ddict[key]))
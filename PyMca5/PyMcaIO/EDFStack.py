@@ -55,6 +55,28 @@
 Y_AXIS=1
 Z_AXIS=2
 
+def _iterFirstImages(filelist):
+    """
+    Iterate over the first image of each file of the list.
+    Lists of Pilatus CBF files are decoded by several threads.
+    """
+    if EdfFile.PILATUS_CBF_SUPPORT:
+        isCBF = True
+        for filename in filelist:
+            if not filename.upper().endswith(".CBF"):
+                isCBF = False
+                break
+        if isCBF:
+            fd = open(filelist[0], "rb")
+            isCBF = fd.read(1) != "{".encode("latin-1")
+            fd.close()
+        if isCBF:
+            for data in EdfFile.PilatusCBF.iterData(filelist):
+                yield data
+            return
+    for filename in filelist:
+        yield EdfFile.EdfFile(filename, 'rb').GetData(0)
+
 class EDFStack(DataObject.DataObject):
     def __init__(self, filelist = None, imagestack=None, dtype=None):
         DataObject.DataObject.__init__(self)
@@ -174,9 +196,7 @@ def loadFileList(self, filelist, fileindex=0):
                                                      arrRet.shape[1]),
                                                      self.__dtype)
                             self.incrProgressBar=0
-                            for tempEdfFileName in filelist:
-                                tempEdf=EdfFile.EdfFile(tempEdfFileName, 'rb')
-                                pieceOfStack=tempEdf.GetData(0)
+                            for pieceOfStack in _iterFirstImages(filelist):
                                 self.data[self.incrProgressBar] = pieceOfStack
                                 self.incrProgressBar += 1
                                 self.onProgress(self.incrProgressBar)
@@ -187,9 +207,7 @@ def loadFileList(self, filelist, fileindex=0):
                                                      self.nbFiles),
                                                      self.__dtype)
                             self.incrProgressBar=0
-                            for tempEdfFileName in filelist:
-                                tempEdf=EdfFile.EdfFile(tempEdfFileName, 'rb')
-                                pieceOfStack=tempEdf.GetData(0)
+                            for pieceOfStack in _iterFirstImages(filelist):
                                 self.data[:,:, self.incrProgressBar] = pieceOfStack
                                 self.incrProgressBar += 1
                                 self.onProgress(self.incrProgressBar)
@@ -405,9 +423,7 @@ def loadFileList(self, filelist, fileindex=0):
                                     raise MemoryError("Memory Error")
                     self.incrProgressBar=0
                     if fileindex == 1:
-                        for tempEdfFileName in filelist:
-                            tempEdf=EdfFile.EdfFile(tempEdfFileName, 'rb')
-                            pieceOfStack=tempEdf.GetData(0)
+                        for pieceOfStack in _iterFirstImages(filelist):
                             self.data[:,self.incrProgressBar,:] = pieceOfStack[:,:]
                             self.incrProgressBar += 1
                             self.onProgress(self.incrProgressBar)
@@ -439,14 +455,12 @@ def loadFileList(self, filelist, fileindex=0):
                                     motorName = positionersEdf.GetHeader(i).get("Title", "Motor_%02d" % i)
                                     motorValue = positionersEdf.GetData(i)
                                     self.info["positioners"][motorName] = motorValue
-                        for tempEdfFileName in filelist:
-                            tempEdf=EdfFile.EdfFile(tempEdfFileName, 'rb')
+                        for pieceOfStack in _iterFirstImages(filelist):
+                            tempEdfFileName = filelist[self.incrProgressBar]
                             if ID24:
-                                pieceOfStack=-numpy.log((tempEdf.GetData(0) - bckData)/(i0Start[0,:] + id24idx * i0Slope))
+                                pieceOfStack=-numpy.log((pieceOfStack - bckData)/(i0Start[0,:] + id24idx * i0Slope))
                                 pieceOfStack[numpy.isfinite(pieceOfStack) == False] = 1
                                 id24idx += 1
-                            else:
-                                pieceOfStack=tempEdf.GetData(0)
                             try:
                                 self.data[self.incrProgressBar, :,:] = pieceOfStack[:,:]
                             except:
@@ -0,0 +1,352 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2016 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+__author__ = "V.A. Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+__doc__ = """
+Write the images produced by a batch of fits while the fits progress.
+
+Every pixel carries one value per label (peak areas, their uncertainties,
+chi square, concentrations, ...). Only a block of rows is kept in memory.
+Once the fit moves past a block, the block is appended to:
+
+    - one EDF file per selected label
+    - a text table with one line per pixel: "row  column  value ..."
+    - an HDF5 file with the datasets "images" (labels, rows, columns),
+      "names" and "fill" (the value of the pixels never set)
+
+Pixels never set keep their fill value. Rows are normally filled in
+increasing order, but a row already written can be set again (for instance
+when the row index restarts with every file of a stack). The written blocks
+are kept in a temporary file so that such a block can be read back, updated
+and written again at its place; the last value set for a pixel wins, as
+with a full image held in memory.
+"""
+import sys
+import tempfile
+import numpy
+from . import EdfFile
+try:
+    import h5py
+    HDF5SUPPORT = True
+except ImportError:
+    HDF5SUPPORT = False
+
+DEBUG = 0
+
+# number of values buffered in memory before writing
+BUFFER_SIZE = 1024 * 1024
+
+if sys.byteorder == "big":
+    _BYTE_ORDER = "HighByteFirst"
+else:
+    _BYTE_ORDER = "LowByteFirst"
+
+
+def _getEdfHeader(title, shape, dtype):
+    """
+    Header of a single image EDF file as written by EdfFile.
+    """
+    staticHeader = {"HeaderID": "EH:%06d:000000:000000" % 1,
+                    "Image": 1,
+                    "ByteOrder": _BYTE_ORDER,
+                    "DataType": "DoubleValue",
+                    "Dim_1": "%d" % shape[1],
+                    "Dim_2": "%d" % shape[0],
+                    "Size": "%d" % (shape[0] * shape[1] * \
+                                    numpy.dtype(dtype).itemsize)}
+    text = "{\n"
+    for key in EdfFile.STATIC_HEADER_ELEMENTS:
+        if key in staticHeader:
+            text += "%s = %s ;\n" % (key, staticHeader[key])
+    text += "Title = %s ;\n" % title
+    size = ((len(text) + 1) // EdfFile.HEADER_BLOCK_SIZE + 1) * \
+           EdfFile.HEADER_BLOCK_SIZE - 2
+    text = text.ljust(size) + "}\n"
+    return text.encode()
+
+
+class FitImageSink(object):
+    def __init__(self, shape, labels, fill=None, edffiles=None, titles=None,
+                 textfile=None, textlabel=None, hdf5file=None):
+        """
+        :param shape: (rows, columns) of the images
+        :param labels: list with one label per image
+        :param fill: list with the value of the pixels never set, default 0
+        :param edffiles: list with one EDF file name or None per label
+        :param titles: list with the title of each EDF image, default labels
+        :param textfile: name of the text table output or None
+        :param textlabel: first line of the text table
+        :param hdf5file: name of the HDF5 output or None
+        """
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.labels = list(labels)
+        nLabels = len(self.labels)
+        if fill is None:
+            fill = [0.0] * nLabels
+        if len(fill) != nLabels:
+            raise ValueError("One fill value per label is needed")
+        self._fill = numpy.array(fill, dtype=numpy.float64).reshape(-1, 1, 1)
+        self._bufferRows = max(1, min(self.shape[0],
+                           BUFFER_SIZE // max(1, nLabels * self.shape[1])))
+        self._buffer = numpy.zeros((nLabels, self._bufferRows, self.shape[1]),
+                                   dtype=numpy.float64)
+        self._buffer[:] = self._fill
+        # first image row held by the buffer
+        self._firstRow = 0
+        # rows already written to the outputs
+        self._writtenRows = 0
+        # all the written rows, to read back blocks set again
+        self._scratch = tempfile.TemporaryFile()
+        self._closed = False
+
+        # EDF outputs
+        self._edf = []
+        if edffiles is None:
+            edffiles = [None] * nLabels
+        if titles is None:
+            titles = self.labels
+        if (len(edffiles) != nLabels) or (len(titles) != nLabels):
+            raise ValueError("One EDF file name and title per label needed")
+        for i in range(nLabels):
+            if edffiles[i] is None:
+                continue
+            header = _getEdfHeader(titles[i], self.shape, numpy.float64)
+            f = open(edffiles[i], "wb")
+            f.write(header)
+            f.close()
+            self._edf.append((i, edffiles[i], len(header)))
+
+        # text output
+        self._textFile = textfile
+        if textfile is not None:
+            if textlabel is None:
+                textlabel = "row  column  " + "  ".join(self.labels)
+            self._textLabel = textlabel
+            f = open(textfile, "w")
+            f.write("%s\n" % textlabel)
+            f.close()
+            # the table has to be written again if a written row changes
+            self._textDirty = False
+            self._textFormat = ["%d", "%d"] + ["%g"] * nLabels
+            rows, cols = numpy.meshgrid(numpy.arange(self._bufferRows),
+                                        numpy.arange(self.shape[1]),
+                                        indexing="ij")
+            self._textIndices = numpy.array([rows.ravel(), cols.ravel()],
+                                            dtype=numpy.float64).T
+
+        # HDF5 output
+        self._h5 = None
+        if hdf5file is not None:
+            if not HDF5SUPPORT:
+                raise ImportError("h5py is needed to write HDF5 images")
+            self._h5 = h5py.File(hdf5file, "w")
+            self._h5.create_dataset("images",
+                                    shape=(nLabels,) + self.shape,
+                                    dtype=numpy.float64,
+                                    chunks=(1, self._bufferRows,
+                                            self.shape[1]))
+            self._h5["names"] = numpy.array([label.encode("utf-8") \
+                                             for label in self.labels])
+            self._h5["fill"] = self._fill.ravel()
+
+    def getEdfFileList(self):
+        return [name for i, name, offset in self._edf]
+
+    def setPixel(self, row, col, values):
+        """
+        Set the values of all the labels of an image pixel.
+
+        :param row: image row
+        :param col: image column
+        :param values: one value per label, None keeps the previous value
+        """
+        if self._closed:
+            raise ValueError("Image sink already closed")
+        if (row < 0) or (row >= self.shape[0]):
+            raise ValueError("Image row %d out of range" % row)
+        if (col < 0) or (col >= self.shape[1]):
+            raise ValueError("Image column %d out of range" % col)
+        if (row < self._firstRow) or \
+           (row >= (self._firstRow + self._bufferRows)):
+            self._flush()
+            self._fillRows((row // self._bufferRows) * self._bufferRows)
+            self._load((row // self._bufferRows) * self._bufferRows)
+        bufferRow = row - self._firstRow
+        for i, value in enumerate(values):
+            if value is not None:
+                self._buffer[i, bufferRow, col] = value
+
+    def _flush(self):
+        """
+        Write the buffered rows at their place in the outputs.
+        """
+        nRows = min(self._bufferRows, self.shape[0] - self._firstRow)
+        if nRows <= 0:
+            return
+        block = self._buffer[:, :nRows, :]
+        for i, filename, offset in self._edf:
+            f = open(filename, "r+b")
+            f.seek(offset + self._firstRow * self.shape[1] * 8)
+            f.write(numpy.ascontiguousarray(block[i]).tobytes())
+            f.close()
+        self._scratch.seek(self._firstRow * self.shape[1] * 8 * \
+                           len(self.labels))
+        self._scratch.write(numpy.ascontiguousarray(\
+                                block.transpose(1, 0, 2)).tobytes())
+        if self._textFile is not None:
+            if self._firstRow < self._writtenRows:
+                self._textDirty = True
+            else:
+                f = open(self._textFile, "ab")
+                self._writeText(f, self._firstRow, block)
+                f.close()
+        if self._h5 is not None:
+            self._h5["images"][:, self._firstRow:self._firstRow + nRows] = \
+                                                                        block
+        if DEBUG:
+            print("Written rows %d to %d" % (self._firstRow,
+                                             self._firstRow + nRows - 1))
+        self._writtenRows = max(self._writtenRows, self._firstRow + nRows)
+
+    def _fillRows(self, nRows):
+        """
+        Write the fill value to the rows never written below nRows.
+        """
+        while self._writtenRows < nRows:
+            self._load(self._writtenRows)
+            self._flush()
+
+    def _load(self, firstRow):
+        """
+        Move the buffer to the rows starting at firstRow, reading back the
+        rows already written.
+        """
+        self._firstRow = firstRow
+        self._buffer[:] = self._fill
+        nRows = min(self._bufferRows, self._writtenRows - firstRow)
+        if nRows <= 0:
+            return
+        rowSize = self.shape[1] * len(self.labels)
+        self._scratch.seek(firstRow * rowSize * 8)
+        data = numpy.frombuffer(self._scratch.read(nRows * rowSize * 8),
+                                dtype=numpy.float64)
+        self._buffer[:, :nRows, :] = data.reshape(nRows, len(self.labels),
+                                        self.shape[1]).transpose(1, 0, 2)
+
+    def _writeText(self, f, firstRow, block):
+        nPixels = block.shape[1] * self.shape[1]
+        table = numpy.empty((nPixels, 2 + len(self.labels)),
+                            dtype=numpy.float64)
+        table[:, :2] = self._textIndices[:nPixels]
+        table[:, 0] += firstRow
+        table[:, 2:] = block.reshape(len(self.labels), nPixels).T
+        numpy.savetxt(f, table, fmt=self._textFormat, delimiter="  ")
+
+    def close(self):
+        """
+        Write the remaining rows and close the outputs.
+        """
+        if self._closed:
+            return
+        self._flush()
+        self._fillRows(self.shape[0])
+        if self._textFile is not None:
+            if self._textDirty:
+                f = open(self._textFile, "wb")
+                f.write(("%s\n" % self._textLabel).encode())
+                for firstRow in range(0, self.shape[0], self._bufferRows):
+                    self._load(firstRow)
+                    nRows = min(self._bufferRows, self.shape[0] - firstRow)
+                    self._writeText(f, firstRow, self._buffer[:, :nRows])
+                f.close()
+            f = open(self._textFile, "a")
+            f.write("\n")
+            f.close()
+        if self._h5 is not None:
+            self._h5.close()
+            self._h5 = None
+        self._scratch.close()
+        self._scratch = None
+        self._buffer = None
+        self._closed = True
+
+    def __del__(self):
+        try:
+            self.close()
+        except:
+            pass
+
+
+def mergeFitImageFiles(filelist, outputfile):
+    """
+    Add the HDF5 images written by the different chunks of a batch.
+    Pixels keeping the fill value of a label (for instance the chi square
+    of pixels not fitted) are ignored, the others keep their values.
+
+    :param filelist: list of HDF5 image files of identical layout
+    :param outputfile: name of the output HDF5 file
+    """
+    if not HDF5SUPPORT:
+        raise ImportError("h5py is needed to merge HDF5 images")
+    inputs = [h5py.File(filename, "r") for filename in filelist]
+    try:
+        names = inputs[0]["names"][()]
+        shape = inputs[0]["images"].shape
+        if "fill" in inputs[0]:
+            fill = inputs[0]["fill"][()]
+        else:
+            fill = numpy.zeros((shape[0],), dtype=numpy.float64)
+        for h5 in inputs[1:]:
+            if h5["images"].shape != shape:
+                raise ValueError("Images of %s do not match" % h5.filename)
+        output = h5py.File(outputfile, "w")
+        try:
+            images = output.create_dataset("images",
+                                           shape=shape,
+                                           dtype=numpy.float64,
+                                           chunks=(1,) + shape[1:])
+            output["names"] = names
+            output["fill"] = fill
+            for i in range(shape[0]):
+                data = numpy.zeros(shape[1:], dtype=numpy.float64)
+                isSet = numpy.zeros(shape[1:], dtype=bool)
+                for h5 in inputs:
+                    data0 = h5["images"][i]
+                    data0Set = data0 != fill[i]
+                    data[data0Set] += data0[data0Set]
+                    isSet |= data0Set
+                data[~isSet] = fill[i]
+                images[i] = data
+        finally:
+            output.close()
+    finally:
+        for h5 in inputs:
+            h5.close()
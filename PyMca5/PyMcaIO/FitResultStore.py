@@ -0,0 +1,392 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2016 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+__author__ = "V.A. Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+__doc__ = """
+Store the results of a batch of fits in a single HDF5 file.
+
+Every fitted spectrum is identified by its source file and its key. The
+fitted parameters, their uncertainties, the reduced chi square, the group
+areas and, if calculated, the concentrations are kept as rows of chunked
+two-dimensional datasets, one column per quantity:
+
+    /source                  source file of each spectrum
+    /key                     key of each spectrum
+    /chisq                   reduced chi square
+    /parameters/names        fit parameter names
+    /parameters/values       fitted parameters
+    /parameters/sigmas       uncertainties of the fitted parameters
+    /groups/names            peak family names
+    /groups/fitarea          fitted areas
+    /groups/sigmaarea        uncertainties of the fitted areas
+    /concentrations/names    concentrations entries as "key/group" paths
+    /concentrations/values   concentrations values
+
+It is meant as an alternative to writing one .fit file per spectrum.
+"""
+import json
+import numpy
+import h5py
+
+DEBUG = 0
+
+_STRING_DTYPE = h5py.special_dtype(vlen=str)
+
+_SECTIONS = [("parameters", ["values", "sigmas"]),
+             ("groups", ["fitarea", "sigmaarea"]),
+             ("concentrations", ["values"])]
+
+_DATASETS = ["chisq"] + [section + "/" + name \
+                         for section, names in _SECTIONS for name in names]
+
+def _toString(value):
+    if hasattr(value, "decode"):
+        return value.decode("utf-8")
+    return "%s" % value
+
+def _flattenConcentrations(ddict, prefix="", names=None, values=None,
+                           lists=None):
+    """
+    Split a concentrations dictionary into its numerical entries, indexed
+    by their "key/subkey" path, and its lists of names.
+    """
+    if names is None:
+        names = []
+        values = []
+        lists = {}
+    for key in ddict:
+        item = ddict[key]
+        if isinstance(item, dict):
+            _flattenConcentrations(item, prefix + key + "/",
+                                   names, values, lists)
+        elif isinstance(item, (list, tuple)):
+            lists[prefix + key] = [_toString(x) for x in item]
+        else:
+            try:
+                value = float(item)
+            except (TypeError, ValueError):
+                continue
+            names.append(prefix + key)
+            values.append(value)
+    return names, values, lists
+
+def _buildConcentrations(names, values, lists):
+    ddict = {}
+    for key in lists:
+        ddict[key] = list(lists[key])
+    for name, value in zip(names, values):
+        path = name.split("/")
+        target = ddict
+        for key in path[:-1]:
+            if key not in target:
+                target[key] = {}
+            target = target[key]
+        target[path[-1]] = float(value)
+    return ddict
+
+
+class FitResultStore(object):
+    def __init__(self, filename, mode="a", buffersize=256):
+        """
+        :param filename: Name of the HDF5 file
+        :param mode: h5py file mode. Default is "a" (create or append)
+        :param buffersize: Number of results kept in memory before being
+                           written to the file
+        """
+        self._filename = filename
+        self._file = h5py.File(filename, mode)
+        self._bufferSize = max(1, int(buffersize))
+        self._index = {}
+        self._names = {}
+        self._lists = None
+        self._pending = []
+        if "source" in self._file:
+            sources = self._file["source"][()]
+            keys = self._file["key"][()]
+            for i in range(len(sources)):
+                self._index[(_toString(sources[i]), _toString(keys[i]))] = i
+            for section in ["parameters", "groups", "concentrations"]:
+                if section in self._file:
+                    self._names[section] = [_toString(x) for x in \
+                                        self._file[section]["names"][()]]
+            if "concentrations" in self._file:
+                self._lists = json.loads( \
+                    _toString(self._file["concentrations"].attrs["lists"]))
+        self._nStored = len(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, item):
+        return tuple(item) in self._index
+
+    def keys(self):
+        """
+        Return the list of (source, key) pairs in storage order.
+        """
+        keys = [None] * len(self._index)
+        for item, row in self._index.items():
+            keys[row] = item
+        return keys
+
+    def addResult(self, source, key, result, concentrations=None):
+        """
+        Add the result of one fit.
+
+        :param source: Name of the file containing the spectrum
+        :param key: Key of the spectrum in that file
+        :param result: Fit result as given by the McaTheory digestresult or
+                       imagingDigestResult methods. If present, the keys
+                       parameters, fittedpar and sigmapar are also stored.
+        :param concentrations: Optional concentrations dictionary as given by
+                               ConcentrationsTool.processFitResult
+        """
+        item = (source, key)
+        if item in self._index:
+            raise ValueError("Result of %s %s already stored" % item)
+        record = {}
+        record["chisq"] = result.get("chisq", -1.0)
+        groups = list(result["groups"])
+        record["groups"] = (groups,
+                            [result[group]["fitarea"] for group in groups],
+                            [result[group]["sigmaarea"] for group in groups])
+        if "parameters" in result:
+            record["parameters"] = (list(result["parameters"]),
+                                    result["fittedpar"],
+                                    result["sigmapar"])
+        if concentrations is not None:
+            names, values, lists = _flattenConcentrations(concentrations)
+            order = numpy.argsort(names)
+            record["concentrations"] = ([names[i] for i in order],
+                                        [values[i] for i in order])
+            if self._lists is None:
+                self._lists = lists
+        for section in ["parameters", "groups", "concentrations"]:
+            if section not in record:
+                continue
+            names = record[section][0]
+            if section not in self._names:
+                self._names[section] = names
+            elif self._names[section] != names:
+                raise ValueError("%s of %s %s differ from the stored ones" % \
+                                 (section, source, key))
+        self._index[item] = len(self._index)
+        self._pending.append((item, record))
+        if len(self._pending) >= self._bufferSize:
+            self.flush()
+
+    def getResult(self, source, key):
+        """
+        Return the stored (result, concentrations) of the given spectrum.
+
+        The result dictionary has the same layout as the one returned by the
+        McaTheory imagingDigestResult method plus, if available, the
+        parameters, fittedpar and sigmapar keys. The concentrations are None
+        if they were not stored.
+        """
+        row = self._index[(source, key)]
+        if row >= self._nStored:
+            record = self._pending[row - self._nStored][1]
+        else:
+            record = {}
+            record["chisq"] = self._file["chisq"][row]
+            for section, datasets in _SECTIONS:
+                if section in self._file:
+                    values = [self._file[section][name][row] \
+                              for name in datasets]
+                    # rows written before the section existed are NaN
+                    if not numpy.isnan(values[0]).all():
+                        record[section] = [self._names[section]] + values
+        result = {}
+        result["chisq"] = float(record["chisq"])
+        groups, fitarea, sigmaarea = record["groups"]
+        result["groups"] = list(groups)
+        for i, group in enumerate(groups):
+            result[group] = {}
+            result[group]["fitarea"] = float(fitarea[i])
+            result[group]["sigmaarea"] = float(sigmaarea[i])
+        if "parameters" in record:
+            names, values, sigmas = record["parameters"]
+            result["parameters"] = list(names)
+            result["fittedpar"] = numpy.array(values, numpy.float64)
+            result["sigmapar"] = numpy.array(sigmas, numpy.float64)
+        concentrations = None
+        if "concentrations" in record:
+            names, values = record["concentrations"][:2]
+            concentrations = _buildConcentrations(names, values, self._lists)
+        return result, concentrations
+
+    def getColumn(self, section, name, dataset=None):
+        """
+        Return the stored values of one quantity for all the spectra.
+
+        :param section: "chisq", "parameters", "groups" or "concentrations"
+        :param name: Name of the parameter, group or concentration entry
+        :param dataset: values, sigmas, fitarea or sigmaarea. Default is the
+                        first dataset of the section.
+        """
+        self.flush()
+        if section == "chisq":
+            return self._file["chisq"][()]
+        if dataset is None:
+            dataset = {"parameters":"values",
+                       "groups":"fitarea",
+                       "concentrations":"values"}[section]
+        column = self._names[section].index(name)
+        return self._file[section][dataset][:, column]
+
+    def flush(self):
+        """
+        Write the buffered results to the file.
+        """
+        if not len(self._pending):
+            return
+        items = [item for item, record in self._pending]
+        records = [record for item, record in self._pending]
+        arrays = {}
+        arrays["chisq"] = numpy.array([record["chisq"] for record in records],
+                                      numpy.float64)
+        for section, datasets in _SECTIONS:
+            if section not in self._names:
+                continue
+            nColumns = len(self._names[section])
+            for i, name in enumerate(datasets):
+                data = numpy.zeros((len(records), nColumns), numpy.float64)
+                for j, record in enumerate(records):
+                    if section in record:
+                        data[j] = record[section][i + 1]
+                    else:
+                        data[j] = numpy.nan
+                arrays[section + "/" + name] = data
+        self._appendArrays([item[0] for item in items],
+                           [item[1] for item in items],
+                           arrays)
+        self._pending = []
+        self._file.flush()
+
+    def _appendArrays(self, sources, keys, arrays):
+        n = len(sources)
+        chunkRows = self._bufferSize
+        if "source" not in self._file:
+            for name in ["source", "key"]:
+                self._file.create_dataset(name, (0,), dtype=_STRING_DTYPE,
+                                          maxshape=(None,),
+                                          chunks=(chunkRows,))
+        for section in self._names:
+            if section in self._file:
+                continue
+            group = self._file.require_group(section)
+            group.create_dataset("names",
+                                 data=numpy.array(self._names[section],
+                                                  dtype=object),
+                                 dtype=_STRING_DTYPE)
+            if section == "concentrations":
+                group.attrs["lists"] = json.dumps(self._lists)
+        for name in arrays:
+            data = arrays[name]
+            if name not in self._file:
+                self._file.create_dataset(name,
+                                          (self._nStored,) + data.shape[1:],
+                                          dtype=numpy.float64,
+                                          maxshape=(None,) + data.shape[1:],
+                                          chunks=(chunkRows,) + data.shape[1:],
+                                          fillvalue=numpy.nan)
+        for name in ["source", "key"]:
+            self._file[name].resize((self._nStored + n,))
+        self._file["source"][self._nStored:] = numpy.array(sources,
+                                                           dtype=object)
+        self._file["key"][self._nStored:] = numpy.array(keys, dtype=object)
+        # the datasets without new data are extended with their fill value
+        for name in _DATASETS:
+            if name not in self._file:
+                continue
+            dataset = self._file[name]
+            dataset.resize((self._nStored + n,) + dataset.shape[1:])
+            if name in arrays:
+                dataset[self._nStored:] = arrays[name]
+        self._nStored += n
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except:
+            pass
+
+def mergeFitResultStores(filelist, outputfile):
+    """
+    Concatenate the given fit result files into a new one.
+
+    :param filelist: List of input HDF5 files written by FitResultStore
+    :param outputfile: Name of the output file. It is overwritten.
+    """
+    output = FitResultStore(outputfile, mode="w")
+    try:
+        for filename in filelist:
+            store = FitResultStore(filename, mode="r")
+            try:
+                if not len(store):
+                    continue
+                items = store.keys()
+                for item in items:
+                    if item in output._index:
+                        raise ValueError("Result of %s %s is duplicated" % \
+                                         item)
+                for section in store._names:
+                    if section not in output._names:
+                        output._names[section] = store._names[section]
+                    elif output._names[section] != store._names[section]:
+                        raise ValueError("%s of %s differ from previous files" \
+                                         % (section, filename))
+                if (output._lists is None) and (store._lists is not None):
+                    output._lists = store._lists
+                arrays = {}
+                arrays["chisq"] = store._file["chisq"][()]
+                for section, datasets in _SECTIONS:
+                    if section in store._file:
+                        for name in datasets:
+                            arrays[section + "/" + name] = \
+                                        store._file[section][name][()]
+                for item in items:
+                    output._index[item] = len(output._index)
+                output._appendArrays([item[0] for item in items],
+                                     [item[1] for item in items],
+                                     arrays)
+            finally:
+                store.close()
+    finally:
+        output.close()
+    return outputfile
@@ -45,6 +45,11 @@
 except ImportError:
     print("HDF5Stack1D importing NexusDataSource from local directory!")
     import NexusDataSource
+try:
+    from PyMca5.PyMcaIO import HDF5VirtualStack
+except ImportError:
+    print("HDF5Stack1D importing HDF5VirtualStack from local directory!")
+    import HDF5VirtualStack
 
 DEBUG = 0
 SOURCE_TYPE = "HDF5Stack1D"
@@ -52,13 +57,17 @@
 class HDF5Stack1D(DataObject.DataObject):
     def __init__(self, filelist, selection,
                        scanlist=None,
-                       dtype=None):
+                       dtype=None,
+                       lazy=False):
         DataObject.DataObject.__init__(self)
 
         #the data type of the generated stack
         self.__dtype0 = dtype
         self.__dtype  = dtype
 
+        #keep the stacks of spectra in the files instead of in memory
+        self.__lazy = lazy
+
         if filelist is not None:
             if selection is not None:
                 self.loadFileList(filelist, selection, scanlist)
@@ -79,6 +88,10 @@ def loadFileList(self, filelist, selection, scanlist=None):
                  /whatever1/whatever2/counts
                  That means scanlist = ["/whatever1"]
                  and               selection['y'] = "/whatever2/counts"
+        Stacks of spectra that do not fit into memory, or all of them if
+        the stack was created with lazy=True, are not copied. The data
+        attribute is then an HDF5VirtualStack reading them from the files
+        when sliced.
         """
         if DEBUG:
             print("filelist = ", filelist)
@@ -276,7 +289,7 @@ def loadFileList(self, filelist, selection, scanlist=None):
             else:
                 bytefactor = 8
 
-            neededMegaBytes = nFiles * dim0 * dim1 * (mcaDim * bytefactor/(1024*1024.))
+            neededMegaBytes = dim0 * dim1 * (mcaDim * bytefactor/(1024*1024.))
             physicalMemory = PhysicalMemory.getPhysicalMemoryOrNone()
             if physicalMemory is None:
                 # 5 Gigabytes should be a good compromise
@@ -293,10 +306,15 @@ def loadFileList(self, filelist, selection, scanlist=None):
                         raise MemoryError("Force dynamic loading")
                 else:
                     raise MemoryError("Force dynamic loading")
+            elif neededMegaBytes > (0.95*physicalMemory):
+                raise MemoryError("Force lazy loading")
             if (mcaIndex == 0) and ( nFiles == 1) and (nScans == 1):
                 #keep the original arrangement but in memory
                 self.data = numpy.zeros(yDataset.shape, self.__dtype)
                 considerAsImages = True
+            elif self.__lazy:
+                # assembled later on as a virtual stack
+                self.data = None
             else:
                 # force arrangement as spectra
                 self.data = numpy.zeros((dim0, dim1, mcaDim), self.__dtype)
@@ -321,18 +339,17 @@ def loadFileList(self, filelist, selection, scanlist=None):
                     self._fileReference = hdfStack
                 DONE = True
             else:
-                #what to do if the number of dimensions is only 2?
-                raise
+                # read the spectra from the files on demand
+                print("Attempting lazy loading")
+                self.data = None
+                DONE = False
 
         if (not DONE) and (not considerAsImages):
             self.info["McaIndex"] = 2
             n = 0
-
-            if dim0 == 1:
-                self.onBegin(dim1)
-            else:
-                self.onBegin(dim0)
-            self.incrProgressBar=0
+            # map the spectra of every file and scan to the stack pixels
+            virtualStack = HDF5VirtualStack.HDF5VirtualStack(\
+                                        (dim0, dim1, mcaDim), self.__dtype)
             for hdf in hdfStack._sourceObjectList:
                 entryNames = list(hdf["/"].keys())
                 goodEntryNames = []
@@ -341,189 +358,46 @@ def loadFileList(self, filelist, selection, scanlist=None):
                     if hasattr(hdf[tmpPath], "keys"):
                         goodEntryNames.append(entry)
                 for scan in scanlist:
-                    IN_MEMORY = None
                     nStart = n
                     for ySelection in ySelectionList:
-                        n = nStart
-                        if IN_MEMORY == False:
-                            # We can only deal with one dynamic dataset
-                            print("Selection %s ignored" % ySelection)
-                            continue
                         if JUST_KEYS:
                             entryName = goodEntryNames[int(scan.split(".")[-1])-1]
                             path = entryName + ySelection
                             if mSelection is not None:
                                 mpath = entryName + mSelection
-                                mdtype = hdf[mpath].dtype
-                                if mdtype not in [numpy.float64, numpy.float32]:
-                                    mdtype = numpy.float64
-                                mDataset = numpy.asarray(hdf[mpath], dtype=mdtype)
                             if xSelection is not None:
                                 xpath = entryName + xSelection
-                                xDataset = hdf[xpath].value
                         else:
                             path = scan + ySelection
                             if mSelection is not None:
                                 mpath = scan + mSelection
-                                mdtype = hdf[mpath].dtype
-                                if mdtype not in [numpy.float64, numpy.float32]:
-                                    mdtype = numpy.float64
-                                mDataset = numpy.asarray(hdf[mpath], dtype=mdtype)
                             if xSelection is not None:
                                 xpath = scan + xSelection
-                                xDataset = hdf[xpath].value
-                        try:
-                            yDataset = hdf[path]
-                            tmpShape = yDataset.shape
-                            totalBytes = numpy.ones((1,), yDataset.dtype).itemsize
-                            for nItems in tmpShape:
-                                totalBytes *= nItems
-                            if (totalBytes/(1024.*1024.)) > 500:
-                                #read from disk
-                                IN_MEMORY = False
-                            else:
-                                #read the data into memory
-                                yDataset = hdf[path].value
-                                IN_MEMORY = True
-                        except (MemoryError, ValueError):
-                            yDataset = hdf[path]
-                            IN_MEMORY = False
-                        nMcaInYDataset = 1
-                        for dim in yDataset.shape:
-                            nMcaInYDataset *= dim
-                        nMcaInYDataset = int(nMcaInYDataset/mcaDim)
-                        if mcaIndex != 0:
-                            if IN_MEMORY:
-                                yDataset.shape = -1, mcaDim
-                            if mSelection is not None:
-                                case = -1
-                                nMonitorData = 1
-                                for v in mDataset.shape:
-                                    nMonitorData *= v
-                                if nMonitorData == nMcaInYDataset:
-                                    mDataset.shape = nMcaInYDataset
-                                    case = 0
-                                elif nMonitorData == (nMcaInYDataset * mcaDim):
-                                    case = 1
-                                    mDataset.shape = nMcaInYDataset, mcaDim
-                                if case == -1:
-                                    raise ValueError(\
-                                        "I do not know how to handle this monitor data")
-                            if (len(yDataset.shape) == 3) and\
-                               (dim1 == yDataset.shape[1]):
-                                mca = 0
-                                deltaI = int(yDataset.shape[1]/dim1)
-                                for ii in range(yDataset.shape[0]):
-                                    i = int(n/dim1)
-                                    yData = yDataset[ii:(ii+1)]
-                                    yData.shape = -1, mcaDim
-                                    if mSelection is not None:
-                                        if case == 0:
-                                            mData = numpy.outer(mDataset[mca:(mca+dim1)],
-                                                                numpy.ones((mcaDim)))
-                                            self.data[i, :, :] += yData / mData
-                                        elif case == 1:
-                                            mData = mDataset[mca:(mca+dim1), :]
-                                            mData.shape = -1, mcaDim
-                                            self.data[i, :, :]  += yData / mData
-                                    else:
-                                        self.data[i:(i+deltaI), :] += yData
-                                    n += yDataset.shape[1]
-                                    mca += dim1
-                            else:
-                                for mca in range(nMcaInYDataset):
-                                    i = int(n/dim1)
-                                    j = n % dim1
-                                    if len(yDataset.shape) == 3:
-                                        ii = int(mca/yDataset.shape[1])
-                                        jj = mca % yDataset.shape[1]
-                                        yData = yDataset[ii, jj]
-                                    elif len(yDataset.shape) == 2:
-                                        yData = yDataset[mca,:]
-                                    elif len(yDataset.shape) == 1:
-                                        yData = yDataset
-                                    if mSelection is not None:
-                                        if case == 0:
-                                            self.data[i, j, :] += yData / mDataset[mca]
-                                        elif case == 1:
-                                            self.data[i, j, :] += yData / mDataset[mca, :]
-                                    else:
-                                        self.data[i, j, :] += yData
-                                    n += 1
-                        else:
-                            if mSelection is not None:
-                                case = -1
-                                nMonitorData = 1
-                                for v in mDataset.shape:
-                                    nMonitorData *= v
-                                if nMonitorData == yDataset.shape[0]:
-                                    case = 3
-                                    mDataset.shape = yDataset.shape[0]
-                                elif nMonitorData == nMcaInYDataset:
-                                    mDataset.shape = nMcaInYDataset
-                                    case = 0
-                                #elif nMonitorData == (yDataset.shape[1] * yDataset.shape[2]):
-                                #    case = 1
-                                #    mDataset.shape = yDataset.shape[1], yDataset.shape[2]
-                                if case == -1:
-                                    raise ValueError(\
-                                        "I do not know how to handle this monitor data")
-                            if IN_MEMORY:
-                                yDataset.shape = mcaDim, -1
-                            if len(yDataset.shape) != 3:
-                                for mca in range(nMcaInYDataset):
-                                    i = int(n/dim1)
-                                    j = n % dim1
-                                    if len(yDataset.shape) == 3:
-                                        ii = int(mca/yDataset.shape[2])
-                                        jj = mca % yDataset.shape[2]
-                                        yData = yDataset[:, ii, jj]
-                                    elif len(yDataset.shape) == 2:
-                                        yData = yDataset[:, mca]
-                                    elif len(yDataset.shape) == 1:
-                                        yData = yDataset[:]
-                                    if mSelection is not None:
-                                        if case == 0:
-                                            self.data[i, j, :] += yData / mDataset[mca]
-                                        elif case == 1:
-                                            self.data[i, j, :] += yData / mDataset[:, mca]
-                                        elif case == 3:
-                                            self.data[i, j, :] += yData / mDataset
-                                    else:
-                                        self.data[i, j, :] += yData
-                                    n += 1
-                            else:
-                                #stack of images to be read as MCA
-                                for nImage in range(yDataset.shape[0]):
-                                    tmp = yDataset[nImage:(nImage+1)]
-                                    if len(tmp.shape) == 3:
-                                        i = int(n/dim1)
-                                        j = n % dim1
-                                        if 0:
-                                            #this loop is extremely SLOW!!!(and useless)
-                                            for ii in range(tmp.shape[1]):
-                                                for jj in range(tmp.shape[2]):
-                                                    self.data[i+ii, j+jj, nImage] += tmp[0, ii, jj]
-                                        else:
-                                            self.data[i:i+tmp.shape[1],
-                                                      j:j+tmp.shape[2], nImage] += tmp[0]
-                                if mSelection is not None:
-                                    for mca in range(yDataset.shape[0]):
-                                        i = int(n/dim1)
-                                        j = n % dim1
-                                        yData = self.data[i, j, :]
-                                        if case == 0:
-                                            self.data[i, j, :] += yData / mDataset[mca]
-                                        elif case == 1:
-                                            self.data[i, j, :]  += yData / mDataset[:, mca]
-                                        n += 1
-                                else:
-                                    n += tmp.shape[1] * tmp.shape[2]
-                        if dim0 == 1:
-                            self.onProgress(j)
-                if dim0 != 1:
-                    self.onProgress(i)
-            self.onEnd()
+                        mDataset = None
+                        if mSelection is not None:
+                            mdtype = hdf[mpath].dtype
+                            if mdtype not in [numpy.float64, numpy.float32]:
+                                mdtype = numpy.float64
+                            mDataset = numpy.asarray(hdf[mpath], dtype=mdtype)
+                        if xSelection is not None:
+                            xDataset = hdf[xpath][()]
+                        n = virtualStack.addDataset(hdf[path],
+                                        start=nStart,
+                                        mcaindex=0 if mcaIndex == 0 else -1,
+                                        monitor=mDataset)
+            if self.data is None:
+                # read the spectra on demand
+                self.data = virtualStack
+                self._fileReference = hdfStack
+            else:
+                # read the spectra in blocks of rows
+                rowBytes = dim1 * mcaDim * 8
+                step = max(1, HDF5VirtualStack.BLOCK_BYTES // rowBytes)
+                self.onBegin(dim0)
+                for i in range(0, dim0, step):
+                    self.data[i:i + step] = virtualStack[i:i + step]
+                    self.onProgress(min(i + step, dim0))
+                self.onEnd()
         elif not DONE:
             # data into memory but as images
             self.info["McaIndex"] = mcaIndex
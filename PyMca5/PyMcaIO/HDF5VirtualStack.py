@@ -0,0 +1,327 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+__author__ = "V.A. Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+__doc__ = """
+Stack of spectra assembled from several datasets without reading them.
+
+Every dataset (typically one per file or per scan) provides the spectra of
+a range of consecutive pixels of the map. The spectra are read on demand
+when the stack is sliced, in blocks aligned with the chunks of the
+datasets, and normalized by the monitor on the fly. Datasets providing
+the same pixels are added.
+"""
+import numpy
+
+DEBUG = 0
+
+# maximum size in bytes of the blocks read at once
+BLOCK_BYTES = 64 * 1024 * 1024
+
+
+class _Segment(object):
+    def __init__(self, dataset, start, mcaIndex, monitor, nChannels):
+        self.dataset = dataset
+        self.start = start
+        self.mcaIndex = mcaIndex
+        shape = dataset.shape
+        if mcaIndex == 0:
+            spatialShape = shape[1:]
+        else:
+            spatialShape = shape[:-1]
+        if len(spatialShape):
+            self.nRows = spatialShape[0]
+        else:
+            self.nRows = 1
+        # number of spectra per element of the first spatial axis
+        self.rowSize = 1
+        for n in spatialShape[1:]:
+            self.rowSize *= n
+        self.nSpectra = self.nRows * self.rowSize
+        self.nDimensions = len(spatialShape)
+        # rows per chunk along the first spatial axis
+        self.chunkRows = 1
+        chunks = getattr(dataset, "chunks", None)
+        if chunks and len(spatialShape):
+            self.chunkRows = chunks[1] if mcaIndex == 0 else chunks[0]
+        self.monitorCase = None
+        self.monitor = None
+        if monitor is not None:
+            monitor = numpy.asarray(monitor)
+            if monitor.dtype not in [numpy.float32, numpy.float64]:
+                monitor = monitor.astype(numpy.float64)
+            if (mcaIndex == 0) and (monitor.size == nChannels):
+                self.monitorCase = "channel"
+                self.monitor = monitor.reshape(1, nChannels)
+            elif monitor.size == self.nSpectra:
+                self.monitorCase = "spectrum"
+                self.monitor = monitor.reshape(self.nSpectra, 1)
+            elif (mcaIndex != 0) and \
+                 (monitor.size == (self.nSpectra * nChannels)):
+                self.monitorCase = "value"
+                self.monitor = monitor.reshape(self.nSpectra, nChannels)
+            elif monitor.size == nChannels:
+                self.monitorCase = "channel"
+                self.monitor = monitor.reshape(1, nChannels)
+            else:
+                raise ValueError(\
+                    "I do not know how to handle this monitor data")
+
+    def read(self, firstRow, lastRow, channels):
+        """
+        Spectra of the given rows of the dataset as a 2D array.
+
+        :param channels: slice of channels with positive step
+        """
+        if self.nDimensions == 0:
+            data = numpy.asarray(self.dataset[channels]).reshape(1, -1)
+        elif self.mcaIndex == 0:
+            data = numpy.asarray(self.dataset[channels, firstRow:lastRow])
+            data = data.reshape(data.shape[0], -1).T
+        else:
+            data = numpy.asarray(self.dataset[firstRow:lastRow, ..., channels])
+            data = data.reshape(-1, data.shape[-1])
+        if self.monitorCase is None:
+            return data
+        first = firstRow * self.rowSize
+        last = lastRow * self.rowSize
+        if self.monitorCase == "spectrum":
+            return data / self.monitor[first:last]
+        elif self.monitorCase == "value":
+            return data / self.monitor[first:last, channels]
+        else:
+            return data / self.monitor[:, channels]
+
+
+class HDF5VirtualStack(object):
+    def __init__(self, shape, dtype=numpy.float64):
+        """
+        :param shape: (rows, columns, channels) of the stack
+        :param dtype: data type of the returned spectra
+        """
+        self.shape = tuple(int(x) for x in shape)
+        if len(self.shape) != 3:
+            raise ValueError("Three dimensional shape expected")
+        self.dtype = numpy.dtype(dtype)
+        self.ndim = 3
+        self.size = self.shape[0] * self.shape[1] * self.shape[2]
+        self._segments = []
+        self._end = 0
+        # last block read: (segment, channels, first row, last row, spectra)
+        self._cache = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None):
+        data = self[:]
+        if dtype is not None:
+            data = data.astype(dtype)
+        return data
+
+    def addDataset(self, dataset, start=None, mcaindex=-1, monitor=None):
+        """
+        Add the spectra of a dataset to the stack.
+
+        :param dataset: h5py dataset or array with the spectra
+        :param start: index (row * columns + column) of the pixel of the
+            first spectrum, default the pixel following the last one added
+        :param mcaindex: index of the spectral axis of the dataset, 0 or -1
+        :param monitor: None or array with one value per spectrum, one
+            value per spectrum and channel or one value per channel
+        :return: index of the pixel following the last added spectrum
+        """
+        if start is None:
+            start = self._end
+        if mcaindex not in [0, -1]:
+            mcaindex = -1 if mcaindex == (len(dataset.shape) - 1) else mcaindex
+        if mcaindex not in [0, -1]:
+            raise ValueError("Spectral axis must be the first or the last one")
+        if dataset.shape[mcaindex] != self.shape[2]:
+            raise ValueError("Dataset of %d channels instead of %d" % \
+                             (dataset.shape[mcaindex], self.shape[2]))
+        segment = _Segment(dataset, int(start), mcaindex, monitor,
+                           self.shape[2])
+        if (segment.start + segment.nSpectra) > \
+           (self.shape[0] * self.shape[1]):
+            raise ValueError("Dataset spectra exceed the stack size")
+        self._segments.append(segment)
+        self._end = segment.start + segment.nSpectra
+        self._cache = None
+        return self._end
+
+    def getSourceOfPixel(self, row, column):
+        """
+        :return: list of (dataset, index of the spectrum in the dataset)
+        """
+        pixel = row * self.shape[1] + column
+        return [(segment.dataset, pixel - segment.start) \
+                for segment in self._segments \
+                if segment.start <= pixel < (segment.start + segment.nSpectra)]
+
+    def _getIndices(self, key, n):
+        """
+        Indices selected by a key along an axis of n items and a flag
+        telling if the axis has to be removed.
+        """
+        if isinstance(key, slice):
+            return numpy.arange(*key.indices(n)), False
+        if numpy.isscalar(key) and not isinstance(key, (str, bytes)):
+            index = int(key)
+            if index < 0:
+                index += n
+            if (index < 0) or (index >= n):
+                raise IndexError("Index %d out of range" % key)
+            return numpy.array([index]), True
+        indices = numpy.asarray(key)
+        if indices.dtype == numpy.bool_:
+            if indices.shape != (n,):
+                raise IndexError("Boolean index of wrong shape")
+            return numpy.nonzero(indices)[0], False
+        indices = indices.astype(numpy.int64).reshape(-1)
+        indices[indices < 0] += n
+        if indices.size and ((indices.min() < 0) or (indices.max() >= n)):
+            raise IndexError("Index out of range")
+        return indices, False
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        for i, item in enumerate(key):
+            if item is Ellipsis:
+                key = key[:i] + (slice(None),) * (4 - len(key)) + key[i + 1:]
+                break
+        maskKey = numpy.asarray(key[0]) if len(key) else None
+        if (maskKey is not None) and (maskKey.dtype == numpy.bool_) and \
+           (maskKey.ndim == 2):
+            # pixels selected by a boolean image
+            if maskKey.shape != self.shape[:2]:
+                raise IndexError("Boolean index of wrong shape")
+            if len(key) > 2:
+                raise IndexError("Too many indices")
+            channelKey = key[1] if len(key) > 1 else slice(None)
+            pixels = numpy.flatnonzero(maskKey)
+            spectra, channelScalar = self._getSpectra(pixels, channelKey)
+            if channelScalar:
+                return spectra[:, 0]
+            return spectra
+        if len(key) > 3:
+            raise IndexError("Too many indices")
+        key = key + (slice(None),) * (3 - len(key))
+        rows, rowScalar = self._getIndices(key[0], self.shape[0])
+        columns, columnScalar = self._getIndices(key[1], self.shape[1])
+        pixels = (rows[:, None] * self.shape[1] + columns[None, :]).reshape(-1)
+        spectra, channelScalar = self._getSpectra(pixels, key[2])
+        spectra.shape = len(rows), len(columns), spectra.shape[-1]
+        index = []
+        for scalar in [rowScalar, columnScalar, channelScalar]:
+            index.append(0 if scalar else slice(None))
+        return spectra[tuple(index)]
+
+    def _getSpectra(self, pixels, channelKey):
+        """
+        Spectra of the given pixels in the order of the pixels.
+        """
+        nChannels = self.shape[2]
+        if isinstance(channelKey, slice) and \
+           ((channelKey.step is None) or (channelKey.step > 0)):
+            start, stop, step = channelKey.indices(nChannels)
+            stop = max(start, stop)
+            channels = slice(start, stop, step)
+            channelIndices = None
+            channelScalar = False
+            nSelected = len(range(start, stop, step))
+        else:
+            channelIndices, channelScalar = self._getIndices(channelKey,
+                                                             nChannels)
+            nSelected = channelIndices.size
+            if nSelected:
+                channels = slice(channelIndices.min(),
+                                 channelIndices.max() + 1)
+                channelIndices = channelIndices - channels.start
+        output = numpy.zeros((pixels.size, nSelected), dtype=self.dtype)
+        if (not pixels.size) or (not nSelected):
+            return output, channelScalar
+        order = numpy.argsort(pixels, kind="mergesort")
+        sortedPixels = pixels[order]
+        nRead = len(range(*channels.indices(nChannels)))
+        maxSpectra = max(1, BLOCK_BYTES // (8 * nRead))
+        for segmentIndex, segment in enumerate(self._segments):
+            i0 = numpy.searchsorted(sortedPixels, segment.start)
+            i1 = numpy.searchsorted(sortedPixels,
+                                    segment.start + segment.nSpectra)
+            while i0 < i1:
+                first = sortedPixels[i0] - segment.start
+                i = numpy.searchsorted(sortedPixels,
+                                       segment.start + first + maxSpectra)
+                i = min(i, i1)
+                spectra = sortedPixels[i0:i] - segment.start
+                block, blockStart = self._readBlock(segmentIndex, channels,
+                                                    spectra[0],
+                                                    spectra[-1] + 1)
+                values = block[spectra - blockStart]
+                if channelIndices is not None:
+                    values = values[:, channelIndices]
+                output[order[i0:i]] += values
+                i0 = i
+        return output, channelScalar
+
+    def _readBlock(self, segmentIndex, channels, first, last):
+        """
+        Spectra first to last of a segment read with the spectra around
+        them in the same chunks.
+
+        :return: spectra and index of the first spectrum
+        """
+        segment = self._segments[segmentIndex]
+        channelsKey = (channels.start, channels.stop, channels.step)
+        firstRow = first // segment.rowSize
+        lastRow = (last - 1) // segment.rowSize + 1
+        if self._cache is not None:
+            cachedSegment, cachedChannels, row0, row1, spectra = self._cache
+            if (cachedSegment == segmentIndex) and \
+               (cachedChannels == channelsKey) and \
+               (row0 <= firstRow) and (lastRow <= row1):
+                return spectra, row0 * segment.rowSize
+        # extend the read to complete chunks if it is not too large
+        chunkRows = segment.chunkRows
+        row0 = (firstRow // chunkRows) * chunkRows
+        row1 = min(segment.nRows,
+                   ((lastRow + chunkRows - 1) // chunkRows) * chunkRows)
+        nChannels = len(range(*channels.indices(self.shape[2])))
+        if ((row1 - row0) * segment.rowSize * nChannels * 8) > BLOCK_BYTES:
+            row0, row1 = firstRow, lastRow
+        if DEBUG:
+            print("Reading rows %d to %d of dataset %d" % \
+                  (row0, row1, segmentIndex))
+        spectra = segment.read(row0, row1, channels)
+        self._cache = (segmentIndex, channelsKey, row0, row1, spectra)
+        return spectra, row0 * segment.rowSize
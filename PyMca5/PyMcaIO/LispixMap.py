@@ -32,9 +32,9 @@
 __copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
 import os
 import sys
-import struct
 import numpy
 from PyMca5 import DataObject
+from PyMca5.PyMcaIO import BinaryArray
 
 DEBUG = 0
 SOURCE_TYPE = "EdfFileStack"
@@ -48,7 +48,7 @@ class LispixMap(DataObject.DataObject):
     This class data member contains the map itself as a 3D array.
     '''
     
-    def __init__(self, filename, native=False):
+    def __init__(self, filename, native=False, lazy=False):
         '''
         Parameters:
         -----------
@@ -57,6 +57,9 @@ def __init__(self, filename, native=False):
         native : boolean (default False)
             If set to False, it will always return a stack of spectra.
             It set to True, it will return what it is specified in the original file.
+        lazy : boolean (default False)
+            If set to True and the stored data can be used as they are, the
+            data file is memory mapped instead of read.
         '''
         dataFile, headerFile = _getDataAndDescriptionFileName(filename)
         description = _parseHeaderFile(headerFile)
@@ -72,112 +75,50 @@ def __init__(self, filename, native=False):
         if description["data-type"] in ["float", "double"]:
             if description["data-length"] == 4:
                 dtype = numpy.float32
-                fmt = "f"
             elif description["data-length"] == 8:
                 dtype = numpy.float64
-                fmt = "d"
             else:
                 raise ValueError("Out of standard float length %d" % description["data-length"])
-        elif description["data-type"] == "signed":
-            if description["data-length"] == 1:
-                dtype = numpy.int8
-                fmt = "b"
-            elif description["data-length"] == 2:
-                dtype = numpy.int16
-                fmt = "h"
-            elif description["data-length"] == 4:
-                dtype = numpy.int32
-                fmt = "l"                      
-            elif description["data-length"] == 8:
-                dtype = numpy.int64
-                fmt = "q"
-        elif description["data-type"] == "unsigned":
-            if description["data-length"] == 1:
-                dtype = numpy.uint8
-                fmt = "B"
-            elif description["data-length"] == 2:
-                dtype = numpy.uint16
-                fmt = "H"
-            elif description["data-length"] == 4:
-                dtype = numpy.uint32
-                fmt = "L"
-            elif description["data-length"] == 8:
-                dtype = numpy.uint64
-                fmt = "Q"
+        elif description["data-type"] in ["signed", "unsigned"]:
+            if description["data-type"] == "signed":
+                dtypes = {1: numpy.int8, 2: numpy.int16,
+                          4: numpy.int32, 8: numpy.int64}
+            else:
+                dtypes = {1: numpy.uint8, 2: numpy.uint16,
+                          4: numpy.uint32, 8: numpy.uint64}
+            if description["data-length"] not in dtypes:
+                raise ValueError("Out of standard integer length %d" % description["data-length"])
+            dtype = dtypes[description["data-length"]]
         else:
             raise IOError("Unknown data-type:  <%s>" % description["data-type"])
+        if description["byte-order"] in ["big-endian", "high-endian"]:
+            byteorder = ">"
+        else:
+            byteorder = "<"
 
+        if description["record-by"] == "image":
+            shape = channels, rows, columns
+        else:
+            shape = rows, columns, channels
+        if dtype in [numpy.int8, numpy.uint8, numpy.int16, numpy.uint16]:
+            # force stack of spectra with floating point values
+            outputDtype = numpy.float32
+        else:
+            outputDtype = dtype
+        self.data = BinaryArray.fromFile(dataFile, dtype, shape,
+                                         offset=offset,
+                                         byteorder=byteorder,
+                                         mmap=lazy or (outputDtype != dtype))
+        if outputDtype != dtype:
+            self.data = self.data.astype(outputDtype)
         if (description["record-by"] == "image") and (not native):
             # we have to convert to stack of spectra to make sure all PyMca
             # functionalities (particularly fitting) are available
-            if dtype in [numpy.int8, numpy.uint8, numpy.int16, numpy.uint16]:
-                # force stack of spectra with floating point values
-                self.data = numpy.zeros((rows, columns, channels), dtype=numpy.float32)
-            else:
-                self.data = numpy.zeros((rows, columns, channels), dtype=dtype)
-            try:
-                f =open(dataFile, "rb")
-                dataBuffer = f.read(offset)
-                if description["byte-order"] in ["big-endian", "high-endian"]:
-                    fmt = ">%d%s" % (rows * columns, fmt)
-                else:
-                    fmt = "<%d%s" % (rows * columns, fmt)
-                nBytes = struct.calcsize(fmt)
-                for i in range(channels):
-                    tmpData = numpy.array(struct.unpack(fmt, f.read(nBytes)), dtype=self.data.dtype)
-                    tmpData.shape = rows, columns
-                    self.data[:, :, i] = tmpData
-            finally:
-                f.close()
+            self.data = numpy.ascontiguousarray(self.data.transpose(1, 2, 0),
+                                                dtype=outputDtype)
             mcaIndex = 2
-        elif (offset == 0) and (dtype not in [numpy.int8, numpy.uint8, numpy.int16, numpy.uint16]):
-            # direct, native readout using numpy
-            self.data = numpy.fromfile(dataFile, dtype=dtype)
-            native = True
-        elif description["record-by"] == "image":
-            if dtype in [numpy.int8, numpy.uint8, numpy.int16, numpy.uint16]:
-                # force stack of spectra with floating point values
-                self.data = numpy.zeros((channels, rows, columns), dtype=numpy.float32)
-            else:
-                self.data = numpy.zeros((channels, rows, columns), dtype=dtype)
-            try:
-                f =open(dataFile, "rb")
-                dataBuffer = f.read(offset)
-                if description["byte-order"] in ["big-endian", "high-endian"]:
-                    fmt = ">%d%s" % (rows * columns, fmt)
-                else:
-                    fmt = "<%d%s" % (rows * columns, fmt)
-                nBytes = struct.calcsize(fmt)
-                for i in range(channels):
-                    tmpData = numpy.array(struct.unpack(fmt, f.read(nBytes)), dtype=self.data.dtype)
-                    tmpData.shape = rows, columns
-                    self.data[i] = tmpData
-            finally:
-                f.close()
-            native = True
-        elif description["record-by"] != "image":
-            if dtype in [numpy.int8, numpy.uint8, numpy.int16, numpy.uint16]:
-                # force stack of spectra with floating point values
-                self.data = numpy.zeros((rows, columns, channels), dtype=numpy.float32)
-            else:
-                self.data = numpy.zeros((rows, columns, channels), dtype=dtype)
-            try:
-                f =open(dataFile, "rb")
-                dataBuffer = f.read(offset)
-                if description["byte-order"] in ["big-endian", "high-endian"]:
-                    fmt = ">%d%s" % (columns * channels, fmt)
-                else:
-                    fmt = "<%d%s" % (columns * channels, fmt)
-                nBytes = struct.calcsize(fmt)
-                for i in range(rows):
-                    tmpData = numpy.array(struct.unpack(fmt, f.read(nBytes)), dtype=self.data.dtype)
-                    tmpData.shape = columns, channels
-                    self.data[i] = tmpData
-            finally:
-                f.close()
-            native = True
         else:
-            raise IOError("Unhandled reading case. I should not reach this point")
+            native = True
 
         if native:
             if description["record-by"] == "image":
@@ -0,0 +1,138 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+__author__ = "V.A. Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+__doc__ = """
+Build a stack of spectra from list mode data.
+
+List mode readers decode their events into arrays of map rows, map columns
+and detector channels and feed them to a ListModeStack. The events are
+histogrammed with numpy, so readers can stream their files in blocks of
+events of any size.
+"""
+import numpy
+from PyMca5.PyMcaCore import DataObject
+
+DEBUG = 0
+SOURCE_TYPE = "EdfFileStack"
+
+
+class ListModeStack(DataObject.DataObject):
+    def __init__(self, shape, nChannels, binning=1, dtype=numpy.uint32,
+                 calibration=None, sourceName=None):
+        """
+        :param shape: (rows, columns) of the map
+        :param nChannels: number of detector channels, events at higher
+                          channels are ignored
+        :param binning: number of detector channels added in each stack channel
+        :param dtype: data type of the stack
+        :param calibration: (a, b, c) energy calibration of the detector
+                            channels, default (0.0, 1.0, 0.0)
+        :param sourceName: name of the source of the events
+        """
+        DataObject.DataObject.__init__(self)
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.nChannels = int(nChannels)
+        self.binning = int(binning)
+        if (self.nChannels < 1) or (self.binning < 1):
+            raise ValueError("Number of channels and binning must be positive")
+        nBins = (self.nChannels + self.binning - 1) // self.binning
+        self.data = numpy.zeros(self.shape + (nBins,), dtype=dtype)
+        self.nEvents = 0
+        self.nIgnoredEvents = 0
+
+        if calibration is None:
+            calibration = (0.0, 1.0, 0.0)
+        a, b, c = [float(x) for x in calibration]
+        if self.binning > 1:
+            if c != 0.0:
+                raise ValueError("Binning needs a linear calibration")
+            # stack channels are centered on the detector channels they add
+            a += b * 0.5 * (self.binning - 1)
+            b *= self.binning
+        self.info = {}
+        for i in range(len(self.data.shape)):
+            key = 'Dim_%d' % (i + 1,)
+            self.info[key] = self.data.shape[i]
+        self.info["SourceType"] = SOURCE_TYPE
+        self.info["SourceName"] = sourceName
+        self.info["Size"] = self.shape[0]
+        self.info["NumberOfFiles"] = self.shape[0]
+        self.info["FileIndex"] = 0
+        self.info["McaCalib"] = [a, b, c]
+        self.info["Channel0"] = 0.0
+
+    def addEvents(self, rows, columns, channels):
+        """
+        Add a block of events to the stack.
+
+        :param rows: map row of each event
+        :param columns: map column of each event
+        :param channels: detector channel of each event
+        :return: number of events added to the stack
+        """
+        rows = numpy.asarray(rows, dtype=numpy.int64).reshape(-1)
+        columns = numpy.asarray(columns, dtype=numpy.int64).reshape(-1)
+        channels = numpy.asarray(channels, dtype=numpy.int64).reshape(-1)
+        if (rows.size != columns.size) or (rows.size != channels.size):
+            raise ValueError("Rows, columns and channels must have equal size")
+        valid = (rows >= 0) & (rows < self.shape[0]) & \
+                (columns >= 0) & (columns < self.shape[1]) & \
+                (channels >= 0) & (channels < self.nChannels)
+        nValid = int(valid.sum())
+        self.nIgnoredEvents += rows.size - nValid
+        self.nEvents += nValid
+        if not nValid:
+            return 0
+        if nValid < rows.size:
+            rows = rows[valid]
+            columns = columns[valid]
+            channels = channels[valid]
+        nBins = self.data.shape[2]
+        index = (rows * self.shape[1] + columns) * nBins
+        if self.binning > 1:
+            index += channels // self.binning
+        else:
+            index += channels
+        self._histogram(index)
+        return nValid
+
+    def _histogram(self, index):
+        data = self.data.reshape(-1)
+        first = index.min()
+        last = index.max() + 1
+        if (last - first) <= (8 * index.size):
+            # usual case: the block covers a few neighbouring pixels
+            counts = numpy.bincount(index - first, minlength=last - first)
+            data[first:last] += counts.astype(data.dtype)
+        else:
+            index, counts = numpy.unique(index, return_counts=True)
+            data[index] += counts.astype(data.dtype)
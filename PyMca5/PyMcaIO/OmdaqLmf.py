@@ -33,9 +33,9 @@
 import numpy
 import os
 import struct
-from PyMca5.PyMcaCore import DataObject
+from PyMca5.PyMcaIO import ListModeStack
 import sys
-SOURCE_TYPE = "EdfFileStack"
+SOURCE_TYPE = ListModeStack.SOURCE_TYPE
 
 class OmdaqLmf(list):
     """
@@ -60,24 +60,40 @@ class OmdaqLmf(list):
                     2:1047,
                     3:1055,
                     4:3604} # discrepancy with documentation
-    def __init__(self, filelist):
+    # approximate number of bytes read at once
+    READ_SIZE = 8 * 1024 * 1024
+    def __init__(self, filelist, shape=None, binning=1):
         """
         Parse a list of files into a list of stacks. One for each stack
         The maximum number of stacks is 8.
-        An ADC with no hits will give a stack equal to None 
+        An ADC with no hits will give a stack equal to None
+
+        :param filelist: list of list mode files
+        :param shape: (rows, columns) of the maps, default (256, 256)
+        :param binning: number of ADC channels added in each stack channel
         """
         super(OmdaqLmf, self).__init__()
         for i in range(8):
             self.append(None)
+        if shape is None:
+            shape = (256, 256)
+        self._shape = shape
+        self._binning = binning
         if type(filelist) not in [type([]), type((1,))]:
             filelist = [filelist]
         for fname in filelist:
             self.parseFile(fname)
 
     def parseFile(self, fname):
+        fileSize = os.path.getsize(fname)
         f = open(fname, "rb")
-        d = f.read()
-        f.close()
+        try:
+            self._parseFile(f, fileSize)
+        finally:
+            f.close()
+
+    def _parseFile(self, f, fileSize):
+        d = f.read(self.GENERAL_SIZE)
         informationHeader = parseInformationHeader(d)
         if informationHeader["Identifier"] != 66:
             raise IOError("Not an OMDAQ File")
@@ -86,46 +102,38 @@ def parseFile(self, fname):
 
         hv = informationHeader["HeaderVersion"]
         adc_offset = self.GENERAL_SIZE + self.RUNDATA_SIZE[hv]
+        f.seek(0)
+        d = f.read(adc_offset + 8 * 128)
         adc_list = parseAdcInfo(d, hv, offset=adc_offset)
 
         # the offset to the events is unclear, but we know they
         # are at the end of the file, how they end and the block size
         block_size = informationHeader["ListModeBlockSize"]
-        n_blocks = len(d) // block_size
-        for i in range(n_blocks):
-            block_end = len(d) - i * block_size
-            block_start = block_end - block_size
-            events = parseLmfBlock(d[block_start:block_end],
-                          lmf_version=informationHeader["ListModeVersion"],
-                          offset=0)
-            n_events = events.shape[0]
-            for idx in range(n_events):
-                adc, row, col, energy = events[idx]
-                #print(adc, energy, row, col)
-                nChannels = int(adc_list[adc]["Calibration"][-1])
+        n_blocks = fileSize // block_size
+        f.seek(fileSize - n_blocks * block_size)
+        blocks_per_read = max(1, self.READ_SIZE // block_size)
+        for i in range(0, n_blocks, blocks_per_read):
+            n = min(blocks_per_read, n_blocks - i)
+            blocks = numpy.frombuffer(f.read(n * block_size),
+                                      dtype=numpy.uint8)
+            blocks = blocks.reshape(n, block_size)
+            adc, row, col, energy = parseLmfBlocks(blocks,
+                          lmf_version=informationHeader["ListModeVersion"])
+            for i_adc in numpy.unique(adc):
+                nChannels = int(adc_list[i_adc]["Calibration"][-1])
                 if nChannels < 1:
                     continue
-                if self[adc] is None:
-                    self[adc] = DataObject.DataObject()
-                    self[adc].data = numpy.zeros((256, 256, nChannels),
-                                                      dtype=numpy.uint32)
-                    self[adc].info = {}
-                    self[adc].info["SourceType"] = SOURCE_TYPE
-                    self[adc].info["SourceName"] = adc_list[adc]["Name"]
-                    self[adc].info["McaCalib"] = [\
-                                adc_list[adc]["Calibration"][0],
-                                adc_list[adc]["Calibration"][1],
-                                0.0]
-                    self[adc].info["Channel0"] = 0.0
-                    nSpectra = 256 * 256
-                    nRows = 256
-                    nFiles = nSpectra // nRows
-                    self[adc].info["Size"] = nFiles
-                    self[adc].info["NumberOfFiles"] = nFiles
-                    self[adc].info["FileIndex"] = 0
-                if energy >= nChannels:
-                    continue
-                self[adc].data[row, col, energy] += 1
+                if self[i_adc] is None:
+                    self[i_adc] = ListModeStack.ListModeStack(self._shape,
+                                nChannels,
+                                binning=self._binning,
+                                calibration=[\
+                                    adc_list[i_adc]["Calibration"][0],
+                                    adc_list[i_adc]["Calibration"][1],
+                                    0.0],
+                                sourceName=adc_list[i_adc]["Name"])
+                idx = adc == i_adc
+                self[i_adc].addEvents(row[idx], col[idx], energy[idx])
 
 def parseAdcInfo(block, header_version, offset=0):
     HV_ADC_OFFSETS = {1: 122,
@@ -154,32 +162,58 @@ def parseAdcInfo(block, header_version, offset=0):
         #sys.exit(0)
     return adc
 
-def parseLmfBlock(block, lmf_version=0, offset=0):
-    EnergyMask = 0x0fff
-    ChannelMask = 0x7000
+def _getEventDtype(lmf_version):
     if lmf_version < 2:
-        fmt = "<BBH"
+        return numpy.dtype([("row", "u1"),
+                            ("column", "u1"),
+                            ("adcEnergy", "<u2")])
     else:
-        fmt = "<III"
+        return numpy.dtype([("row", "<u4"),
+                            ("column", "<u4"),
+                            ("adcEnergy", "<u4")])
+
+def parseLmfBlocks(blocks, lmf_version=0):
+    """
+    Decode the events of a set of list mode blocks
+
+    :param blocks: uint8 array with one list mode block per row
+    :param lmf_version: list mode format version
+    :return: adc, row, column and energy arrays with one element per event
+    """
+    EnergyMask = 0x0fff
+    ChannelMask = 0x7000
+    dtype = _getEventDtype(lmf_version)
+    size = dtype.itemsize
     # size of block header
     block_header_size = 20
-    size = struct.calcsize(fmt)
-    block_start = offset + block_header_size
-    block_end = len(block)
-    while block[block_end - 2: block_end] == b'\xff\xff':
-        block_end -= size
-    offset = block_start
-    n_events = (block_end - offset) // size
-    events = numpy.zeros((n_events, 4), dtype=numpy.uint16)
-    for event in range(n_events):
-        row, col, adc_energy = struct.unpack(fmt,
-                                             block[offset:offset+size])
-        adc = (adc_energy & ChannelMask) >> 12
-        energy = (adc_energy & EnergyMask)
-        events[event] = adc, row, col, energy
-        offset += size
+    n_blocks, block_size = blocks.shape
+    n_max = max(0, (block_size - block_header_size) // size)
+    # events ending by 0xffff at the end of the block are padding
+    block_ends = block_size - size * numpy.arange(n_max + 1)
+    padding = (blocks[:, block_ends - 2] == 0xff) & \
+              (blocks[:, block_ends - 1] == 0xff)
+    n_padding = numpy.cumprod(padding, axis=1).sum(axis=1)
+    n_events = (block_size - n_padding * size - block_header_size) // size
+    events = numpy.ascontiguousarray(\
+        blocks[:, block_header_size:block_header_size + n_max * size])
+    events = events.view(dtype).reshape(n_blocks, n_max)
+    events = events[numpy.arange(n_max) < n_events[:, None]]
+    adc_energy = events["adcEnergy"]
+    adc = (adc_energy & ChannelMask) >> 12
+    energy = adc_energy & EnergyMask
+    return adc, events["row"], events["column"], energy
+
+def parseLmfBlock(block, lmf_version=0, offset=0):
+    blocks = numpy.frombuffer(block, dtype=numpy.uint8, offset=offset)
+    adc, row, col, energy = parseLmfBlocks(blocks.reshape(1, -1),
+                                           lmf_version=lmf_version)
+    events = numpy.zeros((adc.size, 4), dtype=numpy.uint16)
+    events[:, 0] = adc
+    events[:, 1] = row
+    events[:, 2] = col
+    events[:, 3] = energy
     return events
-  
+
 def parseInformationHeader(d):
     """
     Parse the first 6 bytes of the buffer
@@ -37,6 +37,7 @@
 import numpy
 import copy
 from PyMca5 import DataObject
+from PyMca5.PyMcaIO import BinaryArray
 
 DEBUG = 0
 SOURCE_TYPE = "EdfFileStack"
@@ -59,10 +60,7 @@ def __init__(self, filename):
             It is expected to work with OMNIC versions 7.x and 8.x
         '''
         DataObject.DataObject.__init__(self)
-        if sys.platform == 'win32':
-            fid = open(filename, 'rb')
-        else:
-            fid = open(filename, 'r')
+        fid = open(filename, 'rb')
         data = fid.read()
         fid.close()
 
@@ -138,23 +136,17 @@ def __init__(self, filename):
         #arrange as an EDF Stack
         self.info = {}
         self.__nFiles = int(self.nSpectra / self.nRows)
-        self.data = numpy.zeros((self.__nFiles, self.nRows, self.nChannels),
-                                 dtype=numpy.float32)
 
         self.__nImagesPerFile = 1
         offset = firstByte - 16 + 100  # starting position of the data
         delta = 100 + self.nChannels * 4
-        fmt = "%df" % self.nChannels
-        for i in range(self.__nFiles):
-            for j in range(self.nRows):
-                # this approach is inneficient when compared to a direct
-                # data readout, but it allows to deal with nan at the source
-                tmpData = numpy.zeros((self.nChannels,), dtype=numpy.float32)
-                tmpData[:] = struct.unpack(fmt,\
-                                data[offset:(offset + delta - 100)])
-                finiteData = numpy.isfinite(tmpData)
-                self.data[i, j, finiteData] = tmpData[finiteData]
-                offset = int(offset + delta)
+        # each spectrum is preceded by its 100 bytes header
+        self.data = BinaryArray.fromBuffer(data, numpy.float32,
+                                    (self.__nFiles, self.nRows, self.nChannels),
+                                    offset=offset,
+                                    strides=(self.nRows * delta, delta, 4))
+        # deal with nan at the source
+        self.data[numpy.isfinite(self.data) == False] = 0.0
         shape = self.data.shape
         for i in range(len(shape)):
             key = 'Dim_%d' % (i + 1,)
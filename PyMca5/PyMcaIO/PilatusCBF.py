@@ -43,6 +43,16 @@
 import os
 import numpy as np
 import logging
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+try:
+    from PyMca5.PyMcaIO.PyMcaIOHelper import decodeByteOffset as \
+         _cDecodeByteOffset
+    from PyMca5.PyMcaIO.PyMcaIOHelper import encodeByteOffset as \
+         _cEncodeByteOffset
+except ImportError:
+    _cDecodeByteOffset = None
+    _cEncodeByteOffset = None
 if sys.version < '3':
     _fileClass = file
 else:
@@ -144,59 +154,9 @@ def _readbinary_byte_offset(self, inStream):
 
         @param inStream: the binary image (without any CIF decorators)
         @type inStream: python string.
-        @return: a linear numpy array without shape and dtype set
+        @return: a linear int32 numpy array without shape set
         @rtype: numpy array
         """
-
-        def analyse(stream):
-            """
-            Analyze a stream of char with any length of exception (2,4, or 8 bytes integers)
-
-            @return list of NParrays
-            """
-            listnpa = []
-            if sys.version < '3.0' or\
-               isinstance(stream, str):
-                key16 = "\x80"
-                key32 = "\x00\x80"
-                key64 = "\x00\x00\x00\x80"
-            else:
-                # I avoid the b"..." syntax to try to keep python 2.5 compatibility
-                # encoding with utf-8 does not work
-                key16 = "\x80".encode('latin-1')
-                key32 = "\x00\x80".encode('latin-1')
-                key64 = "\x00\x040\x00\x80".encode('latin-1')
-#            idx = 0
-            shift = 1
-#            position = 0
-            while True:
-#                lns = len(stream)
-                idx = stream.find(key16)
-                if idx == -1:
-                    listnpa.append(np.fromstring(stream, dtype="int8"))
-                    break
-                listnpa.append(np.fromstring(stream[:idx], dtype="int8"))
-#                position += listnpa[-1].size
-
-                if stream[idx + 1:idx + 3] == key32:
-                    if stream[idx + 3:idx + 7] == key64:
-                        listnpa.append(np.fromstring(stream[idx + 7:idx + 15], dtype="int64"))
-#                        position += 1
-#                        print "loop64 x=%4i y=%4i in idx %4i lns %4i value=%s" % ((position % 2463), (position // 2463), idx, lns, listnpa[-1])
-                        shift = 15
-                    else: #32 bit int
-                        listnpa.append(np.fromstring(stream[idx + 3:idx + 7], dtype="int32"))
-#                        position += 1
-#                        print "loop32 x=%4i y=%4i in idx %4i lns %4i value=%s" % ((position % 2463), (position // 2463), idx, lns, listnpa[-1])
-                        shift = 7
-                else: #int16
-                    listnpa.append(np.fromstring(stream[idx + 1:idx + 3], dtype="int16"))
-#                    position += 1
-#                    print "loop16 x=%4i y=%4i in idx %4i lns %4i value=%s" % ((position % 2463), (position // 2463), idx, lns, listnpa[-1])
-                    shift = 3
-                stream = stream[idx + shift:]
-            return  listnpa
-
         if sys.version < '3.0' or\
             isinstance(inStream, str):
             starter = "\x0c\x1a\x04\xd5"
@@ -206,10 +166,7 @@ def analyse(stream):
             starter = "\x0c\x1a\x04\xd5".encode('latin-1')
         startPos = inStream.find(starter) + 4
         data = inStream[ startPos: startPos + int(self.__header["X-Binary-Size"])]
-        myData = np.hstack(analyse(data)).cumsum()
-
-        assert len(myData) == self.dim1 * self.dim2
-        return myData
+        return decodeByteOffset(data, self.dim1 * self.dim2)
 
     def read(self, fname):
         self.__header = {}
@@ -241,11 +198,209 @@ def read(self, fname):
             logging.warning("Defaulting type to int32")
 
         if self.__header["conversions"] == "x-CBF_BYTE_OFFSET":
-            self.__data = self._readbinary_byte_offset(self.cif["_array_data.data"]).astype(bytecode).reshape((self.dim2, self.dim1))
+            self.__data = self._readbinary_byte_offset(self.cif["_array_data.data"])
+            if self.__data.dtype != bytecode:
+                self.__data = self.__data.astype(bytecode)
+            self.__data.shape = self.dim2, self.dim1
         else:
             raise Exception(IOError, "Compression scheme not yet supported, please contact FABIO development team")
         self.__info = self.__header
 
+def decodeByteOffset(stream, size, output=None):
+    """
+    Decode a CBF byte offset compressed stream.
+
+    :param stream: the compressed bytes (string, bytes or uint8 array)
+    :param size: number of values to decode
+    :param output: optional C contiguous int32 array of that size to fill
+    :return: one dimensional int32 array with the decoded values
+    """
+    if output is None:
+        output = np.empty((size,), dtype=np.int32)
+    elif (output.dtype != np.int32) or (output.size != size) or \
+         (not output.flags["C_CONTIGUOUS"]):
+        raise ValueError("Output must be a contiguous int32 array of size %d" \
+                         % size)
+    output = output.reshape(-1)
+    if isinstance(stream, np.ndarray):
+        stream = stream.view(np.uint8).reshape(-1)
+    else:
+        stream = np.frombuffer(stream, dtype=np.uint8)
+    if _cDecodeByteOffset is None:
+        n = _decodeByteOffset(stream, output)
+    else:
+        n = _cDecodeByteOffset(stream, output)
+    if n != size:
+        raise IOError("Byte offset stream holds %d values instead of %d" % \
+                      (n, size))
+    return output
+
+
+def _decodeByteOffset(stream, output):
+    """
+    Python version of the decoder. Runs of one byte differences are handled
+    as a whole, only the escaped values are treated one by one.
+    """
+    escapes = np.nonzero(stream == 0x80)[0]
+    nValues = output.size
+    delta = np.empty((nValues,), dtype=np.int64)
+    n = 0
+    start = 0
+    idx = 0
+    nStream = stream.size
+    while (n < nValues) and (start < nStream):
+        # next escape flag not inside a value already decoded
+        while (idx < escapes.size) and (escapes[idx] < start):
+            idx += 1
+        if idx < escapes.size:
+            stop = escapes[idx]
+        else:
+            stop = nStream
+        nBytes = min(stop - start, nValues - n)
+        delta[n:n + nBytes] = stream[start:start + nBytes].view(np.int8)
+        n += nBytes
+        start += nBytes
+        if (start >= nStream) or (n >= nValues):
+            break
+        # escaped value
+        if start + 3 > nStream:
+            break
+        value = int(stream[start + 1:start + 3].view("<i2")[0])
+        shift = 3
+        if value == -32768:
+            if start + 7 > nStream:
+                break
+            value = int(stream[start + 3:start + 7].view("<i4")[0])
+            shift = 7
+            if value == -2147483648:
+                if start + 15 > nStream:
+                    break
+                value = int(stream[start + 7:start + 15].view("<i8")[0])
+                shift = 15
+        delta[n] = value
+        n += 1
+        start += shift
+    output[:n] = np.cumsum(delta[:n])
+    return n
+
+
+def encodeByteOffset(data):
+    """
+    Compress integer data with the CBF byte offset algorithm.
+
+    :param data: integer array, it is compressed as a flat int32 array
+    :return: the compressed stream as a uint8 array
+    """
+    data = np.ascontiguousarray(data, dtype=np.int32).reshape(-1)
+    if _cEncodeByteOffset is not None:
+        return _cEncodeByteOffset(data)
+    delta = np.diff(data.astype(np.int64), prepend=0)
+    nBytes = np.ones(delta.shape, dtype=np.int64)
+    big = (delta < -127) | (delta > 127)
+    nBytes[big] = 3
+    big &= (delta < -32767) | (delta > 32767)
+    nBytes[big] = 7
+    big &= (delta < -2147483647) | (delta > 2147483647)
+    nBytes[big] = 15
+    positions = np.cumsum(nBytes) - nBytes
+    output = np.zeros((int(nBytes.sum()),), dtype=np.uint8)
+    output[positions] = delta.astype(np.uint8)
+    for size, flags, n in [(3, [0x80], 2),
+                           (7, [0x80, 0x00, 0x80], 4),
+                           (15, [0x80, 0x00, 0x80, 0x00, 0x00, 0x00, 0x80], 8)]:
+        idx = nBytes == size
+        pos = positions[idx]
+        values = delta[idx].astype("<i8").view(np.uint8).reshape(-1, 8)
+        for i, flag in enumerate(flags):
+            output[pos + i] = flag
+        for i in range(n):
+            output[pos + len(flags) + i] = values[:, i]
+    return output
+
+
+def saveCBF(filename, data, header=None):
+    """
+    Write a two dimensional integer array as a byte offset compressed CBF file.
+
+    :param filename: output file name
+    :param data: two dimensional integer array
+    :param header: optional dictionary written as "# key value" lines of the
+                   Pilatus header
+    """
+    data = np.ascontiguousarray(data, dtype=np.int32)
+    if len(data.shape) != 2:
+        raise ValueError("Only two dimensional arrays can be saved")
+    compressed = encodeByteOffset(data).tobytes()
+    text = "###CBF: VERSION 1.5, PyMca\r\n\r\n"
+    text += "data_%s\r\n\r\n" % \
+            os.path.splitext(os.path.basename(filename))[0]
+    text += "_array_data.header_convention \"PILATUS_1.2\"\r\n"
+    text += "_array_data.header_contents\r\n;\r\n"
+    if header is not None:
+        for key in header:
+            text += "# %s %s\r\n" % (key, header[key])
+    text += ";\r\n\r\n"
+    text += "_array_data.data\r\n;\r\n"
+    text += "--CIF-BINARY-FORMAT-SECTION--\r\n"
+    text += "Content-Type: application/octet-stream;\r\n"
+    text += "     conversions=\"x-CBF_BYTE_OFFSET\"\r\n"
+    text += "Content-Transfer-Encoding: BINARY\r\n"
+    text += "X-Binary-Size: %d\r\n" % len(compressed)
+    text += "X-Binary-ID: 1\r\n"
+    text += "X-Binary-Element-Type: \"signed 32-bit integer\"\r\n"
+    text += "X-Binary-Element-Byte-Order: LITTLE_ENDIAN\r\n"
+    text += "X-Binary-Number-of-Elements: %d\r\n" % data.size
+    text += "X-Binary-Size-Fastest-Dimension: %d\r\n" % data.shape[1]
+    text += "X-Binary-Size-Second-Dimension: %d\r\n" % data.shape[0]
+    text += "X-Binary-Size-Padding: 4095\r\n\r\n"
+    fd = open(filename, "wb")
+    try:
+        fd.write(text.encode("latin-1"))
+        fd.write("\x0c\x1a\x04\xd5".encode("latin-1"))
+        fd.write(compressed)
+        fd.write(("\x00" * 4095).encode("latin-1"))
+        fd.write("\r\n--CIF-BINARY-FORMAT-SECTION----\r\n;\r\n\r\n".\
+                 encode("latin-1"))
+    finally:
+        fd.close()
+
+
+def _readData(filename):
+    return PilatusCBF(filename).getData()
+
+
+def iterData(filelist, nThreads=None):
+    """
+    Iterate over the images of a list of CBF files keeping their order.
+
+    The files are decoded by a pool of threads. The compiled decoder releases
+    the interpreter lock, so several frames are decoded at the same time.
+
+    :param filelist: list of CBF file names
+    :param nThreads: number of decoding threads, default the number of CPUs
+    """
+    if nThreads is None:
+        try:
+            nThreads = multiprocessing.cpu_count()
+        except NotImplementedError:
+            nThreads = 1
+    nThreads = min(nThreads, len(filelist))
+    if (nThreads < 2) or (_cDecodeByteOffset is None):
+        for filename in filelist:
+            yield _readData(filename)
+        return
+    pool = ThreadPool(nThreads)
+    try:
+        # keep a limited number of decoded frames waiting to be used
+        chunk = 2 * nThreads
+        for i in range(0, len(filelist), chunk):
+            for data in pool.map(_readData, filelist[i:i + chunk]):
+                yield data
+    finally:
+        pool.close()
+        pool.join()
+
+
 class CIF(dict):
     """
     This is the CIF class, it represents the CIF dictionnary as a a python dictionnary thus inherits from the dict built in class.
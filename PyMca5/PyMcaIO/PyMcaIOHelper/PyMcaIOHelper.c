@@ -33,6 +33,8 @@
 
 #include <./numpy/arrayobject.h>
 #include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
 
 struct module_state {
     PyObject *error;
@@ -49,6 +51,9 @@ static struct module_state _state;
 
 static PyObject *PyMcaIOHelper_fillSupaVisio(PyObject *dummy, PyObject *args);
 static PyObject *PyMcaIOHelper_readAifira(PyObject *dummy, PyObject *args);
+static PyObject *PyMcaIOHelper_decodeByteOffset(PyObject *dummy, PyObject *args);
+static PyObject *PyMcaIOHelper_encodeByteOffset(PyObject *dummy, PyObject *args);
+static PyObject *PyMcaIOHelper_parseTextTable(PyObject *dummy, PyObject *args);
 
 /* Functions */
 
@@ -189,11 +194,508 @@ PyMcaIOHelper_readAifira(PyObject *self, PyObject *args)
     return PyArray_Return(outputArray);
 }
 
+/* CBF byte offset compression
+ *
+ * Each value is stored as the difference to the previous one (starting at 0)
+ * as a signed little endian integer of 1, 2, 4 or 8 bytes. The smallest
+ * value of each size (0x80, 0x8000, 0x80000000) flags a larger size to follow.
+ */
+
+static PyObject *
+PyMcaIOHelper_decodeByteOffset(PyObject *self, PyObject *args)
+{
+    PyObject *input, *output;
+    PyArrayObject *inputArray, *outputArray;
+    unsigned char *p, *end;
+    npy_int32 *outputPointer;
+    npy_intp nValues, n;
+    npy_int64 value, delta;
+    npy_uint64 udelta;
+    int i;
+    struct module_state *st = GETSTATE(self);
+
+    if (!PyArg_ParseTuple(args, "OO", &input, &output))
+        return NULL;
+    if (!PyArray_Check(output))
+    {
+        PyErr_SetString(st->error, "Output must be an int32 array");
+        return NULL;
+    }
+    outputArray = (PyArrayObject *) output;
+    if ((PyArray_TYPE(outputArray) != NPY_INT32) || \
+        (!PyArray_ISCARRAY(outputArray)) || \
+        (!PyArray_ISNOTSWAPPED(outputArray)))
+    {
+        PyErr_SetString(st->error,
+                        "Output must be a C contiguous writable int32 array");
+        return NULL;
+    }
+    inputArray = (PyArrayObject *)
+                PyArray_ContiguousFromObject(input, NPY_UBYTE, 1, 1);
+    if (inputArray == NULL)
+    {
+        PyErr_SetString(st->error, "Cannot parse input array");
+        return NULL;
+    }
+
+    p = (unsigned char *) PyArray_DATA(inputArray);
+    end = p + PyArray_DIMS(inputArray)[0];
+    outputPointer = (npy_int32 *) PyArray_DATA(outputArray);
+    nValues = PyArray_SIZE(outputArray);
+    n = 0;
+    value = 0;
+
+    /* Do the job */
+    Py_BEGIN_ALLOW_THREADS
+    while ((n < nValues) && (p < end))
+    {
+        if (*p != 0x80)
+        {
+            value += (signed char) *p;
+            p += 1;
+        }
+        else
+        {
+            if ((p + 3) > end)
+                break;
+            delta = p[1] | (p[2] << 8);
+            if (delta != 0x8000)
+            {
+                if (delta > 0x7FFF)
+                    delta -= 0x10000;
+                value += delta;
+                p += 3;
+            }
+            else
+            {
+                if ((p + 7) > end)
+                    break;
+                delta = ((npy_int64) p[3]) | ((npy_int64) p[4] << 8) | \
+                        ((npy_int64) p[5] << 16) | ((npy_int64) p[6] << 24);
+                if (delta != 0x80000000LL)
+                {
+                    if (delta > 0x7FFFFFFFLL)
+                        delta -= 0x100000000LL;
+                    value += delta;
+                    p += 7;
+                }
+                else
+                {
+                    if ((p + 15) > end)
+                        break;
+                    udelta = 0;
+                    for (i = 14; i > 6; i--)
+                    {
+                        udelta = (udelta << 8) | p[i];
+                    }
+                    value += (npy_int64) udelta;
+                    p += 15;
+                }
+            }
+        }
+        outputPointer[n] = (npy_int32) value;
+        n++;
+    }
+    Py_END_ALLOW_THREADS
+
+    Py_DECREF(inputArray);
+    return PyLong_FromSsize_t((Py_ssize_t) n);
+}
+
+static PyObject *
+PyMcaIOHelper_encodeByteOffset(PyObject *self, PyObject *args)
+{
+    PyObject *input;
+    PyArrayObject *inputArray, *outputArray;
+    npy_int32 *inputPointer;
+    unsigned char *p;
+    npy_intp nValues, i, dimensions[1];
+    npy_int64 previous, delta;
+    int j;
+    struct module_state *st = GETSTATE(self);
+
+    if (!PyArg_ParseTuple(args, "O", &input))
+        return NULL;
+    inputArray = (PyArrayObject *)
+                PyArray_ContiguousFromObject(input, NPY_INT32, 0, 0);
+    if (inputArray == NULL)
+    {
+        PyErr_SetString(st->error, "Cannot parse input array");
+        return NULL;
+    }
+    inputPointer = (npy_int32 *) PyArray_DATA(inputArray);
+    nValues = PyArray_SIZE(inputArray);
+
+    /* first pass: size of the compressed stream */
+    dimensions[0] = 0;
+    previous = 0;
+    Py_BEGIN_ALLOW_THREADS
+    for (i = 0; i < nValues; i++)
+    {
+        delta = inputPointer[i] - previous;
+        previous = inputPointer[i];
+        if ((delta > -128) && (delta < 128))
+            dimensions[0] += 1;
+        else if ((delta > -32768) && (delta < 32768))
+            dimensions[0] += 3;
+        else if ((delta > -2147483647LL - 1) && (delta < 2147483648LL))
+            dimensions[0] += 7;
+        else
+            dimensions[0] += 15;
+    }
+    Py_END_ALLOW_THREADS
+
+    outputArray = (PyArrayObject *) PyArray_SimpleNew(1, dimensions, NPY_UBYTE);
+    if (outputArray == NULL)
+    {
+        Py_DECREF(inputArray);
+        return NULL;
+    }
+
+    /* second pass: fill it */
+    p = (unsigned char *) PyArray_DATA(outputArray);
+    previous = 0;
+    Py_BEGIN_ALLOW_THREADS
+    for (i = 0; i < nValues; i++)
+    {
+        delta = inputPointer[i] - previous;
+        previous = inputPointer[i];
+        if ((delta > -128) && (delta < 128))
+        {
+            *p++ = (unsigned char) (delta & 0xFF);
+            continue;
+        }
+        *p++ = 0x80;
+        if ((delta > -32768) && (delta < 32768))
+        {
+            *p++ = (unsigned char) (delta & 0xFF);
+            *p++ = (unsigned char) ((delta >> 8) & 0xFF);
+            continue;
+        }
+        *p++ = 0x00;
+        *p++ = 0x80;
+        if ((delta > -2147483647LL - 1) && (delta < 2147483648LL))
+        {
+            for (j = 0; j < 4; j++)
+                *p++ = (unsigned char) ((delta >> (8 * j)) & 0xFF);
+            continue;
+        }
+        *p++ = 0x00;
+        *p++ = 0x00;
+        *p++ = 0x00;
+        *p++ = 0x80;
+        for (j = 0; j < 8; j++)
+            *p++ = (unsigned char) ((delta >> (8 * j)) & 0xFF);
+    }
+    Py_END_ALLOW_THREADS
+
+    Py_DECREF(inputArray);
+    return PyArray_Return(outputArray);
+}
+
+/* Numeric text tables
+ *
+ * Values are separated by blanks, tabulators, commas, semicolons or quotes.
+ * Lines end with \n or \r. Lines without values are ignored.
+ */
+
+#define IS_SEPARATOR(c) (((c) == ' ') || ((c) == '\t') || ((c) == ',') || \
+                         ((c) == ';') || ((c) == '"'))
+#define IS_END_OF_LINE(c) (((c) == '\n') || ((c) == '\r'))
+
+static const double powersOfTen[] = {1e0, 1e1, 1e2, 1e3, 1e4, 1e5, 1e6, 1e7,
+                                     1e8, 1e9, 1e10, 1e11, 1e12, 1e13, 1e14,
+                                     1e15, 1e16, 1e17, 1e18, 1e19, 1e20, 1e21,
+                                     1e22};
+
+/* Values with up to 15 significant digits and small exponents are exactly
+ * represented as the quotient or product of two doubles, so a single
+ * correctly rounded operation gives the correctly rounded value.
+ * Returns 0 when the token has to be converted by Python. */
+static int
+parseSimpleDouble(const unsigned char *p, const unsigned char *end, double *value)
+{
+    int negative = 0, nDigits = 0, exponent = 0, expSign = 1, exp10 = 0;
+    int hasDigits = 0;
+    npy_uint64 mantissa = 0;
+
+    if ((*p == '-') || (*p == '+'))
+    {
+        negative = (*p == '-');
+        p++;
+    }
+    while ((p < end) && (*p >= '0') && (*p <= '9'))
+    {
+        hasDigits = 1;
+        if (mantissa || (*p != '0'))
+        {
+            if (nDigits >= 15)
+                return 0;
+            mantissa = mantissa * 10 + (*p - '0');
+            nDigits++;
+        }
+        p++;
+    }
+    if ((p < end) && (*p == '.'))
+    {
+        p++;
+        while ((p < end) && (*p >= '0') && (*p <= '9'))
+        {
+            hasDigits = 1;
+            if (mantissa || (*p != '0'))
+            {
+                if (nDigits >= 15)
+                    return 0;
+                mantissa = mantissa * 10 + (*p - '0');
+                nDigits++;
+            }
+            exp10--;
+            p++;
+        }
+    }
+    if (!hasDigits)
+        return 0;
+    if ((p < end) && ((*p == 'e') || (*p == 'E')))
+    {
+        p++;
+        if ((p < end) && ((*p == '-') || (*p == '+')))
+        {
+            expSign = (*p == '-') ? -1 : 1;
+            p++;
+        }
+        if ((p >= end) || (*p < '0') || (*p > '9'))
+            return 0;
+        while ((p < end) && (*p >= '0') && (*p <= '9'))
+        {
+            if (exponent < 10000)
+                exponent = exponent * 10 + (*p - '0');
+            p++;
+        }
+    }
+    if (p != end)
+        return 0;
+    exp10 += expSign * exponent;
+    if (mantissa == 0)
+        *value = 0.0;
+    else if ((exp10 >= 0) && (exp10 <= 22))
+        *value = ((double) mantissa) * powersOfTen[exp10];
+    else if ((exp10 < 0) && (exp10 >= -22))
+        *value = ((double) mantissa) / powersOfTen[-exp10];
+    else
+        return 0;
+    if (negative)
+        *value = -(*value);
+    return 1;
+}
+
+static PyObject *
+PyMcaIOHelper_parseTextTable(PyObject *self, PyObject *args)
+{
+    PyObject *input, *columns = NULL;
+    PyArrayObject *inputArray, *columnsArray = NULL, *outputArray;
+    unsigned char *p, *start, *end, *tokenStart;
+    int nColumns, comment = -1;
+    int column, i, nSelected;
+    int *selected = NULL;
+    npy_intp nRows, row, line, dimensions[2];
+    double *outputPointer, value;
+    char token[512];
+    struct module_state *st = GETSTATE(self);
+
+    if (!PyArg_ParseTuple(args, "Oi|Oi", &input, &nColumns, &columns, &comment))
+        return NULL;
+    if (nColumns < 1)
+    {
+        PyErr_SetString(st->error, "Number of columns must be positive");
+        return NULL;
+    }
+    inputArray = (PyArrayObject *)
+                PyArray_ContiguousFromObject(input, NPY_UBYTE, 1, 1);
+    if (inputArray == NULL)
+    {
+        PyErr_SetString(st->error, "Cannot parse input array");
+        return NULL;
+    }
+    /* column selected for each column of the table or -1 */
+    selected = (int *) malloc(nColumns * sizeof(int));
+    if (selected == NULL)
+    {
+        Py_DECREF(inputArray);
+        return PyErr_NoMemory();
+    }
+    if ((columns == NULL) || (columns == Py_None))
+    {
+        nSelected = nColumns;
+        for (i = 0; i < nColumns; i++)
+            selected[i] = i;
+    }
+    else
+    {
+        columnsArray = (PyArrayObject *)
+                PyArray_ContiguousFromObject(columns, NPY_INT, 1, 1);
+        if (columnsArray == NULL)
+        {
+            free(selected);
+            Py_DECREF(inputArray);
+            PyErr_SetString(st->error, "Cannot parse columns");
+            return NULL;
+        }
+        for (i = 0; i < nColumns; i++)
+            selected[i] = -1;
+        nSelected = (int) PyArray_DIMS(columnsArray)[0];
+        for (i = 0; i < nSelected; i++)
+        {
+            column = ((int *) PyArray_DATA(columnsArray))[i];
+            if ((column < 0) || (column >= nColumns) || (selected[column] >= 0))
+            {
+                free(selected);
+                Py_DECREF(inputArray);
+                Py_DECREF(columnsArray);
+                PyErr_SetString(st->error,
+                                "Columns must be different and in range");
+                return NULL;
+            }
+            selected[column] = i;
+        }
+        Py_DECREF(columnsArray);
+    }
+
+    start = (unsigned char *) PyArray_DATA(inputArray);
+    end = start + PyArray_DIMS(inputArray)[0];
+
+    /* first pass: count and check the rows */
+    nRows = 0;
+    line = 0;
+    p = start;
+    while (p < end)
+    {
+        column = 0;
+        while ((p < end) && !IS_END_OF_LINE(*p))
+        {
+            if (IS_SEPARATOR(*p))
+            {
+                p++;
+                continue;
+            }
+            if (*p == comment)
+            {
+                while ((p < end) && !IS_END_OF_LINE(*p))
+                    p++;
+                break;
+            }
+            column++;
+            while ((p < end) && !IS_SEPARATOR(*p) && !IS_END_OF_LINE(*p) && \
+                   (*p != comment))
+                p++;
+        }
+        if (column)
+        {
+            if (column != nColumns)
+            {
+                free(selected);
+                Py_DECREF(inputArray);
+                PyErr_Format(PyExc_ValueError,
+                             "Line %ld has %d values instead of %d",
+                             (long) (line + 1), column, nColumns);
+                return NULL;
+            }
+            nRows++;
+        }
+        line++;
+        if (p < end)
+        {
+            if ((*p == '\r') && ((p + 1) < end) && (p[1] == '\n'))
+                p++;
+            p++;
+        }
+    }
+
+    dimensions[0] = nRows;
+    dimensions[1] = nSelected;
+    outputArray = (PyArrayObject *) PyArray_SimpleNew(2, dimensions, NPY_DOUBLE);
+    if (outputArray == NULL)
+    {
+        free(selected);
+        Py_DECREF(inputArray);
+        return NULL;
+    }
+    outputPointer = (double *) PyArray_DATA(outputArray);
+
+    /* second pass: convert the selected values */
+    row = 0;
+    p = start;
+    while (p < end)
+    {
+        column = 0;
+        while ((p < end) && !IS_END_OF_LINE(*p))
+        {
+            if (IS_SEPARATOR(*p))
+            {
+                p++;
+                continue;
+            }
+            if (*p == comment)
+            {
+                while ((p < end) && !IS_END_OF_LINE(*p))
+                    p++;
+                break;
+            }
+            tokenStart = p;
+            while ((p < end) && !IS_SEPARATOR(*p) && !IS_END_OF_LINE(*p) && \
+                   (*p != comment))
+                p++;
+            if (selected[column] >= 0)
+            {
+                if (!parseSimpleDouble(tokenStart, p, &value))
+                {
+                    /* let Python deal with long, special or invalid values */
+                    if ((p - tokenStart) >= (int) sizeof(token))
+                    {
+                        free(selected);
+                        Py_DECREF(inputArray);
+                        Py_DECREF(outputArray);
+                        PyErr_SetString(PyExc_ValueError,
+                                        "Non numeric value found");
+                        return NULL;
+                    }
+                    memcpy(token, tokenStart, p - tokenStart);
+                    token[p - tokenStart] = 0;
+                    value = PyOS_string_to_double(token, NULL, NULL);
+                    if ((value == -1.0) && PyErr_Occurred())
+                    {
+                        free(selected);
+                        Py_DECREF(inputArray);
+                        Py_DECREF(outputArray);
+                        return NULL;
+                    }
+                }
+                outputPointer[row * nSelected + selected[column]] = value;
+            }
+            column++;
+        }
+        if (column)
+            row++;
+        if (p < end)
+        {
+            if ((*p == '\r') && ((p + 1) < end) && (p[1] == '\n'))
+                p++;
+            p++;
+        }
+    }
+
+    free(selected);
+    Py_DECREF(inputArray);
+    return PyArray_Return(outputArray);
+}
+
 /* Module methods */
 
 static PyMethodDef PyMcaIOHelper_methods[] = {
     {"fillSupaVisio", PyMcaIOHelper_fillSupaVisio, METH_VARARGS},
     {"readAifira", PyMcaIOHelper_readAifira, METH_VARARGS},
+    {"decodeByteOffset", PyMcaIOHelper_decodeByteOffset, METH_VARARGS},
+    {"encodeByteOffset", PyMcaIOHelper_encodeByteOffset, METH_VARARGS},
+    {"parseTextTable", PyMcaIOHelper_parseTextTable, METH_VARARGS},
 	{NULL, NULL}
 };
 
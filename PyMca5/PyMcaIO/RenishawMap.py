@@ -55,6 +55,7 @@
 import re
 import numpy
 from PyMca5.PyMcaCore import DataObject
+from PyMca5.PyMcaIO import TextTable
 
 SOURCE_TYPE = "EdfFileStack"
 
@@ -62,81 +63,44 @@ class RenishawMap(DataObject.DataObject):
     def __init__(self, filename, infofile=None):
         DataObject.DataObject.__init__(self)
 
-        # allocate buffers greater than any spected number of channels
-        x = numpy.zeros((10000,), numpy.float32)
-        y = numpy.zeros((10000,), numpy.float32)
-        wl = numpy.zeros((10000,), numpy.float32)
-        data = numpy.zeros((10000,), numpy.float32)
-        #import time
-        #t0 = time.time()
-        with open(filename, 'r') as f:
-            nChannels = 0
-            for line in f:
-                # read the first line
-                y[nChannels], x[nChannels], wl[nChannels], data[nChannels] = \
-                              [float(value) for value in line.split("\t")]
-                if nChannels == 0:
-                    firstChannel = wl[0]
-                elif wl[nChannels] == firstChannel:
-                    break
-                nChannels += 1
-            if y[0] == y[nChannels]:
-                firstChangesFirst = False
-            else:
-                firstChangesFirst = True
-            nLines = nChannels + 1 + sum([1 for l in f])
-        #print("ELAPSED 0 = ", time.time() - t0)
+        # one line per channel: y x wavelength value
+        try:
+            table = TextTable.readTable(filename, comments=None)
+        except ValueError:
+            raise IOError("Not a Renishaw map file")
+        if table.shape[1] != 4:
+            raise IOError("Not a Renishaw map with four columns")
+        nLines = table.shape[0]
+        # the first wavelength is repeated at the start of the next spectrum
+        repeated = numpy.nonzero(table[1:, 2] == table[0, 2])[0]
+        if len(repeated):
+            nChannels = int(repeated[0]) + 1
+        else:
+            nChannels = nLines
         if nLines % nChannels:
             raise IOError("Not a regular Renishaw map or a not a complete file")
         nSpectra = int(nLines / nChannels)
-        #print("N Channels = %d" % nChannels)
-        #print("N Lines = %d" % nLines)
-        #print("N Spectra = %f" % (nLines/nChannels))
+        if (nSpectra > 1) and \
+           (numpy.float32(table[0, 0]) != numpy.float32(table[nChannels, 0])):
+            firstChangesFirst = True
+        else:
+            firstChangesFirst = False
 
-        rows = numpy.zeros((nSpectra,), numpy.float32)
-        columns = numpy.zeros((nSpectra,), numpy.float32)
-        wl = numpy.array(wl[:nChannels], dtype=numpy.float32)        
-        data = numpy.zeros((nSpectra, nChannels), numpy.float32)
-        nRows = 0
-        nColumns = 0
-        #t0 = time.time()
-        myFloat = numpy.float32
-        actualRows = []
-        actualColumns = []
-        indices = [None] * nSpectra
-        with open(filename, 'r') as f:
-            for i in range(nSpectra):
-                for j in range(nChannels):
-                    line = f.readline()
-                if firstChangesFirst:
-                    column, row, dummy1, dummy2 = \
-                            [float(value) for value in line.split("\t")]
-                else:
-                    row, column, dummy1, dummy2 = \
-                            [float(value) for value in line.split("\t")]
-                #positions.append((row, column, i))
-                if row not in actualRows:
-                    actualRows.append(row)
-                if column not in actualColumns:
-                    actualColumns.append(column)
-                indices[i] = (actualRows.index(row), actualColumns.index(column))
-        nRows = len(actualRows)
-        nColumns = len(actualColumns)
-        #positions.sort()
-        data.shape = nRows, nColumns, nChannels
-        with open(filename, 'r') as f:
-            for i in range(nSpectra):
-                row, column = indices[i]
-                for j in range(nChannels):
-                    line = f.readline()
-                    d1, d2, d3, data[row, column, j] = \
-                              [myFloat(value) for value in line.split("\t")]
-        #print "nRows = ", nRows
-        #print "nColumns= ", nColumns
-        #print columns[::nColumns]
-        #print rows[::nRows]
-        #print "product = ", nRows * nColumns
-        #print("ELAPSED tinal = ", time.time() - t0)
+        # the position of a spectrum is the one of its last line
+        positions = table[nChannels - 1::nChannels, :2]
+        if firstChangesFirst:
+            columns = positions[:, 0]
+            rows = positions[:, 1]
+        else:
+            rows = positions[:, 0]
+            columns = positions[:, 1]
+        rowIndex, nRows = _getIndexInOrderOfAppearance(rows)
+        columnIndex, nColumns = _getIndexInOrderOfAppearance(columns)
+        if nRows * nColumns != nSpectra:
+            raise IOError("Not a regular Renishaw map")
+        wl = numpy.array(table[:nChannels, 2], dtype=numpy.float32)
+        data = numpy.zeros((nRows, nColumns, nChannels), numpy.float32)
+        data[rowIndex, columnIndex] = table[:, 3].reshape(nSpectra, nChannels)
 
         # arrange as EDF stack
         self.sourceName = filename
@@ -156,6 +120,18 @@ def __init__(self, filename, infofile=None):
         self.info["Channel0"] = 0.0
         self.x = [wl]
 
+def _getIndexInOrderOfAppearance(values):
+    """
+    Index of each value in the list of the different values sorted by
+    first appearance, and the number of different values.
+    """
+    unique, first, inverse = numpy.unique(values,
+                                          return_index=True,
+                                          return_inverse=True)
+    rank = numpy.empty(first.shape, dtype=numpy.int64)
+    rank[numpy.argsort(first)] = numpy.arange(first.size)
+    return rank[inverse], unique.size
+
 def isRenishawMapFile(filename):
     try:
         if filename.endswith(".txt"):
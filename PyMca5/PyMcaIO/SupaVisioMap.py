@@ -33,35 +33,26 @@
 import sys
 import os
 import numpy
-import struct
-import time
 from PyMca5 import DataObject
-from PyMca5.PyMcaIO import PyMcaIOHelper
+from PyMca5.PyMcaIO import BinaryArray
+from PyMca5.PyMcaIO import ListModeStack
 
 DEBUG = 0
 SOURCE_TYPE="EdfFileStack"
+N_CHANNELS = 2048
 
 class SupaVisioMap(DataObject.DataObject):
     def __init__(self, filename):
         DataObject.DataObject.__init__(self)
 
-        fileSize = os.path.getsize(filename)
-        if sys.platform == 'win32':
-            fid = open(filename, 'rb')
-        else:
-            fid = open(filename, 'r')
-        data=fid.read()
-        fid.close()
         self.sourceName = [filename]
-        e0 = time.time()
 
-        values = struct.unpack("%dH" % (len(data)/2), data)
-        data = numpy.array(values, numpy.uint16)
-        #print values
-        nrows = values[1]
-        ncols = values[2]
+        # header and events are triplets of unsigned short
+        data = BinaryArray.fromFile(filename, numpy.uint16,
+                                    (os.path.getsize(filename) // 6, 3))
+        nrows = int(data[0, 1])
+        ncols = int(data[0, 2])
         self.nSpectra = nrows * ncols
-        data.shape = [len(data)/3, 3]
         self.nChannels = data[:,2].max() + 1
 
         #fill the header
@@ -70,11 +61,15 @@ def __init__(self, filename):
 
         #arrange as an EDF Stack
         self.info = {}
-        self.__nFiles = (self.nSpectra)/self.nRows
+        self.__nFiles = self.nSpectra // self.nRows
         self.__nImagesPerFile = 1
 
-        e0 = time.time()
-        self.data = PyMcaIOHelper.fillSupaVisio(data).astype(numpy.float);
+        # the events (y, x, channel) follow the header, the last two
+        # triplets are not events
+        events = data[1:-2]
+        stack = ListModeStack.ListModeStack((ncols, nrows), N_CHANNELS)
+        stack.addEvents(events[:, 1], events[:, 0], events[:, 2])
+        self.data = stack.data.astype(numpy.float64)
         shape = self.data.shape
         for i in range(len(shape)):
             key = 'Dim_%d' % (i+1,)
@@ -34,13 +34,23 @@
 import sys
 import os
 from PyMca5 import DataObject
+from PyMca5.PyMcaIO import TextTable
 
 SOURCE_TYPE = "EdfFileStack"
 DEBUG = 0
 
 class TextImageStack(DataObject.DataObject):
-    def __init__(self, filelist = None, imagestack=None, dtype=None):
+    def __init__(self, filelist = None, imagestack=None, dtype=None,
+                 nProcesses=None):
+        """
+        :param filelist: list of text image files
+        :param imagestack: ignored, the files are always images
+        :param dtype: data type of the stack, default the one of the first file
+        :param nProcesses: number of processes parsing the files, default
+                           1 (the files are read in the calling process)
+        """
         DataObject.DataObject.__init__(self)
+        self.nProcesses = nProcesses
         self.incrProgressBar=0
         self.__keyList = []
         if imagestack is None:
@@ -66,7 +76,7 @@ def loadFileList(self, filelist, fileindex=0):
         self.info = {}
         self.__nFiles=len(filelist)
         #read first file
-        arrRet = numpy.loadtxt(filelist[0])
+        arrRet = TextTable.readTable(filelist[0])
         if self.__dtype is None:
             self.__dtype = arrRet.dtype
         self.__nImagesPerFile = 1
@@ -97,19 +107,17 @@ def loadFileList(self, filelist, fileindex=0):
         self.onBegin(self.__nFiles)
         self.__imageStack = True
         self.incrProgressBar=0
-        if samplingStep == 1:
-            for tempFileName in filelist:
-                self.data[self.incrProgressBar]=numpy.loadtxt(tempFileName,
-                                                        dtype=self.__dtype)
-                self.incrProgressBar += 1
-                self.onProgress(self.incrProgressBar)
-        else:
-            for tempFileName in filelist:
-                pieceOfStack=numpy.loadtxt(tempFileName, dtype=self.__dtype)
-                self.data[self.incrProgressBar] = pieceOfStack[::samplingStep,
-                                                               ::samplingStep]
-                self.incrProgressBar += 1
-                self.onProgress(self.incrProgressBar)
+        # the first file is already read
+        self.data[0] = arrRet[::samplingStep, ::samplingStep]
+        self.incrProgressBar += 1
+        self.onProgress(self.incrProgressBar)
+        for pieceOfStack in TextTable.iterTables(filelist[1:],
+                                                 nProcesses=self.nProcesses,
+                                                 dtype=self.__dtype):
+            self.data[self.incrProgressBar] = pieceOfStack[::samplingStep,
+                                                           ::samplingStep]
+            self.incrProgressBar += 1
+            self.onProgress(self.incrProgressBar)
         self.onEnd()
         if self.__imageStack:
             self.info["McaIndex"] = 0
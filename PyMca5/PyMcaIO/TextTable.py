@@ -0,0 +1,286 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+__author__ = "V.A. Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+__doc__ = """
+Fast reading of numeric tables stored as text.
+
+The values of a line can be separated by blanks, tabulators, commas or
+semicolons and can be quoted. Files are parsed by numpy in chunks of lines,
+so only the selected columns of a table are kept in memory. Lists of files
+can optionally be parsed by several processes.
+"""
+import sys
+import re
+import multiprocessing
+import numpy
+
+DEBUG = 0
+
+# approximate number of bytes parsed at once
+CHUNK_SIZE = 16 * 1024 * 1024
+
+if sys.version_info < (3, 0):
+    import string
+    _DELIMITERS = string.maketrans(',;"\t\r', "    \n")
+else:
+    _DELIMITERS = bytes.maketrans(b',;"\t\r', b"    \n")
+_NEW_LINE = "\n".encode("latin-1")
+_CARRIAGE_RETURN = "\r".encode("latin-1")
+
+try:
+    from PyMca5.PyMcaIO.PyMcaIOHelper import parseTextTable as \
+         _cParseTextTable
+except ImportError:
+    _cParseTextTable = None
+
+
+def _parseChunk(chunk, nColumns, columns=None, comments=None):
+    """
+    Parse complete lines of text into a table of floats.
+    """
+    if _cParseTextTable is not None:
+        if comments is None:
+            comment = -1
+        else:
+            comment = ord(comments)
+        return _cParseTextTable(numpy.frombuffer(chunk, dtype=numpy.uint8),
+                                nColumns, columns, comment)
+    chunk = chunk.replace(_CARRIAGE_RETURN + _NEW_LINE, _NEW_LINE)
+    chunk = chunk.translate(_DELIMITERS)
+    if comments is not None:
+        chunk = re.sub(re.escape(comments.encode("latin-1")) + \
+                       "[^\n]*".encode("latin-1"), " ".encode("latin-1"),
+                       chunk)
+    # same check of the rows as the compiled parser
+    for line, tokens in enumerate(chunk.split(_NEW_LINE)):
+        nValues = len(tokens.split())
+        if nValues and (nValues != nColumns):
+            raise ValueError("Line %d has %d values instead of %d" % \
+                             (line + 1, nValues, nColumns))
+    # numpy.fromstring would return -1 for chunks without values
+    try:
+        values = numpy.array(chunk.split(), dtype=numpy.float64)
+    except ValueError:
+        raise ValueError("Non numeric values found")
+    values.shape = -1, nColumns
+    if columns is not None:
+        values = values[:, columns]
+    return values
+
+
+def _getNumberOfColumns(chunk, comments=None):
+    """
+    Number of values of the first line with values, 0 if none.
+    """
+    for line in chunk.translate(_DELIMITERS).split(_NEW_LINE):
+        if comments is not None:
+            line = line.split(comments.encode("latin-1"))[0]
+        nColumns = len(line.split())
+        if nColumns:
+            return nColumns
+    return 0
+
+
+def _findLastEndOfLine(chunk):
+    return max(chunk.rfind(_NEW_LINE), chunk.rfind(_CARRIAGE_RETURN))
+
+
+def _skipLine(chunk):
+    idx = [i for i in (chunk.find(_NEW_LINE), chunk.find(_CARRIAGE_RETURN)) \
+           if i >= 0]
+    if not len(idx):
+        return chunk[:0]
+    idx = min(idx)
+    if chunk[idx:idx + 2] == _CARRIAGE_RETURN + _NEW_LINE:
+        idx += 1
+    return chunk[idx + 1:]
+
+
+def readTable(filename, columns=None, skiprows=0, dtype=numpy.float64,
+              comments="#", chunksize=None):
+    """
+    Read a text table of numbers.
+
+    :param filename: name of the file
+    :param columns: indices of the columns to keep, default all
+    :param skiprows: number of lines to skip at the start of the file
+    :param dtype: data type of the returned array
+    :param comments: character starting a comment or None
+    :param chunksize: approximate number of bytes to parse at once
+    :return: 2D array with one row per line with values
+    """
+    if chunksize is None:
+        chunksize = CHUNK_SIZE
+    blocks = []
+    nColumns = 0
+    toSkip = skiprows
+    remainder = "".encode("latin-1")
+    f = open(filename, "rb")
+    try:
+        while True:
+            data = f.read(chunksize)
+            chunk = remainder + data
+            if len(data):
+                idx = _findLastEndOfLine(chunk)
+                if (idx == (len(chunk) - 1)) and \
+                   (chunk[idx:] == _CARRIAGE_RETURN):
+                    # the line feed of a CRLF may be in the next read
+                    idx = _findLastEndOfLine(chunk[:idx])
+                if idx < 0:
+                    # no complete line yet
+                    remainder = chunk
+                    continue
+                remainder = chunk[idx + 1:]
+                chunk = chunk[:idx + 1]
+            while toSkip and len(chunk):
+                chunk = _skipLine(chunk)
+                toSkip -= 1
+            if not nColumns:
+                nColumns = _getNumberOfColumns(chunk, comments)
+            if nColumns:
+                values = _parseChunk(chunk, nColumns, columns=columns,
+                                     comments=comments)
+                blocks.append(values.astype(dtype))
+            if not len(data):
+                break
+    finally:
+        f.close()
+    if not nColumns:
+        raise ValueError("No values found in file %s" % filename)
+    if len(blocks) == 1:
+        return blocks[0]
+    return numpy.concatenate(blocks)
+
+
+def _readTable(task):
+    filename, kw = task
+    return readTable(filename, **kw)
+
+
+def iterTables(filelist, nProcesses=None, **kw):
+    """
+    Iterate over the tables of a list of files keeping their order.
+
+    :param filelist: list of file names
+    :param nProcesses: number of processes parsing the files, default 1.
+                       Applications using several processes have to call
+                       multiprocessing.freeze_support() when frozen.
+    :param kw: keyword arguments of readTable
+    """
+    if nProcesses is None:
+        nProcesses = 1
+    nProcesses = min(nProcesses, len(filelist))
+    if nProcesses < 2:
+        for filename in filelist:
+            yield readTable(filename, **kw)
+        return
+    pool = multiprocessing.Pool(nProcesses)
+    try:
+        tasks = [(filename, kw) for filename in filelist]
+        for table in pool.imap(_readTable, tasks):
+            yield table
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def readTables(filelist, nProcesses=None, **kw):
+    """
+    Read the tables of a list of files.
+
+    :param filelist: list of file names
+    :param nProcesses: number of processes parsing the files, default 1
+    :param kw: keyword arguments of readTable
+    :return: list of arrays
+    """
+    return list(iterTables(filelist, nProcesses=nProcesses, **kw))
+
+
+def _getLabels(line):
+    """
+    Labels of a batch fit table header.
+    """
+    line = line.replace("\r", "")
+    line = line.replace("\n", "")
+    line = line.replace(",", "  ")
+    line = line.replace("\t", "  ")
+    line = line.replace(";", "  ")
+    line = line.replace('"', "")
+    return line.split("  ")
+
+
+def readBatchImages(filename, ignoresigma=None):
+    """
+    Read the images of a table written by a batch fit (.dat or .csv).
+
+    The first line holds the labels, the first two columns the row and the
+    column of each pixel.
+
+    :param filename: name of the file
+    :param ignoresigma: if True or None, skip the uncertainty columns
+    :return: list of labels and list of images
+    """
+    f = open(filename, "rb")
+    try:
+        line = f.readline()
+        # some tables use \r as line terminator
+        line = line.split("\r".encode("latin-1"))[0]
+    finally:
+        f.close()
+    try:
+        line = line.decode("utf-8")
+    except UnicodeDecodeError:
+        line = line.decode("latin-1")
+    labels = _getLabels(line)
+    nlabels = len(labels)
+    if ignoresigma or (ignoresigma is None):
+        iterationList = [2]
+        if len(labels) > 4:
+            for i in range(3, len(labels)):
+                if len(labels[i]) <= 5:
+                    iterationList.append(i)
+                elif labels[i] == ("s("+labels[i-1]+")"):
+                    continue
+                else:
+                    iterationList.append(i)
+        else:
+            iterationList = list(range(2, nlabels))
+    else:
+        iterationList = list(range(2, nlabels))
+    values = readTable(filename, columns=[0, 1] + iterationList, skiprows=1,
+                       comments=None)
+    nrows = int(values[:, 0].max() + 1)
+    ncols = int(values[:, 1].max() + 1)
+    images = []
+    for i in range(len(iterationList)):
+        images.append(numpy.resize(values[:, i + 2], (nrows, ncols)))
+    return [labels[i] for i in iterationList], images
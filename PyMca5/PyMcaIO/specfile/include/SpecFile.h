@@ -50,11 +50,11 @@
 #include <windows.h>
 #include <io.h>
 #define SF_OPENFLAG   O_RDONLY | O_BINARY
-#define SF_WRITEFLAG  O_CREAT | O_WRONLY
+#define SF_WRITEFLAG  O_CREAT | O_WRONLY | O_TRUNC | O_BINARY
 #define SF_UMASK      0666
 #else   /* if not windows */
 #define SF_OPENFLAG   O_RDONLY
-#define SF_WRITEFLAG  O_CREAT | O_WRONLY
+#define SF_WRITEFLAG  O_CREAT | O_WRONLY | O_TRUNC
 #define SF_UMASK      0666
 #endif
 
@@ -120,6 +120,7 @@ typedef struct _SpecFile{
   int             fd;
   long            m_time;
   char           *sfname;
+  char           *idxname;
   struct _ListHeader    list;
   long int        no_scans;
   ObjectList     *current;
@@ -171,6 +172,8 @@ typedef struct _SpecScan {
  * init
  */
 DllExport extern    SpecFile  *SfOpen        ( char *name, int *error );
+DllExport extern    SpecFile  *SfOpenIndexed ( char *name, char *idxname,
+                                                int *error );
 DllExport extern    short      SfUpdate      ( SpecFile *sf,int *error );
 DllExport extern    int        SfClose       ( SpecFile *sf );
 
@@ -219,6 +219,17 @@ DllExport long
 SfIndex( SpecFile *sf, long number, long order )
 {
      ObjectList		*ptr;
+     SpecScan		*scan;
+     int			 i;
+
+    /*
+     * Check first the current scan and the next one
+     */
+     for ( ptr=sf->current, i=0 ; ptr && i < 2 ; ptr=ptr->next, i++ ) {
+          scan = (SpecScan *)(ptr->contents);
+          if ( scan->scan_no == number && scan->order == order )
+               return( scan->index );
+     }
 
      ptr = findScanByNo( &(sf->list), number, order );
      if ( ptr != (ObjectList *)NULL )
@@ -123,29 +123,40 @@
 #define NEWLINE      1
 #define COMMENT      2
 
-#define SF_ISFX      ".sfI"
-
 #define SF_INIT      0
 #define SF_READY     1
 #define SF_MODIFIED  2
 
+/*
+ * Index file
+ *   The signature has to change with the layout of the index
+ *   The last bytes indexed are kept to check the file was only appended
+ */
+#define SF_ISIGNATURE  "SpecFile index 2"
+#define SF_ITAIL       64
+
+typedef struct _SfIndexHeader {
+    char      signature[32];
+    long int  sizes[3];    /* sizeof long, SfCursor and SpecScan */
+    long int  mtime;       /* modification time of the indexed file */
+    long int  size;        /* number of bytes indexed */
+    long int  no_scans;
+    long int  entries;     /* number of SpecScan records following */
+    char      tail[SF_ITAIL];
+} SfIndexHeader;
+
 /*
  * Function declaration
  */
 
 DllExport SpecFile * SfOpen   ( char *name,int *error);
 DllExport SpecFile * SfOpen2  ( int fd, char *name,int *error);
+DllExport SpecFile * SfOpenIndexed ( char *name, char *idxname, int *error);
 DllExport int        SfClose  ( SpecFile *sf);
 DllExport short      SfUpdate ( SpecFile *sf, int *error);
 DllExport char     * SfError  ( int error);
 
 
-#ifdef linux
-char SF_SIGNATURE[] =  "Linux 2ruru Sf2.0";
-#else
-char SF_SIGNATURE[] =  "2ruru Sf2.0";
-#endif
-
 /*
  * Internal functions
  */
@@ -155,14 +166,14 @@ static void  sfNewLine     ( SpecFile *sf, SfCursor *cursor, char c0,char c1,int
 static void  sfHeaderLine  ( SpecFile *sf, SfCursor *cursor, char c,int *error);
 static void  sfNewBlock    ( SpecFile *sf, SfCursor *cursor, short how,int *error);
 static void  sfSaveScan    ( SpecFile *sf, SfCursor *cursor, int *error);
-static void  sfAssignScanNumbers (SpecFile *sf);
+static void  sfAssignScanNumbers (SpecFile *sf, long first);
 static void  sfReadFile    ( SpecFile *sf, SfCursor *cursor, int *error);
 static void  sfResumeRead  ( SpecFile *sf, SfCursor *cursor, int *error);
-#ifdef SPECFILE_USE_INDEX_FILE
+static SpecFile * sfOpen   ( int fd, char *name, char *idxname, int *error);
 static short sfOpenIndex   ( SpecFile *sf, SfCursor *cursor, int *error);
 static short sfReadIndex   ( int sfi, SpecFile *sf, SfCursor *cursor, int *error);
 static void  sfWriteIndex  ( SpecFile *sf, SfCursor *cursor, int *error);
-#endif
+static int   sfReadTail    ( SpecFile *sf, long size, char *tail);
 
 /*
  * errors
@@ -252,10 +263,52 @@ SfOpen(char *name, int *error) {
 
 DllExport SpecFile *
 SfOpen2(int fd, char *name,int *error) {
+   return (sfOpen(fd, name, (char *)NULL, error));
+}
+
+
+
+/*********************************************************************
+ *   Function:          SpecFile *SfOpenIndexed( name, idxname, error)
+ *
+ *   Description:       Opens connection to Spec data file.
+ *                      The index list is read from the index file
+ *                      when it matches the data file. Only the part
+ *                      of the data file appended since the index was
+ *                      written is analyzed. The index file is written
+ *                      again when the index changes.
+ *
+ *   Parameters:
+ *              Input :
+ *                      (1) Filename
+ *                      (2) Index filename
+ *              Output:
+ *                      (3) error number
+ *   Returns:
+ *                      SpecFile pointer.
+ *                      NULL if not successful.
+ *
+ *   Possible errors:
+ *                      SF_ERR_FILE_OPEN
+ *                      SF_ERR_MEMORY_ALLOC
+ *
+ *********************************************************************/
+DllExport SpecFile *
+SfOpenIndexed(char *name, char *idxname, int *error) {
+
+   int         fd;
+   fd   = open(name,SF_OPENFLAG);
+   return (sfOpen(fd, name, idxname, error));
+}
+
+
+static SpecFile *
+sfOpen(int fd, char *name, char *idxname, int *error) {
    SpecFile   *sf;
    short       idxret;
    SfCursor      cursor;
    struct stat mystat;
+   long        first;
 
    if ( fd == -1 ) {
       *error = SF_ERR_FILE_OPEN;
@@ -277,6 +330,10 @@ SfOpen2(int fd, char *name,int *error) {
    sf->fd     = fd;
    sf->m_time = mystat.st_mtime;
    sf->sfname = (char *)strdup(name);
+   if (idxname != (char *)NULL)
+      sf->idxname = (char *)strdup(idxname);
+   else
+      sf->idxname = (char *)NULL;
 
    sf->list.first      = (ObjectList *)NULL;
    sf->list.last       = (ObjectList *)NULL;
@@ -311,23 +368,29 @@ SfOpen2(int fd, char *name,int *error) {
    cursor.file_header  = 0;
 
 
-#ifdef SPECFILE_USE_INDEX_FILE
   /*
    * Check if index file
    *   open it and continue from there
    */
-   idxret = sfOpenIndex(sf,&cursor,error);
-#else
-   idxret = SF_INIT;
-#endif
+   if (sf->idxname != (char *)NULL) {
+      idxret = sfOpenIndex(sf,&cursor,error);
+   } else {
+      idxret = SF_INIT;
+   }
 
+   first = 0;
    switch(idxret) {
       case SF_MODIFIED:
+          /*
+           * the last indexed scan may have grown
+           */
+          first = cursor.scanno;
           sfResumeRead(sf,&cursor,error);
           sfReadFile(sf,&cursor,error);
           break;
 
       case SF_INIT:
+          lseek(sf->fd,0,SEEK_SET);
           sfReadFile(sf,&cursor,error);
           break;
 
@@ -340,14 +403,14 @@ SfOpen2(int fd, char *name,int *error) {
 
    sf->cursor = cursor;
 
-  /*
-   * Once is all done assign scan numbers and orders
-   */
-   sfAssignScanNumbers(sf);
+   if (idxret != SF_READY) {
+     /*
+      * Once is all done assign scan numbers and orders
+      */
+      sfAssignScanNumbers(sf, first);
 
-#ifdef SPECFILE_USE_INDEX_FILE
-   if (idxret != SF_READY) sfWriteIndex(sf,&cursor,error);
-#endif
+      if (sf->idxname != (char *)NULL) sfWriteIndex(sf,&(sf->cursor),error);
+   }
    return(sf);
 }
 
@@ -383,6 +446,8 @@ SfClose( SpecFile *sf )
      }
 
      free ((char *)sf->sfname);
+     if (sf->idxname != NULL)
+        free ((char *)sf->idxname);
      if (sf->scanbuffer != NULL)
         free ((char *)sf->scanbuffer);
 
@@ -426,21 +491,29 @@ SfUpdate ( SpecFile *sf, int *error )
 {
     struct stat mystat;
     long   mtime;
+    long   first;
    /*printf("In SfUpdate\n");
    __asm("int3");*/
     stat(sf->sfname,&mystat);
 
     mtime = mystat.st_mtime;
 
-    if (sf->m_time != mtime)  {
+    if ((sf->m_time != mtime) || (mystat.st_size != sf->cursor.bytecnt))  {
+       first = sf->cursor.scanno;
        sfResumeRead (sf,&(sf->cursor),error);
        sfReadFile   (sf,&(sf->cursor),error);
 
        sf->m_time = mtime;
-       sfAssignScanNumbers(sf);
-#ifdef SPECFILE_USE_INDEX_FILE
-       sfWriteIndex (sf,&(sf->cursor),error);
-#endif
+       sfAssignScanNumbers(sf, first);
+
+      /*
+       * the scan kept in memory may have grown
+       */
+       freeAllData(sf);
+       sf->current = (ObjectList *)NULL;
+
+       if (sf->idxname != (char *)NULL)
+          sfWriteIndex (sf,&(sf->cursor),error);
        return(1);
     }else{
        return(0);
@@ -546,104 +619,195 @@ sfResumeRead  ( SpecFile *sf, SfCursor *cursor, int *error) {
 }
 
 
-#ifdef SPECFILE_USE_INDEX_FILE
 static short
 sfOpenIndex ( SpecFile *sf, SfCursor *cursor, int *error) {
-    char *idxname;
-    short namelength;
     int   sfi;
+    short ret;
 
-    namelength = strlen(sf->sfname) + strlen(SF_ISFX) + 1;
-
-    idxname = (char *)malloc(sizeof(char) * namelength);
-
-    sprintf(idxname,"%s%s",sf->sfname,SF_ISFX);
-
-    if ((sfi = open(idxname,SF_OPENFLAG)) == -1) {
-        free(idxname);
+    if ((sfi = open(sf->idxname,SF_OPENFLAG)) == -1) {
         return(SF_INIT);
     } else {
-        free(idxname);
-        return(sfReadIndex(sfi,sf,cursor,error));
+        ret = sfReadIndex(sfi,sf,cursor,error);
+        close(sfi);
+        return(ret);
     }
 }
 
-
+
+/*********************************************************************
+ *
+ *   Function:     static short sfReadIndex()
+ *
+ *   Description:  Reads the index list from an index file.
+ *                 The index is used if the indexed part of the data
+ *                 file is unchanged:
+ *                   - same size and modification time (SF_READY)
+ *                   - appended data keeping the last indexed bytes
+ *                     (SF_MODIFIED)
+ *                 Otherwise nothing is read (SF_INIT).
+ *
+ *********************************************************************/
 static short
 sfReadIndex   ( int sfi, SpecFile *sf, SfCursor *cursor, int *error) {
-    SfCursor   filecurs;
-    char       buffer[200];
-    long       bytesread,i=0;
-    SpecScan   scan;
-    short      modif = 0;
-    long       mtime;
+    SfIndexHeader  header;
+    SfCursor       filecurs;
+    SpecScan      *scans;
+    struct stat    mystat;
+    char           tail[SF_ITAIL];
+    long           i, nbytes;
+    short          ret;
 
    /*
-    * read signature
+    * read signature and check the index was written on this platform
     */
-    bytesread = read(sfi,buffer,sizeof(SF_SIGNATURE));
-    if (strcmp(buffer,SF_SIGNATURE) || bytesread == 0 ) {
+    if (read(sfi,&header,sizeof(SfIndexHeader)) != sizeof(SfIndexHeader))
+        return(SF_INIT);
+    if (strncmp(header.signature,SF_ISIGNATURE,sizeof(header.signature)) ||
+        header.sizes[0] != sizeof(long)     ||
+        header.sizes[1] != sizeof(SfCursor) ||
+        header.sizes[2] != sizeof(SpecScan) ||
+        header.no_scans < 1 || header.entries < 1)
         return(SF_INIT);
-    }
 
    /*
-    * read cursor and specfile structure
+    * check the indexed part of the data file
     */
-    if ( read(sfi,&mtime,   sizeof(long)) == 0)   return(SF_INIT);
-    if ( read(sfi,&filecurs, sizeof(SfCursor)) == 0) return(SF_INIT);
+    if (fstat(sf->fd,&mystat) || mystat.st_size < header.size)
+        return(SF_INIT);
+    if (mystat.st_size == header.size) {
+        if (sf->m_time != header.mtime) return(SF_INIT);
+        ret = SF_READY;
+    } else {
+        ret = SF_MODIFIED;
+    }
+    if (sfReadTail(sf,header.size,tail) ||
+        memcmp(tail,header.tail,SF_ITAIL))
+        return(SF_INIT);
 
-    if (sf->m_time != mtime)  modif = 1;
+   /*
+    * read cursor and scan list
+    */
+    if (read(sfi,&filecurs,sizeof(SfCursor)) != sizeof(SfCursor))
+        return(SF_INIT);
+    if (filecurs.bytecnt != header.size ||
+        filecurs.scanno  != header.no_scans)
+        return(SF_INIT);
 
-    while(read(sfi,&scan, sizeof(SpecScan))) {
-        addToList(&(sf->list), (void *)&scan, (long)sizeof(SpecScan));
-        i++;
+    nbytes = header.entries * sizeof(SpecScan);
+    if (fstat(sfi,&mystat) ||
+        mystat.st_size != (long) (sizeof(SfIndexHeader) + sizeof(SfCursor)) + nbytes)
+        return(SF_INIT);
+    if ((scans = (SpecScan *) malloc(nbytes)) == (SpecScan *)NULL)
+        return(SF_INIT);
+    if (read(sfi,scans,nbytes) != nbytes) {
+        free(scans);
+        return(SF_INIT);
     }
-    sf->no_scans = i;
 
-    memcpy(cursor,&filecurs,sizeof(SfCursor));
+    for (i = 0; i < header.entries; i++)
+        addToList(&(sf->list), (void *)&(scans[i]), (long)sizeof(SpecScan));
+    free(scans);
+    sf->no_scans = header.no_scans;
 
-    if (modif) return(SF_MODIFIED);
+    memcpy(cursor,&filecurs,sizeof(SfCursor));
 
-    return(SF_READY);
+    return(ret);
 }
 
-
+
+/*********************************************************************
+ *
+ *   Function:     static void sfWriteIndex()
+ *
+ *   Description:  Writes the index list to the index file.
+ *                 The file is written under a temporary name and
+ *                 renamed afterwards, so that other readers never
+ *                 see an incomplete index. Errors are ignored, the
+ *                 index is only an optimization.
+ *
+ *********************************************************************/
 static void
 sfWriteIndex  ( SpecFile *sf, SfCursor *cursor, int *error) {
 
+    SfIndexHeader header;
     int         fdi;
-    char       *idxname;
-    short       namelength;
+    int         ok;
+    char       *tmpname;
     ObjectList *obj;
-    long        mtime;
-
-    namelength = strlen(sf->sfname) + strlen(SF_ISFX) + 1;
-
-    idxname = (char *)malloc(sizeof(char) * namelength);
 
-    sprintf(idxname,"%s%s",sf->sfname,SF_ISFX);
+    memset(&header,0,sizeof(SfIndexHeader));
+    strncpy(header.signature,SF_ISIGNATURE,sizeof(header.signature));
+    header.sizes[0] = sizeof(long);
+    header.sizes[1] = sizeof(SfCursor);
+    header.sizes[2] = sizeof(SpecScan);
+    header.mtime    = sf->m_time;
+    header.size     = cursor->bytecnt;
+    header.no_scans = sf->no_scans;
+    header.entries  = 0;
+    for( obj = sf->list.first; obj ; obj = obj->next)
+        header.entries++;
+    if (header.no_scans < 1 || header.entries < 1)
+        return;
+    if (sfReadTail(sf,header.size,header.tail))
+        return;
 
-    /* if ((fdi = open(idxname,SF_WRITEFLAG,SF_UMASK)) == -1) { */
-    if ((fdi = open(idxname,O_CREAT | O_WRONLY,SF_UMASK)) == -1) {
-        printf("    - cannot open. Error: (%d)\n",errno);
-        free(idxname);
+    tmpname = (char *)malloc(sizeof(char) * (strlen(sf->idxname) + 5));
+    if (tmpname == (char *)NULL)
         return;
-    } else {
-        mtime = sf->m_time;
-        write(fdi,SF_SIGNATURE,sizeof(SF_SIGNATURE));
- /*
-  * Swap bytes for linux
-  */
-        write(fdi, (void *) &mtime, sizeof(long));
-        write(fdi, (void *) cursor, sizeof(SfCursor));
-        for( obj = sf->list.first; obj ; obj = obj->next)
-           write(fdi,(void *) obj->contents, sizeof(SpecScan));
-        close(fdi);
-        free(idxname);
+    sprintf(tmpname,"%s.tmp",sf->idxname);
+
+    if ((fdi = open(tmpname,SF_WRITEFLAG,SF_UMASK)) == -1) {
+        free(tmpname);
         return;
     }
+    ok = (write(fdi,(void *) &header,sizeof(SfIndexHeader)) ==
+                                                sizeof(SfIndexHeader));
+    if (ok)
+        ok = (write(fdi,(void *) cursor,sizeof(SfCursor)) == sizeof(SfCursor));
+    for( obj = sf->list.first; ok && obj ; obj = obj->next)
+        ok = (write(fdi,(void *) obj->contents,sizeof(SpecScan)) ==
+                                                sizeof(SpecScan));
+    if (close(fdi))
+        ok = 0;
+
+    if (ok && rename(tmpname,sf->idxname)) {
+       /*
+        * Windows does not replace existing files
+        */
+        remove(sf->idxname);
+        ok = !rename(tmpname,sf->idxname);
+    }
+    if (!ok)
+        remove(tmpname);
+    free(tmpname);
+    return;
+}
+
+
+/*********************************************************************
+ *
+ *   Function:     static int sfReadTail()
+ *
+ *   Description:  Reads the last SF_ITAIL bytes before offset size.
+ *                 Smaller files are padded with zeros.
+ *
+ *   Returns:      0 if successful, -1 otherwise
+ *
+ *********************************************************************/
+static int
+sfReadTail    ( SpecFile *sf, long size, char *tail) {
+    long  n;
+
+    memset(tail,0,SF_ITAIL);
+    n = (size < SF_ITAIL) ? size : SF_ITAIL;
+    if (n <= 0)
+        return(0);
+    if (lseek(sf->fd,size - n,SEEK_SET) == -1)
+        return(-1);
+    if (read(sf->fd,tail,n) != n)
+        return(-1);
+    return(0);
 }
-#endif
 
 
 /*****************************************************************************
@@ -788,7 +952,7 @@ sfSaveScan(SpecFile *sf, SfCursor *cursor,int *error) {
 
 
 static void
-sfAssignScanNumbers(SpecFile *sf) {
+sfAssignScanNumbers(SpecFile *sf, long first) {
 
   int                    size,i;
   char                  *buffer,*ptr;
@@ -799,22 +963,63 @@ sfAssignScanNumbers(SpecFile *sf) {
                         *object2;
   SpecScan              *scan,
                         *scan2;
+  long                   nscans,minno,maxno;
+  long                  *counts;
 
   size = 50;
   buffer = (char *) malloc(size);
+  if (buffer == (char *)NULL) return;
 
+ /*
+  * Only the scans from index first on are new
+  */
+  nscans = 0;
+  minno  = 0;
+  maxno  = 0;
   for ( object = (sf->list).first; object; object=object->next) {
         scan = (SpecScan *) object->contents;
+        nscans++;
+
+        if (scan->index >= first) {
+            lseek(sf->fd,scan->offset,SEEK_SET);
+            memset(buffer,0,size);
+            read(sf->fd,buffer,size);
+            buffer[49] = '\0';
 
-        lseek(sf->fd,scan->offset,SEEK_SET);
-        read(sf->fd,buffer,size);
-        buffer[49] = '\0';
+            for ( ptr = buffer+3,i=0; *ptr != ' ' && *ptr != '\0';ptr++,i++)
+                buffer2[i] = *ptr;
 
-        for ( ptr = buffer+3,i=0; *ptr != ' ';ptr++,i++) buffer2[i] = *ptr;
+            buffer2[i] = '\0';
+
+            scan->scan_no = atol(buffer2);
+        }
+        if (scan->scan_no < minno) minno = scan->scan_no;
+        if (scan->scan_no > maxno) maxno = scan->scan_no;
+  }
+  free(buffer);
 
-        buffer2[i] = '\0';
+ /*
+  * The order is the number of previous scans with the same number.
+  * Count them in a table unless the scan numbers are unreasonable
+  */
+  counts = (long *)NULL;
+  if ((minno >= 0) && (maxno < 16 * nscans + 1048576))
+      counts = (long *) calloc(maxno + 1, sizeof(long));
+
+  if (counts != (long *)NULL) {
+     for ( object = (sf->list).first; object; object=object->next) {
+           scan = (SpecScan *) object->contents;
+           counts[scan->scan_no]++;
+           if (scan->index >= first)
+               scan->order = counts[scan->scan_no];
+     }
+     free(counts);
+     return;
+  }
 
-        scan->scan_no = atol(buffer2);
+  for ( object = (sf->list).first; object; object=object->next) {
+        scan = (SpecScan *) object->contents;
+        if (scan->index < first) continue;
         scan->order   = 1;
         for ( object2 = (sf->list).first; object2 != object; object2=object2->next) {
             scan2 = (SpecScan *) object2->contents;
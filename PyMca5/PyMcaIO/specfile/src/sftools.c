@@ -127,9 +127,15 @@ sfSetCurrent( SpecFile *sf, long index,int *error )
      freeAllData(sf);
 
     /*
-     * Find scan
+     * Find scan, scans are often read one after the other
      */
-     list = findScanByIndex(&(sf->list),index);
+     if (sf->current != (ObjectList *)NULL &&
+         sf->current->next != (ObjectList *)NULL &&
+         ((SpecScan *)sf->current->next->contents)->index == index) {
+         list = sf->current->next;
+     } else {
+         list = findScanByIndex(&(sf->list),index);
+     }
 
      if (list == (ObjectList *)NULL) {
          *error = SF_ERR_SCAN_NOT_FOUND;
@@ -141,7 +141,7 @@ typedef struct {
    PyObject_HEAD
    SpecFile *sf;
    char     *name;
-   short     length;
+   long      length;
 } specfileobject;
 
 typedef struct {
@@ -199,7 +199,7 @@ static struct PyMethodDef  specfile_methods[] =
    /*
     * Specfile python basic operations
     */
-static PyObject * specfile_open   (char *filename);             /* create  */
+static PyObject * specfile_open   (char *filename, char *indexname); /* create */
 static PyObject * specfile_close  (PyObject *self);             /* dealloc */
 static Py_ssize_t specfile_noscans(PyObject *self);             /* length  */
 static PyObject * specfile_scan   (PyObject *self, Py_ssize_t index);   /* item    */
@@ -514,7 +514,7 @@ specfile_show(PyObject *self,PyObject *args)
    * Basic specfiletype operations
    */
 static PyObject *
-specfile_open(char *filename) {      /* on x = specfile.Specfile(name) */
+specfile_open(char *filename, char *indexname) { /* on x = specfile.Specfile(name) */
     specfileobject *self;
     SpecFile       *sf;
     int             error;
@@ -524,7 +524,11 @@ specfile_open(char *filename) {      /* on x = specfile.Specfile(name) */
     if (self == NULL)
         return NULL;
 
-    if (( sf = SfOpen(filename,&error)) == NULL )
+    if (indexname == NULL)
+        sf = SfOpen(filename,&error);
+    else
+        sf = SfOpenIndexed(filename,indexname,&error);
+    if (sf == NULL)
         onError("cannot open file");
 
     self->sf = sf;
@@ -1417,11 +1421,12 @@ specfiletype_new(self,args)
 {
    PyObject *ret;
    char *filename;
+   char *indexname = NULL;
 
 #ifdef WIN32
    PyObject *input;
    PyObject *bytesObject;
-    if (!PyArg_ParseTuple(args, "O", &input))
+    if (!PyArg_ParseTuple(args, "O|z", &input, &indexname))
     {
       return NULL;
     }
@@ -1442,20 +1447,20 @@ specfiletype_new(self,args)
             filename = PyString_AsString(bytesObject);
 #endif
         }else{
-            if (!PyArg_ParseTuple(args, "s", &filename))
+            if (!PyArg_ParseTuple(args, "s|z", &filename, &indexname))
             {
                 return NULL;
             }
         }
     }
 #else
-    if (!PyArg_ParseTuple(args, "s", &filename))
+    if (!PyArg_ParseTuple(args, "s|z", &filename, &indexname))
     {
         return NULL;
     }
 #endif
 
-    ret = (PyObject *)specfile_open(filename);
+    ret = (PyObject *)specfile_open(filename, indexname);
 
    return ret;
 
@@ -27,7 +27,7 @@ typedef struct {
     /* Type-specific fields go here. */
     SpecFile *sf;
     char     *name;
-    short     length;
+    long      length;
 } specfileobject;
 
 typedef struct {
@@ -326,9 +326,12 @@ specfile_open(PyObject *self, PyObject *args) /* on x = specfile.Specfile(name)
 {
     PyObject *input;
 #ifdef WIN32
+    PyObject *indexInput = NULL;
     PyObject *bytesObject;
+    PyObject *indexBytesObject = NULL;
 #endif
     const char *filename;
+    const char *indexname = NULL;
     specfileobject *object;
     SpecFile       *sf;
     int             error;
@@ -340,7 +343,7 @@ specfile_open(PyObject *self, PyObject *args) /* on x = specfile.Specfile(name)
      */
 
 #ifdef WIN32
-    if (!PyArg_ParseTuple(args, "O", &input))
+    if (!PyArg_ParseTuple(args, "O|O", &input, &indexInput))
     {
       return NULL;
     }
@@ -350,9 +353,18 @@ specfile_open(PyObject *self, PyObject *args) /* on x = specfile.Specfile(name)
             onError("Cannot generate String from object name attribute")
         }
         filename = PyBytes_AsString(bytesObject);
+        if ((indexInput != NULL) && (indexInput != Py_None))
+        {
+            indexBytesObject = PyUnicode_AsMBCSString(indexInput);
+            if (!indexBytesObject){
+                Py_DECREF(bytesObject);
+                onError("Cannot generate String from index name")
+            }
+            indexname = PyBytes_AsString(indexBytesObject);
+        }
     }
 #else
-    if (!PyArg_ParseTuple(args, "s", &filename))
+    if (!PyArg_ParseTuple(args, "s|z", &filename, &indexname))
     {
         return NULL;
     }
@@ -368,16 +380,21 @@ specfile_open(PyObject *self, PyObject *args) /* on x = specfile.Specfile(name)
     object->sf = NULL;
     object->name = (char *)strdup(filename);
     strcpy(object->name, filename);
+    if (indexname == NULL)
+        sf = SfOpen((char *) filename, &error);
+    else
+        sf = SfOpenIndexed((char *) filename, (char *) indexname, &error);
 #ifdef WIN32
     Py_DECREF(bytesObject);
+    Py_XDECREF(indexBytesObject);
 #endif
-    if (( sf = SfOpen((char *) filename, &error)) == NULL )
+    if (sf == NULL)
     {
         Py_DECREF(object);
         onError("cannot open file");
     }
     object->sf = sf;
-    object->length = (short) SfScanNo(sf);
+    object->length = SfScanNo(sf);
     return (PyObject *) object;
 }
 
@@ -1281,7 +1298,7 @@ scandata_print(PyObject *self,FILE *fp,int flags) {
 
 /*--------------------------------------------------*/
 static PyMethodDef SpecfileMethods[] = {
-    {"Specfile",  specfile_open, METH_VARARGS, "Open a Specfile instance."},
+    {"Specfile",  specfile_open, METH_VARARGS, "Open a Specfile instance, optionally with a scan index file."},
     {"system",  specfile_system, METH_VARARGS, "Execute a shell command."},
     {NULL, NULL, 0, NULL}        /* Sentinel */
 };
@@ -71,7 +71,13 @@ def safe_str(*var, **kw):
     def bytes(*var, **kw):
         return var[0]
 
-def Specfile(filename):
+def Specfile(filename, indexfile=None):
+    """
+    Open a SPEC file or any of the other supported formats.
+
+    :param filename: name of the file
+    :param indexfile: name of the file keeping the scan index of SPEC files
+    """
     f = open(filename)
     line0  = f.readline()
     if filename.upper().endswith('DTA'):
@@ -108,7 +114,10 @@ def Specfile(filename):
         #it is a Specfile
         if DEBUG:
             print("This looks as a specfile")
-        output=specfile.Specfile(filename)
+        if indexfile is None:
+            output = specfile.Specfile(filename)
+        else:
+            output = specfile.Specfile(filename, indexfile)
     elif SPX and filename.upper().endswith("SPX"):
         if DEBUG:
             print("This looks as an SPX file")
@@ -29,6 +29,11 @@
 #include <sps.h>
 /* #include <stdio.h> */
 #include <Python.h>
+#include <spec_shm.h>
+#include <sys/types.h>
+#include <sys/ipc.h>
+#include <sys/shm.h>
+#include <time.h>
 /* adding next line may raise errors ...
 #define NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION
 */
@@ -471,6 +476,19 @@ static PyObject *sps_create(PyObject *self, PyObject *args)
   return (PyObject*) arrobj;
 }
 
+/* Deletes the shared memory arrays and spec versions created by this
+   process. The arrays returned by create must not be used afterwards,
+   the views keep their own attachment. */
+static PyObject *sps_cleanupall(PyObject *self, PyObject *args)
+{
+  if (!PyArg_ParseTuple(args, "")) {
+    return NULL;
+  }
+  SPS_CleanUpAll();
+  Py_INCREF(Py_None);
+  return Py_None;
+}
+
 static PyObject *sps_getshmid(PyObject *self, PyObject *args)
 {
   char *spec_version, *array_name;
@@ -755,6 +773,207 @@ static PyObject *sps_putdatacol(PyObject *self, PyObject *args)
   return Py_None;
 }
 
+/* Wait until the update counter of any of the given arrays differs from
+   the supplied one or until the timeout (in seconds) expires. The counters
+   are checked in C and the interpreter lock is released while sleeping.
+   Returns the list of the current update counters. */
+static double sps_monotonic(void)
+{
+  struct timespec ts;
+
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+  return ts.tv_sec + 1.0e-9 * ts.tv_nsec;
+}
+
+static PyObject *sps_waitupdate(PyObject *self, PyObject *args)
+{
+  char *spec_version;
+  PyObject *in_arrays, *in_counters, *arrays, *counters, *item, *result;
+  double timeout = -1.0, interval, start;
+  long *old_values, *new_values;
+  char **names;
+  Py_ssize_t n, i;
+  int changed;
+  struct timespec ts;
+
+  if (!PyArg_ParseTuple(args, "sOO|d", &spec_version, &in_arrays,
+                        &in_counters, &timeout)) {
+    return NULL;
+  }
+
+  arrays = PySequence_Fast(in_arrays, "Array names must be a sequence");
+  if (arrays == NULL)
+    return NULL;
+  counters = PySequence_Fast(in_counters, "Counters must be a sequence");
+  if (counters == NULL) {
+    Py_DECREF(arrays);
+    return NULL;
+  }
+  n = PySequence_Fast_GET_SIZE(arrays);
+  if (PySequence_Fast_GET_SIZE(counters) != n) {
+    Py_DECREF(arrays);
+    Py_DECREF(counters);
+    PyErr_SetString(PyExc_ValueError, "One counter per array expected");
+    return NULL;
+  }
+
+  names = (char **) malloc((n + 1) * sizeof(char *));
+  old_values = (long *) malloc((n + 1) * sizeof(long));
+  new_values = (long *) malloc((n + 1) * sizeof(long));
+  if ((names == NULL) || (old_values == NULL) || (new_values == NULL)) {
+    free(names);
+    free(old_values);
+    free(new_values);
+    Py_DECREF(arrays);
+    Py_DECREF(counters);
+    return PyErr_NoMemory();
+  }
+  for (i = 0; i < n; i++) {
+    item = PySequence_Fast_GET_ITEM(arrays, i);
+#if PY_MAJOR_VERSION >= 3
+    names[i] = PyUnicode_Check(item) ? (char *) PyUnicode_AsUTF8(item) : NULL;
+#else
+    names[i] = PyString_Check(item) ? PyString_AsString(item) : NULL;
+#endif
+    old_values[i] = PyLong_AsLong(PySequence_Fast_GET_ITEM(counters, i));
+    if ((names[i] == NULL) || PyErr_Occurred()) {
+      if (!PyErr_Occurred())
+        PyErr_SetString(PyExc_TypeError, "Array names must be strings");
+      free(names);
+      free(old_values);
+      free(new_values);
+      Py_DECREF(arrays);
+      Py_DECREF(counters);
+      return NULL;
+    }
+  }
+
+  start = sps_monotonic();
+  interval = 0.001;
+  while (1) {
+    changed = 0;
+    for (i = 0; i < n; i++) {
+      new_values[i] = SPS_UpdateCounter(spec_version, names[i]);
+      /* an array not longer updated does not wake us up */
+      if ((new_values[i] != -1) && (new_values[i] != old_values[i]))
+        changed = 1;
+    }
+    if (changed || (n == 0))
+      break;
+    if ((timeout >= 0) && ((sps_monotonic() - start) >= timeout))
+      break;
+    if (PyErr_CheckSignals()) {
+      free(names);
+      free(old_values);
+      free(new_values);
+      Py_DECREF(arrays);
+      Py_DECREF(counters);
+      return NULL;
+    }
+    if ((timeout >= 0) && (interval > (timeout - (sps_monotonic() - start))))
+      interval = timeout - (sps_monotonic() - start);
+    if (interval > 0) {
+      ts.tv_sec = (time_t) interval;
+      ts.tv_nsec = (long) ((interval - ts.tv_sec) * 1.0e9);
+      Py_BEGIN_ALLOW_THREADS
+      nanosleep(&ts, NULL);
+      Py_END_ALLOW_THREADS
+    }
+    /* back off up to 10 ms between checks */
+    interval = (interval < 0.005) ? 2 * interval : 0.010;
+  }
+
+  result = PyList_New(n);
+  if (result != NULL) {
+    for (i = 0; i < n; i++)
+      PyList_SET_ITEM(result, i, PyInt_FromLong(new_values[i]));
+  }
+  free(names);
+  free(old_values);
+  free(new_values);
+  Py_DECREF(arrays);
+  Py_DECREF(counters);
+  return result;
+}
+
+/* The views keep their own read-only attachment to the shared segment.
+   The memory stays valid while the view exists, even if the array is
+   deleted or recreated by the other party. */
+static void sps_view_destructor(PyObject *capsule)
+{
+  void *shm = PyCapsule_GetPointer(capsule, "sps.view");
+
+  if (shm != NULL)
+    shmdt(shm);
+}
+
+static PyObject *sps_getdataview(PyObject *self, PyObject *args)
+{
+  char *spec_version, *array_name;
+  int rows, cols, type, flag, shmid, ptype;
+  npy_intp dims[2];
+  struct shm_head *head;
+  PyArrayObject *arrobj;
+  PyObject *capsule;
+  void *shm;
+  char *data;
+
+  if (!PyArg_ParseTuple(args, "ss", &spec_version, &array_name)) {
+    return NULL;
+  }
+
+  /* refreshes the identifier of the shared memory segment */
+  if (SPS_GetArrayInfo(spec_version, array_name, &rows, &cols, &type, &flag)) {
+    struct module_state *st = GETSTATE(self);
+    PyErr_SetString(st->SPSError, "Error getting array info");
+    return NULL;
+  }
+  ptype = sps_type2py(type);
+  if ((ptype == -1) || (ptype == NPY_STRING) || \
+      (type != sps_py2type(ptype))) {
+    struct module_state *st = GETSTATE(self);
+    PyErr_SetString(st->SPSError, "Type of data in shared memory not supported");
+    return NULL;
+  }
+  shmid = SPS_GetShmId(spec_version, array_name);
+  shm = (shmid < 0) ? (void *) -1 : shmat(shmid, NULL, SHM_RDONLY);
+  if (shm == (void *) -1) {
+    struct module_state *st = GETSTATE(self);
+    PyErr_SetString(st->SPSError, "Error attaching to shared memory");
+    return NULL;
+  }
+  head = (struct shm_head *) shm;
+  if (head->magic != SHM_MAGIC) {
+    shmdt(shm);
+    struct module_state *st = GETSTATE(self);
+    PyErr_SetString(st->SPSError, "Invalid shared memory segment");
+    return NULL;
+  }
+  if (head->version < 4)
+    data = ((char *) shm) + SHM_OHEAD_SIZE;
+  else
+    data = ((char *) shm) + SHM_HEAD_SIZE;
+
+  capsule = PyCapsule_New(shm, "sps.view", sps_view_destructor);
+  if (capsule == NULL) {
+    shmdt(shm);
+    return NULL;
+  }
+  dims[0] = head->rows;
+  dims[1] = head->cols;
+  arrobj = (PyArrayObject *) PyArray_New(&PyArray_Type, 2, dims, ptype, NULL,
+                                         data, 0, NPY_ARRAY_CARRAY_RO, NULL);
+  if (arrobj == NULL) {
+    Py_DECREF(capsule);
+    return NULL;
+  }
+  if (PyArray_SetBaseObject(arrobj, capsule) < 0) {
+    Py_DECREF(arrobj);
+    return NULL;
+  }
+  return (PyObject *) arrobj;
+}
+
 static void sps_cleanup()
 {
   SPS_CleanUpAll();
@@ -776,7 +995,10 @@ static PyMethodDef SPSMethods[] = {
   { "attach",        sps_attach,     METH_VARARGS},
   { "detach",        sps_detach,     METH_VARARGS},
   { "create",        sps_create,     METH_VARARGS},
+  { "cleanup",       sps_cleanupall, METH_VARARGS},
   { "updatedone",    sps_updatedone, METH_VARARGS},
+  { "waitupdate",    sps_waitupdate, METH_VARARGS},
+  { "getdataview",   sps_getdataview, METH_VARARGS},
   { "putdata",       sps_putdata,    METH_VARARGS},
   { "putdatarow",    sps_putdatarow, METH_VARARGS},
   { "putdatacol",    sps_putdatacol, METH_VARARGS},
@@ -188,6 +188,58 @@ def getdata(spec,shm):
     spslock.release()
     return result
 
+def getdataview(spec, shm):
+    """
+    Read-only view of the shared memory array without copying the data.
+    The view remains valid even if the array is deleted or recreated.
+    Falls back to a copy of the data if views are not supported.
+    """
+    result = []
+
+    spslock.acquire()
+    try:
+        if hasattr(sps, "getdataview"):
+            result = sps.getdataview(spec, shm)
+        else:
+            result = sps.getdata(spec, shm)
+    except:
+        pass
+    spslock.release()
+    return result
+
+def waitupdate(spec, arraylist, counterlist, timeout=1.0):
+    """
+    Block until the update counter of any of the arrays in arraylist
+    differs from the respective value in counterlist or until timeout
+    (in seconds) expires. A negative timeout waits forever.
+    Returns the list of current update counters (-1 if not available).
+    """
+    if hasattr(sps, "waitupdate"):
+        # the lock is not needed because the module does not release
+        # the interpreter lock while accessing the shared memory
+        try:
+            return sps.waitupdate(spec, arraylist, counterlist, timeout)
+        except sps.error:
+            return [-1] * len(arraylist)
+    t0 = time.time()
+    while True:
+        result = []
+        spslock.acquire()
+        try:
+            for array in arraylist:
+                try:
+                    result.append(sps.updatecounter(spec, array))
+                except:
+                    result.append(-1)
+        finally:
+            spslock.release()
+        for new, old in zip(result, counterlist):
+            if (new != -1) and (new != old):
+                return result
+        if (timeout >= 0) and ((time.time() - t0) >= timeout):
+            return result
+        time.sleep(0.010)
+
 def getdatacol(spec,shm,idx):
 
     result = []
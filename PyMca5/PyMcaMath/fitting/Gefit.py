@@ -47,7 +47,8 @@
 
 def LeastSquaresFit(model, parameters0, data=None, maxiter = 100,constrains=None,
                         weightflag = 0,model_deriv=None,deltachi=None,fulloutput=0,
-                        xdata=None,ydata=None,sigmadata=None,linear=None):
+                        xdata=None,ydata=None,sigmadata=None,linear=None,
+                        model_and_deriv=None,subsample=1):
     """
     Typical use:
 
@@ -96,10 +97,20 @@ def LeastSquaresFit(model, parameters0, data=None, maxiter = 100,constrains=None
                       of the fitting parameters, index is the fitting parameter index of which the the derivative has
                       to be provided in the supplied array of x points.
 
+        model_and_deriv - function providing at once the fitting function and its derivatives respect to the
+                      fitted parameters. It will be called as model_and_deriv(parameters, indices, x) where
+                      parameters are the current values of all the parameters, indices are the indices of the
+                      fitted parameters and x is the array of points. It has to return a tuple (y, derivatives)
+                      where derivatives is an array of shape (len(indices), len(x)). If given, it replaces the
+                      calls to model_deriv in non-linear fits without ignored parameters.
+
         linear - Flag to indicate a linear fit instead of a non-linear. Default is non-linear fit (=false)
 
         maxiter - Maximum number of iterations (default is 100)
 
+        subsample - If true (default), the first iteration of a non-linear fit only uses every second
+                    point. Set it to false when the starting parameters are already close to the solution.
+
     Output:
 
         fitted_parameters, reduced_chi_square, uncertainties
@@ -146,7 +157,9 @@ def LeastSquaresFit(model, parameters0, data=None, maxiter = 100,constrains=None
                                     fulloutput=fulloutput,
                                     xdata=xdata,
                                     ydata=ydata,
-                                    sigmadata=sigmadata)
+                                    sigmadata=sigmadata,
+                                    model_and_deriv=model_and_deriv,
+                                    subsample=subsample)
         except TypeError:
             print("You should reconsider how to write your function")
             raise TypeError("You should reconsider how to write your function")
@@ -158,7 +171,9 @@ def LeastSquaresFit(model, parameters0, data=None, maxiter = 100,constrains=None
                                 fulloutput=fulloutput,
                                 xdata=xdata,
                                 ydata=ydata,
-                                sigmadata=sigmadata)
+                                sigmadata=sigmadata,
+                                model_and_deriv=model_and_deriv,
+                                subsample=subsample)
 
 def LinearLeastSquaresFit(model0,parameters0,data0,maxiter,
                                 constrains0,weightflag,model_deriv=None,deltachi=0.01,fulloutput=0,
@@ -286,7 +301,9 @@ def RestreinedLeastSquaresFit(model0,parameters0,data0,maxiter,
                 constrains0,weightflag,model_deriv=None,deltachi=0.01,fulloutput=0,
                                     xdata=None,
                                     ydata=None,
-                                    sigmadata=None):
+                                    sigmadata=None,
+                                    model_and_deriv=None,
+                                    subsample=1):
     #get the codes:
     # 0 = Free       1 = Positive     2 = Quoted
     # 3 = Fixed      4 = Factor       5 = Delta
@@ -375,7 +392,7 @@ def RestreinedLeastSquaresFit(model0,parameters0,data0,maxiter,
     index = numpy.arange(0,nr0,2)
     while (iiter > 0):
         niter = niter + 1
-        if (niter < 2) and (n_param*3 < nr0):
+        if subsample and (niter < 2) and (n_param*3 < nr0):
                 x=numpy.take(selfx,index)
                 y=numpy.take(selfy,index)
                 weight=numpy.take(selfweight,index)
@@ -387,7 +404,8 @@ def RestreinedLeastSquaresFit(model0,parameters0,data0,maxiter,
         chisq0, alpha0, beta,\
         n_free, free_index, noigno, fitparam, derivfactor  =ChisqAlphaBeta(
                                                  model,fittedpar,
-                                                 x,y,weight,constrains,model_deriv=model_deriv)
+                                                 x,y,weight,constrains,model_deriv=model_deriv,
+                                                 model_and_deriv=model_and_deriv)
         nr, nc = alpha0.shape
         flag = 0
         lastdeltachi = chisq0
@@ -463,7 +481,8 @@ def RestreinedLeastSquaresFit(model0,parameters0,data0,maxiter,
     else:
         return fittedpar.tolist(), chisq/(len(yfit)-len(sigma0)), sigmapar.tolist(),niter,lastdeltachi
 
-def ChisqAlphaBeta(model0, parameters, x,y,weight, constrains,model_deriv=None,linear=None):
+def ChisqAlphaBeta(model0, parameters, x,y,weight, constrains,model_deriv=None,linear=None,
+                   model_and_deriv=None):
     if linear is None:linear=0
     model = model0
     #nr0, nc = data.shape
@@ -525,6 +544,20 @@ def ChisqAlphaBeta(model0, parameters, x,y,weight, constrains,model_deriv=None,l
     newpar = numpy.take(newpar,noigno)
     if n_free == 0:
         raise ValueError("No free parameters to fit")
+    if (model_and_deriv is not None) and (not linear) and \
+       (len(noigno) == n_param):
+        # the function and all the derivatives obtained in a single call
+        newpar = numpy.array(getparameters(pwork.tolist(),constrains))
+        yfit, deriv = model_and_deriv(newpar, free_index, x)
+        deriv = numpy.array(deriv, copy=False).reshape(n_free, nr) * \
+                numpy.array(derivfactor).reshape(n_free, 1)
+        deltay = y - yfit
+        help0 = weight * deltay
+        beta = numpy.dot(deriv, help0).reshape(1, n_free)
+        alpha = numpy.dot(deriv * weight, deriv.T)
+        chisq = (help0 * deltay).sum()
+        return chisq, alpha, beta, \
+               n_free, free_index, noigno, fitparam, derivfactor
     for i in range(n_free):
         if model_deriv is None:
             #pwork = parameters.__copy__()
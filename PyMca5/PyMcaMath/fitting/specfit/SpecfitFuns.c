@@ -74,6 +74,23 @@ void lsdf(double *data, int size, int fwhm, double f, double A, double M, double
 void smooth1d(double *data, int size);
 void smooth2d(double *data, int size0, int size1);
 void smooth3d(double *data, int size0, int size1, int size2);
+
+/* Multiple peak families related functions */
+int hypermet_groups(double *peaks, int *groups, int nlines, int ngroups,
+                    double *x, long nx, int tails, double window,
+                    int matrix, double *output);
+int pvoigt_groups(double *peaks, int *groups, int nlines, int ngroups,
+                  double *x, long nx, double window,
+                  int matrix, double *output);
+int hypermet_groups_jacobian(double *peaks, int *groups, double *coefficients,
+                             double *weights, int nweights, int nlines,
+                             int ngroups, double *x, long nx, int tails,
+                             double window, double *matrix,
+                             double *derivatives);
+int pvoigt_groups_jacobian(double *peaks, int *groups, double *coefficients,
+                           double *weights, int nweights, int nlines,
+                           int ngroups, double *x, long nx, double window,
+                           double *matrix, double *derivatives);
 /* end of SNIP related functions */
 
 /* --------------------------------------------------------------------- */
@@ -3138,6 +3155,313 @@ printf("LT_Area=%f,LT_Slope=%f\n",phyper[i].lt_area_r,phyper[i].lt_slope_r);
 }
 
 
+static PyObject *
+peak_groups_wrapper(PyObject *args, int hypermet)
+{
+    PyObject *input1, *input2, *input3;
+    PyArrayObject *param, *groups, *x;
+    PyArrayObject *ret;
+    int tails=15;
+    int matrix=0;
+    int ngroups=0;
+    double window=5.0;
+    int ncolumns, nlines, i, status;
+    long nx;
+    npy_intp dim_ret[2];
+    int *pgroups;
+
+    /** statements **/
+    if (hypermet)
+    {
+        if (!PyArg_ParseTuple(args, "OOO|iiid", &input1, &input2, &input3,
+                              &tails, &matrix, &ngroups, &window))
+            return NULL;
+        ncolumns = 8;
+    }
+    else
+    {
+        if (!PyArg_ParseTuple(args, "OOO|iid", &input1, &input2, &input3,
+                              &matrix, &ngroups, &window))
+            return NULL;
+        ncolumns = 4;
+    }
+
+    param = (PyArrayObject *)
+             PyArray_ContiguousFromObject(input1, NPY_DOUBLE, 0, 0);
+    if (param == NULL)
+        return NULL;
+    groups = (PyArrayObject *)
+             PyArray_FROMANY(input2, NPY_INT, 0, 0,
+                             NPY_C_CONTIGUOUS|NPY_FORCECAST);
+    if (groups == NULL){
+        Py_DECREF(param);
+        return NULL;
+    }
+    x = (PyArrayObject *)
+             PyArray_ContiguousFromObject(input3, NPY_DOUBLE, 0, 0);
+    if (x == NULL){
+        Py_DECREF(param);
+        Py_DECREF(groups);
+        return NULL;
+    }
+
+    if ((PyArray_SIZE(param) % ncolumns) != 0){
+        PyErr_SetString(PyExc_ValueError, "Incorrect number of parameters");
+        Py_DECREF(param);
+        Py_DECREF(groups);
+        Py_DECREF(x);
+        return NULL;
+    }
+    nlines = (int) (PyArray_SIZE(param) / ncolumns);
+    if (PyArray_SIZE(groups) != nlines){
+        PyErr_SetString(PyExc_ValueError,
+                        "One group index per peak line expected");
+        Py_DECREF(param);
+        Py_DECREF(groups);
+        Py_DECREF(x);
+        return NULL;
+    }
+    pgroups = (int *) PyArray_DATA(groups);
+    if (ngroups <= 0){
+        for (i = 0; i < nlines; i++){
+            if (pgroups[i] >= ngroups)
+                ngroups = pgroups[i] + 1;
+        }
+    }
+    nx = (long) PyArray_SIZE(x);
+
+    /* Create the output array */
+    if (matrix){
+        dim_ret[0] = nx;
+        dim_ret[1] = ngroups;
+        ret = (PyArrayObject *) PyArray_SimpleNew(2, dim_ret, NPY_DOUBLE);
+    }else{
+        ret = (PyArrayObject *) PyArray_SimpleNew(PyArray_NDIM(x),
+                                                  PyArray_DIMS(x), NPY_DOUBLE);
+    }
+    if (ret == NULL){
+        Py_DECREF(param);
+        Py_DECREF(groups);
+        Py_DECREF(x);
+        return NULL;
+    }
+    PyArray_FILLWBYTE(ret, 0);
+
+    status = 0;
+    if ((nlines > 0) && (ngroups > 0) && (nx > 0))
+    {
+        Py_BEGIN_ALLOW_THREADS
+        if (hypermet)
+            status = hypermet_groups((double *) PyArray_DATA(param),
+                                     pgroups, nlines, ngroups,
+                                     (double *) PyArray_DATA(x), nx,
+                                     tails, window, matrix,
+                                     (double *) PyArray_DATA(ret));
+        else
+            status = pvoigt_groups((double *) PyArray_DATA(param),
+                                   pgroups, nlines, ngroups,
+                                   (double *) PyArray_DATA(x), nx,
+                                   window, matrix,
+                                   (double *) PyArray_DATA(ret));
+        Py_END_ALLOW_THREADS
+    }
+    Py_DECREF(param);
+    Py_DECREF(groups);
+    Py_DECREF(x);
+    if (status){
+        Py_DECREF(ret);
+        if (status == -1)
+            return PyErr_NoMemory();
+        if (status == -2)
+            PyErr_SetString(PyExc_ValueError,
+                            "Linear Algebra Error: Division by zero (FWHM = 0)");
+        else
+            PyErr_SetString(PyExc_ValueError, "Invalid group index");
+        return NULL;
+    }
+    return PyArray_Return(ret);
+}
+
+static PyObject *
+SpecfitFuns_ahypermetgroups(PyObject *self, PyObject *args)
+{
+    /* (peaks, groups, x, tails=15, matrix=0, ngroups=0, window=5.0) */
+    return peak_groups_wrapper(args, 1);
+}
+
+static PyObject *
+SpecfitFuns_apvoigtgroups(PyObject *self, PyObject *args)
+{
+    /* (peaks, groups, x, matrix=0, ngroups=0, window=5.0) */
+    return peak_groups_wrapper(args, 0);
+}
+
+static PyObject *
+peak_groups_jacobian_wrapper(PyObject *args, int hypermet)
+{
+    PyObject *input1, *input2, *input3, *input4, *input5;
+    PyArrayObject *param, *groups, *coefficients, *weights, *x;
+    PyArrayObject *matrix, *derivatives;
+    int tails=15;
+    double window=5.0;
+    int ncolumns, nlines, ngroups, nweights, nrows, status;
+    long nx;
+    npy_intp dim_ret[2];
+    PyObject *result;
+
+    /** statements **/
+    if (hypermet)
+    {
+        if (!PyArg_ParseTuple(args, "OOOOO|id", &input1, &input2, &input3,
+                              &input4, &input5, &tails, &window))
+            return NULL;
+        ncolumns = 8;
+    }
+    else
+    {
+        if (!PyArg_ParseTuple(args, "OOOOO|d", &input1, &input2, &input3,
+                              &input4, &input5, &window))
+            return NULL;
+        ncolumns = 4;
+    }
+
+    param = (PyArrayObject *)
+             PyArray_ContiguousFromObject(input1, NPY_DOUBLE, 0, 0);
+    groups = (PyArrayObject *)
+             PyArray_FROMANY(input2, NPY_INT, 0, 0,
+                             NPY_C_CONTIGUOUS|NPY_FORCECAST);
+    coefficients = (PyArrayObject *)
+             PyArray_ContiguousFromObject(input3, NPY_DOUBLE, 0, 0);
+    weights = (PyArrayObject *)
+             PyArray_ContiguousFromObject(input4, NPY_DOUBLE, 0, 0);
+    x = (PyArrayObject *)
+             PyArray_ContiguousFromObject(input5, NPY_DOUBLE, 0, 0);
+    if ((param == NULL) || (groups == NULL) || (coefficients == NULL) || \
+        (weights == NULL) || (x == NULL)){
+        Py_XDECREF(param);
+        Py_XDECREF(groups);
+        Py_XDECREF(coefficients);
+        Py_XDECREF(weights);
+        Py_XDECREF(x);
+        return NULL;
+    }
+
+    status = 0;
+    nlines = (int) (PyArray_SIZE(param) / ncolumns);
+    ngroups = (int) PyArray_SIZE(coefficients);
+    nweights = 0;
+    if ((PyArray_SIZE(param) % ncolumns) != 0){
+        PyErr_SetString(PyExc_ValueError, "Incorrect number of parameters");
+        status = 1;
+    }else if (PyArray_SIZE(groups) != nlines){
+        PyErr_SetString(PyExc_ValueError,
+                        "One group index per peak line expected");
+        status = 1;
+    }else if ((nlines > 0) && ((PyArray_SIZE(weights) % nlines) != 0)){
+        PyErr_SetString(PyExc_ValueError,
+                        "Same number of weights per peak line expected");
+        status = 1;
+    }
+    if (status){
+        Py_DECREF(param);
+        Py_DECREF(groups);
+        Py_DECREF(coefficients);
+        Py_DECREF(weights);
+        Py_DECREF(x);
+        return NULL;
+    }
+    if (nlines > 0)
+        nweights = (int) (PyArray_SIZE(weights) / nlines);
+    else if (PyArray_NDIM(weights) == 2)
+        nweights = (int) PyArray_DIMS(weights)[1];
+    if (hypermet)
+        nrows = 6 + nweights;
+    else
+        nrows = 2 + nweights;
+    nx = (long) PyArray_SIZE(x);
+
+    /* Create the output arrays */
+    dim_ret[0] = nx;
+    dim_ret[1] = ngroups;
+    matrix = (PyArrayObject *) PyArray_SimpleNew(2, dim_ret, NPY_DOUBLE);
+    dim_ret[0] = nrows;
+    dim_ret[1] = nx;
+    derivatives = (PyArrayObject *) PyArray_SimpleNew(2, dim_ret, NPY_DOUBLE);
+    if ((matrix == NULL) || (derivatives == NULL)){
+        Py_XDECREF(matrix);
+        Py_XDECREF(derivatives);
+        Py_DECREF(param);
+        Py_DECREF(groups);
+        Py_DECREF(coefficients);
+        Py_DECREF(weights);
+        Py_DECREF(x);
+        return NULL;
+    }
+    PyArray_FILLWBYTE(matrix, 0);
+    PyArray_FILLWBYTE(derivatives, 0);
+
+    if ((nlines > 0) && (ngroups > 0) && (nx > 0))
+    {
+        Py_BEGIN_ALLOW_THREADS
+        if (hypermet)
+            status = hypermet_groups_jacobian((double *) PyArray_DATA(param),
+                                (int *) PyArray_DATA(groups),
+                                (double *) PyArray_DATA(coefficients),
+                                (double *) PyArray_DATA(weights), nweights,
+                                nlines, ngroups,
+                                (double *) PyArray_DATA(x), nx,
+                                tails, window,
+                                (double *) PyArray_DATA(matrix),
+                                (double *) PyArray_DATA(derivatives));
+        else
+            status = pvoigt_groups_jacobian((double *) PyArray_DATA(param),
+                                (int *) PyArray_DATA(groups),
+                                (double *) PyArray_DATA(coefficients),
+                                (double *) PyArray_DATA(weights), nweights,
+                                nlines, ngroups,
+                                (double *) PyArray_DATA(x), nx,
+                                window,
+                                (double *) PyArray_DATA(matrix),
+                                (double *) PyArray_DATA(derivatives));
+        Py_END_ALLOW_THREADS
+    }
+    Py_DECREF(param);
+    Py_DECREF(groups);
+    Py_DECREF(coefficients);
+    Py_DECREF(weights);
+    Py_DECREF(x);
+    if (status){
+        Py_DECREF(matrix);
+        Py_DECREF(derivatives);
+        if (status == -1)
+            return PyErr_NoMemory();
+        if (status == -2)
+            PyErr_SetString(PyExc_ValueError,
+                            "Linear Algebra Error: Division by zero (FWHM = 0)");
+        else
+            PyErr_SetString(PyExc_ValueError, "Invalid group index");
+        return NULL;
+    }
+    result = Py_BuildValue("(OO)", matrix, derivatives);
+    Py_DECREF(matrix);
+    Py_DECREF(derivatives);
+    return result;
+}
+
+static PyObject *
+SpecfitFuns_ahypermetjacobian(PyObject *self, PyObject *args)
+{
+    /* (peaks, groups, coefficients, weights, x, tails=15, window=5.0) */
+    return peak_groups_jacobian_wrapper(args, 1);
+}
+
+static PyObject *
+SpecfitFuns_apvoigtjacobian(PyObject *self, PyObject *args)
+{
+    /* (peaks, groups, coefficients, weights, x, window=5.0) */
+    return peak_groups_jacobian_wrapper(args, 0);
+}
+
 
 static PyObject *
 SpecfitFuns_seek(PyObject *self, PyObject *args)
@@ -4145,6 +4469,10 @@ static PyMethodDef SpecfitFuns_methods[] = {
     {"slit",        SpecfitFuns_slit,       METH_VARARGS},
     {"ahypermet",   SpecfitFuns_ahypermet,  METH_VARARGS},
     {"fastahypermet",   SpecfitFuns_fastahypermet,  METH_VARARGS},
+    {"ahypermetgroups", SpecfitFuns_ahypermetgroups, METH_VARARGS},
+    {"apvoigtgroups",   SpecfitFuns_apvoigtgroups,   METH_VARARGS},
+    {"ahypermetjacobian", SpecfitFuns_ahypermetjacobian, METH_VARARGS},
+    {"apvoigtjacobian",   SpecfitFuns_apvoigtjacobian,   METH_VARARGS},
     {"erfc",        SpecfitFuns_erfc,       METH_VARARGS},
     {"erf",         SpecfitFuns_erf,        METH_VARARGS},
     {"seek",        SpecfitFuns_seek,       METH_VARARGS},
@@ -0,0 +1,822 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+/*
+   Evaluation of many peak families (groups of lines) in a single call.
+
+   Every line is only evaluated inside a window around its position. The
+   window is given in FWHM units and it is widened at the low energy side
+   to cover the tails of the hypermet function. The step of the hypermet
+   function is constant at the left of the window and it is accumulated at
+   once for all the lines of a group.
+
+   The groups are distributed among threads when compiled with OpenMP.
+
+   The jacobian functions evaluate the contribution of every group with
+   unit area together with the derivatives of the weighted sum of all the
+   groups respect to the evaluation point, the FWHM (through a set of per
+   line weights) and the remaining shape parameters in the same pass.
+*/
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+
+#ifdef _OPENMP
+#define PRAGMA_OMP(ompString) _Pragma(ompString)
+#else
+#define PRAGMA_OMP(ompString)
+#endif /* _OPENMP */
+
+#ifdef WIN32
+#define M_PI 3.1415926535
+#define erfc myerfc
+double myerfc(double x);
+#endif
+
+/* negligible exponential argument used to limit the extent of the tails */
+#define TAIL_LIMIT 40.0
+#define MAX_TAIL(x, y) (((x) > (y)) ? (x) : (y))
+
+int hypermet_groups(double *peaks, int *groups, int nlines, int ngroups,
+                    double *x, long nx, int tails, double window,
+                    int matrix, double *output);
+int pvoigt_groups(double *peaks, int *groups, int nlines, int ngroups,
+                  double *x, long nx, double window,
+                  int matrix, double *output);
+int hypermet_groups_jacobian(double *peaks, int *groups, double *coefficients,
+                             double *weights, int nweights, int nlines,
+                             int ngroups, double *x, long nx, int tails,
+                             double window, double *matrix,
+                             double *derivatives);
+int pvoigt_groups_jacobian(double *peaks, int *groups, double *coefficients,
+                           double *weights, int nweights, int nlines,
+                           int ngroups, double *x, long nx, double window,
+                           double *matrix, double *derivatives);
+
+static int is_ascending(double *x, long nx)
+{
+    long j;
+    for (j = 1; j < nx; j++)
+    {
+        if (x[j] < x[j-1])
+            return 0;
+    }
+    return 1;
+}
+
+/* first index with x[index] >= value */
+static long lower_index(double *x, long nx, double value)
+{
+    long low = 0, high = nx, middle;
+    while (low < high)
+    {
+        middle = low + (high - low) / 2;
+        if (x[middle] < value)
+            low = middle + 1;
+        else
+            high = middle;
+    }
+    return low;
+}
+
+/* first index with x[index] > value */
+static long upper_index(double *x, long nx, double value)
+{
+    long low = 0, high = nx, middle;
+    while (low < high)
+    {
+        middle = low + (high - low) / 2;
+        if (x[middle] <= value)
+            low = middle + 1;
+        else
+            high = middle;
+    }
+    return low;
+}
+
+/* Sort the lines by group. The lines of group g are found in
+   order[offsets[g]:offsets[g+1]] */
+static int sort_lines(int *groups, int nlines, int ngroups,
+                      int **order, int **offsets)
+{
+    int i, g;
+    int *counter;
+
+    *order = (int *) malloc(nlines * sizeof(int));
+    *offsets = (int *) calloc(ngroups + 1, sizeof(int));
+    counter = (int *) calloc(ngroups + 1, sizeof(int));
+    if ((*order == NULL) || (*offsets == NULL) || (counter == NULL))
+    {
+        free(*order);
+        free(*offsets);
+        free(counter);
+        return -1;
+    }
+    for (i = 0; i < nlines; i++)
+    {
+        if ((groups[i] < 0) || (groups[i] >= ngroups))
+        {
+            free(*order);
+            free(*offsets);
+            free(counter);
+            return -3;
+        }
+        (*offsets)[groups[i] + 1] += 1;
+    }
+    for (g = 0; g < ngroups; g++)
+    {
+        (*offsets)[g + 1] += (*offsets)[g];
+    }
+    for (i = 0; i < nlines; i++)
+    {
+        g = groups[i];
+        (*order)[(*offsets)[g] + counter[g]] = i;
+        counter[g] += 1;
+    }
+    free(counter);
+    return 0;
+}
+
+/* same expression as SpecfitFuns.ahypermet for one line and one point */
+static double hypermet_point(double *line, double x, int g_term_flag,
+                             int st_term_flag, int lt_term_flag,
+                             int step_term_flag)
+{
+    double sqrt2PI = sqrt(2.0 * M_PI);
+    double tosigma = 1.0 / (2.0 * sqrt(2.0 * 0.69314718055994529));
+    double x1, x2, x3, x4, x5, x6, x7, x8;
+    double z0, z1, z2, dhelp;
+    double result = 0.0;
+
+    x1 = line[0];
+    x2 = line[1];
+    x3 = line[2] * tosigma;
+    z0 = x - x2;
+    z1 = x3 * 1.4142135623730950488;
+    z2 = (0.5 * z0 * z0) / (x3 * x3);
+    if (g_term_flag)
+    {
+        if (z2 < 612)
+            result += exp(-z2) * (x1 / (x3 * sqrt2PI));
+    }
+    if (st_term_flag)
+    {
+        x4 = line[3];
+        x5 = line[4];
+        if ((x5 != 0) && (x4 != 0))
+        {
+            dhelp = x4 * 0.5 * erfc((z0 / z1) + 0.5 * z1 / x5);
+            if ((dhelp != 0.0) && (fabs(z0 / x5) <= 612))
+                result += ((x1 * dhelp) / x5) * \
+                          exp(0.5 * (x3 / x5) * (x3 / x5) + (z0 / x5));
+        }
+    }
+    if (lt_term_flag)
+    {
+        x6 = line[5];
+        x7 = line[6];
+        if ((x7 != 0) && (x6 != 0))
+        {
+            dhelp = x6 * 0.5 * erfc((z0 / z1) + 0.5 * z1 / x7);
+            if ((dhelp != 0.0) && (fabs(z0 / x7) <= 612))
+                result += ((x1 * dhelp) / x7) * \
+                          exp(0.5 * (x3 / x7) * (x3 / x7) + (z0 / x7));
+        }
+    }
+    if (step_term_flag)
+    {
+        x8 = line[7];
+        if (x8 != 0)
+            result += x8 * (x1 / (x3 * sqrt2PI)) * 0.5 * erfc(z0 / z1);
+    }
+    return result;
+}
+
+static void hypermet_line(double *line, double *x, long nx, int ascending,
+                          int tails, double window,
+                          double *buffer, double *step)
+{
+    double sqrt2PI = sqrt(2.0 * M_PI);
+    double tosigma = 1.0 / (2.0 * sqrt(2.0 * 0.69314718055994529));
+    int g_term_flag, st_term_flag, lt_term_flag, step_term_flag;
+    double left, right, stepValue;
+    long j, jmin, jmax;
+
+    g_term_flag    = tails & 1;
+    st_term_flag   = (tails>>1) & 1;
+    lt_term_flag   = (tails>>2) & 1;
+    step_term_flag = (tails>>3) & 1;
+
+    left = window * line[2];
+    right = window * line[2];
+    if (st_term_flag && (line[3] != 0))
+        left = MAX_TAIL(left, TAIL_LIMIT * fabs(line[4]));
+    if (lt_term_flag && (line[5] != 0))
+        left = MAX_TAIL(left, TAIL_LIMIT * fabs(line[6]));
+    left = line[1] - left;
+    right = line[1] + right;
+
+    /* value of the step far from the peak */
+    stepValue = 0.0;
+    if (step_term_flag && (line[7] != 0))
+        stepValue = line[7] * (line[0] / (line[2] * tosigma * sqrt2PI));
+
+    if (ascending)
+    {
+        jmin = lower_index(x, nx, left);
+        jmax = upper_index(x, nx, right);
+        for (j = jmin; j < jmax; j++)
+        {
+            buffer[j] += hypermet_point(line, x[j], g_term_flag,
+                                        st_term_flag, lt_term_flag,
+                                        step_term_flag);
+        }
+        if ((jmin > 0) && (stepValue != 0))
+            step[jmin - 1] += stepValue;
+    }
+    else
+    {
+        for (j = 0; j < nx; j++)
+        {
+            if (x[j] > right)
+                continue;
+            if (x[j] < left)
+                buffer[j] += stepValue;
+            else
+                buffer[j] += hypermet_point(line, x[j], g_term_flag,
+                                            st_term_flag, lt_term_flag,
+                                            step_term_flag);
+        }
+    }
+}
+
+static void pvoigt_line(double *line, double *x, long nx, int ascending,
+                        double window, double *buffer)
+{
+    double sqrt2PI = sqrt(2.0 * M_PI);
+    double tosigma = 1.0 / (2.0 * sqrt(2.0 * 0.69314718055994529));
+    double area, centroid, fwhm, eta, sigma, dhelp, left, right;
+    long j, jmin, jmax;
+
+    area = line[0];
+    centroid = line[1];
+    fwhm = line[2];
+    eta = line[3];
+    sigma = fwhm * tosigma;
+
+    /* the lorentzian term decays too slowly to be limited */
+    if (eta != 0)
+    {
+        for (j = 0; j < nx; j++)
+        {
+            dhelp = (x[j] - centroid) / (0.5 * fwhm);
+            dhelp = 1.0 + (dhelp * dhelp);
+            buffer[j] += eta * (area / (0.5 * M_PI * fwhm * dhelp));
+        }
+    }
+    if (eta == 1.0)
+        return;
+    left = centroid - window * fwhm;
+    right = centroid + window * fwhm;
+    if (ascending)
+    {
+        jmin = lower_index(x, nx, left);
+        jmax = upper_index(x, nx, right);
+    }
+    else
+    {
+        jmin = 0;
+        jmax = nx;
+    }
+    for (j = jmin; j < jmax; j++)
+    {
+        if ((x[j] < left) || (x[j] > right))
+            continue;
+        dhelp = (x[j] - centroid) / sigma;
+        buffer[j] += (1.0 - eta) * (area / (sigma * sqrt2PI)) * \
+                     exp(-0.5 * dhelp * dhelp);
+    }
+}
+
+/* common driver for both peak shapes */
+static int peak_groups(double *peaks, int ncolumns, int *groups, int nlines,
+                       int ngroups, double *x, long nx, int tails,
+                       double window, int matrix, double *output)
+{
+    int *order, *offsets;
+    int i, g, status, ascending;
+    long j;
+    double fwhm;
+
+    for (i = 0; i < nlines; i++)
+    {
+        fwhm = peaks[i * ncolumns + 2];
+        if (fwhm == 0)
+            return -2;
+    }
+    status = sort_lines(groups, nlines, ngroups, &order, &offsets);
+    if (status)
+        return status;
+
+    ascending = is_ascending(x, nx);
+    if (matrix)
+        memset(output, 0, nx * ngroups * sizeof(double));
+    else
+        memset(output, 0, nx * sizeof(double));
+
+    PRAGMA_OMP("omp parallel private(g, i, j)")
+    {
+        double *buffer, *step, *sum;
+        double running;
+
+        buffer = (double *) malloc(nx * sizeof(double));
+        step = (double *) calloc(nx, sizeof(double));
+        sum = NULL;
+        if (!matrix)
+            sum = (double *) calloc(nx, sizeof(double));
+        if ((buffer == NULL) || (step == NULL) || ((!matrix) && (sum == NULL)))
+        {
+            PRAGMA_OMP("omp critical")
+            status = -1;
+        }
+        PRAGMA_OMP("omp for schedule(dynamic)")
+        for (g = 0; g < ngroups; g++)
+        {
+            if ((buffer == NULL) || (step == NULL) || \
+                ((!matrix) && (sum == NULL)))
+                continue;
+            if (offsets[g] == offsets[g + 1])
+                continue;
+            memset(buffer, 0, nx * sizeof(double));
+            for (i = offsets[g]; i < offsets[g + 1]; i++)
+            {
+                if (ncolumns == 8)
+                    hypermet_line(&peaks[order[i] * ncolumns], x, nx,
+                                  ascending, tails, window, buffer, step);
+                else
+                    pvoigt_line(&peaks[order[i] * ncolumns], x, nx,
+                                ascending, window, buffer);
+            }
+            if (ncolumns == 8)
+            {
+                running = 0.0;
+                for (j = nx - 1; j >= 0; j--)
+                {
+                    running += step[j];
+                    step[j] = 0.0;
+                    buffer[j] += running;
+                }
+            }
+            if (matrix)
+            {
+                for (j = 0; j < nx; j++)
+                    output[j * ngroups + g] = buffer[j];
+            }
+            else
+            {
+                for (j = 0; j < nx; j++)
+                    sum[j] += buffer[j];
+            }
+        }
+        if (sum != NULL)
+        {
+            PRAGMA_OMP("omp critical")
+            {
+                for (j = 0; j < nx; j++)
+                    output[j] += sum[j];
+            }
+        }
+        free(buffer);
+        free(step);
+        free(sum);
+    }
+    free(order);
+    free(offsets);
+    return status;
+}
+
+int hypermet_groups(double *peaks, int *groups, int nlines, int ngroups,
+                    double *x, long nx, int tails, double window,
+                    int matrix, double *output)
+{
+    return peak_groups(peaks, 8, groups, nlines, ngroups, x, nx, tails,
+                       window, matrix, output);
+}
+
+int pvoigt_groups(double *peaks, int *groups, int nlines, int ngroups,
+                  double *x, long nx, double window,
+                  int matrix, double *output)
+{
+    return peak_groups(peaks, 4, groups, nlines, ngroups, x, nx, 0,
+                       window, matrix, output);
+}
+
+/* Rows of the derivatives array of the hypermet jacobian. The rows
+   following HYPERMET_FWHM contain the sum of the derivatives respect to
+   the FWHM multiplied by each of the per line weights */
+#define HYPERMET_X          0
+#define HYPERMET_ST_AREA    1
+#define HYPERMET_ST_SLOPE   2
+#define HYPERMET_LT_AREA    3
+#define HYPERMET_LT_SLOPE   4
+#define HYPERMET_STEP       5
+#define HYPERMET_FWHM       6
+
+/* Rows of the derivatives array of the pseudo-voigt jacobian */
+#define PVOIGT_X            0
+#define PVOIGT_ETA          1
+#define PVOIGT_FWHM         2
+
+/* Hypermet value of one line at one point and the derivatives multiplied
+   by the coefficient of the group. The derivative row j of the point is
+   found at derivatives[j * nx] */
+static double hypermet_point_jacobian(double *line, double *weights,
+                                      int nweights, double coefficient,
+                                      double x, int g_term_flag,
+                                      int st_term_flag, int lt_term_flag,
+                                      int step_term_flag, long nx,
+                                      double *derivatives)
+{
+    double sqrt2PI = sqrt(2.0 * M_PI);
+    double tosigma = 1.0 / (2.0 * sqrt(2.0 * 0.69314718055994529));
+    double area, sigma, z0, z1, z2, gauss, tail, unit, ratio, slope;
+    double dx, dsigma, dslope;
+    double result = 0.0;
+    int k;
+
+    area = line[0];
+    sigma = line[2] * tosigma;
+    z0 = x - line[1];
+    z1 = sigma * 1.4142135623730950488;
+    z2 = (0.5 * z0 * z0) / (sigma * sigma);
+    /* the gaussian is needed by the derivatives of the other terms */
+    gauss = 0.0;
+    if (z2 < 612)
+        gauss = exp(-z2) * (area / (sigma * sqrt2PI));
+    dx = 0.0;
+    dsigma = 0.0;
+    if (g_term_flag)
+    {
+        result += gauss;
+        dx -= gauss * z0 / (sigma * sigma);
+        dsigma += gauss * ((z0 * z0) / (sigma * sigma * sigma) - 1.0 / sigma);
+    }
+    for (k = 0; k < 2; k++)
+    {
+        if (k == 0)
+        {
+            if (!st_term_flag)
+                continue;
+            ratio = line[3];
+            slope = line[4];
+        }
+        else
+        {
+            if (!lt_term_flag)
+                continue;
+            ratio = line[5];
+            slope = line[6];
+        }
+        if ((slope == 0) || (ratio == 0))
+            continue;
+        unit = 0.5 * erfc((z0 / z1) + 0.5 * z1 / slope);
+        if ((unit == 0.0) || (fabs(z0 / slope) > 612))
+            continue;
+        unit = ((area * unit) / slope) * \
+               exp(0.5 * (sigma / slope) * (sigma / slope) + (z0 / slope));
+        tail = ratio * unit;
+        result += tail;
+        dx += (tail - ratio * gauss) / slope;
+        dsigma += tail * sigma / (slope * slope) - \
+                  (ratio / slope) * gauss * sigma * \
+                  (1.0 / slope - z0 / (sigma * sigma));
+        dslope = ratio * gauss * sigma * sigma / (slope * slope * slope) - \
+                 tail * (1.0 / slope + (sigma * sigma) / (slope * slope * slope) \
+                         + z0 / (slope * slope));
+        if (k == 0)
+        {
+            derivatives[HYPERMET_ST_AREA * nx] += coefficient * unit;
+            derivatives[HYPERMET_ST_SLOPE * nx] += coefficient * dslope;
+        }
+        else
+        {
+            derivatives[HYPERMET_LT_AREA * nx] += coefficient * unit;
+            derivatives[HYPERMET_LT_SLOPE * nx] += coefficient * dslope;
+        }
+    }
+    if (step_term_flag && (line[7] != 0))
+    {
+        unit = (area / (sigma * sqrt2PI)) * 0.5 * erfc(z0 / z1);
+        tail = line[7] * unit;
+        result += tail;
+        dx -= line[7] * gauss / (sqrt2PI * sigma);
+        dsigma += line[7] * gauss * z0 / (sqrt2PI * sigma * sigma) - \
+                  tail / sigma;
+        derivatives[HYPERMET_STEP * nx] += coefficient * unit;
+    }
+    derivatives[HYPERMET_X * nx] += coefficient * dx;
+    for (k = 0; k < nweights; k++)
+    {
+        derivatives[(HYPERMET_FWHM + k) * nx] += \
+                                coefficient * weights[k] * dsigma * tosigma;
+    }
+    return result;
+}
+
+static void hypermet_line_jacobian(double *line, double *weights,
+                                   int nweights, double coefficient,
+                                   double *x, long nx, int ascending,
+                                   int tails, double window,
+                                   double *buffer, double *step,
+                                   double *derivatives, double *dstep)
+{
+    double sqrt2PI = sqrt(2.0 * M_PI);
+    double tosigma = 1.0 / (2.0 * sqrt(2.0 * 0.69314718055994529));
+    int g_term_flag, st_term_flag, lt_term_flag, step_term_flag;
+    double left, right, stepValue;
+    long j, jmin, jmax;
+    int k;
+
+    g_term_flag    = tails & 1;
+    st_term_flag   = (tails>>1) & 1;
+    lt_term_flag   = (tails>>2) & 1;
+    step_term_flag = (tails>>3) & 1;
+
+    left = window * line[2];
+    right = window * line[2];
+    if (st_term_flag && (line[3] != 0))
+        left = MAX_TAIL(left, TAIL_LIMIT * fabs(line[4]));
+    if (lt_term_flag && (line[5] != 0))
+        left = MAX_TAIL(left, TAIL_LIMIT * fabs(line[6]));
+    left = line[1] - left;
+    right = line[1] + right;
+
+    stepValue = 0.0;
+    if (step_term_flag && (line[7] != 0))
+        stepValue = line[7] * (line[0] / (line[2] * tosigma * sqrt2PI));
+
+    if (ascending)
+    {
+        jmin = lower_index(x, nx, left);
+        jmax = upper_index(x, nx, right);
+    }
+    else
+    {
+        jmin = 0;
+        jmax = nx;
+    }
+    for (j = jmin; j < jmax; j++)
+    {
+        if (x[j] > right)
+            continue;
+        if (x[j] < left)
+        {
+            /* only reached when the abscissa is not ascending */
+            if (stepValue == 0)
+                continue;
+            buffer[j] += stepValue;
+            derivatives[HYPERMET_STEP * nx + j] += \
+                                    coefficient * stepValue / line[7];
+            for (k = 0; k < nweights; k++)
+                derivatives[(HYPERMET_FWHM + k) * nx + j] -= \
+                            coefficient * weights[k] * stepValue / line[2];
+            continue;
+        }
+        buffer[j] += hypermet_point_jacobian(line, weights, nweights,
+                                             coefficient, x[j],
+                                             g_term_flag, st_term_flag,
+                                             lt_term_flag, step_term_flag,
+                                             nx, &derivatives[j]);
+    }
+    if (ascending && (jmin > 0) && (stepValue != 0))
+    {
+        step[jmin - 1] += stepValue;
+        dstep[HYPERMET_STEP * nx + jmin - 1] += \
+                                    coefficient * stepValue / line[7];
+        for (k = 0; k < nweights; k++)
+            dstep[(HYPERMET_FWHM + k) * nx + jmin - 1] -= \
+                            coefficient * weights[k] * stepValue / line[2];
+    }
+}
+
+static void pvoigt_line_jacobian(double *line, double *weights,
+                                 int nweights, double coefficient,
+                                 double *x, long nx, int ascending,
+                                 double window, double *buffer,
+                                 double *derivatives)
+{
+    double sqrt2PI = sqrt(2.0 * M_PI);
+    double tosigma = 1.0 / (2.0 * sqrt(2.0 * 0.69314718055994529));
+    double area, centroid, fwhm, eta, sigma, z0, dhelp, lorentz, gauss;
+    double dfwhm, left, right;
+    long j, jmin, jmax;
+    int k;
+
+    area = line[0];
+    centroid = line[1];
+    fwhm = line[2];
+    eta = line[3];
+    sigma = fwhm * tosigma;
+
+    /* the lorentzian term is evaluated over the whole range because it
+       decays too slowly and because of the derivative respect to eta */
+    for (j = 0; j < nx; j++)
+    {
+        z0 = x[j] - centroid;
+        dhelp = fwhm * fwhm + 4.0 * z0 * z0;
+        lorentz = 2.0 * area * fwhm / (M_PI * dhelp);
+        buffer[j] += eta * lorentz;
+        derivatives[PVOIGT_ETA * nx + j] += coefficient * lorentz;
+        derivatives[PVOIGT_X * nx + j] -= \
+                        coefficient * eta * lorentz * 8.0 * z0 / dhelp;
+        dfwhm = eta * (2.0 * area / M_PI) * \
+                (4.0 * z0 * z0 - fwhm * fwhm) / (dhelp * dhelp);
+        for (k = 0; k < nweights; k++)
+            derivatives[(PVOIGT_FWHM + k) * nx + j] += \
+                                        coefficient * weights[k] * dfwhm;
+    }
+    left = centroid - window * fwhm;
+    right = centroid + window * fwhm;
+    if (ascending)
+    {
+        jmin = lower_index(x, nx, left);
+        jmax = upper_index(x, nx, right);
+    }
+    else
+    {
+        jmin = 0;
+        jmax = nx;
+    }
+    for (j = jmin; j < jmax; j++)
+    {
+        if ((x[j] < left) || (x[j] > right))
+            continue;
+        z0 = x[j] - centroid;
+        dhelp = z0 / sigma;
+        gauss = (area / (sigma * sqrt2PI)) * exp(-0.5 * dhelp * dhelp);
+        buffer[j] += (1.0 - eta) * gauss;
+        derivatives[PVOIGT_ETA * nx + j] -= coefficient * gauss;
+        derivatives[PVOIGT_X * nx + j] -= \
+                        coefficient * (1.0 - eta) * gauss * z0 / (sigma * sigma);
+        dfwhm = (1.0 - eta) * gauss * (dhelp * dhelp - 1.0) * tosigma / sigma;
+        for (k = 0; k < nweights; k++)
+            derivatives[(PVOIGT_FWHM + k) * nx + j] += \
+                                        coefficient * weights[k] * dfwhm;
+    }
+}
+
+/* common driver for the jacobian of both peak shapes */
+static int peak_groups_jacobian(double *peaks, int ncolumns, int *groups,
+                                double *coefficients, double *weights,
+                                int nweights, int nlines, int ngroups,
+                                double *x, long nx, int tails, double window,
+                                double *matrix, double *derivatives)
+{
+    int *order, *offsets;
+    int i, g, status, ascending, nrows;
+    long j;
+
+    for (i = 0; i < nlines; i++)
+    {
+        if (peaks[i * ncolumns + 2] == 0)
+            return -2;
+    }
+    status = sort_lines(groups, nlines, ngroups, &order, &offsets);
+    if (status)
+        return status;
+
+    if (ncolumns == 8)
+        nrows = HYPERMET_FWHM + nweights;
+    else
+        nrows = PVOIGT_FWHM + nweights;
+    ascending = is_ascending(x, nx);
+    memset(matrix, 0, nx * ngroups * sizeof(double));
+    memset(derivatives, 0, nrows * nx * sizeof(double));
+
+    PRAGMA_OMP("omp parallel private(g, i, j)")
+    {
+        double *buffer, *step, *dsum, *dstep, *line;
+        double running;
+        int k;
+
+        buffer = (double *) malloc(nx * sizeof(double));
+        step = (double *) calloc(nx, sizeof(double));
+        dsum = (double *) calloc(nrows * nx, sizeof(double));
+        dstep = (double *) calloc(nrows * nx, sizeof(double));
+        if ((buffer == NULL) || (step == NULL) || \
+            (dsum == NULL) || (dstep == NULL))
+        {
+            PRAGMA_OMP("omp critical")
+            status = -1;
+        }
+        PRAGMA_OMP("omp for schedule(dynamic)")
+        for (g = 0; g < ngroups; g++)
+        {
+            if ((buffer == NULL) || (step == NULL) || \
+                (dsum == NULL) || (dstep == NULL))
+                continue;
+            if (offsets[g] == offsets[g + 1])
+                continue;
+            memset(buffer, 0, nx * sizeof(double));
+            for (i = offsets[g]; i < offsets[g + 1]; i++)
+            {
+                line = &peaks[order[i] * ncolumns];
+                if (ncolumns == 8)
+                    hypermet_line_jacobian(line,
+                                           &weights[order[i] * nweights],
+                                           nweights, coefficients[g],
+                                           x, nx, ascending, tails, window,
+                                           buffer, step, dsum, dstep);
+                else
+                    pvoigt_line_jacobian(line,
+                                         &weights[order[i] * nweights],
+                                         nweights, coefficients[g],
+                                         x, nx, ascending, window,
+                                         buffer, dsum);
+            }
+            if (ncolumns == 8)
+            {
+                running = 0.0;
+                for (j = nx - 1; j >= 0; j--)
+                {
+                    running += step[j];
+                    step[j] = 0.0;
+                    buffer[j] += running;
+                }
+            }
+            for (j = 0; j < nx; j++)
+                matrix[j * ngroups + g] = buffer[j];
+        }
+        if ((dsum != NULL) && (dstep != NULL))
+        {
+            /* the steps of all the groups can be accumulated at once */
+            for (k = 0; k < nrows; k++)
+            {
+                running = 0.0;
+                for (j = nx - 1; j >= 0; j--)
+                {
+                    running += dstep[k * nx + j];
+                    dsum[k * nx + j] += running;
+                }
+            }
+            PRAGMA_OMP("omp critical")
+            {
+                for (j = 0; j < nrows * nx; j++)
+                    derivatives[j] += dsum[j];
+            }
+        }
+        free(buffer);
+        free(step);
+        free(dsum);
+        free(dstep);
+    }
+    free(order);
+    free(offsets);
+    return status;
+}
+
+int hypermet_groups_jacobian(double *peaks, int *groups, double *coefficients,
+                             double *weights, int nweights, int nlines,
+                             int ngroups, double *x, long nx, int tails,
+                             double window, double *matrix,
+                             double *derivatives)
+{
+    return peak_groups_jacobian(peaks, 8, groups, coefficients, weights,
+                                nweights, nlines, ngroups, x, nx, tails,
+                                window, matrix, derivatives);
+}
+
+int pvoigt_groups_jacobian(double *peaks, int *groups, double *coefficients,
+                           double *weights, int nweights, int nlines,
+                           int ngroups, double *x, long nx, double window,
+                           double *matrix, double *derivatives)
+{
+    return peak_groups_jacobian(peaks, 4, groups, coefficients, weights,
+                                nweights, nlines, ngroups, x, nx, 0,
+                                window, matrix, derivatives);
+}
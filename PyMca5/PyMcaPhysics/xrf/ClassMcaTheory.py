@@ -94,6 +94,8 @@ def __init__(self, initdict=None, filelist=None, **kw):
         self.attflag   = kw.get('attenuatorsflag',1)
         self.lastxmin = None
         self.lastxmax = None
+        self._zz = None
+        self._zzPending = False
         self.laststrip = None
         self.laststripconstant = None
         self.laststripiterations = None
@@ -128,6 +130,7 @@ def enableOptimizedLinearFit(self):
     def disableOptimizedLinearFit(self):
         self._batchFlag = False
         self.linearMatrix = None
+        self._linearMatrixKey = None
 
     def setConfiguration(self, ddict):
         """
@@ -171,6 +174,9 @@ def _updateCallback(self):
 
     def __configure(self):
         self.linearMatrix = None
+        self._linearMatrixKey = None
+        self._estimateCache = None
+        self._startingParametersGiven = False
         #multilayer key
         self.config['multilayer'] = self.config.get('multilayer',{})
         #update Elements material information
@@ -1146,7 +1152,12 @@ def setData(self,*var,**kw):
 
             #calculate the background here gives better results
             if not self.config['fit']['linearfitflag']:
-                self.__getselfzz()
+                if self.STRIP:
+                    self.__getselfzz()
+                else:
+                    # only needed to estimate or to digest the fit
+                    self._zz = None
+                    self._zzPending = True
             else:
                 if self.STRIP:
                     self.__getselfzz()
@@ -1195,7 +1206,21 @@ def __smooth(self,y):
         return result
 
 
+    def _getZz(self):
+        if self._zzPending:
+            self._zzPending = False
+            self.__getselfzz()
+        return self._zz
+
+    def _setZz(self, value):
+        self._zzPending = False
+        self._zz = value
+
+    # non analytical background, calculated on first use unless fitted
+    zz = property(_getZz, _setZz)
+
     def __getselfzz(self):
+        self._zzPending = False
         n=len(self.xdata)
 
         #loop for anchors
@@ -1315,7 +1340,8 @@ def getPeakMatrixContribution(self,param0,t0=None,hypermet=None,
         PEAKS0ESCAPE = self.PEAKS0ESCAPE
         PEAKSW = self.PEAKSW
         PARAMETERS = self.PARAMETERS
-        FASTER = 0
+        # all the groups are evaluated at once
+        FASTER = 1
         for i in range(len(param[self.NGLOBAL:])):
             result = 0 * energy
             if self.ESCAPE:
@@ -1405,9 +1431,90 @@ def getPeakMatrixContribution(self,param0,t0=None,hypermet=None,
                             result += SpecfitFuns.apvoigt(PEAKSW[i],energy)
             #print "shape = ",result.shape
             #print "matrix = ",matrix.shape
-            matrix[:,i] = result[:,0]
+            if not FASTER:
+                matrix[:,i] = result[:,0]
+        if FASTER and len(PEAKSW[:]):
+            a = numpy.concatenate(PEAKSW[:])
+            groups = self._getPeakGroupIndices(PEAKSW)
+            if hypermet:
+                matrix = SpecfitFuns.ahypermetgroups(a, groups, energy,
+                                                     hypermet, 1, len(PEAKSW))
+            else:
+                matrix = SpecfitFuns.apvoigtgroups(a, groups, energy,
+                                                   1, len(PEAKSW))
         return matrix
 
+    def _getPeakShapeIndices(self):
+        """
+        Indices of the parameters defining the shape of the peak families:
+        zero, gain, noise, fano and the peak shape parameters.
+        """
+        if self.__HYPERMET:
+            names = ['ST AreaR', 'ST SlopeR', 'LT AreaR', 'LT SlopeR',
+                     'STEP HeightR']
+        else:
+            names = ['Eta Factor']
+        return [0, 1, 2, 3] + [self.PARAMETERS.index(name) for name in names]
+
+    def _hasFixedPeakShape(self, codes):
+        """
+        Return True if the given constraints fix all the parameters defining
+        the shape of the peak families. The fitting function is then a linear
+        combination of the peak families plus the continuum.
+        """
+        for i in self._getPeakShapeIndices():
+            if abs(codes[0][i]) != Gefit.CFIXED:
+                return False
+        return True
+
+    def _isLinearMatrixValid(self, param, x=None):
+        """
+        Return True if the current linearMatrix corresponds to the given
+        energy calibration, resolution, peak shape and fitted channels.
+        """
+        if (self.linearMatrix is None) or (self._linearMatrixKey is None):
+            return False
+        if x is None:
+            x = self.xdata
+        values, channels = self._linearMatrixKey
+        if not numpy.array_equal(channels, numpy.ravel(x)):
+            return False
+        return numpy.array_equal(values,
+                    [param[i] for i in self._getPeakShapeIndices()])
+
+    def _calculateLinearMatrix(self, param, x=None):
+        """
+        Calculate the contribution of each peak family for unit area and
+        keep it as linearMatrix to be reused by the following fits.
+        """
+        if x is None:
+            x = self.xdata
+        param = numpy.array(param, dtype=numpy.float)
+        param[self.NGLOBAL:] = 1.0
+        self.linearMatrix = self.getPeakMatrixContribution(param, t0=x)
+        self._linearMatrixKey = (numpy.array([param[i] for i in \
+                                        self._getPeakShapeIndices()]),
+                                 numpy.array(numpy.ravel(x), copy=True))
+        return self.linearMatrix
+
+    def _getLinearMatrix(self, x):
+        """
+        Rows of linearMatrix corresponding to the channels x. The fit
+        routine may evaluate the fitting function on a subset of them.
+        """
+        if len(x) == self.linearMatrix.shape[0]:
+            return self.linearMatrix
+        channels = self._linearMatrixKey[1]
+        return self.linearMatrix[numpy.searchsorted(channels, numpy.ravel(x))]
+
+    def _getPeakGroupIndices(self, peakTables):
+        """
+        Index of the peak family of each line of the concatenated peak
+        tables as expected by SpecfitFuns.ahypermetgroups
+        """
+        return numpy.concatenate([numpy.zeros((len(table),), numpy.int32) + i \
+                                  for i, table in enumerate(peakTables)])
+
     def linearMcaTheory(self, param0, t0, hypermet=None, continuum=None, summing=None):
         if continuum is None:
             continuum = self.__CONTINUUM
@@ -1421,7 +1528,7 @@ def linearMcaTheory(self, param0, t0, hypermet=None, continuum=None, summing=Non
         gain = param[1]
         #the loop in mcatheory is replaced by this single line
         if len(self.PEAKSW[:]):
-            result = numpy.sum(param[self.NGLOBAL:] * self.linearMatrix, 1)
+            result = numpy.sum(param[self.NGLOBAL:] * self._getLinearMatrix(x), 1)
         else:
             result = 0.0 * x
         if continuum:
@@ -1553,10 +1660,12 @@ def mcatheory(self,param0,t0,hypermet=None,continuum=None,summing=None):
                 #t=time.time()
                 #result = SpecfitFuns.agauss(a,energy)
                 #if HYPERMET:
+                groups = self._getPeakGroupIndices(PEAKSW)
                 if hypermet:
-                    result = SpecfitFuns.fastahypermet(a,energy,hypermet)
+                    result = SpecfitFuns.ahypermetgroups(a, groups, energy,
+                                                         hypermet)
                 else:
-                    result = SpecfitFuns.apvoigt(a,energy)
+                    result = SpecfitFuns.apvoigtgroups(a, groups, energy)
             else:
                 result = 0.0 * x
             #print "eval = ",time.time()-t
@@ -1620,7 +1729,7 @@ def num_deriv(self, param0,index,t0):
     def linearMcaTheoryDerivative(self, param0, index, t0):
         NGLOBAL = self.NGLOBAL
         if index > NGLOBAL-1:
-             return self.linearMatrix[:, index-NGLOBAL]
+             return self._getLinearMatrix(t0)[:, index-NGLOBAL]
         PARAMETERS = self.PARAMETERS
         if self.__CONTINUUM and (PARAMETERS[index] == 'Constant'):
             return numpy.ones(len(t0)).astype(numpy.float)
@@ -1657,6 +1766,43 @@ def linearMcaTheoryDerivative(self, param0, index, t0):
             #print "f1,f2,delta = ",f1,f2,delta
             return (f1-f2) / (2.0 * delta)
 
+    def linearMcaTheoryJacobian(self, param0, indices, t0):
+        """
+        linearMcaTheoryJacobian(self, parameters, indices, x)
+        Equivalent to analyticalJacobian when zero, gain, noise, fano and
+        the peak shape parameters are fixed. The peak families are taken
+        from linearMatrix instead of being evaluated at each iteration.
+        """
+        NGLOBAL = self.NGLOBAL
+        param = numpy.array(param0, dtype=numpy.float)
+        x = numpy.array(t0, dtype=numpy.float)
+        zero = param[0]
+        gain = param[1]
+        matrix = self._getLinearMatrix(x)
+        if len(param) > NGLOBAL:
+            result = numpy.dot(matrix, param[NGLOBAL:])
+        else:
+            result = 0.0 * x
+        yfit = result + self.continuum(param, x)
+        summing = self.__SUM and (param[4] != 0.0)
+        xmin = int(x[0])
+        if self.__SUM:
+            pileup = SpecfitFuns.pileup(yfit, xmin, zero, gain)
+        jacobian = numpy.zeros((len(indices), len(x)), numpy.float)
+        for i, index in enumerate(indices):
+            if index > NGLOBAL - 1:
+                # as in analyticalJacobian the pile-up is neglected
+                jacobian[i] = matrix[:, index - NGLOBAL]
+            elif self.PARAMETERS[index] == 'Sum':
+                if self.__SUM:
+                    jacobian[i] = pileup
+            else:
+                # continuum parameters
+                jacobian[i] = self.analyticalDerivative(param, index, x)
+        if summing:
+            yfit = yfit + param[4] * pileup
+        return yfit, jacobian
+
     def analyticalDerivative(self, param0, index, t0):
         """
         analyticalDerivative(self, parameters, index, x)
@@ -1737,10 +1883,12 @@ def analyticalDerivative(self, param0, index, t0):
          else:
                 dummy[0:,3] = param[PARAMETERS.index('Eta Factor')]
          if self.FASTER:
+            groups = numpy.zeros((dummy.shape[0],), numpy.int32)
             if HYPERMET:
-                return SpecfitFuns.fastahypermet(dummy,energy,HYPERMET)
+                return SpecfitFuns.ahypermetgroups(dummy, groups, energy,
+                                                   HYPERMET)
             else:
-                return SpecfitFuns.apvoigt(dummy,energy)
+                return SpecfitFuns.apvoigtgroups(dummy, groups, energy)
          else:
             if HYPERMET:
                 return SpecfitFuns.ahypermet(dummy,energy,HYPERMET)
@@ -1774,8 +1922,8 @@ def analyticalDerivative(self, param0, index, t0):
             x=numpy.array(t0)
             zero = param[0]
             gain = param[1] * 1.0
-            energy=zero + gain * x
-            energy -= numpy.sum(energy)/len(energy)
+            # same energy as in the continuum function
+            energy=zero + gain * (x - numpy.sum(x)/len(x))
             return pow(energy,index-PARAMETERS.index('Sum')-1)
         elif self.__CONTINUUM == CONTINUUM_LIST.index('Exp. Polynomial') and \
             PARAMETERS[index] == ('A%d' % (index-PARAMETERS.index('Sum')-1)):
@@ -1783,12 +1931,12 @@ def analyticalDerivative(self, param0, index, t0):
             x=numpy.array(t0)
             zero = param[0]
             gain = param[1] * 1.0
-            energy=zero + gain * x
-            energy -= numpy.sum(energy)/len(energy)
+            # same energy as in the continuum function
+            energy=zero + gain * (x - numpy.sum(x)/len(x))
             if HYPERMET:
                 parameters = param[(PARAMETERS.index('Sum')+1):NGLOBAL-5]
             else:
-                parameters = param[(PARAMETERS.index('Sum')+1):NGLOBAL]
+                parameters = param[(PARAMETERS.index('Sum')+1):NGLOBAL-1]
             return self.exppol_deriv(parameters,index-PARAMETERS.index('Sum')-1,energy)
         else:
             #numerical derivative
@@ -1803,16 +1951,220 @@ def analyticalDerivative(self, param0, index, t0):
             #print "f1,f2,delta = ",f1,f2,delta
             return (f1-f2) / (2.0 * delta)
 
-    def estimate(self):
+    def analyticalJacobian(self, param0, indices, t0):
+        """
+        analyticalJacobian(self, parameters, indices, x)
+        Internal function returning the fitting function f(parameters, x)
+        and its derivatives respect to the parameters given by indices.
+
+        All the peak families are evaluated at once together with the
+        derivatives respect to the peak areas, zero, gain, noise, fano and
+        peak shape parameters. Therefore, there is no need to evaluate the
+        fitting function once per derivative.
+        """
+        NGLOBAL = self.NGLOBAL
+        HYPERMET = self.__HYPERMET
+        PARAMETERS = self.PARAMETERS
+        param = numpy.array(param0, dtype=numpy.float)
+        # a column of points would broadcast against the peak arrays
+        x = numpy.array(t0, dtype=numpy.float).reshape(-1)
+        zero = param[0]
+        gain = param[1]
+        energy = zero + gain * x
+        noise = param[2] * param[2]
+        fanoFactor = 2.3548 * 2.3548 * 0.00385
+        fano = param[3] * fanoFactor
+        PEAKS0 = self.PEAKS0
+        PEAKSW = self.PEAKSW
+        areas = param[NGLOBAL:]
+        for i in range(len(areas)):
+            (r, c) = (PEAKS0[i]).shape
+            PEAKSW[i][0:r, 0] = PEAKS0[i][:, 0] * gain
+            PEAKSW[i][0:r, 1] = PEAKS0[i][:, 1] * 1.0
+            if self.ESCAPE:
+                if OLDESCAPE:
+                    PEAKSW[i][r:, 0] = PEAKSW[i][0:r, 0] * PEAKS0[i][:, 3]
+                    PEAKSW[i][r:, 1] = PEAKS0[i][:, 1] - \
+                                       self.config['detector']['detene']
+                else:
+                    ii = 0
+                    j = 0
+                    for esc_group in self.PEAKS0ESCAPE[i]:
+                        for esc_line in esc_group:
+                            PEAKSW[i][j+r, 0] = PEAKSW[i][ii, 0] * esc_line[1]
+                            PEAKSW[i][j+r, 1] = esc_line[0] * 1.0
+                            j = j + 1
+                        ii = ii + 1
+            PEAKSW[i][:, 2] = numpy.sqrt(noise + \
+                                (PEAKSW[i][:, 1] > 0) * PEAKSW[i][:, 1] * fano)
+            if HYPERMET:
+                PEAKSW[i][0:r, 3] = param[PARAMETERS.index('ST AreaR')]
+                PEAKSW[i][:, 4] = param[PARAMETERS.index('ST SlopeR')]
+                PEAKSW[i][0:r, 5] = param[PARAMETERS.index('LT AreaR')]
+                PEAKSW[i][:, 6] = param[PARAMETERS.index('LT SlopeR')]
+                PEAKSW[i][0:r, 7] = param[PARAMETERS.index('STEP HeightR')]
+                #neglect tails in escape peaks
+                PEAKSW[i][r:, 3] = 0.0
+                PEAKSW[i][r:, 5] = 0.0
+                PEAKSW[i][r:, 7] = 0.0
+            else:
+                PEAKSW[i][:, 3] = param[PARAMETERS.index('Eta Factor')]
+        if len(areas):
+            peaks = numpy.concatenate(PEAKSW[:len(areas)])
+            groups = self._getPeakGroupIndices(PEAKSW[:len(areas)])
+        else:
+            peaks = numpy.zeros((0, 3 + 5 * (HYPERMET > 0) + (HYPERMET == 0)),
+                                numpy.float)
+            groups = numpy.zeros((0,), numpy.int32)
+        # derivatives of the FWHM of each line respect to noise and fano
+        weights = numpy.zeros((peaks.shape[0], 2), numpy.float)
+        weights[:, 0] = param[2] / peaks[:, 2]
+        weights[:, 1] = 0.5 * fanoFactor * (peaks[:, 1] > 0) * \
+                        peaks[:, 1] / peaks[:, 2]
+        if HYPERMET:
+            matrix, derivatives = SpecfitFuns.ahypermetjacobian(peaks,
+                                            groups, areas, weights, energy,
+                                            HYPERMET)
+            shapeParameters = {'ST AreaR': 1,
+                               'ST SlopeR': 2,
+                               'LT AreaR': 3,
+                               'LT SlopeR': 4,
+                               'STEP HeightR': 5}
+            fwhmRow = 6
+        else:
+            matrix, derivatives = SpecfitFuns.apvoigtjacobian(peaks,
+                                            groups, areas, weights, energy)
+            shapeParameters = {'Eta Factor': 1}
+            fwhmRow = 2
+        result = numpy.dot(matrix, areas)
+        shapeParameters['Zero'] = None
+        shapeParameters['Gain'] = None
+        shapeParameters['Noise'] = fwhmRow
+        shapeParameters['Fano'] = fwhmRow + 1
+
+        # the continuum may depend on the energy calibration
+        continuum = self.continuum(param, x)
+        dcontinuum = self._continuumEnergyDerivative(param, x)
+        yfit = result + continuum
+        summing = self.__SUM and (param[4] != 0.0)
+        xmin = int(x[0])
+        if summing:
+            pileup = SpecfitFuns.pileup(yfit, xmin, zero, gain)
+
+        jacobian = numpy.zeros((len(indices), len(x)), numpy.float)
+        for i, index in enumerate(indices):
+            name = PARAMETERS[index] if index < NGLOBAL else None
+            if index > NGLOBAL - 1:
+                # as in analyticalDerivative the pile-up is neglected
+                jacobian[i] = matrix[:, index - NGLOBAL]
+                continue
+            elif name == 'Sum':
+                if summing:
+                    jacobian[i] = pileup
+                elif self.__SUM:
+                    jacobian[i] = SpecfitFuns.pileup(yfit, xmin, zero, gain)
+                continue
+            elif name == 'Zero':
+                deriv = derivatives[0] + dcontinuum
+            elif name == 'Gain':
+                deriv = derivatives[0] * x + result / gain + \
+                        dcontinuum * (x - numpy.sum(x) / len(x))
+            elif name in shapeParameters:
+                deriv = derivatives[shapeParameters[name]]
+            else:
+                # continuum parameters
+                jacobian[i] = self.analyticalDerivative(param, index, x)
+                continue
+            if summing:
+                # the pile-up is bilinear in the fitting function
+                deriv = deriv + param[4] * 0.5 * \
+                        (SpecfitFuns.pileup(yfit + deriv, xmin, zero, gain) - \
+                         SpecfitFuns.pileup(yfit - deriv, xmin, zero, gain))
+            jacobian[i] = deriv
+        if summing:
+            yfit = yfit + param[4] * pileup
+        return yfit, jacobian
+
+    def _continuumEnergyDerivative(self, param, x):
+        """
+        Derivative of the continuum respect to the energy for the continua
+        depending on the energy calibration.
+        """
+        if self.__CONTINUUM not in [CONTINUUM_LIST.index('Linear Polynomial'),
+                                    CONTINUUM_LIST.index('Exp. Polynomial')]:
+            return 0.0
+        energy = param[0] + param[1] * (x - numpy.sum(x)/len(x))
+        first = self.PARAMETERS.index('Sum') + 1
+        if self.__HYPERMET:
+            p = param[first:self.NGLOBAL-5]
+        else:
+            p = param[first:self.NGLOBAL-1]
+        deriv = 0.0 * energy
+        for i in range(1, len(p)):
+            deriv += i * p[i] * pow(energy, i - 1)
+        if self.__CONTINUUM == CONTINUUM_LIST.index('Exp. Polynomial'):
+            deriv *= self.exppol(p, energy)
+        return deriv
+
+    def estimate(self, parameters=None):
+        """
+        Estimate the starting values of the fit parameters and their
+        constraints.
+
+        :param parameters: Optional starting values. Typically the fitted
+                           parameters of a similar spectrum (a neighbouring
+                           pixel, the sum spectrum of a map) in order to
+                           reduce the number of iterations. The constraints
+                           estimated for the same fitted channels are reused.
+        """
         if self.__toBeConfigured:
             if DEBUG:
                 print("CONFIGURING FROM ESTIMATION")
             self.configure(self.__originalConfiguration)
-        self.parameters, self.codes = self.specfitestimate(self.xdata, self.ydata,self.zz)
+        if (parameters is not None) and \
+           (len(parameters) != len(self.PARAMETERS)):
+            if DEBUG:
+                print("Starting parameters do not match the configuration")
+            parameters = None
+        x = numpy.ravel(self.xdata)
+        if (parameters is not None) and (self._estimateCache is not None) and \
+           numpy.array_equal(self._estimateCache[0], x):
+            newpar, codes = self._estimateCache[1:]
+        else:
+            newpar, codes = self.specfitestimate(self.xdata, self.ydata,self.zz)
+            self._estimateCache = (numpy.array(x, copy=True),
+                                   list(newpar), codes.copy())
+        if parameters is None:
+            self.parameters, self.codes = newpar, codes
+        else:
+            self.parameters = self._getStartingParameters(newpar, codes,
+                                                          parameters)
+            self.codes = codes.copy()
+        self._startingParametersGiven = parameters is not None
         #self.estimatelinpoly(self.xdata, self.ydata,self.zz)
         #self.estimateexppoly(self.xdata, self.ydata,self.zz)
         #print self.codes[:,3]
 
+    def _getStartingParameters(self, newpar, codes, parameters):
+        """
+        Replace the estimated values of the non fixed parameters by the
+        given ones, keeping the quoted parameters inside their limits.
+        """
+        newpar = list(newpar)
+        for i in range(len(newpar)):
+            code = codes[0][i]
+            if code in [Gefit.CFREE, Gefit.CPOSITIVE]:
+                newpar[i] = parameters[i]
+            elif code == Gefit.CQUOTED:
+                pmin = min(codes[1][i], codes[2][i])
+                pmax = max(codes[1][i], codes[2][i])
+                if pmax > pmin:
+                    # at the limits the parameter could not move
+                    delta = 0.001 * (pmax - pmin)
+                    newpar[i] = min(max(parameters[i], pmin + delta),
+                                    pmax - delta)
+        return newpar
+
     def specfitestimate(self,x,y,z,xscaling=1.0,yscaling=1.0):
         if self.PARAMETERS is None:
             self.__configure()
@@ -2080,7 +2432,8 @@ def specfitestimate(self,x,y,z,xscaling=1.0,yscaling=1.0):
         else:
             #import time
             #e0 = time.time()
-            if self.linearMatrix is None:
+            if not self._isLinearMatrixValid(newpar, x):
+                self.linearMatrix = None
                 self.__oldLinearFixed = []
                 for i in range(len(PARAMETERS)-NGLOBAL):
                     positions = (self.PEAKS0[i][:,1] - zero)/gain
@@ -2132,7 +2485,7 @@ def specfitestimate(self,x,y,z,xscaling=1.0,yscaling=1.0):
                     codes[0,i+NGLOBAL]= Gefit.CFIXED
             #print "Elapsed = ",time.time() - e0
             if self._batchFlag and self.linearMatrix is None:
-                    self.linearMatrix = self.getPeakMatrixContribution(newpar)
+                    self._calculateLinearMatrix(newpar, x)
         return newpar, codes
 
     def startfit(self,digest=0, linear=None, currentIteration=None):
@@ -2172,7 +2525,16 @@ def startfit(self,digest=0, linear=None, currentIteration=None):
                                            fulloutput=1, linear=linear)
 
         else:
-            fitresult =  Gefit.LeastSquaresFit(self.mcatheory,
+            model = self.mcatheory
+            jacobian = self.analyticalJacobian
+            if self._batchFlag and self._hasFixedPeakShape(self.codes):
+                # only the areas and the continuum are fitted, the peak
+                # families can be calculated once for all the spectra
+                if not self._isLinearMatrixValid(self.parameters):
+                    self._calculateLinearMatrix(self.parameters)
+                model = self.linearMcaTheory
+                jacobian = self.linearMcaTheoryJacobian
+            fitresult =  Gefit.LeastSquaresFit(model,
                                            self.parameters,
                                            self.datatofit,
                                            constrains=self.codes,
@@ -2180,7 +2542,9 @@ def startfit(self,digest=0, linear=None, currentIteration=None):
                                            maxiter=self.MAXITER,
                                            model_deriv=self.analyticalDerivative,
                                            deltachi=self.config['fit']['deltachi'],
-                                           fulloutput=1, linear=linear)
+                                           fulloutput=1, linear=linear,
+                                    model_and_deriv=jacobian,
+                            subsample=not self._startingParametersGiven)
             if self.__SUM and linear:
                 #This is a patch but the alternative is
                 #to forbid linear fits with pile-up.
@@ -2191,7 +2555,7 @@ def startfit(self,digest=0, linear=None, currentIteration=None):
                 yfitw = self.mcatheory(fitresult[0], xw,summing=0)
                 pileup= self.parameters[4]*SpecfitFuns.pileup(yfitw,int(xw[0]), zero, gain)
                 self.datatofit[:,1] -= pileup
-                fitresult =  Gefit.LeastSquaresFit(self.mcatheory,
+                fitresult =  Gefit.LeastSquaresFit(model,
                                            self.parameters,
                                            self.datatofit,
                                            constrains=self.codes,
@@ -2459,77 +2459,34 @@ def getMaterialMassAttenuationCoefficients(compoundList0, fractionList0, energy0
     dict['photo']    = []
     dict['pair']     = []
     dict['total']    = []
+    if not hasattr(energy, "__len__"):
+        energy = [energy]
+    energy = list(energy)
+    energyArray = numpy.array(energy, numpy.float64)
     eltindex = 0
     for ele in materialElements.keys():
-        if 'xcom' in Element[ele]:
-            xcom_data = Element[ele]['xcom']
+        cohe, comp, photo, pair = _getCrossSections(ele, energyArray)
+        eleFraction = materialElements[ele]
+        if eltindex == 0:
+            coherent = cohe * eleFraction
+            compton = comp * eleFraction
+            photoelectric = photo * eleFraction
+            pairproduction = pair * eleFraction
+            total = (cohe + comp + photo + pair) * eleFraction
         else:
-            xcom_data = getelementmassattcoef(ele,None)
-        #now I have to interpolate at the different energies
-        if (type(energy) != type([])):
-            energy =[energy]
-        eneindex = 0
-        for ene in energy:
-            if ene < 1.0:
-                if PyMcaEPDL97.EPDL97_DICT[ele]['original']:
-                    #make sure the binding energies are those used by this module and not EADL ones
-                    PyMcaEPDL97.setElementBindingEnergies(ele,
-                                                          Element[ele]['binding'])
-                tmpDict = PyMcaEPDL97.getElementCrossSections(ele, ene)
-                cohe  = tmpDict['coherent'][0]
-                comp  = tmpDict['compton'][0]
-                photo = tmpDict['photo'][0]
-                pair  = 0.0
-            else:
-                i0=max(numpy.nonzero(xcom_data['energy'] <= ene)[0])
-                i1=min(numpy.nonzero(xcom_data['energy'] >= ene)[0])
-                if (i1 == i0) or (i0>i1):
-                    cohe=xcom_data['coherent'][i1]
-                    comp=xcom_data['compton'][i1]
-                    photo=xcom_data['photo'][i1]
-                    pair=xcom_data['pair'][i1]
-                else:
-                    if LOGLOG:
-                        A=xcom_data['energylog10'][i0]
-                        B=xcom_data['energylog10'][i1]
-                        logene = numpy.log10(ene)
-                        c2=(logene-A)/(B-A)
-                        c1=(B-logene)/(B-A)
-                    else:
-                        A=xcom_data['energy'][i0]
-                        B=xcom_data['energy'][i1]
-                        c2=(ene-A)/(B-A)
-                        c1=(B-ene)/(B-A)
-                    cohe= pow(10.0,c2*xcom_data['coherentlog10'][i1]+\
-                                   c1*xcom_data['coherentlog10'][i0])
-                    comp= pow(10.0,c2*xcom_data['comptonlog10'][i1]+\
-                                   c1*xcom_data['comptonlog10'][i0])
-                    photo=pow(10.0,c2*xcom_data['photolog10'][i1]+\
-                                   c1*xcom_data['photolog10'][i0])
-                    if xcom_data['pair'][i1] > 0.0:
-                        c2 = c2*numpy.log10(xcom_data['pair'][i1])
-                        if xcom_data['pair'][i0] > 0.0:
-                            c1 = c1*numpy.log10(xcom_data['pair'][i0])
-                            pair = pow(10.0,c1+c2)
-                        else:
-                            pair =0.0
-                    else:
-                        pair =0.0
-            if eltindex == 0:
-                dict['energy'].append(ene)
-                dict['coherent'].append(cohe * materialElements[ele])
-                dict['compton'].append(comp * materialElements[ele])
-                dict['photo'].append(photo * materialElements[ele])
-                dict['pair'].append(pair* materialElements[ele])
-                dict['total'].append((cohe+comp+photo+pair)* materialElements[ele])
-            else:
-                dict['coherent'][eneindex] += cohe  * materialElements[ele]
-                dict['compton'] [eneindex] += comp  * materialElements[ele]
-                dict['photo']   [eneindex] += photo * materialElements[ele]
-                dict['pair']    [eneindex] += pair  * materialElements[ele]
-                dict['total']   [eneindex] += (cohe+comp+photo+pair) *  materialElements[ele]
-            eneindex += 1
+            coherent += cohe * eleFraction
+            compton += comp * eleFraction
+            photoelectric += photo * eleFraction
+            pairproduction += pair * eleFraction
+            total += (cohe + comp + photo + pair) * eleFraction
         eltindex += 1
+    if eltindex:
+        dict['energy'] = energy
+        dict['coherent'] = coherent.tolist()
+        dict['compton'] = compton.tolist()
+        dict['photo'] = photoelectric.tolist()
+        dict['pair'] = pairproduction.tolist()
+        dict['total'] = total.tolist()
     return dict
 
 
@@ -2621,6 +2578,83 @@ def getElementComptonDifferentialCrossSection(ele, theta, energy, p1=None):
           raise ValueError("Unknown element %s" % ele)
     return (value * 6.022142E23)/ Element[ele]['mass']
 
+def _getCrossSections(ele, energy):
+    """
+    Interpolate the photon cross sections of an element in cm2/g.
+
+    :param ele: Element symbol
+    :param energy: Array of energies in keV
+    :return: Arrays coherent, compton, photo and pair
+    """
+    xcom_data = getelementmassattcoef(ele, None)
+    energy = numpy.ravel(energy)
+    cohe = numpy.zeros(energy.shape, numpy.float64)
+    comp = numpy.zeros(energy.shape, numpy.float64)
+    photo = numpy.zeros(energy.shape, numpy.float64)
+    pair = numpy.zeros(energy.shape, numpy.float64)
+
+    # below 1 keV from EPDL97
+    for i in numpy.nonzero(energy < 1.0)[0]:
+        if PyMcaEPDL97.EPDL97_DICT[ele]['original']:
+            #make sure the binding energies are those used by this module and not EADL ones
+            PyMcaEPDL97.setElementBindingEnergies(ele,
+                                                  Element[ele]['binding'])
+        tmpDict = PyMcaEPDL97.getElementCrossSections(ele, energy[i])
+        cohe[i]  = tmpDict['coherent'][0]
+        comp[i]  = tmpDict['compton'][0]
+        photo[i] = tmpDict['photo'][0]
+
+    # XCOM data
+    index = numpy.nonzero(energy >= 1.0)[0]
+    if not len(index):
+        return cohe, comp, photo, pair
+    ene = energy[index]
+    # i0 is the last tabulated energy below or at the energy and i1 the
+    # first one above or at it, both equal at edges or tabulated energies
+    i0 = numpy.searchsorted(xcom_data['energy'], ene, side='right') - 1
+    i1 = numpy.searchsorted(xcom_data['energy'], ene, side='left')
+    if (i0.min() < 0) or (i1.max() >= len(xcom_data['energy'])):
+        raise ValueError("Energy outside the tabulated range of %s" % ele)
+    tabulated = i1 <= i0
+    if tabulated.any():
+        j = index[tabulated]
+        k = i1[tabulated]
+        cohe[j] = xcom_data['coherent'][k]
+        comp[j] = xcom_data['compton'][k]
+        photo[j] = xcom_data['photo'][k]
+        pair[j] = xcom_data['pair'][k]
+    interpolated = ~tabulated
+    if interpolated.any():
+        j = index[interpolated]
+        i0 = i0[interpolated]
+        i1 = i1[interpolated]
+        ene = ene[interpolated]
+        if LOGLOG:
+            A = xcom_data['energylog10'][i0]
+            B = xcom_data['energylog10'][i1]
+            logene = numpy.log10(ene)
+            c2 = (logene - A) / (B - A)
+            c1 = (B - logene) / (B - A)
+        else:
+            A = xcom_data['energy'][i0]
+            B = xcom_data['energy'][i1]
+            c2 = (ene - A) / (B - A)
+            c1 = (B - ene) / (B - A)
+        cohe[j] = pow(10.0, c2 * xcom_data['coherentlog10'][i1] + \
+                            c1 * xcom_data['coherentlog10'][i0])
+        comp[j] = pow(10.0, c2 * xcom_data['comptonlog10'][i1] + \
+                            c1 * xcom_data['comptonlog10'][i0])
+        photo[j] = pow(10.0, c2 * xcom_data['photolog10'][i1] + \
+                             c1 * xcom_data['photolog10'][i0])
+        pair0 = xcom_data['pair'][i0]
+        pair1 = xcom_data['pair'][i1]
+        valid = (pair0 > 0.0) & (pair1 > 0.0)
+        if valid.any():
+            c2 = c2[valid] * numpy.log10(pair1[valid])
+            c1 = c1[valid] * numpy.log10(pair0[valid])
+            pair[j[valid]] = pow(10.0, c1 + c2)
+    return cohe, comp, photo, pair
+
 def getelementmassattcoef(ele,energy=None):
     """
     Usage: getelementmassattcoef(element symbol, energy in kev)
@@ -2745,59 +2779,14 @@ def getelementmassattcoef(ele,energy=None):
     ddict['total']    = []
     if not hasattr(energy, "__len__"):
         energy =[energy]
-    for ene in energy:
-        if ene < 1.0:
-            if PyMcaEPDL97.EPDL97_DICT[ele]['original']:
-                #make sure the binding energies are those used by this module and not EADL ones
-                PyMcaEPDL97.setElementBindingEnergies(ele,
-                                                      Element[ele]['binding'])
-            tmpDict = PyMcaEPDL97.getElementCrossSections(ele, ene)
-            cohe  = tmpDict['coherent'][0]
-            comp  = tmpDict['compton'][0]
-            photo = tmpDict['photo'][0]
-            pair  = 0.0
-        else:
-            i0=max(numpy.nonzero(Element[ele]['xcom']['energy'] <= ene)[0])
-            i1=min(numpy.nonzero(Element[ele]['xcom']['energy'] >= ene)[0])
-            if i1 <= i0:
-                cohe=Element[ele]['xcom']['coherent'][i1]
-                comp=Element[ele]['xcom']['compton'][i1]
-                photo=Element[ele]['xcom']['photo'][i1]
-                pair=Element[ele]['xcom']['pair'][i1]
-            else:
-                if LOGLOG:
-                    A=Element[ele]['xcom']['energylog10'][i0]
-                    B=Element[ele]['xcom']['energylog10'][i1]
-                    logene = numpy.log10(ene)
-                    c2=(logene-A)/(B-A)
-                    c1=(B-logene)/(B-A)
-                else:
-                    A=Element[ele]['xcom']['energy'][i0]
-                    B=Element[ele]['xcom']['energy'][i1]
-                    c2=(ene-A)/(B-A)
-                    c1=(B-ene)/(B-A)
-
-                cohe= pow(10.0,c2*Element[ele]['xcom']['coherentlog10'][i1]+\
-                               c1*Element[ele]['xcom']['coherentlog10'][i0])
-                comp= pow(10.0,c2*Element[ele]['xcom']['comptonlog10'][i1]+\
-                               c1*Element[ele]['xcom']['comptonlog10'][i0])
-                photo=pow(10.0,c2*Element[ele]['xcom']['photolog10'][i1]+\
-                               c1*Element[ele]['xcom']['photolog10'][i0])
-                if Element[ele]['xcom']['pair'][i1] > 0.0:
-                    c2 = c2*numpy.log10(Element[ele]['xcom']['pair'][i1])
-                    if Element[ele]['xcom']['pair'][i0] > 0.0:
-                        c1 = c1*numpy.log10(Element[ele]['xcom']['pair'][i0])
-                        pair = pow(10.0,c1+c2)
-                    else:
-                        pair =0.0
-                else:
-                    pair =0.0
-        ddict['energy'].append(ene)
-        ddict['coherent'].append(cohe)
-        ddict['compton'].append(comp)
-        ddict['photo'].append(photo)
-        ddict['pair'].append(pair)
-        ddict['total'].append(cohe+comp+photo+pair)
+    cohe, comp, photo, pair = _getCrossSections(ele,
+                                    numpy.array(energy, numpy.float64))
+    ddict['energy']   = list(energy)
+    ddict['coherent'] = cohe.tolist()
+    ddict['compton']  = comp.tolist()
+    ddict['photo']    = photo.tolist()
+    ddict['pair']     = pair.tolist()
+    ddict['total']    = (cohe + comp + photo + pair).tolist()
     return ddict
 
 def getElementLShellRates(symbol,energy=None,photoweights = None):
@@ -0,0 +1,479 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+__author__ = "V.A. Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+__doc__ = """
+Module to calculate matrix corrected concentration maps.
+
+The fluorescence rates of the fitted peak families are tabulated on a grid of
+sample compositions and interpolated at every pixel. The interpolation is
+performed on the inverse of the rates, that is close to linear in the sample
+composition because it follows the sample attenuation. The composition
+of all the pixels is then iterated simultaneously following the recipe of the
+SingleLayerStrategy, that otherwise has to be applied spectrum by spectrum.
+"""
+import copy
+import numpy
+from . import Elements
+
+DEBUG = 0
+
+class FastMatrixCorrection(object):
+    # maximum number of compositions to be evaluated when building the table
+    MAX_NODES = 512
+
+    def __init__(self, configuration=None, npoints=None):
+        self._config = None
+        self._npoints = npoints
+        self._groups = []
+        self._table = None
+        self._matrixRates = None
+        if configuration is not None:
+            self.setConfiguration(configuration)
+
+    def setConfiguration(self, configuration):
+        """
+        Set the fit configuration. The sample matrix and the sample
+        components to be iterated are taken from the SingleLayerStrategy
+        section of the configuration.
+        """
+        self._config = copy.deepcopy(configuration)
+        self._table = None
+        self._matrixRates = None
+        self._setup = self._getSetup(self._config)
+        self._components, self._completer = self._getComponents(self._config)
+
+    def getComponents(self):
+        """
+        Return a list of [group, material, element mass fraction in material]
+        describing the compositional degrees of freedom of the sample.
+        """
+        return copy.deepcopy(self._components)
+
+    def getGroups(self):
+        return self._groups * 1
+
+    def _getSetup(self, config):
+        ddict = {}
+        matrix = None
+        ddict['attenuators'] = []
+        ddict['funnyfilters'] = []
+        ddict['beamfilters'] = []
+        ddict['detector'] = None
+        for attenuator in config['attenuators'].keys():
+            if not config['attenuators'][attenuator][0]:
+                continue
+            if attenuator.upper() == "MATRIX":
+                matrix = config['attenuators'][attenuator][1:4]
+                ddict['alphain'] = config['attenuators'][attenuator][4]
+                ddict['alphaout'] = config['attenuators'][attenuator][5]
+            elif attenuator.upper()[0:-1] == "BEAMFILTER":
+                ddict['beamfilters'].append( \
+                            config['attenuators'][attenuator][1:])
+            elif attenuator.upper() == "DETECTOR":
+                ddict['detector'] = config['attenuators'][attenuator][1:]
+            elif (len(config['attenuators'][attenuator]) > 4) and \
+                 (abs(config['attenuators'][attenuator][4] - 1.0) > 1.0e-10):
+                # funny attenuator
+                ddict['funnyfilters'].append( \
+                            config['attenuators'][attenuator][1:])
+            else:
+                ddict['attenuators'].append( \
+                            config['attenuators'][attenuator][1:])
+        if matrix is None:
+            raise ValueError("Invalid or undefined sample matrix")
+        if matrix[0].upper() == "MULTILAYER":
+            txt = "Multilayer matrix correction maps not implemented yet"
+            raise ValueError(txt)
+        if not Elements.isValidMaterial(matrix[0]):
+            raise ValueError("Material %s is not defined" % matrix[0])
+        ddict['matrix'] = matrix
+
+        energyList = config['fit']['energy']
+        if energyList is None:
+            raise ValueError("Invalid energy")
+        if type(energyList) != type([]):
+            energyList = [energyList]
+            flagList = [1]
+            weightList = [1.0]
+        else:
+            flagList = config['fit']['energyflag']
+            weightList = config['fit']['energyweight']
+        ddict['energy'] = []
+        ddict['weight'] = []
+        for idx in range(len(energyList)):
+            if flagList[idx] and (energyList[idx] is not None):
+                ddict['energy'].append(energyList[idx])
+                ddict['weight'].append(weightList[idx])
+        if not len(ddict['energy']):
+            raise ValueError("Invalid energy")
+        totalWeight = sum(ddict['weight'])
+        if totalWeight <= 0.0:
+            raise ValueError("Sum of energy weights is 0.0")
+        ddict['weight'] = [x / totalWeight for x in ddict['weight']]
+        ddict['flag'] = [1] * len(ddict['energy'])
+        return ddict
+
+    def _getComponents(self, config):
+        if "SingleLayerStrategy" not in config:
+            raise ValueError("Missing SingleLayerStrategy configuration")
+        strategyConfiguration = config["SingleLayerStrategy"]
+        components = []
+        for i, group in enumerate(strategyConfiguration["peaks"]):
+            if "-" in group:
+                continue
+            ele = group.split()[0]
+            material = strategyConfiguration["materials"][i]
+            if material in ["-", ele, ele + "1"]:
+                material = ele
+            massFractions = Elements.getMaterialMassFractions([material],
+                                                              [1.0])
+            if massFractions.get(ele, 0.0) <= 0.0:
+                raise ValueError("Element %s not present in material %s" % \
+                                 (ele, material))
+            components.append([group, material, massFractions[ele]])
+        if not len(components):
+            raise ValueError("No sample components to be iterated")
+        completer = strategyConfiguration.get("completer", "-")
+        if completer in ["-", "", None]:
+            completer = None
+        return components, completer
+
+    def _getNumberOfPoints(self):
+        if self._npoints is not None:
+            return max(2, int(self._npoints))
+        nComponents = len(self._components)
+        npoints = int(pow(self.MAX_NODES, 1.0 / nComponents) + 1.0e-6)
+        return max(2, min(npoints, 11))
+
+    def getNumberOfCompositions(self):
+        """
+        Number of sample compositions needed to build the table. The table
+        cannot be built if it is larger than MAX_NODES.
+        """
+        return pow(self._getNumberOfPoints(), len(self._components))
+
+    def _getCompoundList(self, fractions):
+        """
+        Given the fractions of the sample components, return the compound
+        list and the compound fractions defining the sample material.
+        """
+        compoundList = [item[1] for item in self._components]
+        compoundFraction = [float(x) for x in fractions]
+        total = sum(compoundFraction)
+        if self._completer is not None:
+            if total < 1.0:
+                compoundList.append(self._completer)
+                compoundFraction.append(1.0 - total)
+            else:
+                compoundFraction = [x / total for x in compoundFraction]
+        elif total > 0.0:
+            compoundFraction = [x / total for x in compoundFraction]
+        else:
+            # nothing to normalize, use the original matrix
+            compoundList = [self._setup['matrix'][0]]
+            compoundFraction = [1.0]
+        return compoundList, compoundFraction
+
+    def _getUnitRates(self, material, elementsList):
+        """
+        Fluorescence rates of each group at unit concentration in the
+        given material.
+        """
+        setup = self._setup
+        multilayer = [[material,
+                       setup['matrix'][1],
+                       setup['matrix'][2]]]
+        fluo = Elements.getMultilayerFluorescence(multilayer,
+                                 setup['energy'],
+                                 layerList=None,
+                                 weightList=setup['weight'],
+                                 flagList=setup['flag'],
+                                 fulloutput=1,
+                                 attenuators=setup['attenuators'] * 1,
+                                 alphain=setup['alphain'],
+                                 alphaout=setup['alphaout'],
+                                 elementsList=elementsList * 1,
+                                 cascade=True,
+                                 detector=setup['detector'],
+                                 funnyfilters=setup['funnyfilters'] * 1,
+                                 beamfilters=setup['beamfilters'] * 1,
+                                 forcepresent=1)[0]
+        rates = numpy.zeros((len(self._groups),), numpy.float64)
+        for i, group in enumerate(self._groups):
+            element, family = group.split()[0:2]
+            transitions = family + " xrays"
+            if element in fluo:
+                if transitions in fluo[element]['rates']:
+                    rates[i] = fluo[element]['rates'][transitions]
+        return rates
+
+    def buildTable(self, groups):
+        """
+        Tabulate the fluorescence rates of the supplied peak families
+        ("Fe K", "Pb L", ...) on a grid of sample compositions.
+        """
+        if self._config is None:
+            raise ValueError("Please set the fit configuration first")
+        self._groups = []
+        elementsList = []
+        for group in groups:
+            splitted = group.split()
+            ele = splitted[0]
+            if len(ele) > 2:
+                # scatter peaks
+                continue
+            self._groups.append(group)
+            elementsList.append([Elements.getz(ele), ele, splitted[1]])
+        elementsList.sort()
+        for item in self._components:
+            if item[0] not in self._groups:
+                raise ValueError("Group %s is not among the fitted groups" % \
+                                 item[0])
+        self._componentIndices = [self._groups.index(item[0]) \
+                                  for item in self._components]
+        nComponents = len(self._components)
+        npoints = self._getNumberOfPoints()
+        if pow(npoints, nComponents) > self.MAX_NODES:
+            raise ValueError("%d sample components need %d compositions, " \
+                             "the maximum is %d" % (nComponents,
+                                                    pow(npoints, nComponents),
+                                                    self.MAX_NODES))
+        # denser sampling close to zero, where the rates change faster
+        self._axis = pow(numpy.linspace(0.0, 1.0, npoints), 2)
+        self._matrixRates = self._getUnitRates(self._setup['matrix'][0],
+                                               elementsList)
+        table = numpy.zeros((len(self._groups), pow(npoints, nComponents)),
+                            numpy.float64)
+        materialName = "FastMatrixCorrectionMaterial"
+        oldMaterial = Elements.Material.get(materialName, None)
+        try:
+            for node, index in enumerate(numpy.ndindex(*([npoints] * \
+                                                         nComponents))):
+                compoundList, compoundFraction = \
+                              self._getCompoundList(self._axis[list(index)])
+                Elements.Material[materialName] = \
+                    {"Density": self._setup['matrix'][1],
+                     "Thickness": self._setup['matrix'][2],
+                     "CompoundList": compoundList,
+                     "CompoundFraction": compoundFraction,
+                     "Comment": "Fast matrix correction composition"}
+                table[:, node] = self._getUnitRates(materialName,
+                                                    elementsList)
+        finally:
+            if oldMaterial is None:
+                del Elements.Material[materialName]
+            else:
+                Elements.Material[materialName] = oldMaterial
+        self._table = table
+        self._inverseTable = numpy.zeros(table.shape, numpy.float64)
+        self._inverseTable[table > 0] = 1.0 / table[table > 0]
+        if DEBUG:
+            print("Fluorescence table built on %d compositions" % \
+                  table.shape[1])
+        return table
+
+    def getFluorescenceRates(self, compositions):
+        """
+        Multilinear interpolation of the tabulated rates.
+
+        :param compositions: Array (nComponents, nPixels) with the fraction of
+                             each sample component at each pixel
+        :return: Array (nGroups, nPixels) of rates at unit concentration
+        """
+        if self._table is None:
+            raise ValueError("Fluorescence table not built")
+        compositions = numpy.array(compositions, dtype=numpy.float64,
+                                   copy=False)
+        nComponents, nPixels = compositions.shape
+        npoints = self._axis.size
+        compositions = numpy.clip(compositions, 0.0, 1.0)
+        lower = numpy.clip(numpy.searchsorted(self._axis, compositions,
+                                              side="right") - 1,
+                           0, npoints - 2)
+        t = (compositions - self._axis[lower]) / \
+            (self._axis[lower + 1] - self._axis[lower])
+        inverseRates = numpy.zeros((self._table.shape[0], nPixels),
+                                   numpy.float64)
+        strides = [pow(npoints, nComponents - 1 - i) \
+                   for i in range(nComponents)]
+        for corner in numpy.ndindex(*([2] * nComponents)):
+            weight = numpy.ones((nPixels,), numpy.float64)
+            node = numpy.zeros((nPixels,), numpy.int64)
+            for i in range(nComponents):
+                if corner[i]:
+                    weight *= t[i]
+                else:
+                    weight *= 1.0 - t[i]
+                node += (lower[i] + corner[i]) * strides[i]
+            inverseRates += self._inverseTable[:, node] * weight
+        rates = numpy.zeros(inverseRates.shape, numpy.float64)
+        rates[inverseRates > 0] = 1.0 / inverseRates[inverseRates > 0]
+        return rates
+
+    def getCompositions(self, massFractions):
+        """
+        Fractions of the sample components corresponding to the
+        mass fractions of the iterated groups.
+
+        :param massFractions: Array (nGroups, nPixels)
+        :return: Array (nComponents, nPixels)
+        """
+        fractions = numpy.array([item[2] for item in self._components])
+        compositions = massFractions[self._componentIndices] / \
+                       fractions[:, None]
+        compositions[compositions < 0.0] = 0.0
+        total = compositions.sum(axis=0)
+        if self._completer is None:
+            scale = numpy.zeros(total.shape, numpy.float64)
+            scale[total > 0] = 1.0 / total[total > 0]
+        else:
+            scale = numpy.ones(total.shape, numpy.float64)
+            scale[total > 1.0] = 1.0 / total[total > 1.0]
+        compositions *= scale
+        return compositions
+
+    def getElementMassFractions(self, element, compositions):
+        """
+        Mass fraction of an element in the sample described by the given
+        fractions of the sample components.
+
+        :param element: Element symbol
+        :param compositions: Array (nComponents, nPixels) as returned by
+                             getCompositions
+        :return: Array (nPixels,)
+        """
+        compositions = numpy.array(compositions, dtype=numpy.float64,
+                                   copy=False)
+        fractions = numpy.array([Elements.getMaterialMassFractions( \
+                                    [item[1]], [1.0]).get(element, 0.0) \
+                                 for item in self._components])
+        result = (fractions[:, None] * compositions).sum(axis=0)
+        total = compositions.sum(axis=0)
+        if self._completer is None:
+            # the original matrix is used when there is nothing to normalize
+            matrixFraction = Elements.getMaterialMassFractions( \
+                        [self._setup['matrix'][0]], [1.0]).get(element, 0.0)
+            result[total <= 0.0] = matrixFraction
+        else:
+            completerFraction = Elements.getMaterialMassFractions( \
+                        [self._completer], [1.0]).get(element, 0.0)
+            result += completerFraction * numpy.clip(1.0 - total, 0.0, 1.0)
+        return result
+
+    def correctConcentrations(self, areas, fluxSolidAngle=None,
+                              iterations=None, fulloutput=False,
+                              referenceGroup=None):
+        """
+        Iterate the sample composition of all pixels simultaneously.
+
+        :param areas: Array (nGroups, ...) with the fitted areas of the groups
+                      in the same order as given to buildTable
+        :param fluxSolidAngle: Product of flux, time and solid angle. Either a
+                               scalar or an array with one value per pixel
+        :param iterations: Number of iterations. Default is the number of
+                           iterations of the SingleLayerStrategy
+        :param referenceGroup: Group of the internal standard ("Fe K", ...).
+                               If given, the flux is obtained at each pixel
+                               and iteration from the area of that group and
+                               from the mass fraction of its element in the
+                               current sample composition, and fluxSolidAngle
+                               is not used.
+        :return: Array with the same shape as areas with the mass fractions.
+                 If fulloutput is True, the compositions are also returned.
+        """
+        if self._table is None:
+            raise ValueError("Fluorescence table not built")
+        if iterations is None:
+            iterations = self._config["SingleLayerStrategy"].get("iterations",
+                                                                 3)
+        areas = numpy.array(areas, dtype=numpy.float64, copy=False)
+        shape = areas.shape
+        areas = areas.reshape(shape[0], -1)
+        if shape[0] != len(self._groups):
+            raise ValueError("Expected areas of %d groups, got %d" % \
+                             (len(self._groups), shape[0]))
+        if referenceGroup is None:
+            if fluxSolidAngle is None:
+                raise ValueError("Either flux or reference group needed")
+            fluxSolidAngle = numpy.array(fluxSolidAngle, dtype=numpy.float64,
+                                         copy=False).reshape(-1)
+        else:
+            if referenceGroup not in self._groups:
+                raise ValueError("Reference group %s not among the groups" % \
+                                 referenceGroup)
+            referenceIndex = self._groups.index(referenceGroup)
+            referenceElement = referenceGroup.split()[0]
+            matrixFraction = Elements.getMaterialMassFractions( \
+                                [self._setup['matrix'][0]],
+                                [1.0]).get(referenceElement, 0.0)
+            if matrixFraction <= 0.0:
+                raise ValueError("Element %s not among matrix elements" % \
+                                 referenceElement)
+        unitRates = self._matrixRates[:, None] * numpy.ones((1,
+                                                            areas.shape[1]))
+        compositions = None
+        for i in range(iterations + 1):
+            if referenceGroup is not None:
+                # internal standard in the current sample composition
+                if compositions is None:
+                    referenceFraction = matrixFraction
+                else:
+                    referenceFraction = self.getElementMassFractions( \
+                                                referenceElement,
+                                                compositions)
+                fluxSolidAngle = self._divide(areas[referenceIndex],
+                                    unitRates[referenceIndex] * \
+                                    referenceFraction)
+            massFractions = self._divide(areas,
+                                         unitRates * fluxSolidAngle[None, :])
+            if i == iterations:
+                break
+            compositions = self.getCompositions(massFractions)
+            unitRates = self.getFluorescenceRates(compositions)
+            if DEBUG:
+                print("Iteration %d done" % i)
+        massFractions.shape = shape
+        if fulloutput:
+            if compositions is None:
+                compositions = self.getCompositions(massFractions.reshape( \
+                                                        shape[0], -1))
+            compositions.shape = [len(self._components)] + list(shape[1:])
+            return massFractions, compositions
+        return massFractions
+
+    def _divide(self, areas, rates):
+        result = numpy.zeros(areas.shape, numpy.float64)
+        if rates.shape != areas.shape:
+            rates = rates * numpy.ones(areas.shape)
+        goodIndex = rates > 0.0
+        result[goodIndex] = areas[goodIndex] / rates[goodIndex]
+        return result
@@ -39,6 +39,7 @@
 from . import ClassMcaTheory
 from PyMca5.PyMcaMath.fitting import Gefit
 from . import ConcentrationsTool
+from . import FastMatrixCorrection
 from PyMca5.PyMcaMath.fitting import SpecfitFuns
 from PyMca5.PyMcaIO import ConfigDict
 import time
@@ -603,6 +604,15 @@ def fitMultipleSpectra(self, x=None, y=None, xmin=None, xmax=None,
                                 ((referenceArea/fitresult['result'][group]['fitarea']) *\
                                 (concentrationsResult[layer]['mass fraction'][group]))
                             counter += 1
+            if config['fit'].get("strategyflag", False) and \
+               (len(concentrationsResult['layerlist']) < 2):
+                if DEBUG:
+                    print("Applying matrix correction to every pixel")
+                self._applyMatrixCorrection(config,
+                                    fitresult,
+                                    results[nFreeBackgroundParameters:],
+                                    massFractions,
+                                    addInfo)
             outputDict['concentrations'] = massFractions
             if DEBUG:
                 t = time.time() - t0
@@ -611,6 +621,61 @@ def fitMultipleSpectra(self, x=None, y=None, xmin=None, xmax=None,
             ####################################################
         return outputDict
 
+    def _applyMatrixCorrection(self, config, fitresult, areas,
+                               massFractions, addInfo):
+        """
+        Replace the concentrations calculated with the configured matrix by
+        the ones obtained iterating the matrix composition at each pixel.
+        """
+        strategy = config['fit'].get("strategy", "SingleLayerStrategy")
+        if strategy != "SingleLayerStrategy":
+            # keep the concentrations obtained with the configured matrix
+            if DEBUG:
+                print("Strategy <%s> not applied pixel by pixel" % strategy)
+            return massFractions
+        if config['concentrations'].get('usemultilayersecondary', 0) or \
+           config['concentrations'].get('usexrfmc', 0):
+            # the secondary excitation correction factors were calculated
+            # for the configured matrix and not for the composition of
+            # each pixel
+            if DEBUG:
+                print("Matrix correction not applied pixel by pixel " + \
+                      "when using secondary excitation corrections")
+            return massFractions
+        groups = []
+        indices = []
+        for i, group in enumerate(fitresult['result']['groups']):
+            if group.lower().startswith("scatter"):
+                continue
+            groups.append(group)
+            indices.append(i)
+        corrector = FastMatrixCorrection.FastMatrixCorrection(config)
+        if corrector.getNumberOfCompositions() > corrector.MAX_NODES:
+            # the table grows exponentially with the number of components
+            print("WARNING: Too many sample components to apply the " + \
+                  "matrix correction pixel by pixel. Using the " + \
+                  "configured matrix.")
+            return massFractions
+        corrector.buildTable(groups)
+        if corrector.getGroups() != groups:
+            raise ValueError("Matrix correction requires element groups")
+        referenceElement = addInfo['ReferenceElement']
+        if referenceElement in ["", None, "None"]:
+            correctedFractions = corrector.correctConcentrations( \
+                                    areas[indices],
+                                    addInfo['I0'] * addInfo['SolidAngle'])
+        else:
+            # the flux is obtained pixel by pixel from the reference area
+            # and the current composition of the pixel
+            referenceGroup = referenceElement + " " + \
+                             addInfo['ReferenceTransitions'].split()[0]
+            correctedFractions = corrector.correctConcentrations( \
+                                    areas[indices],
+                                    referenceGroup=referenceGroup)
+        for counter in range(len(groups)):
+            massFractions[counter] = correctedFractions[counter]
+        return massFractions
+
 def getFileListFromPattern(pattern, begin, end, increment=None):
     if type(begin) == type(1):
         begin = [begin]
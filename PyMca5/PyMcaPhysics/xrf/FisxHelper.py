@@ -32,7 +32,9 @@
 __copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
 import os
 import sys
+import copy
 import time
+import multiprocessing
 from fisx import DataDir
 from fisx import Elements as FisxElements
 from fisx import Material
@@ -41,6 +43,10 @@
 xcom = None
 DEBUG = 0
 
+# maximum number of correction factors kept in the cache
+CACHE_SIZE = 256
+_CACHE = {}
+
 def getElementsInstance(dataDir=None, bindingEnergies=None, xcomFile=None):
     if dataDir is None:
         dataDir = DataDir.FISX_DATA_DIR
@@ -608,18 +614,137 @@ def getMultilayerFluorescenceFromFitConfiguration(fitConfiguration,
 def getFisxCorrectionFactorsFromFitConfiguration(fitConfiguration,
                                                  elementsFromMatrix=False,
                                                  secondaryCalculationLimit=None):
-    return _fisxFromFitConfigurationAction(fitConfiguration,
+    key = _getCacheKey(fitConfiguration, None, elementsFromMatrix,
+                       secondaryCalculationLimit)
+    if key not in _CACHE:
+        result = _fisxFromFitConfigurationAction(fitConfiguration,
                                         action="correction",
                                         elementsFromMatrix=elementsFromMatrix,
                                         secondaryCalculationLimit= \
                                            secondaryCalculationLimit)
+        _storeInCache(key, result)
+    return copy.deepcopy(_CACHE[key])
 
-def _fisxFromFitConfigurationAction(fitConfiguration,
-                                    action=None,
-                                    elementsFromMatrix=False, \
-                                    secondaryCalculationLimit=None):
-    if action is None:
-        raise ValueError("Please specify action")
+def getFisxCorrectionFactorsFromFitConfigurationList(fitConfiguration,
+                                                 sampleList,
+                                                 elementsFromMatrix=False,
+                                                 secondaryCalculationLimit=None,
+                                                 nProcesses=None):
+    """
+    Calculate the correction factors of several samples measured with the
+    beam, geometry, attenuators and detector of a fit configuration.
+
+    :param fitConfiguration: PyMca fit configuration
+    :param sampleList: List of samples. Each sample is either a list of
+                       layers [[material, density, thickness], ...] or a
+                       dictionary with that list as "multilayer" and,
+                       optionally, material definitions replacing those of
+                       the configuration as "materials".
+    :param nProcesses: Number of worker processes. The default is the number
+                       of CPUs. Use 1 to calculate in the calling process.
+    :return: List with the correction factors of each sample in the format
+             of getFisxCorrectionFactorsFromFitConfiguration
+    """
+    keyList = [_getCacheKey(fitConfiguration, sample, elementsFromMatrix,
+                            secondaryCalculationLimit) \
+               for sample in sampleList]
+    pending = []
+    pendingKeys = set()
+    for i in range(len(sampleList)):
+        if (keyList[i] not in _CACHE) and (keyList[i] not in pendingKeys):
+            pending.append(i)
+            pendingKeys.add(keyList[i])
+    if len(pending):
+        if nProcesses is None:
+            nProcesses = multiprocessing.cpu_count()
+        nProcesses = max(1, min(nProcesses, len(pending)))
+        # one chunk of samples per worker
+        chunks = [[sampleList[i] for i in pending[n::nProcesses]] \
+                  for n in range(nProcesses)]
+        tasks = [(fitConfiguration, chunk, elementsFromMatrix,
+                  secondaryCalculationLimit) for chunk in chunks]
+        if nProcesses == 1:
+            results = [_getCorrectionFactorsForSampleList(tasks[0])]
+        else:
+            pool = multiprocessing.Pool(nProcesses)
+            try:
+                results = pool.map(_getCorrectionFactorsForSampleList, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        for n in range(nProcesses):
+            for i, result in zip(pending[n::nProcesses], results[n]):
+                _storeInCache(keyList[i], result)
+    return [copy.deepcopy(_CACHE[key]) for key in keyList]
+
+def _getCorrectionFactorsForSampleList(task):
+    fitConfiguration, sampleList, elementsFromMatrix, \
+                      secondaryCalculationLimit = task
+    setup = _getFisxSetup(fitConfiguration, secondaryCalculationLimit)
+    fisxMaterials = setup["materials"]
+    resultList = []
+    for sample in sampleList:
+        setup["materials"] = fisxMaterials
+        if hasattr(sample, "keys"):
+            multilayerSample = sample["multilayer"]
+            if "materials" in sample:
+                configuration = copy.copy(fitConfiguration)
+                configuration["materials"] = \
+                            copy.copy(fitConfiguration.get("materials", {}))
+                configuration["materials"].update(sample["materials"])
+                setup["materials"] = _getFisxMaterials(configuration)
+        else:
+            multilayerSample = sample
+        resultList.append(_fisxFromSetupAction(setup,
+                                        action="correction",
+                                        elementsFromMatrix=elementsFromMatrix,
+                                        multilayerSample=multilayerSample))
+    return resultList
+
+def _getCacheKey(fitConfiguration, sample, elementsFromMatrix,
+                 secondaryCalculationLimit):
+    """
+    Hashable description of the input of a correction factors calculation.
+    """
+    fitSection = fitConfiguration["fit"]
+    item = [[fitSection.get(key, None) for key in ["energy", "energyflag",
+                                                   "energyweight",
+                                                   "energyscatter",
+                                                   "escapeflag"]],
+            [fitConfiguration.get(key, None) for key in ["attenuators",
+                                                         "materials",
+                                                         "multilayer",
+                                                         "peaks",
+                                                         "detector",
+                                                         "concentrations"]],
+            sample, elementsFromMatrix, secondaryCalculationLimit]
+    return _getHashable(item)
+
+def _getHashable(item):
+    if hasattr(item, "keys"):
+        return tuple([(key, _getHashable(item[key])) \
+                      for key in sorted(item.keys())])
+    if isinstance(item, (list, tuple)):
+        return tuple([_getHashable(x) for x in item])
+    if hasattr(item, "tolist"):
+        return _getHashable(item.tolist())
+    return item
+
+def _storeInCache(key, result):
+    if len(_CACHE) >= CACHE_SIZE:
+        _CACHE.clear()
+    _CACHE[key] = result
+
+def clearCache():
+    """
+    Forget the calculated correction factors
+    """
+    _CACHE.clear()
+
+def _getFisxSetup(fitConfiguration, secondaryCalculationLimit=None):
+    """
+    Parse the fit configuration into the arguments needed by fisx.
+    """
     if secondaryCalculationLimit is None:
         secondaryCalculationLimit = \
             _getSecondaryCalculationLimitFromFitConfiguration(fitConfiguration)
@@ -627,68 +752,77 @@ def _fisxFromFitConfigurationAction(fitConfiguration,
     # that has been already made when configuring the fit. However, this is
     # currently the simplest implementation that can work as standalone given
     # the fit configuration
+    setup = {}
+    setup["secondaryCalculationLimit"] = secondaryCalculationLimit
 
     # the fisx materials list
-    fisxMaterials = _getFisxMaterials(fitConfiguration)
+    setup["materials"] = _getFisxMaterials(fitConfiguration)
 
     # extract beam parameters
-    energyList, weightList, characteristicList = _getBeam(fitConfiguration)
+    setup["energyList"], setup["weightList"], setup["characteristicList"] = \
+                                                _getBeam(fitConfiguration)
 
     # extract beamFilters, matrix, geometry, attenuators and detector
-    filterList, multilayerSample, attenuatorList, detector, alphaIn, alphaOut \
+    setup["filterList"], setup["multilayerSample"], setup["attenuatorList"], \
+        detector, setup["alphaIn"], setup["alphaOut"] \
                 = _getFiltersMatrixAttenuatorsDetectorGeometry(fitConfiguration)
 
     # The elements and families to be considered
-    elementsList = _getPeakList(fitConfiguration)
+    setup["elementsList"] = _getPeakList(fitConfiguration)
 
     # The detection setup
-    detectorInstance = _getFisxDetector(fitConfiguration, detector)
+    setup["detector"] = _getFisxDetector(fitConfiguration, detector)
 
     try:
-        secondary = fitConfiguration["concentrations"]["usemultilayersecondary"]
+        setup["secondary"] = \
+                fitConfiguration["concentrations"]["usemultilayersecondary"]
     except:
         print("Exception. Forcing tertiary")
-        secondary = 2
+        setup["secondary"] = 2
+    return setup
+
+def _fisxFromFitConfigurationAction(fitConfiguration,
+                                    action=None,
+                                    elementsFromMatrix=False, \
+                                    secondaryCalculationLimit=None):
+    if action is None:
+        raise ValueError("Please specify action")
+    setup = _getFisxSetup(fitConfiguration, secondaryCalculationLimit)
+    return _fisxFromSetupAction(setup,
+                                action=action,
+                                elementsFromMatrix=elementsFromMatrix)
 
+def _fisxFromSetupAction(setup, action=None, elementsFromMatrix=False,
+                         multilayerSample=None):
+    if action is None:
+        raise ValueError("Please specify action")
+    if multilayerSample is None:
+        multilayerSample = setup["multilayerSample"]
+    secondary = setup["secondary"]
     if action.upper() == "FLUORESCENCE":
-        return getMultilayerFluorescence(multilayerSample,
-                                      energyList,
-                                      weightList = weightList,
-                                      flagList = characteristicList,
-                                      fulloutput = None,
-                                      beamFilters = filterList,
-                                      elementsList = elementsList,
-                                      attenuatorList = attenuatorList,
-                                      alphaIn = alphaIn,
-                                      alphaOut = alphaOut,
-                                      cascade = None,
-                                      detector = detectorInstance,
-                                      elementsFromMatrix=elementsFromMatrix,
-                                      secondary=secondary,
-                                      materials=fisxMaterials,
-                                      secondaryCalculationLimit= \
-                                          secondaryCalculationLimit)
+        function = getMultilayerFluorescence
     else:
         if secondary == 0:
             # otherways it is meaning less to call the function
-            secondary = 2            
-        return getFisxCorrectionFactors(multilayerSample,
-                                      energyList,
-                                      weightList = weightList,
-                                      flagList = characteristicList,
-                                      fulloutput = None,
-                                      beamFilters = filterList,
-                                      elementsList = elementsList,
-                                      attenuatorList = attenuatorList,
-                                      alphaIn = alphaIn,
-                                      alphaOut = alphaOut,
-                                      cascade = None,
-                                      detector = detectorInstance,
-                                      elementsFromMatrix=elementsFromMatrix,
-                                      secondary=secondary,
-                                      materials=fisxMaterials,
-                                      secondaryCalculationLimit= \
-                                          secondaryCalculationLimit)
+            secondary = 2
+        function = getFisxCorrectionFactors
+    return function(multilayerSample,
+                    setup["energyList"],
+                    weightList = setup["weightList"],
+                    flagList = setup["characteristicList"],
+                    fulloutput = None,
+                    beamFilters = setup["filterList"],
+                    elementsList = setup["elementsList"],
+                    attenuatorList = setup["attenuatorList"],
+                    alphaIn = setup["alphaIn"],
+                    alphaOut = setup["alphaOut"],
+                    cascade = None,
+                    detector = setup["detector"],
+                    elementsFromMatrix=elementsFromMatrix,
+                    secondary=secondary,
+                    materials=setup["materials"],
+                    secondaryCalculationLimit= \
+                        setup["secondaryCalculationLimit"])
 
 def getFisxCorrectionFactors(*var, **kw):
     expectedFluorescence = getMultilayerFluorescence(*var, **kw)
@@ -42,9 +42,11 @@
 from PyMca5.PyMcaIO import EDFStack
 from PyMca5.PyMcaIO import LispixMap
 from PyMca5.PyMcaIO import NumpyStack
+from PyMca5.PyMcaIO import FitImageSink
 try:
     import h5py
     from PyMca5.PyMcaIO import HDF5Stack1D
+    from PyMca5.PyMcaIO import FitResultStore
     HDF5SUPPORT = True
 except ImportError:
     HDF5SUPPORT = False
@@ -59,7 +61,8 @@ def __init__(self,initdict,filelist=None,outputdir=None,
                     concentrations=0, fitfiles=1, fitimages=1,
                     filebeginoffset = 0, fileendoffset=0,
                     mcaoffset=0, chunk = None,
-                    selection=None, lock=None, nosave=None):
+                    selection=None, lock=None, nosave=None,
+                    fitstore=0, hdf5images=0, warmstart=0):
         #for the time being the concentrations are bound to the .fit files
         #that is not necessary, but it will be correctly implemented in
         #future releases
@@ -69,6 +72,22 @@ def __init__(self,initdict,filelist=None,outputdir=None,
         else:
             self._nosave = False
         self.fitFiles = fitfiles
+        # store all the fit results in a single HDF5 file
+        if fitstore and (not HDF5SUPPORT):
+            raise ImportError("h5py is needed to store the fit results")
+        self.fitStore = fitstore
+        self._fitStore = None
+        # write the images to an HDF5 file too
+        if hdf5images and (not HDF5SUPPORT):
+            raise ImportError("h5py is needed to write HDF5 images")
+        self.hdf5Images = hdf5images
+        self._imageSink = None
+        # starting values of the fit parameters
+        # 0 - estimated from each spectrum
+        # 1 - fitted parameters of the previous spectrum
+        # 2 - fitted parameters of the mean spectrum of a stack
+        self.warmStart = warmstart
+        self._startingParameters = None
         self._concentrations = concentrations
         if type(initdict) == type([]):
             self.mcafit = ClassMcaTheory.McaTheory(initdict[mcaoffset])
@@ -164,6 +183,7 @@ def setOutputDir(self,outputdir=None):
 
     def processList(self):
         self.counter =  0
+        self._startingParameters = None
         self.__row   = self.fileBeginOffset - 1
         self.__stack = None
         for i in range(0+self.fileBeginOffset,
@@ -203,6 +223,12 @@ def processList(self):
                     self.listfile.close()
             if (self.__ncols is not None) and (not self._nosave):
                 if self.__ncols:self.saveImage()
+        if self._imageSink is not None:
+            self._imageSink.close()
+            self._imageSink = None
+        if self._fitStore is not None:
+            self._fitStore.close()
+            self._fitStore = None
         self.onEnd()
 
     def getFileHandle(self,inputfile):
@@ -325,6 +351,9 @@ def __processStack(self):
         for i in range(nimages):
             keylist[i] = "1.%04d" % i
 
+        if (self.warmStart == 2) and (not self.roiFit):
+            self.__fitMeanSpectrum(stack, xStack)
+
         for i in range(nimages):
             if self.pleaseBreak: break
             self.onImage(keylist[i], keylist)
@@ -366,6 +395,50 @@ def __processStack(self):
                                             key=key,
                                             info=infoDict)
 
+    def __fitMeanSpectrum(self, stack, xStack=None):
+        """
+        Fit the mean spectrum of the stack to provide the starting values
+        of the fit parameters of all the spectra.
+        """
+        self._startingParameters = None
+        if self.mcafit.config['fit'].get("strategyflag", False):
+            return
+        info = stack.info
+        data = stack.data
+        y0 = None
+        for i in range(info['Dim_1']):
+            if self.pleaseBreak: return
+            try:
+                block = data[i, self.mcaOffset::self.mcaStep, :]
+            except:
+                print("Error reading dataset row %d" % i)
+                continue
+            if y0 is None:
+                y0 = numpy.zeros((block.shape[-1],), numpy.float64)
+                n = 0
+            y0 += numpy.sum(block, axis=0, dtype=numpy.float64)
+            n += block.shape[0]
+        if y0 is None:
+            return
+        y0 /= n
+        if xStack is None:
+            if 'MCA start ch' in info:
+                xmin = float(info['MCA start ch'])
+            else:
+                xmin = 0.0
+            x = numpy.arange(len(y0))*1.0 + xmin
+        else:
+            x = xStack
+        try:
+            self.mcafit.config['fit']['use_limit'] = 1
+            self.mcafit.setData(x, y0)
+            self.mcafit.estimate()
+            self.mcafit.startfit(digest=0)
+            self._startingParameters = list(self.mcafit.fittedpar)
+        except:
+            print("Error fitting the mean spectrum: %s" % sys.exc_info()[1])
+            print("Starting values estimated from each spectrum")
+
     def __processOneFile(self):
         ffile=self.file
         fileinfo = ffile.GetSourceInfo()
@@ -484,6 +557,21 @@ def __getFitFile(self, filename, key):
         outfile = self.os_path_join(fitdir,  outfile)
         return outfile
 
+    def __getFitStore(self):
+        if self._fitStore is None:
+            if self.chunk is not None:
+                extension = "_%06d_partial_fitresults.h5" % self.chunk
+            else:
+                extension = "_fitresults.h5"
+            name = self.os_path_join(self._outputdir,
+                                     self._rootname + extension)
+            if self.useExistingFiles:
+                mode = "a"
+            else:
+                mode = "w"
+            self._fitStore = FitResultStore.FitResultStore(name, mode=mode)
+        return self._fitStore
+
     def os_path_join(self, a, b):
         try:
             outfile=os.path.join(a, b)
@@ -505,12 +593,55 @@ def os_path_join(self, a, b):
                                            a.decode('latin-1'))
         return outfile
 
+    def __fitOneMca(self, parameters=None):
+        """
+        Fit the data already set to mcafit.
+
+        :param parameters: starting values of the fit parameters, None to
+                           estimate them from the data
+        """
+        result = None
+        concentrationsdone = 0
+        concentrations = None
+        self.mcafit.estimate(parameters=parameters)
+        if self.fitFiles:
+            fitresult, result = self.mcafit.startfit(digest=1)
+        elif self._concentrations and (self.mcafit._fluoRates is None):
+            fitresult, result = self.mcafit.startfit(digest=1)
+        elif self._concentrations:
+            fitresult = self.mcafit.startfit(digest=0)
+            try:
+                fitresult0 = {}
+                fitresult0['fitresult'] = fitresult
+                fitresult0['result'] = self.mcafit.imagingDigestResult()
+                fitresult0['result']['config'] = self.mcafit.config
+                conf = self.mcafit.configure()
+                tconf = self._tool.configure()
+                if 'concentrations' in conf:
+                    tconf.update(conf['concentrations'])
+                else:
+                    #what to do?
+                    pass
+                concentrations = self._tool.processFitResult(config=tconf,
+                                fitresult=fitresult0,
+                                elementsfrommatrix=False,
+                                fluorates = self.mcafit._fluoRates)
+            except:
+                print("error in concentrations")
+                print(sys.exc_info()[0:-1])
+            concentrationsdone = True
+        else:
+            #just images
+            fitresult = self.mcafit.startfit(digest=0)
+        return fitresult, result, concentrations, concentrationsdone
+
     def __processOneMca(self,x,y,filename,key,info=None):
         self._concentrationsAsAscii = ""
         if not self.roiFit:
             result = None
             concentrationsdone = 0
             concentrations = None
+            storedResult = 0
             outfile=self.os_path_join(self._outputdir, filename)
             fitfile = self.__getFitFile(filename,key)
             if self.chunk is not None:
@@ -541,6 +672,15 @@ def __processOneMca(self,x,y,filename,key,info=None):
                     print("Please, consider deleting it.")
                     print(sys.exc_info())
                     return
+            elif self.useExistingFiles and self.fitStore and \
+                 ((filename, key) in self.__getFitStore()):
+                useExistingResult = 1
+                storedResult = 1
+                result, concentrations = \
+                        self.__getFitStore().getResult(filename, key)
+                result['config'] = self.mcafit.configure()
+                if concentrations is not None:
+                    concentrationsdone = 1
             else:
                 useExistingResult = 0
                 try:
@@ -558,36 +698,26 @@ def __processOneMca(self,x,y,filename,key,info=None):
                         self.mcafit.enableOptimizedLinearFit()
                     return
                 try:
-                    self.mcafit.estimate()
-                    if self.fitFiles:
-                        fitresult, result = self.mcafit.startfit(digest=1)
-                    elif self._concentrations and (self.mcafit._fluoRates is None):
-                        fitresult, result = self.mcafit.startfit(digest=1)
-                    elif self._concentrations:
-                        fitresult = self.mcafit.startfit(digest=0)
+                    startingParameters = self._startingParameters
+                    if self.mcafit.config['fit'].get("strategyflag", False):
+                        startingParameters = None
+                    fitOutput = None
+                    if startingParameters is not None:
+                        # speculative fit starting from a similar spectrum
                         try:
-                            fitresult0 = {}
-                            fitresult0['fitresult'] = fitresult
-                            fitresult0['result'] = self.mcafit.imagingDigestResult()
-                            fitresult0['result']['config'] = self.mcafit.config
-                            conf = self.mcafit.configure()
-                            tconf = self._tool.configure()
-                            if 'concentrations' in conf:
-                                tconf.update(conf['concentrations'])
-                            else:
-                                #what to do?
-                                pass
-                            concentrations = self._tool.processFitResult(config=tconf,
-                                            fitresult=fitresult0,
-                                            elementsfrommatrix=False,
-                                            fluorates = self.mcafit._fluoRates)
+                            fitOutput = self.__fitOneMca(startingParameters)
+                            if fitOutput[0][3] >= self.mcafit.MAXITER:
+                                fitOutput = None
                         except:
-                            print("error in concentrations")
-                            print(sys.exc_info()[0:-1])
-                        concentrationsdone = True
-                    else:
-                        #just images
-                        fitresult = self.mcafit.startfit(digest=0)
+                            fitOutput = None
+                        if fitOutput is None:
+                            # start again from the estimated values
+                            self.mcafit.setData(x,y,
+                                        time=info.get("McaLiveTime", None))
+                    if fitOutput is None:
+                        fitOutput = self.__fitOneMca()
+                    fitresult, result, concentrations, concentrationsdone = \
+                               fitOutput
                 except:
                     print("Error fitting file with output = %s: %s)" %\
                           (filename, sys.exc_info()[1]))
@@ -597,6 +727,9 @@ def __processOneMca(self,x,y,filename,key,info=None):
                         self.mcafit = ClassMcaTheory.McaTheory(config)
                         self.mcafit.enableOptimizedLinearFit()
                     return
+                if (self.warmStart == 1) or \
+                   ((self.warmStart == 2) and (not self.__stack)):
+                    self._startingParameters = list(self.mcafit.fittedpar)
             if self._concentrations:
                 if concentrationsdone == 0:
                     if not ('concentrations' in result):
@@ -662,6 +795,15 @@ def __processOneMca(self,x,y,filename,key,info=None):
                 if not useExistingResult:
                     result = self.mcafit.digestresult(outfile=outfile,
                                                       info=info)
+                elif storedResult:
+                    # the store has no .fit file, write one from the stored
+                    # result (without the fitted spectrum curves)
+                    try:
+                        f=ConfigDict.ConfigDict({'result':result, 'info':info})
+                        f.write(outfile)
+                    except:
+                        print("Error writing stored result to fit file")
+                        print(sys.exc_info())
                 if concentrations is not None:
                     try:
                         f=ConfigDict.ConfigDict()
@@ -699,6 +841,21 @@ def __processOneMca(self,x,y,filename,key,info=None):
                         if result is None:
                             result = self.mcafit.imagingDigestResult()
 
+            if self.fitStore and (not useExistingResult):
+                storeResult = result
+                if 'parameters' not in result:
+                    storeResult = {}
+                    storeResult.update(result)
+                    storeResult['parameters'] = self.mcafit.PARAMETERS
+                    storeResult['fittedpar'] = self.mcafit.fittedpar
+                    storeResult['sigmapar'] = self.mcafit.sigmapar
+                try:
+                    self.__getFitStore().addResult(filename, key, storeResult,
+                                                   concentrations)
+                except:
+                    print("Error storing fit result of %s %s" % (filename, key))
+                    print(sys.exc_info()[1])
+
             #IMAGES
             if self.fitImages:
                 #this only works with EDF
@@ -719,21 +876,11 @@ def __processOneMca(self,x,y,filename,key,info=None):
                             self.imgDir = imgdir
 
                         self.__peaks  = []
-                        self.__images = {}
-                        self.__sigmas = {}
                         if not self.__stack:
                             self.__nrows   = len(range(0, len(self._filelist), self.fileStep))
                         for group in result['groups']:
                             self.__peaks.append(group)
-                            self.__images[group]= numpy.zeros((self.__nrows,
-                                                               self.__ncols),
-                                                               numpy.float)
-                            self.__sigmas[group]= numpy.zeros((self.__nrows,
-                                                               self.__ncols),
-                                                               numpy.float)
-                        self.__images['chisq']  = numpy.zeros((self.__nrows,
-                                                               self.__ncols),
-                                                               numpy.float) - 1.
+                        self.__concentrationsKeys = []
                         if self._concentrations:
                             layerlist = concentrations['layerlist']
                             if 'mmolar' in concentrations:
@@ -745,33 +892,30 @@ def __processOneMca(self,x,y,filename,key,info=None):
                             for group in concentrations['groups']:
                                 key = group+self.__conLabel
                                 self.__concentrationsKeys.append(key)
-                                self.__images[key] = numpy.zeros((self.__nrows,
-                                                                  self.__ncols),
-                                                                  numpy.float)
                                 if len(layerlist) > 1:
                                     for layer in layerlist:
                                         key = group+" "+layer
                                         self.__concentrationsKeys.append(key)
-                                        self.__images[key] = numpy.zeros((self.__nrows,
-                                                                    self.__ncols),
-                                                                    numpy.float)
+                        self._imageSink = self.__getImageSink()
+                # pixel values in the order of the image sink labels
+                values = []
                 for peak in self.__peaks:
-                    try:
-                        self.__images[peak][self.__row, self.__col] = result[peak]['fitarea']
-                        self.__sigmas[peak][self.__row, self.__col] = result[peak]['sigmaarea']
-                    except:
-                        pass
+                    if peak in result:
+                        values.append(result[peak]['fitarea'])
+                        values.append(result[peak]['sigmaarea'])
+                    else:
+                        values += [None, None]
+                values.append(result.get('chisq', None))
                 if self._concentrations:
                     layerlist = concentrations['layerlist']
                     for group in concentrations['groups']:
-                        self.__images[group+self.__conLabel][self.__row, self.__col] = \
-                                              concentrations[self.__conKey][group]
+                        values.append(concentrations[self.__conKey][group])
                         if len(layerlist) > 1:
                             for layer in layerlist:
-                                self.__images[group+" "+layer] [self.__row, self.__col] = \
-                                              concentrations[layer][self.__conKey][group]
+                                values.append(\
+                                    concentrations[layer][self.__conKey][group])
                 try:
-                    self.__images['chisq'][self.__row, self.__col] = result['chisq']
+                    self._imageSink.setPixel(self.__row, self.__col, values)
                 except:
                     print("Error on chisq row %d col %d" %\
                           (self.__row, self.__col))
@@ -825,98 +969,79 @@ def __processOneMca(self,x,y,filename,key,info=None):
         self.counter += 1
 
 
+    def __getImageSink(self, ffile=None):
+        """
+        Image writer receiving the fitted areas, their uncertainties,
+        the chi square and the concentrations pixel by pixel.
+        """
+        if self._nosave:
+            ffile = ""
+        elif ffile is None:
+            ffile = os.path.splitext(self._rootname)[0]
+            ffile = self.os_path_join(self.imgDir,ffile)
+        if (self.fileStep > 1) or (self.mcaStep > 1):
+            trailing = "_filestep_%02d_mcastep_%02d" % ( self.fileStep,
+                                                         self.mcaStep )
+        else:
+            trailing = ""
+        if self.chunk is None:
+            suffix = ".edf"
+        else:
+            suffix = "_%06d_partial.edf" % self.chunk
+        labels = []
+        fill = []
+        edffiles = []
+        titles = []
+        #speclabel = "#L row  column"
+        speclabel = "row  column"
+        for peak in self.__peaks:
+            a,b = peak.split()
+            speclabel +="  %s" % (a+"-"+b)
+            speclabel +="  s(%s)" % (a+"-"+b)
+            labels += [peak, "s(%s)" % peak]
+            fill += [0.0, 0.0]
+            edffiles += [ffile +"_"+a+"_"+b+trailing+suffix, None]
+            titles += [peak, None]
+        speclabel +="  %s" % 'chisq'
+        labels.append('chisq')
+        fill.append(-1.0)
+        edffiles.append(ffile +"_"+'chisq'+trailing+suffix)
+        titles.append('chisq')
+        for peak in self.__concentrationsKeys:
+            speclabel +="  %s" % peak.replace(" ","-")
+            labels.append(peak)
+            fill.append(0.0)
+            edffiles.append(ffile +"_"+peak.replace(" ","_")+trailing+suffix)
+            titles.append(peak)
+        shape = (self.__nrows, self.__ncols)
+        if self._nosave:
+            return FitImageSink.FitImageSink(shape, labels, fill=fill)
+        if self.chunk is None:
+            specname = ffile+trailing+".dat"
+            h5name = ffile+trailing+".h5"
+        else:
+            specname = ffile+trailing+"_%06d_partial.dat" % self.chunk
+            h5name = ffile+trailing+"_%06d_partial.h5" % self.chunk
+        if not self.hdf5Images:
+            h5name = None
+        return FitImageSink.FitImageSink(shape, labels, fill=fill,
+                                         edffiles=edffiles,
+                                         titles=titles,
+                                         textfile=specname,
+                                         textlabel=speclabel,
+                                         hdf5file=h5name)
+
     def saveImage(self,ffile=None):
         self.savedImages=[]
         if ffile is None:
             ffile = os.path.splitext(self._rootname)[0]
             ffile = self.os_path_join(self.imgDir,ffile)
         if not self.roiFit:
-            if (self.fileStep > 1) or (self.mcaStep > 1):
-                trailing = "_filestep_%02d_mcastep_%02d" % ( self.fileStep,
-                                                             self.mcaStep )
-            else:
-                trailing = ""
-            #speclabel = "#L row  column"
-            speclabel = "row  column"
-            if self.chunk is None:
-                suffix = ".edf"
-            else:
-                suffix = "_%06d_partial.edf" % self.chunk
-
-            iterationList = self.__peaks * 1
-            iterationList += ['chisq']
-            if self._concentrations:
-                iterationList += self.__concentrationsKeys
-            for peak in iterationList:
-                if peak in self.__peaks:
-                    a,b = peak.split()
-                    speclabel +="  %s" % (a+"-"+b)
-                    speclabel +="  s(%s)" % (a+"-"+b)
-                    edfname = ffile +"_"+a+"_"+b+trailing+suffix
-                elif peak in self.__concentrationsKeys:
-                    speclabel +="  %s" % peak.replace(" ","-")
-                    edfname = ffile +"_"+peak.replace(" ","_")+trailing+suffix
-                elif peak == 'chisq':
-                    speclabel +="  %s" % (peak)
-                    edfname = ffile +"_"+peak+trailing+suffix
-                else:
-                    print("Unhandled peak name: %s. Not saved." % peak)
-                    continue
-                dirname = os.path.dirname(edfname)
-                if not os.path.exists(dirname):
-                    try:
-                        os.mkdir(dirname)
-                    except:
-                        print("I could not create directory %s" % dirname)
-                Append = 0
-                if os.path.exists(edfname):
-                    try:
-                        os.remove(edfname)
-                    except:
-                        print("I cannot delete output file")
-                        print("trying to append image to the end")
-                        Append = 1
-                edfout   = EdfFile.EdfFile(edfname, access='ab')
-                edfout.WriteImage ({'Title':peak} , self.__images[peak], Append=Append)
-                edfout = None
-                self.savedImages.append(edfname)
-            #save specfile format
-            if self.chunk is None:
-                specname = ffile+trailing+".dat"
-            else:
-                specname = ffile+trailing+"_%06d_partial.dat" % self.chunk
-            if os.path.exists(specname):
-                try:
-                    os.remove(specname)
-                except:
-                    pass
-            specfile=open(specname,'w+')
-            #specfile.write('\n')
-            #specfile.write('#S 1  %s\n' % (file+trailing))
-            #specfile.write('#N %d\n' % (len(self.__peaks)+2))
-            specfile.write('%s\n' % speclabel)
-            specline=""
-            imageRows = self.__images['chisq'].shape[0]
-            imageColumns = self.__images['chisq'].shape[1]
-            for row in range(imageRows):
-                for col in range(imageColumns):
-                    specline += "%d" % row
-                    specline += "  %d" % col
-                    for peak in self.__peaks:
-                        #write area
-                        specline +="  %g" % self.__images[peak][row][col]
-                        #write sigma area
-                        specline +="  %g" % self.__sigmas[peak][row][col]
-                    #write global chisq
-                    specline +="  %g" % self.__images['chisq'][row][col]
-                    if self._concentrations:
-                        for peak in self.__concentrationsKeys:
-                            specline +="  %g" % self.__images[peak][row][col]
-                    specline += "\n"
-                    specfile.write("%s" % specline)
-                    specline =""
-            specfile.write("\n")
-            specfile.close()
+            # the fit images are written while fitting, just complete them
+            if self._imageSink is not None:
+                self.savedImages = self._imageSink.getEdfFileList()
+                self._imageSink.close()
+                self._imageSink = None
         else:
             for group in self.__ROIpeaks:
                 i = 0
@@ -945,12 +1070,16 @@ def saveImage(self,ffile=None):
 if __name__ == "__main__":
     import getopt
     options     = 'f'
-    longoptions = ['cfg=','pkm=','outdir=','roifit=','roi=','roiwidth=']
+    longoptions = ['cfg=','pkm=','outdir=','roifit=','roi=','roiwidth=',
+                   'fitstore=', 'hdf5images=', 'warmstart=']
     filelist = None
     outdir   = None
     cfg      = None
     roifit   = 0
     roiwidth = 250.
+    fitstore = 0
+    hdf5images = 0
+    warmstart = 0
     opts, args = getopt.getopt(
                     sys.argv[1:],
                     options,
@@ -964,10 +1093,18 @@ def saveImage(self,ffile=None):
             roifit   = int(arg)
         elif opt in ('--roiwidth'):
             roiwidth = float(arg)
+        elif opt in ('--fitstore'):
+            fitstore = int(arg)
+        elif opt in ('--hdf5images'):
+            hdf5images = int(arg)
+        elif opt in ('--warmstart'):
+            warmstart = int(arg)
     filelist=args
     if len(filelist) == 0:
         print("No input files, run GUI")
         sys.exit(0)
 
-    b = McaAdvancedFitBatch(cfg,filelist,outdir,roifit,roiwidth)
+    b = McaAdvancedFitBatch(cfg,filelist,outdir,roifit,roiwidth,
+                            fitstore=fitstore, hdf5images=hdf5images,
+                            warmstart=warmstart)
     b.processList()
@@ -36,12 +36,17 @@
 import subprocess
 import time
 import shutil
+import hashlib
+import json
 from PyMca5.PyMcaIO import ConfigDict
 from . import XMSOParser
 
 getXMSOFileFluorescenceInformation =\
                         XMSOParser.getXMSOFileFluorescenceInformation
 
+# maximum size in bytes of the correction factors cache directory
+CACHE_MAX_SIZE = 100 * 1024 * 1024
+
 XMIMSIM_PYMCA = None
 if sys.platform == "win32":
     try:
@@ -162,7 +167,10 @@ def getScriptFile(pathToExecutable=None, args=None, name=None):
             fullPath = name
             if not fullPath.endswith(".sh"):
                 fullPath = name + ".sh"
-            f = open(fullPath, "wb")
+            if sys.version < '3.0':
+                f = open(fullPath, "wb")
+            else:
+                f = open(fullPath, "w", newline='')
             f.write(txt)
             f.close()
         os.system("chmod +x %s"  % fullPath)
@@ -187,7 +195,10 @@ def getScriptFile(pathToExecutable=None, args=None, name=None):
             fullPath = name
             if not fullPath.endswith(".sh"):
                 fullPath = name + ".sh"
-            f = open(fullPath, "wb")
+            if sys.version < '3.0':
+                f = open(fullPath, "wb")
+            else:
+                f = open(fullPath, "w", newline='')
             f.write(txt)
             f.close()
         os.system("chmod +x %s"  % fullPath)
@@ -219,7 +230,140 @@ def getOutputFileNames(fitFile, outputDir=None):
     ddict['xmso'] = xmsoName
     return ddict
 
-def getXRFMCCorrectionFactors(fitConfiguration, xmimsim_pymca=None, verbose=False):
+def getDefaultCacheDirectory():
+    """
+    Return the default directory of the correction factors cache.
+
+    In case of error it returns None.
+    """
+    try:
+        import PyMca5
+        settingsDir = os.path.dirname(PyMca5.getDefaultSettingsFile())
+        return os.path.join(settingsDir, "cache", "xrfmc")
+    except:
+        print("WARNING: Cannot initialize XRFMC cache directory")
+        return None
+
+def _getCacheKey(fitFile, pathToExecutable=None):
+    """
+    The key of a simulation is given by the contents of its input file and
+    by the simulation program.
+    """
+    if pathToExecutable is None:
+        pathToExecutable = XMIMSIM_PYMCA
+    pathToExecutable = os.path.abspath(pathToExecutable)
+    stat = os.stat(pathToExecutable)
+    f = open(fitFile, "rb")
+    key = hashlib.sha1(f.read())
+    f.close()
+    key.update(("%s %d %d" % (pathToExecutable,
+                              stat.st_size,
+                              int(stat.st_mtime))).encode("utf-8"))
+    return key.hexdigest()
+
+def _readCacheEntry(cacheDirectory, key):
+    """
+    Return the cached correction factors or None if not available.
+    """
+    jsonName = os.path.join(cacheDirectory, key + ".json")
+    xmsoName = os.path.join(cacheDirectory, key + ".xmso")
+    corrections = None
+    if os.path.exists(jsonName):
+        try:
+            f = open(jsonName, "r")
+            corrections = json.load(f)
+            f.close()
+        except:
+            print("WARNING: Cannot read cached file %s" % jsonName)
+            corrections = None
+    if (corrections is None) and os.path.exists(xmsoName):
+        try:
+            corrections = getXMSOFileFluorescenceInformation(xmsoName)
+        except:
+            print("WARNING: Cannot read cached file %s" % xmsoName)
+            return None
+    if corrections is not None:
+        # mark the entry as recently used
+        for fname in [jsonName, xmsoName]:
+            if os.path.exists(fname):
+                os.utime(fname, None)
+    return corrections
+
+def _writeCacheEntry(cacheDirectory, key, xmsoName, corrections):
+    if not os.path.isdir(cacheDirectory):
+        os.makedirs(cacheDirectory)
+    # write to temporary files to be safe against concurrent runs
+    handle, tmpName = tempfile.mkstemp(suffix=".tmp", prefix=key,
+                                       dir=cacheDirectory)
+    os.close(handle)
+    shutil.copyfile(xmsoName, tmpName)
+    _replaceFile(tmpName, os.path.join(cacheDirectory, key + ".xmso"))
+    handle, tmpName = tempfile.mkstemp(suffix=".tmp", prefix=key,
+                                       dir=cacheDirectory)
+    os.close(handle)
+    f = open(tmpName, "w")
+    json.dump(corrections, f)
+    f.close()
+    _replaceFile(tmpName, os.path.join(cacheDirectory, key + ".json"))
+    pruneCache(cacheDirectory)
+
+def _replaceFile(source, destination):
+    if hasattr(os, "replace"):
+        os.replace(source, destination)
+    else:
+        if os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+def pruneCache(cacheDirectory=None, maxSize=None):
+    """
+    Remove the least recently used entries of the cache until its size
+    is below maxSize bytes (default CACHE_MAX_SIZE).
+    """
+    if cacheDirectory is None:
+        cacheDirectory = getDefaultCacheDirectory()
+    if maxSize is None:
+        maxSize = CACHE_MAX_SIZE
+    if (cacheDirectory is None) or (not os.path.isdir(cacheDirectory)):
+        return
+    entries = {}
+    for fname in os.listdir(cacheDirectory):
+        root, ext = os.path.splitext(fname)
+        if ext not in [".json", ".xmso"]:
+            continue
+        stat = os.stat(os.path.join(cacheDirectory, fname))
+        size, lastUse = entries.get(root, (0, 0))
+        entries[root] = (size + stat.st_size, max(lastUse, stat.st_mtime))
+    totalSize = sum([entry[0] for entry in entries.values()])
+    for key in sorted(entries.keys(), key=lambda x: entries[x][1]):
+        if totalSize <= maxSize:
+            break
+        for ext in [".json", ".xmso"]:
+            fname = os.path.join(cacheDirectory, key + ext)
+            if os.path.exists(fname):
+                os.remove(fname)
+        totalSize -= entries[key][0]
+
+def clearCache(cacheDirectory=None):
+    """
+    Remove all the cached correction factors.
+    """
+    pruneCache(cacheDirectory, maxSize=0)
+
+def getXRFMCCorrectionFactors(fitConfiguration, xmimsim_pymca=None, verbose=False,
+                              cache=True, cacheDirectory=None):
+    """
+    Run the Monte Carlo simulation of the fit configuration and return the
+    correction factors.
+
+    Unless cache is False, the results are kept in cacheDirectory (default
+    given by getDefaultCacheDirectory) and reused for identical simulation
+    inputs.
+    """
+    if cache and (cacheDirectory is None):
+        cacheDirectory = getDefaultCacheDirectory()
+    if cacheDirectory is None:
+        cache = False
     outputDir=tempfile.mkdtemp(prefix="pymcaTmp")
     if 'result' in fitConfiguration:
         # we have to create a .fit file with the information
@@ -262,6 +406,14 @@ def getXRFMCCorrectionFactors(fitConfiguration, xmimsim_pymca=None, verbose=Fals
     scriptFile = getScriptFile(pathToExecutable=xmimsim_pymca,
                                     name=fileNamesDict['script'])
     xmsoName = fileNamesDict['xmso']
+    if cache:
+        key = _getCacheKey(fitFile, xmimsim_pymca)
+        corrections = _readCacheEntry(cacheDirectory, key)
+        if corrections is not None:
+            if verbose:
+                print("Using cached simulation %s" % key)
+            removeDirectory(outputDir)
+            return corrections
     # basic parameters
     args = [scriptFile,
            "--enable-single-run",
@@ -309,6 +461,12 @@ def getXRFMCCorrectionFactors(fitConfiguration, xmimsim_pymca=None, verbose=Fals
             removeDirectory(outputDir)
         raise IOError("Program terminated with error code %d:\n%s" % (returnCode, text))
     corrections = getXMSOFileFluorescenceInformation(xmsoName)
+    if cache:
+        try:
+            _writeCacheEntry(cacheDirectory, key, xmsoName, corrections)
+        except:
+            print("WARNING: Cannot cache simulation results: %s" % \
+                  sys.exc_info()[1])
     xmsoName = None
     removeDirectory(outputDir)
     return corrections
@@ -31,9 +31,58 @@
 __license__ = "MIT"
 __copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
 from . import Elements
+import copy
+import functools
 import math
 import numpy
 
+# maximum number of results kept in the cache
+CACHE_SIZE = 64
+_CACHE = {}
+
+
+def _getCacheKey(item):
+    """
+    Hashable version of the arguments of a call. The definition of the
+    materials used as window or filters is part of the key.
+    """
+    if isinstance(item, numpy.ndarray):
+        return (item.dtype.str, item.shape, item.tobytes())
+    if isinstance(item, (list, tuple)):
+        return tuple([_getCacheKey(x) for x in item])
+    if isinstance(item, dict):
+        return tuple([_getCacheKey(x) for x in sorted(item.items())])
+    if (type(item) == type("")) and (item in Elements.Material):
+        return (item, repr(Elements.Material[item]))
+    return item
+
+
+def _cached(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kw):
+        key = (function.__name__, _getCacheKey(args), _getCacheKey(kw))
+        try:
+            result = _CACHE.get(key, None)
+        except TypeError:
+            # unhashable arguments
+            return function(*args, **kw)
+        if result is None:
+            result = function(*args, **kw)
+            if len(_CACHE) >= CACHE_SIZE:
+                _CACHE.clear()
+            _CACHE[key] = result
+        return copy.deepcopy(result)
+    return wrapper
+
+
+def clearCache():
+    """
+    Forget the calculated tube spectra
+    """
+    _CACHE.clear()
+
+
+@_cached
 def continuumEbel(target, e0, e=None, window=None,
                   alphae=None, alphax=None,
                   transmission=None, targetthickness=None,
@@ -140,12 +189,11 @@ def continuumEbel(target, e0, e=None, window=None,
 
     if not transmission:
         rhelp = tau * 2.0 * rhoz * sinfactor
-        if len(numpy.nonzero(rhelp <= 0.0)[0]):
+        if (rhelp <= 0.0).any():
             result = numpy.zeros(rhelp.shape, numpy.float)
-            for i in range(len(rhelp)):
-                if rhelp[i] > 0.0:
-                    result[i] = const * z * pow(u0[i] - 1.0, x) * \
-                         (1.0 - numpy.exp(-rhelp[i])) / rhelp[i]
+            i = rhelp > 0.0
+            result[i] = const * z * pow(u0[i] - 1.0, x) * \
+                        (1.0 - numpy.exp(-rhelp[i])) / rhelp[i]
         else:
             result = const * z * pow(u0 - 1.0, x) * \
                  (1.0 - numpy.exp(-rhelp)) / rhelp
@@ -180,13 +228,12 @@ def continuumEbel(target, e0, e=None, window=None,
         ttarget = targetthickness * density
     # generationdepth = min(ttarget, 2 * rhozmax)
     rhelp = tau * 2.0 * rhoz * sinfactor
-    if len(numpy.nonzero(rhelp <= 0.0)[0]):
+    if (rhelp <= 0.0).any():
         result = numpy.zeros(rhelp.shape, numpy.float)
-        for i in range(len(rhelp)):
-            if rhelp[i] > 0.0:
-                result[i] = const * z * pow(u0[i] - 1.0, x) * \
-                     (numpy.exp(-tau[i] *(ttarget - 2.0 * rhoz[i]) / sinalphax) - \
-                      numpy.exp(-tau[i] * ttarget / sinalphax)) / rhelp[i]
+        i = rhelp > 0.0
+        result[i] = const * z * pow(u0[i] - 1.0, x) * \
+                    (numpy.exp(-tau[i] *(ttarget - 2.0 * rhoz[i]) / sinalphax) - \
+                     numpy.exp(-tau[i] * ttarget / sinalphax)) / rhelp[i]
     else:
         result = const * z * pow(u0 - 1.0, x) * \
              (numpy.exp(-tau *(ttarget - 2.0 * rhoz) / sinalphax) - \
@@ -210,6 +257,7 @@ def continuumEbel(target, e0, e=None, window=None,
             result *= w
     return result
 
+@_cached
 def characteristicEbel(target, e0, window=None,
                        alphae=None, alphax=None,
                        transmission=None, targetthickness=None,
@@ -344,9 +392,7 @@ def characteristicEbel(target, e0, window=None,
     rhoz = rhozmax * (p1 / p2)
 
     # the term dealing with the photoelectric absorption
-    energylist = []
-    for i in range(len(fl)):
-        energylist.append(fl[i][0])
+    energylist = [line[0] for line in fl]
     tau = numpy.array(
         Elements.getMaterialMassAttenuationCoefficients(element, 1.0,
                                                         energylist)['photo'])
@@ -376,16 +422,15 @@ def characteristicEbel(target, e0, window=None,
                                                           density=fwindow[1],
                                                           thickness=fwindow[2],
                                                           listoutput=False)['transmission']
+        i = rhelp > 0.0
+        rhelp[i] = (1.0 - numpy.exp(-rhelp[i])) / rhelp[i]
+        rhelp[~i] = 0.0
+        intensity = const * oneovers * r * Elements.getomegak(element) * rhelp
+        #the term dealing with absorption in tube's window
+        if w is not None:
+            intensity = intensity * w
         for i in range(len(fl)):
-            if rhelp[i] > 0.0 :
-                rhelp[i] = (1.0 - numpy.exp(-rhelp[i])) / rhelp[i]
-            else:
-                rhelp[i] = 0.0
-            intensity = const * oneovers * r * Elements.getomegak(element) * rhelp[i]
-            #the term dealing with absorption in tube's window
-            if w is not None:
-                intensity = intensity * w[i]
-            fl[i][1] = intensity * fl[i][1]
+            fl[i][1] = intensity[i] * fl[i][1]
         return fl
 
     #transmission case
@@ -420,17 +465,17 @@ def characteristicEbel(target, e0, window=None,
                                                           density=fwindow[1],
                                                           thickness=fwindow[2],
                                                           listoutput=False)['transmission']
+        i = rhelp > 0.0
+        rhelp[i] = (numpy.exp(-tau[i] *( ttarget - 2.0 * rhoz) / sinalphax) - numpy.exp(-tau[i] * ttarget / sinalphax)) / rhelp[i]
+        rhelp[~i] = 0.0
+        intensity = const * oneovers * r * Elements.getomegak(element) * rhelp
+        if w is not None:
+            intensity = intensity * w
         for i in range(len(fl)):
-            if rhelp[i] > 0.0:
-                rhelp[i] = (numpy.exp(-tau[i] *( ttarget - 2.0 * rhoz) / sinalphax) - numpy.exp(-tau[i] * ttarget / sinalphax)) / rhelp[i]
-            else:
-                rhelp[i] = 0.0
-            intensity = const * oneovers * r * Elements.getomegak(element) * rhelp[i]
-            if w is not None:
-                intensity = intensity * w[i]
-            fl[i][1] = intensity * fl[i][1]
+            fl[i][1] = intensity[i] * fl[i][1]
     return fl
 
+@_cached
 def generateLists(target, e0, window=None,
                   alphae=None, alphax=None,
                   transmission=None, targetthickness=None,
@@ -0,0 +1,190 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import os
+import sys
+import gc
+import shutil
+import tempfile
+import time
+import numpy
+
+try:
+    import h5py
+    from PyMca5.PyMcaIO import ArraySave
+except ImportError:
+    h5py = None
+
+DEBUG = 0
+
+@unittest.skipIf(h5py is None, "h5py not available")
+class testArraySaveBenchmark(unittest.TestCase):
+    def setUp(self):
+        self._tmpDir = tempfile.mkdtemp(prefix="pymcaTest")
+        self._random = numpy.random.RandomState(42)
+
+    def tearDown(self):
+        gc.collect()
+        shutil.rmtree(self._tmpDir, ignore_errors=True)
+
+    def testChunkShape(self):
+        shape = (100, 120, 2048)
+        itemsize = numpy.dtype(numpy.float32).itemsize
+        chunks = ArraySave.getChunkShape(shape, numpy.float32,
+                                         mcaindex=-1, access="spectrum")
+        # complete spectra of a square tile of pixels
+        self.assertEqual(chunks[2], shape[2])
+        self.assertTrue(abs(chunks[0] - chunks[1]) <= 1)
+        self.assertTrue(numpy.prod(chunks) * itemsize <= \
+                        ArraySave.CHUNK_BYTES)
+        self.assertTrue(numpy.prod(chunks) * itemsize > \
+                        ArraySave.CHUNK_BYTES // 2)
+        chunks = ArraySave.getChunkShape(shape, numpy.float32,
+                                         mcaindex=-1, access="image")
+        # complete images of several channels
+        self.assertEqual(chunks[:2], shape[:2])
+        self.assertTrue(chunks[2] > 1)
+        # stack of images read as spectra
+        chunks = ArraySave.getChunkShape((2048, 100, 120), numpy.float32,
+                                         mcaindex=0, access="spectrum")
+        self.assertEqual(chunks[0], 2048)
+        # images larger than the chunk size are split in complete rows
+        chunks = ArraySave.getChunkShape((10, 2000, 2000), numpy.float64,
+                                         mcaindex=0, access="image")
+        self.assertEqual(chunks[0], 1)
+        self.assertEqual(chunks[2], 2000)
+        self.assertTrue(chunks[1] < 2000)
+        # no small last chunk
+        self.assertTrue((2000 % chunks[1]) > (chunks[1] // 2))
+        # spectra larger than the chunk size are not split
+        self.assertEqual(ArraySave.getChunkShape((4, 5, 10000), numpy.float64,
+                                                 chunkbytes=1000),
+                         (1, 1, 10000))
+        self.assertRaises(ValueError, ArraySave.getChunkShape,
+                          shape, numpy.float32, access="unknown")
+
+    def testSaveAndRead(self):
+        data = self._random.uniform(0, 100, (20, 30, 64)).astype(numpy.float32)
+        fname = os.path.join(self._tmpDir, "test.h5")
+        for compression in [None, "fast", True]:
+            for interpretation, expected in \
+                    [("spectrum", data),
+                     ("image", numpy.transpose(data, (2, 0, 1)))]:
+                ArraySave.save3DArrayAsHDF5(data, fname,
+                                            interpretation=interpretation,
+                                            compression=compression)
+                h5 = h5py.File(fname, "r")
+                try:
+                    dset = h5["/data/NXdata/data"]
+                    self.assertTrue(numpy.array_equal(dset[()], expected))
+                    if compression:
+                        self.assertEqual(dset.chunks,
+                            ArraySave.getChunkShape(expected.shape,
+                                                    numpy.float32,
+                                                    mcaindex=0 if \
+                                        interpretation == "image" else -1,
+                                                    access=interpretation))
+                    else:
+                        self.assertTrue(dset.chunks is None)
+                finally:
+                    h5.close()
+            # stack of images saved as spectra
+            images = numpy.transpose(data, (2, 0, 1)).copy()
+            ArraySave.save3DArrayAsHDF5(images, fname, mcaindex=0,
+                                        interpretation="spectrum",
+                                        compression=compression)
+            h5 = h5py.File(fname, "r")
+            try:
+                self.assertTrue(numpy.array_equal(h5["/data/NXdata/data"][()],
+                                                  data))
+            finally:
+                h5.close()
+
+    def testBenchmark(self):
+        data = self._random.uniform(0, 100,
+                        (100, 120, 1024)).astype(numpy.float32)
+        nBytes = data.nbytes / (1024. * 1024.)
+        fname = os.path.join(self._tmpDir, "benchmark.h5")
+        for access in ["spectrum", "image"]:
+            t0 = time.time()
+            ArraySave.save3DArrayAsHDF5(data, fname,
+                                        interpretation="spectrum",
+                                        compression="fast",
+                                        access=access)
+            writeTime = time.time() - t0
+            h5 = h5py.File(fname, "r")
+            try:
+                dset = h5["/data/NXdata/data"]
+                # read back spectra, some rows at a time, as the fits do
+                t0 = time.time()
+                for i in range(0, data.shape[0], 10):
+                    spectra = dset[i:i + 10]
+                spectraTime = time.time() - t0
+                self.assertTrue(numpy.array_equal(spectra, data[-10:]))
+                # read back some images, one channel at a time
+                channels = range(0, data.shape[2], 128)
+                t0 = time.time()
+                for i in channels:
+                    image = dset[:, :, i]
+                imageTime = time.time() - t0
+                self.assertTrue(numpy.array_equal(image, data[:, :, i]))
+            finally:
+                h5.close()
+            if DEBUG:
+                print("%s chunks %s" % (access, ArraySave.getChunkShape(
+                                data.shape, numpy.float32, access=access)))
+                print("    write %.1f MB/s" % (nBytes / writeTime))
+                print("    read spectra %.1f MB/s" % (nBytes / spectraTime))
+                print("    read images %.1f MB/s" % \
+                      (len(channels) * image.nbytes / \
+                       (1024. * 1024. * imageTime)))
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testArraySaveBenchmark))
+    else:
+        # use a predefined order
+        testSuite.addTest(testArraySaveBenchmark("testChunkShape"))
+        testSuite.addTest(testArraySaveBenchmark("testSaveAndRead"))
+        testSuite.addTest(testArraySaveBenchmark("testBenchmark"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        DEBUG = 1
+    test()
@@ -0,0 +1,189 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import sys
+import time
+import numpy
+
+try:
+    from PyMca5 import spslut
+    from PyMca5.PyMcaGraph import ctools
+except ImportError:
+    ctools = None
+
+DEBUG = 0
+
+def getLUT(palette, size=65536):
+    # spslut palette sampled at the bin centers
+    ramp = (numpy.arange(size, dtype=numpy.float64) + 0.5) * (255. / size)
+    ramp.shape = 1, -1
+    lut = spslut.transform(ramp, (1, 0), (spslut.LINEAR, 3.0), "RGBX",
+                           palette, 0, (0, 255), (0, 255), 1)[0]
+    lut = numpy.array(lut, dtype=numpy.uint8).reshape(-1, 4)
+    lut[:, 3] = 255
+    return lut
+
+def oldPixmap(data, palette, mapping, mask, colors, blendFactor=0.8):
+    # the spslut and numpy sequence used by the image widgets
+    finiteData = numpy.isfinite(data)
+    goodData = finiteData.min()
+    if goodData:
+        pixmap = spslut.transform(data, (1, 0), (mapping, 3.0), "RGBX",
+                                  palette, 1, (0, 1), (0, 255), 1)[0]
+    else:
+        tmpData = data[finiteData]
+        pixmap = spslut.transform(data, (1, 0), (mapping, 3.0), "RGBX",
+                                  palette, 0,
+                                  (tmpData.min(), tmpData.max()),
+                                  (0, 255), 1)[0]
+    pixmap.shape = -1, 4
+    pixmap[:, 3] = 255
+    pixmap.shape = data.shape + (4,)
+    if not goodData:
+        pixmap[finiteData < 1] = 255
+    pixmap.shape = -1, 4
+    maskView = mask.reshape(-1)
+    for i in range(1, mask.max() + 1):
+        idx = (maskView == i)
+        pixmap[idx, :] = pixmap[idx, :] * blendFactor + \
+                         colors[i] * (1.0 - blendFactor)
+    pixmap.shape = data.shape + (4,)
+    return pixmap
+
+@unittest.skipIf(ctools is None, "ctools or spslut not available")
+class testColormapBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.lut = getLUT(spslut.TEMP)
+        self.colors = numpy.array([[0, 0, 0, 0],
+                                   [255, 0, 0, 255],
+                                   [0, 0, 0, 255]], dtype=numpy.uint8)
+
+    def _compare(self, old, new, tolerance=1, fraction=0.001):
+        # spslut uses the exact log10 and ctools a fast approximation
+        difference = numpy.abs(old.astype(numpy.int32) - new).max(axis=-1)
+        self.assertTrue(difference.max() <= tolerance,
+                        "Maximum difference %d" % difference.max())
+        self.assertTrue((difference > 0).mean() <= fraction,
+                        "Too many different pixels")
+
+    def testFusedPipeline(self):
+        data = numpy.linspace(-10., 100., 1000).reshape(20, 50)
+        data[0, 0] = numpy.nan
+        data[0, 1] = numpy.inf
+        data[0, 2] = - numpy.inf
+        mask = numpy.zeros(data.shape, dtype=numpy.uint8)
+        mask[:, 10:20] = 1
+        mask[:, 30:] = 2
+        mask[0, 0] = 2
+        nanColor = numpy.array([255, 255, 255, 255], dtype=numpy.uint8)
+        for mapping, fastMapping in [(spslut.LINEAR, ctools.MAPPING_LINEAR),
+                                     (spslut.LOG, ctools.MAPPING_LOG10),
+                                     (spslut.GAMMA, ctools.MAPPING_GAMMA)]:
+            old = oldPixmap(data, spslut.TEMP, mapping, mask, self.colors)
+            new, (vmin, vmax) = ctools.dataToRGBAPixmap(data, self.lut,
+                                            mapping=fastMapping,
+                                            nanColor=nanColor,
+                                            mask=mask,
+                                            maskColors=self.colors,
+                                            maskStartIndex=1)
+            self.assertEqual(new.shape, data.shape + (4,))
+            self.assertEqual(vmax, 100.)
+            if mapping == spslut.LINEAR:
+                # first finite value
+                self.assertEqual(vmin, data[0, 3])
+            else:
+                # autoscale on the positive values
+                self.assertTrue(vmin > 0.)
+            self._compare(old, new, fraction=0.02)
+            # non finite values
+            self.assertEqual(new[0, 1].tolist(), [255, 255, 255, 255])
+            self.assertEqual(new[0, 2].tolist(), [255, 255, 255, 255])
+            # the mask is applied on top of the NaN color
+            self.assertEqual(new[0, 0].tolist(), [204, 204, 204, 255])
+
+        # fixed range and output buffer
+        out = numpy.zeros((data.size, 4), dtype=numpy.uint8)
+        new, (vmin, vmax) = ctools.dataToRGBAPixmap(data, self.lut, 0., 50.,
+                                                    out=out)
+        self.assertEqual((vmin, vmax), (0., 50.))
+        self.assertEqual(new.shape, data.shape + (4,))
+        self.assertTrue(numpy.all(out.reshape(new.shape) == new))
+        self.assertEqual(new[-1, -1].tolist(), self.lut[-1].tolist())
+        self.assertRaises(ValueError, ctools.dataToRGBAPixmap,
+                          data, self.lut, mask=mask[:5])
+
+    def testBenchmark4k(self):
+        data = numpy.random.random((4096, 4096)).astype(numpy.float32)
+        data *= 1000.
+        data[::7, ::5] = numpy.nan
+        mask = numpy.zeros(data.shape, dtype=numpy.uint8)
+        mask[data > 900] = 1
+        mask[1000:1500, 1000:3000] = 2
+        nanColor = numpy.array([255, 255, 255, 255], dtype=numpy.uint8)
+        for mapping, fastMapping in [(spslut.LINEAR, ctools.MAPPING_LINEAR),
+                                     (spslut.LOG, ctools.MAPPING_LOG10)]:
+            t0 = time.time()
+            old = oldPixmap(data, spslut.TEMP, mapping, mask, self.colors)
+            oldTime = time.time() - t0
+            t0 = time.time()
+            new, (vmin, vmax) = ctools.dataToRGBAPixmap(data, self.lut,
+                                            mapping=fastMapping,
+                                            nanColor=nanColor,
+                                            mask=mask,
+                                            maskColors=self.colors,
+                                            maskStartIndex=1)
+            newTime = time.time() - t0
+            if DEBUG:
+                print("mapping %d old %.3f s fused %.3f s" % \
+                      (mapping, oldTime, newTime))
+            self._compare(old, new, fraction=0.02)
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testColormapBenchmark))
+    else:
+        # use a predefined order
+        testSuite.addTest(testColormapBenchmark("testFusedPipeline"))
+        testSuite.addTest(testColormapBenchmark("testBenchmark4k"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        DEBUG = 1
+    test()
@@ -35,6 +35,65 @@
 import os
 import gc
 import tempfile
+import time
+
+DEBUG = 0
+
+TEST_CONFIGURATION = """
+# comment line
+[simple]
+int = 1
+float = -2.5e-3
+string = Hello World
+colon : value with : and = signs
+empty =
+nan = nan
+inf = -inf
+leading = 007
+; another comment
+
+[lists]
+list = 1, 2.0, three
+single = 1,
+multiline = 1, 2, 3
+	4, 5, 6
+	# comment inside a value
+
+	7, 8, 9
+trailing = Fe, Cu,
+
+[arrays]
+array = [ 1.0 2.5 -3.0 ]
+array2D = [ [1. 2.] [3. 4.] ]
+text = [ not an array ]
+
+[nested]
+key = value
+
+[nested.sub_|_dotted]
+key = dotted
+"""
+
+def _compareValues(testCase, a, b, path=""):
+    testCase.assertEqual(type(a), type(b), "Type mismatch at %s" % path)
+    if hasattr(a, "keys"):
+        testCase.assertEqual(list(a.keys()), list(b.keys()),
+                             "Key mismatch at %s" % path)
+        for key in a:
+            _compareValues(testCase, a[key], b[key], path + "/" + key)
+    elif isinstance(a, list):
+        testCase.assertEqual(len(a), len(b), "Length mismatch at %s" % path)
+        for i in range(len(a)):
+            _compareValues(testCase, a[i], b[i], path + "[%d]" % i)
+    elif hasattr(a, "shape"):
+        testCase.assertEqual(a.shape, b.shape, "Shape mismatch at %s" % path)
+        testCase.assertTrue(((a == b) | ((a != a) & (b != b))).all(),
+                            "Array mismatch at %s" % path)
+    elif (a != a) and (b != b):
+        # nan
+        pass
+    else:
+        testCase.assertEqual(a, b, "Value mismatch at %s" % path)
 
 class testConfigDict(unittest.TestCase):
     def setUp(self):
@@ -47,14 +106,31 @@ def setUp(self):
         except:
             self._module = None
         self._tmpFileName = None
+        if self._module is not None:
+            self._fastParser = self._module.USE_FAST_PARSER
 
     def tearDown(self):
         """clean up any possible files"""
         gc.collect()
+        if self._module is not None:
+            self._module.USE_FAST_PARSER = self._fastParser
+            self._module.clearCache()
         if self._tmpFileName is not None:
             if os.path.exists(self._tmpFileName):
                 os.remove(self._tmpFileName)
 
+    def _getTmpFileName(self):
+        tmpFile = tempfile.mkstemp(text=False)
+        os.close(tmpFile[0])
+        self._tmpFileName = tmpFile[1]
+        return self._tmpFileName
+
+    def _read(self, filename, fast, cache=False):
+        self._module.USE_FAST_PARSER = fast
+        readInstance = self._module.ConfigDict()
+        readInstance.read(filename, cache=cache)
+        return readInstance
+
     def testConfigDictImport(self):
         #"""Test successful import"""
         self.assertTrue(self._module is not None,\
@@ -111,6 +187,105 @@ def testConfigDictIO(self):
                 self.assertTrue( read == original,
                             "Read <%s> instead of <%s>" % (read, original))
 
+    def testConfigDictFastParser(self):
+        ConfigDict = self._module
+        if not ConfigDict.USE_FAST_PARSER:
+            # Python 2 always uses the ConfigParser module
+            return
+        fileName = self._getTmpFileName()
+        with open(fileName, "w") as f:
+            f.write(TEST_CONFIGURATION)
+        old = self._read(fileName, False)
+        new = self._read(fileName, True)
+        _compareValues(self, old, new)
+        self.assertEqual(new["simple"]["leading"], 7)
+        self.assertEqual(new["lists"]["multiline"][-1], [7, 8, 9])
+        self.assertEqual(new["nested"]["sub.dotted"]["key"], "dotted")
+
+        # files needing the ConfigParser module give the same result
+        for text in ["[DEFAULT]\na = 1\n[s]\nb = 2\n",
+                     "[s]\na = 100%%\n"]:
+            with open(fileName, "w") as f:
+                f.write(text)
+            _compareValues(self,
+                           self._read(fileName, False),
+                           self._read(fileName, True))
+        for text in ["[s]\na = 1\na = 2\n",
+                     "a = 1\n",
+                     "[s]\na = 10%\n"]:
+            with open(fileName, "w") as f:
+                f.write(text)
+            self.assertRaises(Exception, self._read, fileName, True)
+
+    def testConfigDictCache(self):
+        ConfigDict = self._module
+        fileName = self._getTmpFileName()
+        with open(fileName, "w") as f:
+            f.write("[s]\na = [ 1.0 2.0 ]\nb = 1, 2\n")
+        first = self._read(fileName, ConfigDict.USE_FAST_PARSER, cache=True)
+        second = self._read(fileName, ConfigDict.USE_FAST_PARSER, cache=True)
+        # modifying a read configuration does not modify the cache
+        first["s"]["a"][0] = 10.0
+        first["s"]["b"].append(3)
+        third = self._read(fileName, ConfigDict.USE_FAST_PARSER, cache=True)
+        self.assertEqual(third["s"]["a"].tolist(), [1.0, 2.0])
+        self.assertEqual(third["s"]["b"], [1, 2])
+        # a modified file is read again
+        with open(fileName, "w") as f:
+            f.write("[s]\na = [ 3.0 4.0 5.0 ]\nb = 1, 2\n")
+        stat = os.stat(fileName)
+        os.utime(fileName, (stat.st_atime, stat.st_mtime + 10))
+        fourth = self._read(fileName, ConfigDict.USE_FAST_PARSER, cache=True)
+        self.assertEqual(fourth["s"]["a"].tolist(), [3.0, 4.0, 5.0])
+
+    def testConfigDictBenchmark(self):
+        # a large fit configuration like round trip
+        ConfigDict = self._module
+        if not (ConfigDict.USE_NUMPY and ConfigDict.USE_FAST_PARSER):
+            return
+        import numpy
+        testDict = {}
+        for i in range(50):
+            section = {}
+            section["float"] = i * 0.1
+            section["string"] = "Material%d" % i
+            section["list"] = [i, "Fe", 1.5 * i, "None"]
+            section["table"] = [[j, j * 0.5, "K"] for j in range(40)]
+            section["array"] = numpy.linspace(0.0, i, 500)
+            section["nested"] = {"attenuator": [1, "Kapton", 1.42, 0.0125],
+                                 "flag": i % 2}
+            testDict["section%02d" % i] = section
+        fileName = self._getTmpFileName()
+        writeInstance = ConfigDict.ConfigDict(initdict=testDict)
+        t0 = time.time()
+        writeInstance.write(fileName)
+        writeTime = time.time() - t0
+
+        nReads = 5
+        t0 = time.time()
+        for i in range(nReads):
+            old = self._read(fileName, False)
+        oldTime = (time.time() - t0) / nReads
+        t0 = time.time()
+        for i in range(nReads):
+            new = self._read(fileName, True)
+        newTime = (time.time() - t0) / nReads
+        t0 = time.time()
+        for i in range(nReads):
+            cached = self._read(fileName, True, cache=True)
+        cacheTime = (time.time() - t0) / nReads
+        if DEBUG:
+            print("write %.4f s read old %.4f s fast %.4f s cached %.4f s" % \
+                  (writeTime, oldTime, newTime, cacheTime))
+        _compareValues(self, old, new)
+        _compareValues(self, old, cached)
+        # round trip
+        for key in testDict:
+            for item in ["float", "string", "list", "table", "nested"]:
+                self.assertEqual(new[key][item], testDict[key][item])
+            self.assertTrue(numpy.all(new[key]["array"] == \
+                                      testDict[key]["array"]))
+
 def getSuite(auto=True):
     testSuite = unittest.TestSuite()
     if auto:
@@ -120,10 +295,15 @@ def getSuite(auto=True):
         # use a predefined order
         testSuite.addTest(testConfigDict("testConfigDictImport"))
         testSuite.addTest(testConfigDict("testConfigDictIO"))
+        testSuite.addTest(testConfigDict("testConfigDictFastParser"))
+        testSuite.addTest(testConfigDict("testConfigDictCache"))
+        testSuite.addTest(testConfigDict("testConfigDictBenchmark"))
     return testSuite
 
 def test(auto=False):
     unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        DEBUG = 1
     test()
@@ -0,0 +1,255 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import copy
+import numpy
+
+DEBUG = 0
+
+class testFastMatrixCorrection(unittest.TestCase):
+    def setUp(self):
+        from PyMca5.PyMcaPhysics.xrf import Elements
+        from PyMca5.PyMcaPhysics.xrf import ConcentrationsTool
+        self._materials = ["FastMatrixTestMatrix", "FastMatrixTestSample",
+                           "SingleLayerStrategyMaterial"]
+        self._oldMaterials = {}
+        for material in self._materials:
+            self._oldMaterials[material] = Elements.Material.get(material,
+                                                                 None)
+        Elements.Material["FastMatrixTestMatrix"] = {"Density": 2.0,
+            "Thickness": 0.1,
+            "CompoundList": ["Fe", "Zn", "C"],
+            "CompoundFraction": [0.3, 0.2, 0.5],
+            "Comment": "Configured matrix"}
+        Elements.Material["FastMatrixTestSample"] = {"Density": 2.0,
+            "Thickness": 0.1,
+            "CompoundList": ["Fe", "Zn", "Cu", "C"],
+            "CompoundFraction": [0.3, 0.05, 0.01, 0.64],
+            "Comment": "Actual sample"}
+        self._groups = ["Fe K", "Cu K", "Zn K"]
+        tool = ConcentrationsTool.ConcentrationsTool()
+        concentrations = tool.configure()
+        concentrations.update({"usematrix": 0,
+                               "flux": 1.0e10,
+                               "time": 1.0,
+                               "area": 30.0,
+                               "distance": 10.0,
+                               "reference": "Fe",
+                               "useattenuators": 1,
+                               "mmolarflag": 0})
+        self._config = {"attenuators": {"Matrix": [1, "FastMatrixTestMatrix",
+                                                   2.0, 0.1, 45.0, 45.0,
+                                                   0, 90.0]},
+                        "fit": {"energy": [20.0],
+                                "energyflag": [1],
+                                "energyweight": [1.0],
+                                "strategyflag": 1,
+                                "strategy": "SingleLayerStrategy"},
+                        "materials": {},
+                        "concentrations": concentrations,
+                        "SingleLayerStrategy": {"layer": "Auto",
+                                                "iterations": 4,
+                                                "completer": "C",
+                                                "peaks": ["Fe K", "Zn K"],
+                                                "materials": ["-", "-"],
+                                                "flags": [1, 1]}}
+        # areas of the actual sample measured with the configured flux
+        elementsList = [[Elements.getz(group.split()[0]),
+                         group.split()[0],
+                         group.split()[1]] for group in self._groups]
+        fluo = Elements.getMultilayerFluorescence( \
+                    [["FastMatrixTestSample", 2.0, 0.1]],
+                    [20.0],
+                    layerList=None,
+                    weightList=[1.0],
+                    flagList=[1],
+                    fulloutput=1,
+                    alphain=45.0,
+                    alphaout=45.0,
+                    elementsList=elementsList,
+                    cascade=True,
+                    forcepresent=1)[0]
+        massFractions = Elements.getMaterialMassFractions( \
+                                            ["FastMatrixTestSample"], [1.0])
+        solidAngle = 0.5 * (1.0 - (10.0 / numpy.sqrt(100.0 + 30.0 / numpy.pi)))
+        self._areas = []
+        for group in self._groups:
+            ele, family = group.split()
+            self._areas.append(1.0e10 * solidAngle * massFractions[ele] * \
+                               fluo[ele]["rates"][family + " xrays"])
+
+    def tearDown(self):
+        from PyMca5.PyMcaPhysics.xrf import Elements
+        for material in self._materials:
+            if self._oldMaterials[material] is None:
+                if material in Elements.Material:
+                    del Elements.Material[material]
+            else:
+                Elements.Material[material] = self._oldMaterials[material]
+
+    def _getFitResult(self, config):
+        result = {"config": config, "groups": self._groups * 1}
+        for group, area in zip(self._groups, self._areas):
+            result[group] = {"fitarea": area, "sigmaarea": 1.0}
+        return {"result": result}
+
+    def _getStrategyConcentrations(self, config):
+        # spectrum by spectrum procedure
+        from PyMca5.PyMcaPhysics.xrf import Elements
+        from PyMca5.PyMcaPhysics.xrf import ConcentrationsTool
+        from PyMca5.PyMcaPhysics.xrf import SingleLayerStrategy
+        tool = ConcentrationsTool.ConcentrationsTool()
+        strategy = SingleLayerStrategy.SingleLayerStrategy()
+        iterations = config["SingleLayerStrategy"]["iterations"]
+        config = copy.deepcopy(config)
+        for i in range(iterations):
+            fitResult = self._getFitResult(config)
+            config, n = strategy.applyStrategy(fitResult["result"],
+                                               None,
+                                               iterations - i)
+            Elements.Material["SingleLayerStrategyMaterial"] = \
+                        config["materials"]["SingleLayerStrategyMaterial"]
+        ddict = tool.processFitResult( \
+                        config=copy.deepcopy(config["concentrations"]),
+                        fitresult=self._getFitResult(config))
+        return [ddict["mass fraction"][group] for group in self._groups]
+
+    def _getPixelConcentrations(self, config, shape=(1, 1)):
+        from PyMca5.PyMcaPhysics.xrf import ConcentrationsTool
+        from PyMca5.PyMcaPhysics.xrf import FastXRFLinearFit
+        tool = ConcentrationsTool.ConcentrationsTool()
+        ddict, addInfo = tool.processFitResult( \
+                        config=copy.deepcopy(config["concentrations"]),
+                        fitresult=self._getFitResult(config),
+                        addinfo=True)
+        areas = numpy.zeros((len(self._groups),) + shape)
+        massFractions = numpy.zeros(areas.shape, numpy.float32)
+        for i, group in enumerate(self._groups):
+            areas[i] = self._areas[i]
+            massFractions[i] = ddict["mass fraction"][group]
+        fastFit = FastXRFLinearFit.FastXRFLinearFit()
+        fastFit._applyMatrixCorrection(config,
+                                       {"result": {"groups": self._groups}},
+                                       areas,
+                                       massFractions,
+                                       addInfo)
+        return massFractions
+
+    def _checkConcentrations(self, config):
+        expected = self._getStrategyConcentrations(config)
+        result = self._getPixelConcentrations(config, shape=(2, 3))
+        for i, group in enumerate(self._groups):
+            delta = numpy.abs(result[i] - expected[i]).max() / expected[i]
+            self.assertTrue(delta < 1.0e-3,
+                    "%s relative difference %g" % (group, delta))
+
+    def testWithoutReference(self):
+        config = copy.deepcopy(self._config)
+        config["concentrations"]["usematrix"] = 0
+        self._checkConcentrations(config)
+
+    def testWithReference(self):
+        config = copy.deepcopy(self._config)
+        config["concentrations"]["usematrix"] = 1
+        self._checkConcentrations(config)
+        # the concentration of the internal standard is known
+        result = self._getPixelConcentrations(config)
+        self.assertAlmostEqual(float(result[0, 0, 0]), 0.3, 5)
+
+    def testUnsupportedStrategy(self):
+        config = copy.deepcopy(self._config)
+        config["fit"]["strategy"] = "UnknownStrategy"
+        # the concentrations calculated with the configured matrix are kept
+        from PyMca5.PyMcaPhysics.xrf import ConcentrationsTool
+        ddict = ConcentrationsTool.ConcentrationsTool().processFitResult( \
+                        config=copy.deepcopy(config["concentrations"]),
+                        fitresult=self._getFitResult(config))
+        result = self._getPixelConcentrations(config)
+        for i, group in enumerate(self._groups):
+            self.assertAlmostEqual(float(result[i, 0, 0]) / \
+                                   ddict["mass fraction"][group], 1.0, 5)
+
+    def testManyComponents(self):
+        from PyMca5.PyMcaPhysics.xrf import FastMatrixCorrection
+        from PyMca5.PyMcaPhysics.xrf import FastXRFLinearFit
+        groups = ["K K", "Ca K", "Ti K", "Cr K", "Mn K",
+                  "Fe K", "Co K", "Ni K", "Cu K", "Zn K"]
+        config = copy.deepcopy(self._config)
+        strategy = config["SingleLayerStrategy"]
+        strategy["peaks"] = groups
+        strategy["materials"] = ["-"] * len(groups)
+        strategy["flags"] = [1] * len(groups)
+        corrector = FastMatrixCorrection.FastMatrixCorrection(config)
+        self.assertEqual(len(corrector.getComponents()), 10)
+        # two points per component already exceed the allowed table size
+        self.assertEqual(corrector.getNumberOfCompositions(), 1024)
+        self.assertRaises(ValueError, corrector.buildTable, groups)
+        corrector = FastMatrixCorrection.FastMatrixCorrection(config,
+                                                              npoints=3)
+        self.assertRaises(ValueError, corrector.buildTable, groups)
+        # nine components fit in the table
+        strategy["peaks"] = groups[:9]
+        corrector = FastMatrixCorrection.FastMatrixCorrection(config)
+        self.assertEqual(corrector.getNumberOfCompositions(), 512)
+        # the fast fit keeps the concentrations of the configured matrix
+        strategy["peaks"] = groups
+        areas = numpy.ones((len(groups), 2, 3))
+        massFractions = numpy.zeros(areas.shape, numpy.float32) + 0.01
+        fastFit = FastXRFLinearFit.FastXRFLinearFit()
+        result = fastFit._applyMatrixCorrection(config,
+                                       {"result": {"groups": groups}},
+                                       areas,
+                                       massFractions,
+                                       {"ReferenceElement": None,
+                                        "I0": 1.0e10,
+                                        "SolidAngle": 0.01})
+        self.assertTrue(numpy.allclose(result, 0.01))
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase( \
+                                            testFastMatrixCorrection))
+    else:
+        # use a predefined order
+        testSuite.addTest(testFastMatrixCorrection("testWithoutReference"))
+        testSuite.addTest(testFastMatrixCorrection("testWithReference"))
+        testSuite.addTest(testFastMatrixCorrection("testUnsupportedStrategy"))
+        testSuite.addTest(testFastMatrixCorrection("testManyComponents"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,188 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import os
+import copy
+import unittest
+try:
+    import fisx
+    HAS_FISX = True
+except ImportError:
+    HAS_FISX = False
+
+DEBUG = 0
+
+class testFisxHelper(unittest.TestCase):
+    def setUp(self):
+        from PyMca5 import PyMcaDataDir
+        from PyMca5.PyMcaIO import ConfigDict
+        from PyMca5.PyMcaPhysics.xrf import FisxHelper
+        FisxHelper.clearCache()
+        configuration = ConfigDict.ConfigDict()
+        configuration.read(os.path.join(PyMcaDataDir.PYMCA_DATA_DIR,
+                                        "McaTheory.cfg"))
+        configuration["fit"]["energy"] = [20.0]
+        configuration["fit"]["energyweight"] = [1.0]
+        configuration["fit"]["energyflag"] = [1]
+        configuration["fit"]["energyscatter"] = [1]
+        configuration["peaks"] = {"Fe": "K", "Cu": "K", "Zn": "K"}
+        configuration["attenuators"]["Matrix"] = [1, "Brass", 8.5, 0.01,
+                                                  45.0, 45.0]
+        configuration["materials"]["Brass"] = {"Comment": "",
+                                    "CompoundList": ["Cu", "Zn", "Fe"],
+                                    "CompoundFraction": [0.60, 0.35, 0.05],
+                                    "Density": 8.5,
+                                    "Thickness": 0.01}
+        configuration["concentrations"]["usemultilayersecondary"] = 1
+        self._configuration = configuration
+        steel = {"Comment": "",
+                 "CompoundList": ["Fe", "Cu"],
+                 "CompoundFraction": [0.9, 0.1],
+                 "Density": 7.8,
+                 "Thickness": 0.01}
+        self._sampleList = [[["Brass", 8.5, 0.01]],
+                            {"multilayer": [["Steel", 7.8, 0.01]],
+                             "materials": {"Steel": steel}},
+                            [["Brass", 8.5, 0.002]],
+                            [["Brass", 8.5, 0.01]]]
+
+    def tearDown(self):
+        from PyMca5.PyMcaPhysics.xrf import FisxHelper
+        FisxHelper.clearCache()
+
+    def _getSingleResult(self, sample):
+        from PyMca5.PyMcaPhysics.xrf import FisxHelper
+        configuration = copy.deepcopy(self._configuration)
+        if hasattr(sample, "keys"):
+            configuration["materials"].update(sample["materials"])
+            sample = sample["multilayer"]
+        material, density, thickness = sample[0]
+        configuration["attenuators"]["Matrix"][1:4] = [material,
+                                                       density,
+                                                       thickness]
+        return FisxHelper.getFisxCorrectionFactorsFromFitConfiguration( \
+                                                            configuration)
+
+    def _assertSameCorrections(self, result, expected):
+        self.assertEqual(sorted(result.keys()), sorted(expected.keys()))
+        for element in expected:
+            for family in expected[element]:
+                for key in ["total", "counts", "correction_factor"]:
+                    current = result[element][family][key]
+                    reference = expected[element][family][key]
+                    if not isinstance(reference, list):
+                        current = [current]
+                        reference = [reference]
+                    self.assertEqual(len(current), len(reference))
+                    for a, b in zip(current, reference):
+                        self.assertTrue(abs(a - b) <= 1.0e-10 * abs(b),
+                            "%s %s %s: %g != %g" % \
+                            (element, family, key, a, b))
+
+    @unittest.skipIf(not HAS_FISX, "fisx not installed")
+    def testSampleList(self):
+        from PyMca5.PyMcaPhysics.xrf import FisxHelper
+        resultList = \
+            FisxHelper.getFisxCorrectionFactorsFromFitConfigurationList( \
+                    self._configuration, self._sampleList, nProcesses=1)
+        self.assertEqual(len(resultList), len(self._sampleList))
+        # each sample is calculated as when set as matrix of the configuration
+        FisxHelper.clearCache()
+        for sample, result in zip(self._sampleList, resultList):
+            self._assertSameCorrections(result, self._getSingleResult(sample))
+        # the definitions given with a sample are not kept for the others
+        self.assertTrue(abs(resultList[0]["Fe"]["K"]["total"] - \
+                            resultList[1]["Fe"]["K"]["total"]) > \
+                        1.0e-3 * resultList[0]["Fe"]["K"]["total"])
+        self._assertSameCorrections(resultList[3], resultList[0])
+        if DEBUG:
+            print(resultList[0])
+
+    @unittest.skipIf(not HAS_FISX, "fisx not installed")
+    def testProcesses(self):
+        from PyMca5.PyMcaPhysics.xrf import FisxHelper
+        expected = \
+            FisxHelper.getFisxCorrectionFactorsFromFitConfigurationList( \
+                    self._configuration, self._sampleList, nProcesses=1)
+        FisxHelper.clearCache()
+        resultList = \
+            FisxHelper.getFisxCorrectionFactorsFromFitConfigurationList( \
+                    self._configuration, self._sampleList, nProcesses=2)
+        self.assertEqual(len(resultList), len(expected))
+        for result, reference in zip(resultList, expected):
+            self._assertSameCorrections(result, reference)
+
+    @unittest.skipIf(not HAS_FISX, "fisx not installed")
+    def testCache(self):
+        from PyMca5.PyMcaPhysics.xrf import FisxHelper
+        first = FisxHelper.getFisxCorrectionFactorsFromFitConfiguration( \
+                                                        self._configuration)
+        expected = copy.deepcopy(first)
+        # the returned result can be modified by the caller
+        first["Cu"]["K"]["total"] = 0.0
+        first["Cu"]["K"]["correction_factor"][1] = 0.0
+        second = FisxHelper.getFisxCorrectionFactorsFromFitConfiguration( \
+                                                        self._configuration)
+        self._assertSameCorrections(second, expected)
+        # repeated samples of a list are calculated once
+        nEntries = len(FisxHelper._CACHE)
+        FisxHelper.getFisxCorrectionFactorsFromFitConfigurationList( \
+                    self._configuration, self._sampleList, nProcesses=1)
+        self.assertEqual(len(FisxHelper._CACHE), nEntries + 3)
+        # a modified configuration is not served from the cache
+        configuration = copy.deepcopy(self._configuration)
+        configuration["materials"]["Brass"]["CompoundFraction"] = \
+                                                        [0.30, 0.65, 0.05]
+        modified = FisxHelper.getFisxCorrectionFactorsFromFitConfiguration( \
+                                                        configuration)
+        self.assertTrue(abs(modified["Cu"]["K"]["total"] - \
+                            expected["Cu"]["K"]["total"]) > \
+                        1.0e-3 * expected["Cu"]["K"]["total"])
+        FisxHelper.clearCache()
+        self.assertEqual(len(FisxHelper._CACHE), 0)
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testFisxHelper))
+    else:
+        # use a predefined order
+        testSuite.addTest(testFisxHelper("testSampleList"))
+        testSuite.addTest(testFisxHelper("testProcesses"))
+        testSuite.addTest(testFisxHelper("testCache"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
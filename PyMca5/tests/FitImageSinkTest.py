@@ -0,0 +1,225 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import os
+import tempfile
+import shutil
+import numpy
+try:
+    import h5py
+    HDF5SUPPORT = True
+except ImportError:
+    HDF5SUPPORT = False
+
+DEBUG = 0
+
+class testFitImageSink(unittest.TestCase):
+    def setUp(self):
+        self._random = numpy.random.RandomState(11)
+        self._tmpDir = tempfile.mkdtemp()
+        self._labels = ["Fe K", "s(Fe K)", "Ca K", "s(Ca K)", "chisq"]
+        self._fill = [0.0, 0.0, 0.0, 0.0, -1.0]
+        self._speclabel = "row  column  Fe-K  s(Fe-K)  Ca-K  s(Ca-K)  chisq"
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpDir)
+
+    def _getPixels(self, nFiles, shape):
+        # a stack made of several files, the row index restarts with
+        # every file and later files overwrite the rows of the first ones
+        pixels = []
+        for i in range(nFiles):
+            for row in range(shape[0]):
+                for col in range(shape[1]):
+                    if (i == (nFiles - 1)) and (row == 1) and (col < 3):
+                        # not fitted
+                        continue
+                    values = list(self._random.uniform(-10, 100, 5))
+                    values[4] = abs(values[4])
+                    if col == 2:
+                        # Ca K not found
+                        values[2] = None
+                        values[3] = None
+                    pixels.append((row, col, values))
+        return pixels
+
+    def _writeBaseline(self, pixels, shape, rootname):
+        # full images in memory written at the end, as done before
+        from PyMca5.PyMcaIO import EdfFile
+        images = numpy.zeros((len(self._labels),) + shape)
+        images[:] = numpy.array(self._fill).reshape(-1, 1, 1)
+        for row, col, values in pixels:
+            for i, value in enumerate(values):
+                if value is not None:
+                    images[i, row, col] = value
+        for i in [0, 2, 4]:
+            edfname = rootname + "_%d.edf" % i
+            edfout = EdfFile.EdfFile(edfname, access='ab')
+            edfout.WriteImage({'Title': self._labels[i]}, images[i],
+                              Append=0)
+            edfout = None
+        specfile = open(rootname + ".dat", "w+")
+        specfile.write('%s\n' % self._speclabel)
+        for row in range(shape[0]):
+            for col in range(shape[1]):
+                specline = "%d" % row
+                specline += "  %d" % col
+                for i in range(len(self._labels)):
+                    specline += "  %g" % images[i, row, col]
+                specline += "\n"
+                specfile.write("%s" % specline)
+        specfile.write("\n")
+        specfile.close()
+        return images
+
+    def _writeSink(self, pixels, shape, rootname, bufferSize):
+        from PyMca5.PyMcaIO import FitImageSink
+        oldBufferSize = FitImageSink.BUFFER_SIZE
+        FitImageSink.BUFFER_SIZE = bufferSize
+        try:
+            edffiles = [rootname + "_0.edf", None,
+                        rootname + "_2.edf", None,
+                        rootname + "_4.edf"]
+            if HDF5SUPPORT:
+                h5name = rootname + ".h5"
+            else:
+                h5name = None
+            sink = FitImageSink.FitImageSink(shape, self._labels,
+                                             fill=self._fill,
+                                             edffiles=edffiles,
+                                             textfile=rootname + ".dat",
+                                             textlabel=self._speclabel,
+                                             hdf5file=h5name)
+            for row, col, values in pixels:
+                sink.setPixel(row, col, values)
+            sink.close()
+        finally:
+            FitImageSink.BUFFER_SIZE = oldBufferSize
+
+    def _compare(self, baseline, rootname, images):
+        from PyMca5.PyMcaIO import EdfFile
+        for i in [0, 2, 4]:
+            expected = EdfFile.EdfFile(baseline + "_%d.edf" % i,
+                                       access='rb').GetData(0)
+            edf = EdfFile.EdfFile(rootname + "_%d.edf" % i, access='rb')
+            self.assertEqual(edf.GetNumImages(), 1)
+            self.assertEqual(edf.GetHeader(0)["Title"], self._labels[i])
+            data = edf.GetData(0)
+            self.assertEqual(data.dtype, expected.dtype)
+            self.assertTrue(numpy.array_equal(data, expected),
+                            "EDF image %s differs" % self._labels[i])
+        f = open(baseline + ".dat", "r")
+        expected = f.read()
+        f.close()
+        f = open(rootname + ".dat", "r")
+        text = f.read()
+        f.close()
+        self.assertEqual(text, expected)
+        if HDF5SUPPORT:
+            h5 = h5py.File(rootname + ".h5", "r")
+            try:
+                self.assertTrue(numpy.array_equal(h5["images"][()], images))
+            finally:
+                h5.close()
+
+    def testMultipleFileStack(self):
+        shape = (7, 5)
+        pixels = self._getPixels(3, shape)
+        baseline = os.path.join(self._tmpDir, "baseline")
+        images = self._writeBaseline(pixels, shape, baseline)
+        # whole image in the buffer, blocks of two rows and of one row
+        for nRows in [shape[0], 2, 1]:
+            bufferSize = nRows * shape[1] * len(self._labels)
+            rootname = os.path.join(self._tmpDir, "sink_%d" % nRows)
+            self._writeSink(pixels, shape, rootname, bufferSize)
+            self._compare(baseline, rootname, images)
+
+    def testIncompleteImage(self):
+        # the fit stops before the end of the image
+        shape = (6, 4)
+        pixels = self._getPixels(1, shape)[:9]
+        baseline = os.path.join(self._tmpDir, "baseline")
+        images = self._writeBaseline(pixels, shape, baseline)
+        rootname = os.path.join(self._tmpDir, "sink")
+        self._writeSink(pixels, shape, rootname,
+                        shape[1] * len(self._labels))
+        self._compare(baseline, rootname, images)
+
+    @unittest.skipIf(not HDF5SUPPORT, "h5py not available")
+    def testMergeChunks(self):
+        from PyMca5.PyMcaIO import FitImageSink
+        shape = (4, 6)
+        pixels = self._getPixels(1, shape)
+        images = self._writeBaseline(pixels, shape,
+                                     os.path.join(self._tmpDir, "baseline"))
+        # the chunks of a batch fit different pixels of the image
+        filelist = []
+        for chunk in range(3):
+            h5name = os.path.join(self._tmpDir, "chunk_%d.h5" % chunk)
+            sink = FitImageSink.FitImageSink(shape, self._labels,
+                                             fill=self._fill,
+                                             hdf5file=h5name)
+            for row, col, values in pixels:
+                if (row * shape[1] + col) % 3 == chunk:
+                    sink.setPixel(row, col, values)
+            sink.close()
+            filelist.append(h5name)
+        outputfile = os.path.join(self._tmpDir, "merged.h5")
+        FitImageSink.mergeFitImageFiles(filelist, outputfile)
+        h5 = h5py.File(outputfile, "r")
+        try:
+            merged = h5["images"][()]
+        finally:
+            h5.close()
+        # negative areas are kept, as well as the chi square of the
+        # pixels not fitted
+        self.assertTrue(merged[0].min() < 0)
+        self.assertEqual(merged[4, 1, 0], -1.0)
+        self.assertTrue(numpy.allclose(merged, images))
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testFitImageSink))
+    else:
+        # use a predefined order
+        testSuite.addTest(testFitImageSink("testMultipleFileStack"))
+        testSuite.addTest(testFitImageSink("testIncompleteImage"))
+        testSuite.addTest(testFitImageSink("testMergeChunks"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,179 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import os
+import tempfile
+import shutil
+import numpy
+try:
+    import h5py
+    HDF5SUPPORT = True
+except ImportError:
+    HDF5SUPPORT = False
+
+DEBUG = 0
+
+class testFitResultStore(unittest.TestCase):
+    def setUp(self):
+        self._random = numpy.random.RandomState(13)
+        self._tmpDir = tempfile.mkdtemp()
+        self._groups = ["Fe K", "Cu K", "Zn K"]
+        self._parameters = ["Zero", "Gain", "Noise", "Fano"] + self._groups
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpDir)
+
+    def _getResult(self, withConcentrations=True):
+        result = {"chisq": self._random.uniform(0.5, 2.0),
+                  "groups": self._groups * 1,
+                  "parameters": self._parameters * 1,
+                  "fittedpar": self._random.uniform(0, 100, 7),
+                  "sigmapar": self._random.uniform(0, 1, 7)}
+        for group in self._groups:
+            result[group] = {"fitarea": self._random.uniform(-10, 1000),
+                             "sigmaarea": self._random.uniform(0, 10)}
+        if not withConcentrations:
+            return result, None
+        concentrations = {"groups": self._groups * 1,
+                          "elements": ["Fe", "Cu", "Zn"],
+                          "mass fraction": {},
+                          "area": {}}
+        for group in self._groups:
+            concentrations["mass fraction"][group] = \
+                                        self._random.uniform(0, 0.1)
+            concentrations["area"][group] = result[group]["fitarea"]
+        return result, concentrations
+
+    def _checkResult(self, stored, expected):
+        result, concentrations = stored
+        expectedResult, expectedConcentrations = expected
+        self.assertEqual(result["groups"], expectedResult["groups"])
+        self.assertEqual(result["parameters"], expectedResult["parameters"])
+        self.assertAlmostEqual(result["chisq"], expectedResult["chisq"])
+        for key in ["fittedpar", "sigmapar"]:
+            self.assertTrue(numpy.allclose(result[key], expectedResult[key]))
+        for group in self._groups:
+            for key in ["fitarea", "sigmaarea"]:
+                self.assertAlmostEqual(result[group][key],
+                                       expectedResult[group][key])
+        if expectedConcentrations is None:
+            self.assertTrue(concentrations is None)
+            return
+        self.assertEqual(concentrations["groups"],
+                         expectedConcentrations["groups"])
+        self.assertEqual(concentrations["elements"],
+                         expectedConcentrations["elements"])
+        for key in ["mass fraction", "area"]:
+            for group in self._groups:
+                self.assertAlmostEqual(concentrations[key][group],
+                                       expectedConcentrations[key][group])
+
+    @unittest.skipIf(not HDF5SUPPORT, "h5py not available")
+    def testRoundTrip(self):
+        from PyMca5.PyMcaIO import FitResultStore
+        filename = os.path.join(self._tmpDir, "store.h5")
+        store = FitResultStore.FitResultStore(filename, buffersize=4)
+        expected = {}
+        for i in range(11):
+            item = ("file_%d.mca" % (i // 5), "1.1.%d" % i)
+            # the first spectra without concentrations
+            expected[item] = self._getResult(withConcentrations=(i > 2))
+            store.addResult(item[0], item[1], *expected[item])
+        self.assertEqual(len(store), 11)
+        self.assertTrue(("file_0.mca", "1.1.3") in store)
+        self.assertTrue(("file_9.mca", "1.1.3") not in store)
+        self.assertRaises(ValueError, store.addResult, "file_0.mca",
+                          "1.1.3", *expected[("file_0.mca", "1.1.3")])
+        # flushed and buffered results
+        for item in expected:
+            self._checkResult(store.getResult(*item), expected[item])
+        fitarea = store.getColumn("groups", "Cu K")
+        for i, item in enumerate(store.keys()):
+            self.assertAlmostEqual(fitarea[i],
+                                   expected[item][0]["Cu K"]["fitarea"])
+        store.close()
+
+        store = FitResultStore.FitResultStore(filename, mode="r")
+        try:
+            self.assertEqual(len(store), 11)
+            self.assertEqual(store.keys()[3], ("file_0.mca", "1.1.3"))
+            for item in expected:
+                self._checkResult(store.getResult(*item), expected[item])
+        finally:
+            store.close()
+
+    @unittest.skipIf(not HDF5SUPPORT, "h5py not available")
+    def testMerge(self):
+        from PyMca5.PyMcaIO import FitResultStore
+        expected = {}
+        filelist = []
+        for chunk in range(3):
+            filename = os.path.join(self._tmpDir,
+                                    "store_%06d_partial.h5" % chunk)
+            store = FitResultStore.FitResultStore(filename, buffersize=2)
+            for i in range(chunk + 2):
+                item = ("file_%d.edf" % chunk, "0.0.%04d" % i)
+                expected[item] = self._getResult()
+                store.addResult(item[0], item[1], *expected[item])
+            store.close()
+            filelist.append(filename)
+        outputfile = os.path.join(self._tmpDir, "store.h5")
+        FitResultStore.mergeFitResultStores(filelist, outputfile)
+        store = FitResultStore.FitResultStore(outputfile, mode="r")
+        try:
+            self.assertEqual(len(store), len(expected))
+            self.assertEqual(store.keys()[2], ("file_1.edf", "0.0.0000"))
+            for item in expected:
+                self._checkResult(store.getResult(*item), expected[item])
+        finally:
+            store.close()
+        # the same spectrum in two chunks
+        self.assertRaises(ValueError, FitResultStore.mergeFitResultStores,
+                          [filelist[0], filelist[0]],
+                          os.path.join(self._tmpDir, "duplicated.h5"))
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testFitResultStore))
+    else:
+        # use a predefined order
+        testSuite.addTest(testFitResultStore("testRoundTrip"))
+        testSuite.addTest(testFitResultStore("testMerge"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,189 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import os
+import gc
+import tempfile
+import shutil
+import unittest
+import numpy
+try:
+    import h5py
+    HAS_H5PY = True
+except ImportError:
+    HAS_H5PY = False
+
+DEBUG = 0
+
+class testHDF5VirtualStack(unittest.TestCase):
+    def setUp(self):
+        self._tmpDir = tempfile.mkdtemp(prefix="pymcatmp")
+        numpy.random.seed(11)
+
+    def tearDown(self):
+        gc.collect()
+        shutil.rmtree(self._tmpDir)
+
+    def _assertSame(self, virtual, reference, key, referenceKey=None):
+        if referenceKey is None:
+            referenceKey = key
+        current = virtual[key]
+        expected = reference[referenceKey]
+        self.assertEqual(numpy.shape(current), numpy.shape(expected),
+                         "Wrong shape for key %s" % (key,))
+        self.assertTrue(numpy.allclose(current, expected, rtol=1.0e-12),
+                        "Wrong values for key %s" % (key,))
+
+    @unittest.skipIf(not HAS_H5PY, "h5py not installed")
+    def testSlicing(self):
+        from PyMca5.PyMcaIO import HDF5VirtualStack
+        shape = (5, 8, 20)
+        nPixels = shape[0] * shape[1]
+        spectra = numpy.random.randint(0, 1000, (nPixels, shape[2]))
+        monitor = numpy.random.random(nPixels) + 0.5
+        channelMonitor = numpy.random.random(shape[2]) + 0.5
+        extra = numpy.random.randint(0, 100, (10, shape[2]))
+        h5 = h5py.File(os.path.join(self._tmpDir, "virtual.h5"), "w")
+        try:
+            # 3D dataset of the first 24 pixels, chunked along rows
+            first = h5.create_dataset("first",
+                                      data=spectra[:24].reshape(3, 8, -1),
+                                      chunks=(1, 8, shape[2]))
+            # the channels first for the 16 next pixels
+            second = h5.create_dataset("second",
+                                       data=spectra[24:].T.copy(),
+                                       chunks=(shape[2], 4))
+            virtual = HDF5VirtualStack.HDF5VirtualStack(shape)
+            self.assertEqual(virtual.addDataset(first, monitor=monitor[:24]),
+                             24)
+            self.assertEqual(virtual.addDataset(second, mcaindex=0), nPixels)
+            # spectra added to pixels 30 to 39 with a monitor per channel
+            virtual.addDataset(extra, start=30, monitor=channelMonitor)
+            reference = spectra.astype(numpy.float64)
+            reference[:24] /= monitor[:24, None]
+            reference[30:] += extra / channelMonitor[None, :]
+            reference.shape = shape
+            self.assertEqual(virtual.shape, shape)
+            self.assertEqual(len(virtual), shape[0])
+            self.assertTrue(numpy.allclose(numpy.asarray(virtual), reference))
+            mask = numpy.zeros(shape[:2], dtype=numpy.bool_)
+            mask[1, 2:6] = True
+            mask[4, [0, 7]] = True
+            keyList = [0, -1, (2, 3), (2, 3, 4), (Ellipsis, 5),
+                       (slice(None), 6), (slice(1, 4), slice(None, None, 3)),
+                       (slice(None), slice(None), slice(2, 17, 4)),
+                       (Ellipsis, [19, 0, 5, 5]),
+                       (slice(None), 2, slice(None, None, -1)),
+                       mask, (mask, slice(3, 9)), (mask, 4)]
+            # blocks smaller than the datasets
+            blockBytes = HDF5VirtualStack.BLOCK_BYTES
+            for nBytes in [blockBytes, 3 * shape[2] * 8]:
+                HDF5VirtualStack.BLOCK_BYTES = nBytes
+                try:
+                    for key in keyList:
+                        self._assertSame(virtual, reference, key)
+                    # index lists select rows and columns independently
+                    self._assertSame(virtual, reference, ([4, 0, 2], [7, 1]),
+                                     numpy.ix_([4, 0, 2], [7, 1]))
+                finally:
+                    HDF5VirtualStack.BLOCK_BYTES = blockBytes
+            self.assertRaises(IndexError, virtual.__getitem__, 5)
+            self.assertRaises(IndexError, virtual.__getitem__,
+                              numpy.zeros((4, 8), dtype=numpy.bool_))
+            self.assertRaises(ValueError, virtual.addDataset,
+                              numpy.zeros((2, shape[2] + 1)))
+            self.assertRaises(ValueError, virtual.addDataset,
+                              numpy.zeros((2, shape[2])), start=nPixels - 1)
+            sources = virtual.getSourceOfPixel(3, 7)
+            self.assertEqual([x[1] for x in sources], [7, 1])
+        finally:
+            h5.close()
+
+    @unittest.skipIf(not HAS_H5PY, "h5py not installed")
+    def testLazyStack(self):
+        from PyMca5.PyMcaIO import HDF5Stack1D
+        from PyMca5.PyMcaIO import HDF5VirtualStack
+        nFiles = 4
+        nSpectra = 6
+        nChannels = 16
+        reference = numpy.zeros((nFiles, nSpectra, nChannels))
+        filelist = []
+        for i in range(nFiles):
+            filename = os.path.join(self._tmpDir, "scan_%02d.h5" % i)
+            mca = numpy.random.randint(0, 500, (nSpectra, nChannels))
+            mca = mca.astype(numpy.int32)
+            fluo = numpy.random.randint(0, 50, (nSpectra, nChannels))
+            fluo = fluo.astype(numpy.int32)
+            monitor = numpy.random.random(nSpectra) + 1.0
+            h5 = h5py.File(filename, "w")
+            try:
+                h5["/entry_%d/measurement/mca" % i] = mca
+                h5["/entry_%d/measurement/fluo" % i] = fluo
+                h5["/entry_%d/measurement/I0" % i] = monitor
+            finally:
+                h5.close()
+            reference[i] = (mca + fluo) / monitor[:, None]
+            filelist.append(filename)
+        selection = {"x": None,
+                     "y": ["/measurement/mca", "/measurement/fluo"],
+                     "m": "/measurement/I0"}
+        eager = HDF5Stack1D.HDF5Stack1D(filelist, selection)
+        self.assertTrue(isinstance(eager.data, numpy.ndarray))
+        self.assertEqual(eager.data.shape, reference.shape)
+        self.assertTrue(numpy.allclose(eager.data, reference, rtol=1.0e-12))
+        lazy = HDF5Stack1D.HDF5Stack1D(filelist, selection, lazy=True)
+        self.assertTrue(isinstance(lazy.data,
+                                   HDF5VirtualStack.HDF5VirtualStack))
+        self.assertEqual(lazy.info["McaIndex"], eager.info["McaIndex"])
+        self.assertEqual(lazy.data.shape, eager.data.shape)
+        self.assertTrue(numpy.allclose(lazy.data[:], eager.data,
+                                       rtol=1.0e-12))
+        self.assertTrue(numpy.allclose(lazy.data[2, 1:4],
+                                       eager.data[2, 1:4], rtol=1.0e-12))
+        lazy = None
+        gc.collect()
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testHDF5VirtualStack))
+    else:
+        # use a predefined order
+        testSuite.addTest(testHDF5VirtualStack("testSlicing"))
+        testSuite.addTest(testHDF5VirtualStack("testLazyStack"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,276 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import os
+import shutil
+import tempfile
+import numpy
+
+try:
+    import h5py
+    HAS_H5PY = True
+except ImportError:
+    HAS_H5PY = False
+
+DEBUG = 0
+
+try:
+    from PyMca5.PyMcaGraph import PlotBackend
+
+    class _ImageBackend(PlotBackend.PlotBackend):
+        # keeps the images received and shows the limits on 400x400 pixels
+        def __init__(self, parent=None):
+            self.images = {}
+            self.limits = [0.0, 1.0, 0.0, 1.0]
+            PlotBackend.PlotBackend.__init__(self, parent)
+
+        def addImage(self, data, legend=None, **kw):
+            self.images[legend] = data, kw
+            return legend
+
+        def removeImage(self, handle, replot=True):
+            if handle in self.images:
+                del self.images[handle]
+
+        def getGraphXLimits(self):
+            return self.limits[0], self.limits[1]
+
+        def getGraphYLimits(self):
+            return self.limits[2], self.limits[3]
+
+        def dataToPixel(self, x=None, y=None, axis="left"):
+            xmin, xmax, ymin, ymax = self.limits
+            return 400. * (x - xmin) / (xmax - xmin), \
+                   400. * (y - ymin) / (ymax - ymin)
+
+        def resetZoom(self, dataMargins=None):
+            xmin = ymin = numpy.inf
+            xmax = ymax = -numpy.inf
+            for data, kw in self.images.values():
+                x0, xStep = kw["xScale"]
+                y0, yStep = kw["yScale"]
+                xmin = min(xmin, x0)
+                xmax = max(xmax, x0 + data.shape[1] * xStep)
+                ymin = min(ymin, y0)
+                ymax = max(ymax, y0 + data.shape[0] * yStep)
+            self.limits = [xmin, xmax, ymin, ymax]
+
+        def setGraphXLimits(self, xmin, xmax):
+            self.limits[0:2] = [xmin, xmax]
+
+        def setGraphYLimits(self, ymin, ymax):
+            self.limits[2:4] = [ymin, ymax]
+
+        def setDrawModeEnabled(self, *var, **kw):
+            pass
+
+        def setZoomModeEnabled(self, *var, **kw):
+            pass
+
+        def getDefaultColormap(self):
+            return {"name": "gray", "normalization": "linear",
+                    "autoscale": True, "vmin": 0.0, "vmax": 1.0,
+                    "colors": 256}
+
+        def replot(self):
+            pass
+except ImportError:
+    _ImageBackend = None
+
+class testImagePyramid(unittest.TestCase):
+    def setUp(self):
+        self._tmpDir = tempfile.mkdtemp(prefix="pymcatmp")
+        self._data = numpy.random.RandomState(5).uniform(-1, 10,
+                                                         size=(203, 150))
+        self._data[7, 11] = numpy.nan
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpDir)
+
+    def _getExpectedLevel(self, data, level):
+        # each level averages the finite values of blocks of the previous one
+        for i in range(level):
+            rows = (data.shape[0] + 1) // 2
+            columns = (data.shape[1] + 1) // 2
+            reduced = numpy.zeros((rows, columns))
+            for row in range(rows):
+                for column in range(columns):
+                    block = data[2 * row:2 * row + 2,
+                                 2 * column:2 * column + 2]
+                    reduced[row, column] = block[numpy.isfinite(block)].mean()
+            data = reduced
+        return data
+
+    def testLevels(self):
+        from PyMca5.PyMcaGraph import ImagePyramid
+        pyramid = ImagePyramid.ImagePyramid(self._data, tileSize=32)
+        self.assertEqual(pyramid.getNumberOfLevels(), 4)
+        self.assertEqual(pyramid.getLevelShape(3), (26, 19))
+        self.assertTrue(numpy.array_equal(pyramid.getLevel(0), self._data,
+                                          equal_nan=True))
+        for level in [1, 2, 3]:
+            expected = self._getExpectedLevel(self._data, level)
+            self.assertTrue(numpy.allclose(pyramid.getLevel(level), expected),
+                            "Wrong values at level %d" % level)
+        region = pyramid.getRegion(1, 10, 70, 5, 40)
+        expected = self._getExpectedLevel(self._data, 1)[10:70, 5:40]
+        self.assertTrue(numpy.allclose(region, expected))
+        finite = self._data[numpy.isfinite(self._data)]
+        self.assertEqual(pyramid.getMinMax(), (finite.min(), finite.max()))
+
+    def testRGBA(self):
+        from PyMca5.PyMcaGraph import ImagePyramid
+        data = numpy.zeros((64, 40, 4), dtype=numpy.uint8)
+        data[:, :, 0] = 200
+        data[::2, :, 1] = 100
+        data[:, :, 3] = 255
+        pyramid = ImagePyramid.ImagePyramid(data, tileSize=16)
+        self.assertTrue(pyramid.isRGBA())
+        level = pyramid.getLevel(1)
+        self.assertEqual(level.shape, (32, 20, 4))
+        self.assertEqual(level.dtype, numpy.uint8)
+        self.assertTrue(numpy.all(level[:, :, 0] == 200))
+        self.assertTrue(numpy.all(level[:, :, 1] == 50))
+        self.assertTrue(numpy.all(level[:, :, 3] == 255))
+
+    def testDisplayFunction(self):
+        from PyMca5.PyMcaGraph import ImagePyramid
+        pyramid = ImagePyramid.ImagePyramid(self._data, tileSize=32)
+        calls = []
+        def display(region, level, row0, column0):
+            calls.append((region.shape, level, row0, column0))
+            return region * 2
+        pyramid.setDisplayFunction(display)
+        region = pyramid.getDisplayRegion(2, 3, 20, 4, 30)
+        self.assertEqual(calls, [((17, 26), 2, 3, 4)])
+        self.assertTrue(numpy.allclose(region,
+                                       2 * pyramid.getRegion(2, 3, 20, 4, 30)))
+
+    def testH5Storage(self):
+        if not HAS_H5PY:
+            return
+        from PyMca5.PyMcaGraph import ImagePyramid
+        fname = os.path.join(self._tmpDir, "pyramid.h5")
+        h5 = h5py.File(fname, "w")
+        try:
+            group = h5.create_group("pyramid")
+            source = h5.create_dataset("data", data=self._data)
+            pyramid = ImagePyramid.ImagePyramid(source, tileSize=32,
+                                                h5Group=group)
+            level2 = pyramid.getLevel(2)
+            self.assertTrue(group["level2_done"][()].all())
+            self.assertFalse(group["level3_done"][()].any())
+
+            # same source and tile size, the stored tiles are used
+            pyramid = ImagePyramid.ImagePyramid(source, tileSize=32,
+                                                h5Group=group)
+            self.assertTrue(pyramid._h5Done[2].all())
+            self.assertTrue(numpy.array_equal(pyramid.getLevel(2), level2))
+
+            # other tile size, the pyramid is built again
+            pyramid = ImagePyramid.ImagePyramid(source, tileSize=64,
+                                                h5Group=group)
+            self.assertEqual(pyramid.getNumberOfLevels(), 3)
+            self.assertFalse(group["level2_done"][()].any())
+            self.assertFalse("level3" in group)
+            self.assertTrue(numpy.allclose(pyramid.getLevel(2), level2))
+
+            # other source with the same shape
+            data = self._data[::-1] + 5.0
+            pyramid = ImagePyramid.ImagePyramid(data, tileSize=64,
+                                                h5Group=group)
+            self.assertFalse(group["level2_done"][()].any())
+            self.assertTrue(numpy.allclose(pyramid.getLevel(2),
+                                           self._getExpectedLevel(data, 2)))
+            pyramid = ImagePyramid.ImagePyramid(data.astype(numpy.float32),
+                                                tileSize=64,
+                                                h5Group=group)
+            self.assertFalse(group["level2_done"][()].any())
+        finally:
+            h5.close()
+
+    @unittest.skipIf(_ImageBackend is None, "PyMcaGraph not available")
+    def testPlotZoom(self):
+        from PyMca5.PyMcaGraph import Plot
+        backend = _ImageBackend()
+        plot = Plot.Plot(backend=backend)
+        plot.imagePyramidThreshold = 1000
+        data = numpy.arange(1600 * 1200.).reshape(1600, 1200)
+        plot.addImage(data, "image", xScale=(0.0, 1.0), yScale=(0.0, 1.0))
+        level = backend.images["image"][0].shape[0]
+        # the whole image is sent at a coarse level
+        self.assertTrue(backend.images["image"][0].shape[0] < 1600)
+        self.assertEqual(backend.limits, [0.0, 1200.0, 0.0, 1600.0])
+        # zoom on 100 x 100 pixels
+        backend.limits = [500.0, 600.0, 700.0, 800.0]
+        plot._plotCallback({"event": "limitsChanged",
+                            "xdata": (500.0, 600.0),
+                            "ydata": (700.0, 800.0)})
+        image, kw = backend.images["image"]
+        self.assertEqual(kw["xScale"][1], 1.0)
+        self.assertTrue(image.shape[0] < 200)
+        # adding again the image, as after a mask or colormap change,
+        # keeps the full resolution of the zoomed region
+        plot.addImage(data + 1, "image", xScale=(0.0, 1.0), yScale=(0.0, 1.0),
+                      replot=False)
+        image, kw = backend.images["image"]
+        self.assertEqual(kw["xScale"][1], 1.0)
+        self.assertEqual(kw["yScale"][1], 1.0)
+        row0 = int(kw["yScale"][0])
+        column0 = int(kw["xScale"][0])
+        self.assertTrue(numpy.array_equal(image,
+                    data[row0:row0 + image.shape[0],
+                         column0:column0 + image.shape[1]] + 1))
+        self.assertEqual(backend.limits, [500.0, 600.0, 700.0, 800.0])
+        # a zoom reset sends the whole image again
+        plot.addImage(data, "image", xScale=(0.0, 1.0), yScale=(0.0, 1.0))
+        self.assertEqual(backend.images["image"][0].shape[0], level)
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testImagePyramid))
+    else:
+        # use a predefined order
+        testSuite.addTest(testImagePyramid("testLevels"))
+        testSuite.addTest(testImagePyramid("testRGBA"))
+        testSuite.addTest(testImagePyramid("testDisplayFunction"))
+        testSuite.addTest(testImagePyramid("testH5Storage"))
+        testSuite.addTest(testImagePyramid("testPlotZoom"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,190 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import os
+import struct
+import tempfile
+import shutil
+import unittest
+import numpy
+
+DEBUG = 0
+
+def _writeLmfFile(filename, events, lmfVersion, blockSize, nChannels):
+    """
+    Write a minimal OMDAQ list mode file with header version 1.
+
+    :param events: list of (adc, row, column, energy) events
+    """
+    header = struct.pack("<BBBBH", 1, 66, 2, lmfVersion, blockSize)
+    header += b"\x00" * 1043
+    for adc in range(8):
+        info = struct.pack("H3f9s", 0, 0.1 * adc, 0.01, nChannels[adc],
+                           ("ADC%d" % adc).encode("latin-1"))
+        header += info + b"\x00" * (122 - len(info))
+    if lmfVersion < 2:
+        fmt = "<BBH"
+    else:
+        fmt = "<III"
+    size = struct.calcsize(fmt)
+    nPerBlock = (blockSize - 20) // size
+    blocks = []
+    for start in range(0, len(events), nPerBlock):
+        block = b"\x00" * 20
+        for adc, row, column, energy in events[start:start + nPerBlock]:
+            block += struct.pack(fmt, row, column, (adc << 12) | energy)
+        # unused events of the block are set to 0xff
+        block += b"\xff" * (blockSize - len(block))
+        blocks.append(block)
+    f = open(filename, "wb")
+    try:
+        f.write(header)
+        # the file ends with the blocks, the last events are read first
+        for block in blocks[::-1]:
+            f.write(block)
+    finally:
+        f.close()
+
+class testListModeStack(unittest.TestCase):
+    def setUp(self):
+        self._tmpDir = tempfile.mkdtemp(prefix="pymcatmp")
+        numpy.random.seed(7)
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpDir)
+
+    def _getEvents(self, nEvents, nRows, nColumns, adcList, maxEnergy):
+        adc = numpy.array(adcList)[numpy.random.randint(0, len(adcList),
+                                                        nEvents)]
+        row = numpy.random.randint(0, nRows, nEvents)
+        column = numpy.random.randint(0, nColumns, nEvents)
+        energy = numpy.random.randint(0, maxEnergy, nEvents)
+        return [tuple(int(x) for x in event) \
+                for event in zip(adc, row, column, energy)]
+
+    def _getReference(self, events, adc, shape, nChannels, binning=1):
+        nBins = (nChannels + binning - 1) // binning
+        data = numpy.zeros(tuple(shape) + (nBins,), dtype=numpy.uint32)
+        for i, row, column, energy in events:
+            if (i == adc) and (row < shape[0]) and (column < shape[1]) and \
+               (energy < nChannels):
+                data[row, column, energy // binning] += 1
+        return data
+
+    def testHistogram(self):
+        from PyMca5.PyMcaIO import ListModeStack
+        stack = ListModeStack.ListModeStack((5, 7), 20, binning=3,
+                                            calibration=(1.0, 0.5, 0.0))
+        self.assertEqual(stack.data.shape, (5, 7, 7))
+        # stack channels are centered on the added detector channels
+        self.assertEqual(stack.info["McaCalib"], [1.5, 1.5, 0.0])
+        events = self._getEvents(3000, 6, 8, [0], 22)
+        reference = self._getReference(events, 0, (5, 7), 20, binning=3)
+        events = numpy.array(events)
+        # blocks of neighbouring pixels and blocks spread over the map
+        order = numpy.argsort(events[:, 1] * 8 + events[:, 2], kind="stable")
+        n = 0
+        for block in [events[order[:1000]], events[order[1000:1010]],
+                      events[order[1010:]]]:
+            n += stack.addEvents(block[:, 1], block[:, 2], block[:, 3])
+        self.assertTrue(numpy.array_equal(stack.data, reference))
+        self.assertEqual(n, int(reference.sum()))
+        self.assertEqual(stack.nEvents, n)
+        self.assertEqual(stack.nIgnoredEvents, 3000 - n)
+        self.assertTrue(stack.nIgnoredEvents > 0)
+        self.assertRaises(ValueError, stack.addEvents, [0, 1], [0], [0])
+        self.assertRaises(ValueError, ListModeStack.ListModeStack,
+                          (5, 7), 20, binning=2, calibration=(0., 1., 0.1))
+
+    def testLmfVersion0(self):
+        from PyMca5.PyMcaIO import OmdaqLmf
+        filename = os.path.join(self._tmpDir, "version0.lmf")
+        nChannels = [32, 0, 48, 0, 0, 0, 0, 0]
+        events = self._getEvents(2500, 256, 256, [0, 1, 2], 50)
+        _writeLmfFile(filename, events, 0, 4096, nChannels)
+        self.assertTrue(OmdaqLmf.isOmdaqLmf(filename))
+        stacks = OmdaqLmf.OmdaqLmf(filename)
+        self.assertEqual(len(stacks), 8)
+        for adc in range(8):
+            if adc not in [0, 2]:
+                self.assertTrue(stacks[adc] is None)
+                continue
+            reference = self._getReference(events, adc, (256, 256),
+                                           nChannels[adc])
+            self.assertEqual(stacks[adc].data.shape, reference.shape)
+            self.assertTrue(numpy.array_equal(stacks[adc].data, reference),
+                            "Wrong stack of ADC %d" % adc)
+            self.assertEqual(stacks[adc].info["SourceName"][:4], b"ADC%d" % adc)
+
+    def testLmfVersion2(self):
+        from PyMca5.PyMcaIO import OmdaqLmf
+        filename = os.path.join(self._tmpDir, "version2.lmf")
+        nChannels = [0, 0, 0, 64, 0, 0, 0, 0]
+        events = self._getEvents(3000, 12, 10, [3], 64)
+        # blocks of 340 events, the last one padded
+        _writeLmfFile(filename, events, 2, 20 + 12 * 340, nChannels)
+        # read the file in several parts
+        readSize = OmdaqLmf.OmdaqLmf.READ_SIZE
+        OmdaqLmf.OmdaqLmf.READ_SIZE = 3 * (20 + 12 * 340)
+        try:
+            stacks = OmdaqLmf.OmdaqLmf([filename], shape=(10, 12), binning=4)
+        finally:
+            OmdaqLmf.OmdaqLmf.READ_SIZE = readSize
+        reference = self._getReference(events, 3, (10, 12), 64, binning=4)
+        self.assertTrue(numpy.array_equal(stacks[3].data, reference))
+        self.assertEqual(stacks[3].nIgnoredEvents,
+                         len(events) - int(reference.sum()))
+        # single block decoding
+        f = open(filename, "rb")
+        data = f.read()
+        f.close()
+        block = data[-(20 + 12 * 340):]
+        decoded = OmdaqLmf.parseLmfBlock(block, lmf_version=2)
+        self.assertEqual(decoded.shape, (340, 4))
+        self.assertEqual([tuple(x) for x in decoded.tolist()], events[:340])
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testListModeStack))
+    else:
+        # use a predefined order
+        testSuite.addTest(testListModeStack("testHistogram"))
+        testSuite.addTest(testListModeStack("testLmfVersion0"))
+        testSuite.addTest(testListModeStack("testLmfVersion2"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,203 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import os
+import gc
+import shutil
+import struct
+import tempfile
+import numpy
+
+DEBUG = 0
+
+class testMapReaders(unittest.TestCase):
+    def setUp(self):
+        self._tmpDir = tempfile.mkdtemp(prefix="pymcaTest")
+        self._random = numpy.random.RandomState(42)
+
+    def tearDown(self):
+        gc.collect()
+        shutil.rmtree(self._tmpDir, ignore_errors=True)
+
+    def testOmnicMap(self):
+        from PyMca5.PyMcaIO import OmnicMap
+        nY, nX, nChannels = 3, 4, 50
+        data = self._random.uniform(-10, 10,
+                        (nY, nX, nChannels)).astype(numpy.float32)
+        data[1, 2, 5] = numpy.nan
+        data[2, 0, 7] = numpy.inf
+        fname = os.path.join(self._tmpDir, "test.map")
+        f = open(fname, "wb")
+        f.write(b"\0" * 512)
+        for i in range(nY):
+            for j in range(nX):
+                header = "Spectrum %d of %d, X = %.1f, Y = %.1f" % \
+                         (i * nX + j + 1, nY * nX, 10.0 + j, 20.0 + i)
+                f.write(b"\0" * 16)
+                f.write(header.encode("utf-8").ljust(84, b"\0"))
+                f.write(data[i, j].tobytes())
+        f.close()
+        stack = OmnicMap.OmnicMap(fname)
+        expected = data.copy()
+        expected[numpy.isfinite(expected) == False] = 0.0
+        self.assertEqual(stack.data.dtype, numpy.float32)
+        self.assertTrue(numpy.array_equal(stack.data, expected))
+        self.assertEqual(stack.info["Dim_1"], nY)
+
+    def _writeLispix(self, name, data, description, offset=0):
+        fname = os.path.join(self._tmpDir, name + ".rpl")
+        f = open(fname, "w")
+        for key in ["width", "height", "depth", "offset", "data-length",
+                    "data-type", "byte-order", "record-by"]:
+            f.write("%s\t%s\n" % (key, description[key]))
+        f.close()
+        f = open(os.path.join(self._tmpDir, name + ".raw"), "wb")
+        f.write(b"\1" * offset)
+        f.write(data.tobytes())
+        f.close()
+        return fname
+
+    def testLispixMap(self):
+        from PyMca5.PyMcaIO import LispixMap
+        rows, columns, channels = 5, 6, 7
+        spectra = self._random.randint(0, 3000,
+                        (rows, columns, channels))
+        images = numpy.ascontiguousarray(spectra.transpose(2, 0, 1))
+        description = {"width": columns,
+                       "height": rows,
+                       "depth": channels}
+        # vector layout, little endian, header
+        description.update({"offset": 16, "data-length": 2,
+                            "data-type": "unsigned",
+                            "byte-order": "little-endian",
+                            "record-by": "vector"})
+        fname = self._writeLispix("vector", spectra.astype("<u2"),
+                                  description, offset=16)
+        stack = LispixMap.LispixMap(fname)
+        self.assertEqual(stack.data.dtype, numpy.float32)
+        self.assertTrue(numpy.array_equal(stack.data, spectra))
+        self.assertEqual(stack.info["McaIndex"], 2)
+
+        # image layout, big endian, converted to spectra
+        description.update({"offset": 8, "data-length": 4,
+                            "data-type": "signed",
+                            "byte-order": "big-endian",
+                            "record-by": "image"})
+        fname = self._writeLispix("image", images.astype(">i4"),
+                                  description, offset=8)
+        stack = LispixMap.LispixMap(fname)
+        self.assertEqual(stack.data.dtype, numpy.int32)
+        self.assertTrue(numpy.array_equal(stack.data, spectra))
+        self.assertEqual(stack.info["McaIndex"], 2)
+        stack = LispixMap.LispixMap(fname, native=True)
+        self.assertTrue(numpy.array_equal(stack.data, images))
+        self.assertEqual(stack.info["McaIndex"], 0)
+
+        # image layout without header
+        description.update({"offset": 0, "data-length": 8,
+                            "data-type": "float",
+                            "byte-order": "little-endian"})
+        fname = self._writeLispix("float", images.astype("<f8"),
+                                  description)
+        stack = LispixMap.LispixMap(fname)
+        self.assertEqual(stack.data.dtype, numpy.float64)
+        self.assertTrue(numpy.array_equal(stack.data, spectra))
+        self.assertEqual(stack.info["McaIndex"], 2)
+
+        # memory mapped
+        stack = LispixMap.LispixMap(fname, native=True, lazy=True)
+        self.assertTrue(isinstance(stack.data.base, numpy.memmap))
+        self.assertTrue(numpy.array_equal(stack.data, images))
+        stack = None
+
+    def testRenishawMap(self):
+        from PyMca5.PyMcaIO import RenishawMap
+        nY, nX, nChannels = 3, 4, 20
+        wavelengths = numpy.linspace(100., 200., nChannels)
+        data = self._random.uniform(0, 1000, (nY, nX, nChannels))
+        fname = os.path.join(self._tmpDir, "renishaw.txt")
+        f = open(fname, "w")
+        for i in range(nY):
+            for j in range(nX):
+                for k in range(nChannels):
+                    # the first column changes first
+                    f.write("%.4f\t%.4f\t%.6f\t%.7g\n" % (-1.5 * j, 2.5 * i,
+                                                      wavelengths[k],
+                                                      data[i, j, k]))
+        f.close()
+        self.assertTrue(RenishawMap.isRenishawMapFile(fname))
+        stack = RenishawMap.RenishawMap(fname)
+        expected = numpy.array(["%.7g" % x for x in data.ravel()],
+                               dtype=numpy.float32).reshape(data.shape)
+        self.assertEqual(stack.data.dtype, numpy.float32)
+        self.assertTrue(numpy.array_equal(stack.data, expected))
+        self.assertTrue(numpy.allclose(stack.x[0], wavelengths))
+
+    def testSupaVisioMap(self):
+        from PyMca5.PyMcaIO import SupaVisioMap
+        nRows, nColumns, nEvents = 8, 5, 20000
+        y = self._random.randint(0, nRows, nEvents)
+        x = self._random.randint(0, nColumns, nEvents)
+        channel = self._random.randint(0, 2100, nEvents)
+        events = numpy.array([y, x, channel], dtype=numpy.uint16).T
+        fname = os.path.join(self._tmpDir, "test.pige")
+        f = open(fname, "wb")
+        f.write(struct.pack("3H", 0, nRows, nColumns))
+        f.write(numpy.ascontiguousarray(events).tobytes())
+        # two trailing triplets
+        f.write(struct.pack("6H", 1, 1, 1, 1, 1, 1))
+        f.close()
+        stack = SupaVisioMap.SupaVisioMap(fname)
+        expected = numpy.zeros((nColumns, nRows, 2048))
+        valid = channel < 2048
+        numpy.add.at(expected, (x[valid], y[valid], channel[valid]), 1)
+        self.assertTrue(numpy.array_equal(stack.data, expected))
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testMapReaders))
+    else:
+        # use a predefined order
+        testSuite.addTest(testMapReaders("testOmnicMap"))
+        testSuite.addTest(testMapReaders("testLispixMap"))
+        testSuite.addTest(testMapReaders("testRenishawMap"))
+        testSuite.addTest(testMapReaders("testSupaVisioMap"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,144 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import numpy
+
+try:
+    from PyMca5.PyMcaGraph.ctools import pnpoly
+    from PyMca5.PyMcaGui.plotting import MaskImageTools
+except ImportError:
+    # the graphical package needs Qt
+    MaskImageTools = None
+
+DEBUG = 0
+
+def oldPolygonMask(points, shape, xScale, yScale):
+    # all the pixels of the image checked, as done by the image widget
+    x = xScale[0] + xScale[1] * numpy.arange(shape[1])
+    y = yScale[0] + yScale[1] * numpy.arange(shape[0])
+    X, Y = numpy.meshgrid(x, y)
+    X.shape = -1
+    Y.shape = -1
+    Z = numpy.zeros((shape[1] * shape[0], 2))
+    Z[:, 0] = X
+    Z[:, 1] = Y
+    mask = pnpoly(points, Z, 1)
+    mask.shape = shape
+    return mask
+
+class testMaskImageTools(unittest.TestCase):
+    def setUp(self):
+        self._random = numpy.random.RandomState(5)
+
+    def _getPolygon(self, center, radius, nVertices):
+        angle = numpy.sort(self._random.uniform(0, 2 * numpy.pi, nVertices))
+        r = radius * self._random.uniform(0.3, 1.0, nVertices)
+        points = numpy.zeros((nVertices, 2))
+        points[:, 0] = center[0] + r * numpy.cos(angle)
+        points[:, 1] = center[1] + r * numpy.sin(angle)
+        return points
+
+    @unittest.skipIf(MaskImageTools is None, "PyMca graphical tools needed")
+    def testPolygonMask(self):
+        shape = (23, 31)
+        for xScale, yScale in [([0, 1], [0, 1]),
+                               ([-2.5, 0.5], [10.0, 2.0])]:
+            xMax = xScale[0] + xScale[1] * shape[1]
+            yMax = yScale[0] + yScale[1] * shape[0]
+            center = [0.5 * (xScale[0] + xMax), 0.5 * (yScale[0] + yMax)]
+            for radius in [0.1, 2.0, 0.6 * (xMax - xScale[0])]:
+                for nVertices in [3, 5, 12]:
+                    points = self._getPolygon(center, radius * yScale[1],
+                                              nVertices)
+                    # polygon vertices on pixel positions
+                    points[0, 0] = xScale[0] + 3 * xScale[1]
+                    points[0, 1] = yScale[0] + 4 * yScale[1]
+                    expected = oldPolygonMask(points, shape, xScale, yScale)
+                    mask = numpy.zeros(shape, dtype=expected.dtype)
+                    result = MaskImageTools.getPolygonMask(points, shape,
+                                                           xScale=xScale,
+                                                           yScale=yScale)
+                    if result is not None:
+                        (row0, row1, column0, column1), region = result
+                        mask[row0:row1, column0:column1] = region
+                    self.assertTrue(numpy.array_equal(mask, expected),
+                                    "Polygon mask differs")
+
+    @unittest.skipIf(MaskImageTools is None, "PyMca graphical tools needed")
+    def testPolygonOutside(self):
+        shape = (10, 12)
+        points = self._getPolygon([30.0, -20.0], 4.0, 6)
+        self.assertEqual(oldPolygonMask(points, shape, [0, 1], [0, 1]).max(),
+                         0)
+        result = MaskImageTools.getPolygonMask(points, shape)
+        if result is not None:
+            self.assertEqual(result[1].max(), 0)
+
+    @unittest.skipIf(MaskImageTools is None, "PyMca graphical tools needed")
+    def testPointGridIndex(self):
+        nPoints = 5000
+        x = self._random.uniform(-3, 7, nPoints)
+        y = self._random.normal(2, 3, nPoints)
+        x[10] = numpy.nan
+        # points repeated on the polygon vertices
+        x[20:25] = 1.0
+        y[20:25] = 2.0
+        index = MaskImageTools.PointGridIndex(x, y)
+        Z = numpy.zeros((nPoints, 2))
+        Z[:, 0] = x
+        Z[:, 1] = y
+        for center, radius in [([1.0, 2.0], 0.5), ([0.0, 0.0], 3.0),
+                               ([6.0, 9.0], 20.0), ([50.0, 0.0], 1.0)]:
+            points = self._getPolygon(center, radius, 7)
+            points[0] = [1.0, 2.0]
+            expected = numpy.nonzero(pnpoly(points, Z, 1))[0]
+            result = numpy.sort(index.getPointsInPolygon(points))
+            self.assertTrue(numpy.array_equal(result, expected),
+                            "Points in polygon differ")
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testMaskImageTools))
+    else:
+        # use a predefined order
+        testSuite.addTest(testMaskImageTools("testPolygonMask"))
+        testSuite.addTest(testMaskImageTools("testPolygonOutside"))
+        testSuite.addTest(testMaskImageTools("testPointGridIndex"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
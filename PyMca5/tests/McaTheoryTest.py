@@ -0,0 +1,211 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import numpy
+
+DEBUG = 0
+
+class testMcaTheory(unittest.TestCase):
+    def _getMcaTheory(self, hypermet, continuum, summing):
+        from PyMca5.PyMcaPhysics.xrf import ClassMcaTheory
+        mcafit = ClassMcaTheory.McaTheory()
+        config = mcafit.configure()
+        config['peaks'] = {'Fe': 'K', 'Cu': 'K', 'Zn': 'K'}
+        config['fit']['energy'] = [20.0]
+        config['fit']['hypermetflag'] = hypermet
+        config['fit']['continuum'] = continuum
+        config['fit']['sumflag'] = summing
+        config['fit']['stripflag'] = 0
+        config['fit']['linpolorder'] = 2
+        config['fit']['exppolorder'] = 2
+        config['fit']['xmin'] = 100
+        config['fit']['xmax'] = 1000
+        # the pile-up is shifted by int(zero/gain) channels, keep the
+        # ratio away from an integer for the finite differences
+        config['detector']['zero'] = -0.047
+        config['detector']['gain'] = 0.01
+        mcafit.configure(config)
+        x = numpy.arange(2048.)
+        energy = -0.047 + 0.01 * x
+        y = 5.0 + 0.001 * x
+        for area, position, sigma in [(2.0e4, 6.40, 0.07),
+                                      (1.0e4, 8.05, 0.08),
+                                      (6.0e3, 8.64, 0.08)]:
+            y += area * 0.01 / (sigma * numpy.sqrt(2 * numpy.pi)) * \
+                 numpy.exp(-0.5 * ((energy - position) / sigma) ** 2)
+        mcafit.setData(x, y)
+        mcafit.estimate()
+        return mcafit
+
+    def _getFiniteDifference(self, mcafit, param, index, x):
+        delta = 1.0e-6 * max(abs(param[index]), 1.0e-3)
+        param1 = param.copy()
+        param1[index] += delta
+        param2 = param.copy()
+        param2[index] -= delta
+        return (mcafit.mcatheory(param1, x) - mcafit.mcatheory(param2, x)) /\
+               (2 * delta)
+
+    def testAnalyticalJacobian(self):
+        from PyMca5.PyMcaMath.fitting import Gefit
+        for hypermet in [15, 1, 0]:
+            # no continuum, constant, linear, parabolic, linear and
+            # exponential polynomials
+            for continuum in range(6):
+                for summing in [0, 1]:
+                    mcafit = self._getMcaTheory(hypermet, continuum, summing)
+                    param = numpy.array(mcafit.parameters, dtype=numpy.float64)
+                    param[mcafit.NGLOBAL:] = [2.0e4, 1.0e4, 6.0e3]
+                    if summing:
+                        param[mcafit.PARAMETERS.index('Sum')] = 1.0e-6
+                    x = mcafit.datatofit[:, 0]
+                    indices = [i for i, code in enumerate(mcafit.codes[0]) \
+                               if code != Gefit.CFIXED]
+                    yfit, jacobian = mcafit.analyticalJacobian(param,
+                                                               indices, x)
+                    expected = mcafit.mcatheory(param, x)
+                    self.assertTrue(numpy.allclose(yfit, expected,
+                                                   rtol=1.0e-10, atol=0.0))
+                    # a column of points gives the same result
+                    yfit2, jacobian2 = mcafit.analyticalJacobian(param,
+                                                indices, x.reshape(-1, 1))
+                    self.assertTrue(numpy.array_equal(yfit2, yfit))
+                    self.assertTrue(numpy.array_equal(jacobian2, jacobian))
+                    for i, index in enumerate(indices):
+                        name = mcafit.PARAMETERS[index] \
+                               if index < mcafit.NGLOBAL else "area"
+                        if summing and (name not in ['Zero', 'Gain', 'Noise',
+                                                     'Fano', 'Sum']):
+                            # the pile-up of areas and continuum is
+                            # neglected
+                            continue
+                        deriv = self._getFiniteDifference(mcafit, param,
+                                                          index, x)
+                        delta = abs(jacobian[i] - deriv).max() / \
+                                abs(deriv).max()
+                        self.assertTrue(delta < 1.0e-4,
+                            "Derivative %s differs by %g, hypermet %d, " \
+                            "continuum %d, summing %d" % \
+                            (name, delta, hypermet, continuum, summing))
+
+    def testLinearMatrix(self):
+        # peak shape fixed, the peak families are calculated once
+        mcafit = self._getMcaTheory(15, 2, 0)
+        param = numpy.array(mcafit.parameters, dtype=numpy.float64)
+        param[mcafit.NGLOBAL:] = [2.0e4, 1.0e4, 6.0e3]
+        x = mcafit.datatofit[:, 0]
+        mcafit._calculateLinearMatrix(param, x)
+        self.assertTrue(mcafit._isLinearMatrixValid(param, x))
+        for points in [x, x[::3]]:
+            expected = mcafit.mcatheory(param, points)
+            result = mcafit.linearMcaTheory(param, points)
+            self.assertTrue(numpy.allclose(result, expected,
+                                           rtol=1.0e-10, atol=0.0))
+        indices = [mcafit.PARAMETERS.index(name) for name in \
+                   ['Constant', '1st Order']] + \
+                  list(range(mcafit.NGLOBAL, len(param)))
+        yfit, jacobian = mcafit.analyticalJacobian(param, indices, x)
+        result, jacobian2 = mcafit.linearMcaTheoryJacobian(param, indices, x)
+        self.assertTrue(numpy.allclose(result, yfit, rtol=1.0e-10, atol=0.0))
+        self.assertTrue(numpy.allclose(jacobian2, jacobian,
+                                       rtol=1.0e-10, atol=0.0))
+        # the matrix does not depend on the areas
+        newParam = param.copy()
+        newParam[mcafit.NGLOBAL:] *= 2
+        self.assertTrue(mcafit._isLinearMatrixValid(newParam, x))
+        newParam[mcafit.PARAMETERS.index('Noise')] *= 1.1
+        self.assertFalse(mcafit._isLinearMatrixValid(newParam, x))
+        self.assertFalse(mcafit._isLinearMatrixValid(param, x[1:]))
+
+    def testWarmStart(self):
+        from PyMca5.PyMcaMath.fitting import Gefit
+        mcafit = self._getMcaTheory(15, 2, 0)
+        x = numpy.arange(2048.)
+        param = numpy.array(mcafit.parameters, dtype=numpy.float64)
+        param[mcafit.PARAMETERS.index('Zero')] = -0.045
+        param[mcafit.PARAMETERS.index('Noise')] = 0.11
+        param[mcafit.PARAMETERS.index('Constant')] = 5.0
+        param[mcafit.PARAMETERS.index('1st Order')] = 0.001
+        param[mcafit.NGLOBAL:] = [2.0e4, 1.0e4, 6.0e3]
+        mcafit.setData(x, mcafit.mcatheory(param, x))
+        mcafit.estimate()
+        mcafit.startfit(digest=0)
+        previous = list(mcafit.fittedpar)
+
+        # a neighbouring spectrum fitted from the estimate and from the
+        # parameters of the previous one
+        param[mcafit.NGLOBAL:] = [2.4e4, 1.0e4, 5.0e3]
+        y = mcafit.mcatheory(param, x)
+        mcafit.setData(x, y)
+        mcafit.estimate()
+        mcafit.startfit(digest=0)
+        expected = numpy.array(mcafit.fittedpar)
+        self.assertTrue(numpy.allclose(expected[mcafit.NGLOBAL:],
+                                       param[mcafit.NGLOBAL:], rtol=1.0e-6))
+        mcafit.setData(x, y)
+        mcafit.estimate(parameters=previous)
+        mcafit.startfit(digest=0)
+        result = numpy.array(mcafit.fittedpar)
+        self.assertTrue(numpy.allclose(result, expected,
+                                       rtol=1.0e-6, atol=1.0e-10))
+
+        # quoted starting values are kept inside their limits
+        mcafit.estimate()
+        quoted = [i for i in range(len(param)) \
+                  if mcafit.codes[0][i] == Gefit.CQUOTED]
+        self.assertTrue(len(quoted) > 0)
+        start = list(previous)
+        for i in quoted:
+            start[i] = max(mcafit.codes[1][i], mcafit.codes[2][i]) + 1.0
+        mcafit.estimate(parameters=start)
+        for i in quoted:
+            pmin = min(mcafit.codes[1][i], mcafit.codes[2][i])
+            pmax = max(mcafit.codes[1][i], mcafit.codes[2][i])
+            self.assertTrue(pmin <= mcafit.parameters[i] < pmax)
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testMcaTheory))
+    else:
+        # use a predefined order
+        testSuite.addTest(testMcaTheory("testAnalyticalJacobian"))
+        testSuite.addTest(testMcaTheory("testLinearMatrix"))
+        testSuite.addTest(testMcaTheory("testWarmStart"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,247 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import os
+import gc
+import time
+import threading
+import tempfile
+import shutil
+import unittest
+import numpy
+try:
+    import h5py
+    HAS_H5PY = True
+except ImportError:
+    HAS_H5PY = False
+
+DEBUG = 0
+
+class testNexusDataSource(unittest.TestCase):
+    def setUp(self):
+        self._tmpDir = tempfile.mkdtemp(prefix="pymcatmp")
+        self._sources = []
+        if not HAS_H5PY:
+            return
+        self._filename = os.path.join(self._tmpDir, "scans.h5")
+        h5 = h5py.File(self._filename, "w")
+        try:
+            # entries written in the reverse order of their start times
+            for i, name in enumerate(["scan_3", "scan_1", "scan_2"]):
+                entry = h5.create_group(name)
+                entry.attrs["NX_class"] = "NXentry"
+                entry["title"] = "ascan %d" % i
+                entry["start_time"] = "2016-01-0%dT10:00:00" % (3 - i)
+                if i < 2:
+                    entry["end_time"] = "2016-01-0%dT11:00:00" % (3 - i)
+                measurement = entry.create_group("measurement")
+                measurement["energy"] = numpy.linspace(5.0, 6.0, 11) + i
+                measurement["I0"] = numpy.arange(11.) + 100 * (i + 1)
+                measurement["mca"] = numpy.arange(11 * 32).reshape(11, 32) * \
+                                     (i + 1)
+                measurement["mca"].attrs["interpretation"] = "spectrum"
+        finally:
+            h5.close()
+
+    def tearDown(self):
+        for source in self._sources:
+            for instance in source._sourceObjectList:
+                instance.close()
+        self._sources = None
+        gc.collect()
+        shutil.rmtree(self._tmpDir)
+
+    def _getSource(self):
+        from PyMca5.PyMcaCore import NexusDataSource
+        source = NexusDataSource.NexusDataSource(self._filename)
+        self._sources.append(source)
+        return source
+
+    def _getSelection(self, entry, selectionType="SCAN"):
+        return {"sourcename": self._filename,
+                "entry": entry,
+                "selectiontype": selectionType,
+                "cntlist": ["/measurement/energy",
+                            "/measurement/I0",
+                            "/measurement/mca"],
+                "x": [0],
+                "y": [2] if selectionType == "2D" else [1],
+                "m": [] if selectionType == "2D" else [1]}
+
+    @unittest.skipIf(not HAS_H5PY, "h5py not installed")
+    def testFileIndex(self):
+        source = self._getSource()
+        fileIndex = source.getFileIndex()
+        fileIndex.wait()
+        self.assertEqual(fileIndex.getEntryNames(),
+                         list(source._sourceObjectList[0]["/"].keys()))
+        self.assertEqual(fileIndex.getSortedEntryNames(),
+                         ["scan_2", "scan_1", "scan_3"])
+        self.assertEqual(fileIndex.getEntryIndex("/scan_2"),
+                         fileIndex.getEntryNames().index("scan_2"))
+        self.assertEqual(sorted(fileIndex.getChildren("/scan_1/measurement")),
+                         ["I0", "energy", "mca"])
+        info = fileIndex.getNodeInfo("/scan_1/measurement/mca")
+        self.assertFalse(info["isGroup"])
+        self.assertEqual(info["shape"], (11, 32))
+        self.assertEqual(info["attrs"]["interpretation"], "spectrum")
+        info = fileIndex.getNodeInfo("/scan_3")
+        self.assertEqual(info["values"]["title"], "ascan 0")
+        self.assertEqual(info["attrs"]["NX_class"], "NXentry")
+        self.assertFalse("end_time" in fileIndex.getNodeInfo( \
+                                                "/scan_2")["values"])
+        self.assertEqual(len(source.getSourceInfo()["KeyList"]), 3)
+
+    @unittest.skipIf(not HAS_H5PY, "h5py not installed")
+    def testRefresh(self):
+        from PyMca5.PyMcaCore import NexusDataSource
+        h5 = h5py.File(self._filename, "a")
+        try:
+            fileIndex = NexusDataSource.NexusFileIndex(h5, background=False)
+            self.assertEqual(len(fileIndex.getEntryNames()), 3)
+            # a new entry and the end of an unfinished one
+            entry = h5.create_group("scan_4")
+            entry["start_time"] = "2016-01-04T10:00:00"
+            h5["/scan_2/end_time"] = "2016-01-01T11:00:00"
+            h5.flush()
+            # make sure the modification time changes
+            mtime = os.path.getmtime(self._filename)
+            os.utime(self._filename, (mtime + 10, mtime + 10))
+            fileIndex.refresh(background=False)
+            self.assertEqual(len(fileIndex.getEntryNames()), 4)
+            self.assertEqual(fileIndex.getSortedEntryNames()[-1], "scan_4")
+            self.assertEqual( \
+                fileIndex.getNodeInfo("/scan_2")["values"]["end_time"],
+                "2016-01-01T11:00:00")
+            self.assertTrue(NexusDataSource.getFileIndex(h5) is \
+                            NexusDataSource.getFileIndex(h5))
+        finally:
+            h5.close()
+
+    @unittest.skipIf(not HAS_H5PY, "h5py not installed")
+    def testBackgroundRefresh(self):
+        from PyMca5.PyMcaCore import NexusDataSource
+        h5 = h5py.File(self._filename, "a")
+        release = threading.Event()
+        try:
+            fileIndex = NexusDataSource.NexusFileIndex(h5, background=False)
+            # keep the indexing thread busy until released
+            indexGroup = fileIndex._indexGroup
+            def slowIndexGroup(path):
+                release.wait(5.0)
+                return indexGroup(path)
+            fileIndex._indexGroup = slowIndexGroup
+            h5.create_group("scan_4/measurement")
+            fileIndex.refresh(background=True)
+            thread = fileIndex._thread
+            self.assertTrue(fileIndex.isIndexing())
+            # a refresh does not wait for the running thread
+            h5.create_group("scan_5/measurement")
+            t0 = time.time()
+            fileIndex.refresh(background=True)
+            self.assertTrue((time.time() - t0) < 2.0)
+            self.assertTrue(fileIndex._thread is thread)
+            self.assertEqual(len(fileIndex.getEntryNames()), 5)
+            release.set()
+            fileIndex.wait()
+            self.assertFalse(fileIndex.isIndexing())
+            for name in ["scan_4", "scan_5"]:
+                info = fileIndex._nodes["/%s/measurement" % name]
+                self.assertEqual(info["children"], [])
+        finally:
+            release.set()
+            h5.close()
+
+    @unittest.skipIf(not HAS_H5PY, "h5py not installed")
+    def testSelectionList(self):
+        source = self._getSource()
+        fileIndex = source.getFileIndex()
+        keyList = []
+        selectionList = []
+        for name in fileIndex.getEntryNames():
+            key = "1.%d" % (fileIndex.getEntryIndex(name) + 1)
+            for selectionType in ["SCAN", "2D"]:
+                keyList.append(key)
+                selectionList.append(self._getSelection("/" + name,
+                                                        selectionType))
+        # the same selection twice shares the datasets
+        keyList.append(keyList[0])
+        selectionList.append(selectionList[0])
+        objectList = source.getDataObject(keyList, selectionList)
+        self.assertEqual(len(objectList), len(keyList))
+        for key, selection, dataObject in zip(keyList, selectionList,
+                                              objectList):
+            expected = source.getDataObject(key, selection)
+            self.assertEqual(dataObject.info["Key"], expected.info["Key"])
+            self.assertEqual(dataObject.info["selectiontype"],
+                             expected.info["selectiontype"])
+            for attribute in ["x", "y", "m", "data"]:
+                current = getattr(dataObject, attribute)
+                reference = getattr(expected, attribute)
+                if reference is None:
+                    self.assertTrue(current is None)
+                    continue
+                if attribute == "data":
+                    current = [current]
+                    reference = [reference]
+                self.assertEqual(len(current), len(reference))
+                for a, b in zip(current, reference):
+                    self.assertTrue(numpy.array_equal(a, b))
+        # every data object gets its own arrays
+        objectList[0].y[0][:] = 0
+        self.assertTrue(objectList[-1].y[0].max() > 0)
+        self.assertTrue(objectList[0].m[0] is not objectList[0].y[0])
+        # one selection for all the keys
+        objectList = source.getDataObject(keyList[:2], selectionList[0])
+        self.assertEqual(len(objectList), 2)
+        self.assertTrue(numpy.array_equal(objectList[0].y[0],
+                                          objectList[1].y[0]))
+        self.assertRaises(ValueError, source.getDataObject, keyList[:2],
+                          selectionList[:1])
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testNexusDataSource))
+    else:
+        # use a predefined order
+        testSuite.addTest(testNexusDataSource("testFileIndex"))
+        testSuite.addTest(testNexusDataSource("testRefresh"))
+        testSuite.addTest(testNexusDataSource("testBackgroundRefresh"))
+        testSuite.addTest(testNexusDataSource("testSelectionList"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
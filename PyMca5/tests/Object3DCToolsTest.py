@@ -0,0 +1,202 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import numpy
+
+try:
+    from PyMca5.Object3D import Object3DCTools
+except ImportError:
+    Object3DCTools = None
+
+DEBUG = 0
+
+def _sortedTriangles(vertices, normals=None):
+    # one row per triangle, rows sorted to compare results independently
+    # of the order in which the bricks and the cubes were processed
+    rows = vertices.reshape(-1, 9)
+    if normals is not None:
+        rows = numpy.concatenate((rows, normals.reshape(-1, 9)), axis=1)
+    rows = numpy.round(rows.astype(numpy.float64), 5)
+    return rows[numpy.lexsort(rows.T[::-1])]
+
+class testObject3DCTools(unittest.TestCase):
+    def setUp(self):
+        self._x = numpy.linspace(-1.0, 1.0, 21).astype(numpy.float32)
+        self._y = numpy.linspace(-1.0, 1.0, 18).astype(numpy.float32)
+        self._z = numpy.linspace(-1.0, 1.0, 25).astype(numpy.float32)
+        X, Y, Z = numpy.meshgrid(self._x, self._y, self._z, indexing="ij")
+        self._values = numpy.sqrt(X * X + Y * Y + Z * Z).astype(numpy.float32)
+        self._isoValue = 0.6
+
+    def _isosurface(self, values, *args):
+        return Object3DCTools.gridMarchingCubesBlocks(self._x, self._y,
+                                                      self._z, values,
+                                                      self._isoValue, *args)
+
+    @unittest.skipIf(Object3DCTools is None,
+                     "Object3DCTools extension not available")
+    def testSphereBrickSizes(self):
+        vertices, normals = self._isosurface(self._values)
+        self.assertEqual(vertices.shape, normals.shape)
+        self.assertEqual(vertices.shape[1], 3)
+        self.assertTrue(vertices.shape[0] > 0)
+        self.assertEqual(vertices.shape[0] % 3, 0)
+
+        # the vertices lie on the sphere up to the interpolation error
+        radius = numpy.sqrt((vertices * vertices).sum(axis=1))
+        self.assertTrue(numpy.allclose(radius, self._isoValue, atol=0.02))
+
+        # unit normals pointing towards the decreasing values, the center
+        length = numpy.sqrt((normals * normals).sum(axis=1))
+        self.assertTrue(numpy.allclose(length, 1.0, atol=1.0e-4))
+        self.assertTrue(((vertices * normals).sum(axis=1) < 0).all())
+
+        # the bricks only change the order of the triangles
+        reference = _sortedTriangles(vertices, normals)
+        for brickSize in [1, 3, 8, 100]:
+            result = self._isosurface(self._values, (1, 1, 1), brickSize)
+            self.assertTrue(numpy.array_equal(_sortedTriangles(*result),
+                                              reference),
+                            "Brick size %d changes the triangles" % brickSize)
+
+    @unittest.skipIf(Object3DCTools is None,
+                     "Object3DCTools extension not available")
+    def testSphereSteps(self):
+        steps = (2, 1, 3)
+        x = numpy.ascontiguousarray(self._x[::steps[0]])
+        y = numpy.ascontiguousarray(self._y[::steps[1]])
+        z = numpy.ascontiguousarray(self._z[::steps[2]])
+        values = numpy.ascontiguousarray(self._values[::steps[0],
+                                                      ::steps[1],
+                                                      ::steps[2]])
+        reference = _sortedTriangles(*Object3DCTools.gridMarchingCubesBlocks(
+                                            x, y, z, values, self._isoValue))
+        self.assertTrue(len(reference))
+        for brickSize in [1, 4, 32]:
+            result = self._isosurface(self._values, steps, brickSize)
+            self.assertTrue(numpy.array_equal(_sortedTriangles(*result),
+                                              reference),
+                    "Steps %s with brick size %d differ from a subsampled "
+                    "grid" % (steps, brickSize))
+
+    @unittest.skipIf(Object3DCTools is None,
+                     "Object3DCTools extension not available")
+    def testPointsInRange(self):
+        numpy.random.seed(7)
+        values = numpy.random.random(self._values.shape).astype(numpy.float32)
+        values[3, 4, 5] = numpy.nan
+        values[10, 0, :] = numpy.nan
+        # exact bounds must be included
+        values[0, 0, 0] = 0.25
+        values[1, 1, 1] = 0.75
+        colors = numpy.random.randint(0, 256,
+                                      size=values.shape + (4,)).astype(numpy.uint8)
+        vMin, vMax = 0.25, 0.75
+        vertices, colorsOut = Object3DCTools.get3DGridPointsInRange(
+                                            self._x, self._y, self._z,
+                                            values, vMin, vMax, colors)
+
+        # numpy reference, the NaN values compare as False
+        X, Y, Z = numpy.meshgrid(self._x, self._y, self._z, indexing="ij")
+        with numpy.errstate(invalid="ignore"):
+            mask = ((values >= numpy.float32(vMin)) &
+                    (values <= numpy.float32(vMax))).ravel()
+        expected = numpy.column_stack((X.ravel()[mask],
+                                       Y.ravel()[mask],
+                                       Z.ravel()[mask]))
+        self.assertEqual(vertices.shape, expected.shape)
+        self.assertTrue(numpy.array_equal(vertices, expected))
+        self.assertEqual(colorsOut.dtype, numpy.uint8)
+        self.assertTrue(numpy.array_equal(colorsOut,
+                                          colors.reshape(-1, 4)[mask]))
+
+        vertices, colorsOut = Object3DCTools.get3DGridPointsInRange(
+                                            self._x, self._y, self._z,
+                                            values, vMin, vMax)
+        self.assertTrue(colorsOut is None)
+        self.assertTrue(numpy.array_equal(vertices, expected))
+
+    @unittest.skipIf(Object3DCTools is None,
+                     "Object3DCTools extension not available")
+    def testNaNValues(self):
+        # the cubes around a NaN value are skipped, the rest of the
+        # isosurface is unchanged
+        full = _sortedTriangles(*self._isosurface(self._values))
+        X, Y, Z = numpy.meshgrid(self._x, self._y, self._z, indexing="ij")
+        i, j, k = numpy.unravel_index(
+                        numpy.argmin(numpy.abs(self._values - self._isoValue)),
+                        self._values.shape)
+        values = self._values.copy()
+        values[i, j, k] = numpy.nan
+        for brickSize in [1, 5, 32]:
+            vertices, normals = self._isosurface(values, (1, 1, 1), brickSize)
+            self.assertTrue(numpy.isfinite(vertices).all())
+            self.assertTrue(numpy.isfinite(normals).all())
+            result = _sortedTriangles(vertices)
+            self.assertTrue(0 < len(result) < len(full))
+
+            # every triangle also belongs to the full isosurface
+            fullVertices = set(map(tuple, full[:, :9]))
+            self.assertTrue(set(map(tuple, result)).issubset(fullVertices))
+
+            # only the triangles next to the NaN value are missing
+            node = numpy.array([self._x[i], self._y[j], self._z[k]])
+            cell = max(self._x[1] - self._x[0], self._y[1] - self._y[0],
+                       self._z[1] - self._z[0])
+            missing = fullVertices - set(map(tuple, result))
+            for row in missing:
+                distance = numpy.abs(numpy.array(row).reshape(3, 3) - node)
+                self.assertTrue((distance <= cell + 1.0e-5).all())
+
+        # the whole isosurface vanishes with NaN values only
+        values[:] = numpy.nan
+        vertices, normals = self._isosurface(values)
+        self.assertEqual(vertices.shape[0], 0)
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testObject3DCTools))
+    else:
+        # use a predefined order
+        testSuite.addTest(testObject3DCTools("testSphereBrickSizes"))
+        testSuite.addTest(testObject3DCTools("testSphereSteps"))
+        testSuite.addTest(testObject3DCTools("testPointsInRange"))
+        testSuite.addTest(testObject3DCTools("testNaNValues"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
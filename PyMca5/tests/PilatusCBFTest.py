@@ -0,0 +1,160 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import os
+import sys
+import struct
+import tempfile
+import shutil
+import unittest
+import numpy
+
+DEBUG = 0
+
+def _decodeReference(stream, size):
+    # value by value decoding following the byte offset definition
+    output = numpy.zeros((size,), dtype=numpy.int64)
+    value = 0
+    pos = 0
+    for i in range(size):
+        delta = struct.unpack("<b", stream[pos:pos + 1])[0]
+        pos += 1
+        if delta == -128:
+            delta = struct.unpack("<h", stream[pos:pos + 2])[0]
+            pos += 2
+            if delta == -32768:
+                delta = struct.unpack("<i", stream[pos:pos + 4])[0]
+                pos += 4
+                if delta == -2147483648:
+                    delta = struct.unpack("<q", stream[pos:pos + 8])[0]
+                    pos += 8
+        value += delta
+        output[i] = value
+    return output.astype(numpy.int32)
+
+class testPilatusCBF(unittest.TestCase):
+    def setUp(self):
+        self._tmpDir = tempfile.mkdtemp(prefix="pymcatmp")
+        # differences needing one, three, seven and fifteen bytes
+        data = numpy.arange(40 * 30, dtype=numpy.int32).reshape(40, 30) % 17
+        data[3, 4] = 1000
+        data[5, 0:3] = [-200, 127, -128]
+        data[7, 9] = 40000
+        data[8, 1] = -70000
+        data[9, 2:5] = [2147483647, -2147483648, 2147483647]
+        data[20, :] = -1
+        data[39, 29] = 32767
+        self._data = data
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpDir)
+
+    def testEncodeDecode(self):
+        from PyMca5.PyMcaIO import PilatusCBF
+        stream = PilatusCBF.encodeByteOffset(self._data)
+        self.assertEqual(stream.dtype, numpy.uint8)
+        if sys.version < '3.0':
+            stream = stream.tostring()
+        else:
+            stream = stream.tobytes()
+        reference = _decodeReference(stream, self._data.size)
+        self.assertTrue(numpy.array_equal(reference, self._data.reshape(-1)),
+                        "Encoded stream does not follow the definition")
+        decoded = PilatusCBF.decodeByteOffset(stream, self._data.size)
+        self.assertEqual(decoded.dtype, numpy.int32)
+        self.assertTrue(numpy.array_equal(decoded, self._data.reshape(-1)))
+        # decoding into a given array
+        output = numpy.zeros(self._data.shape, dtype=numpy.int32)
+        PilatusCBF.decodeByteOffset(stream, self._data.size, output=output)
+        self.assertTrue(numpy.array_equal(output, self._data))
+        self.assertRaises(ValueError, PilatusCBF.decodeByteOffset,
+                          stream, self._data.size,
+                          numpy.zeros((self._data.size,), numpy.int64))
+        # the stream does not hold enough values
+        self.assertRaises(IOError, PilatusCBF.decodeByteOffset,
+                          stream, self._data.size + 1)
+
+    def testPythonVersion(self):
+        from PyMca5.PyMcaIO import PilatusCBF
+        stream = PilatusCBF.encodeByteOffset(self._data)
+        output = numpy.zeros((self._data.size,), dtype=numpy.int32)
+        n = PilatusCBF._decodeByteOffset(stream, output)
+        self.assertEqual(n, self._data.size)
+        self.assertTrue(numpy.array_equal(output, self._data.reshape(-1)))
+        cEncoder = PilatusCBF._cEncodeByteOffset
+        PilatusCBF._cEncodeByteOffset = None
+        try:
+            pythonStream = PilatusCBF.encodeByteOffset(self._data)
+        finally:
+            PilatusCBF._cEncodeByteOffset = cEncoder
+        self.assertTrue(numpy.array_equal(pythonStream, stream))
+
+    def testSaveRead(self):
+        from PyMca5.PyMcaIO import PilatusCBF
+        filelist = []
+        for i in range(5):
+            filename = os.path.join(self._tmpDir, "frame_%04d.cbf" % i)
+            PilatusCBF.saveCBF(filename, self._data + i,
+                               header={"Exposure_time": "1.0 s"})
+            filelist.append(filename)
+        cbf = PilatusCBF.PilatusCBF(filelist[0])
+        data = cbf.getData()
+        self.assertEqual(data.shape, self._data.shape)
+        self.assertTrue(numpy.array_equal(data, self._data))
+        self.assertEqual(int(cbf.getInfo()["X-Binary-Number-of-Elements"]),
+                         self._data.size)
+        # frames are given in the order of the list
+        for nThreads in [1, 3]:
+            i = 0
+            for data in PilatusCBF.iterData(filelist, nThreads=nThreads):
+                self.assertTrue(numpy.array_equal(data, self._data + i),
+                                "Wrong frame %d with %d threads" % \
+                                (i, nThreads))
+                i += 1
+            self.assertEqual(i, len(filelist))
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testPilatusCBF))
+    else:
+        # use a predefined order
+        testSuite.addTest(testPilatusCBF("testEncodeDecode"))
+        testSuite.addTest(testPilatusCBF("testPythonVersion"))
+        testSuite.addTest(testPilatusCBF("testSaveRead"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -79,8 +79,12 @@ def tearDown(self):
         # this should free the handle
         gc.collect()
         if self.specfileClass is not None:
-            if os.path.exists(self.fname):
-                os.remove(self.fname)
+            dirname, basename = os.path.split(self.fname)
+            indexName = os.path.join(dirname, "." + basename + ".pymcaidx")
+            for fname in [self.fname, self.fname + ".idx",
+                          indexName, indexName + ".json"]:
+                if os.path.exists(fname):
+                    os.remove(fname)
 
     def testSpecfileImport(self):
         #"""Test successful import"""
@@ -143,6 +147,116 @@ def testSpecfileReadingCompatibleWithUserLocale(self):
                     (datacol[1], data[0][1]))
         gc.collect()
 
+    def testSpecfileIndexFile(self):
+        #"""Test specfile reading with a scan index file"""
+        self.testSpecfileImport()
+        indexName = self.fname + ".idx"
+        self._sf = self.specfileClass.Specfile(self.fname, indexName)
+        self.assertEqual(self._sf.scanno(), 2)
+        self._sf = None
+        gc.collect()
+        self.assertTrue(os.path.exists(indexName),
+                        "Scan index file not written")
+
+        # scans appended to the file
+        text  = "#S 10  Undefined command 2\n"
+        text += "#N 2\n"
+        text += "#L A  B\n"
+        text += "5  6\n"
+        text += "\n"
+        f = open(self.fname, "ab")
+        if sys.version < '3.0':
+            f.write(text)
+        else:
+            f.write(bytes(text, 'utf-8'))
+        f.close()
+        for i in range(2):
+            # first time from the appended part, then from the index
+            self._sf = self.specfileClass.Specfile(self.fname, indexName)
+            self.assertEqual(self._sf.list(), "10,20,10")
+            self._scan = self._sf.select('10.2')
+            self.assertEqual(self._scan.alllabels(), ['A', 'B'])
+            self.assertEqual(self._scan.datacol(2)[0], 6)
+            self._scan = self._sf.select('20.1')
+            self.assertEqual(self._scan.datacol(1)[2], 3.7)
+            self._scan = None
+            self._sf = None
+            gc.collect()
+
+        # file rewritten with other contents
+        text  = "#F \n"
+        text += "\n"
+        text += "#S 30  Undefined command 0\n"
+        text += "#N 1\n"
+        text += "#L C\n"
+        text += "7\n"
+        text += "\n"
+        f = open(self.fname, "wb")
+        if sys.version < '3.0':
+            f.write(text)
+        else:
+            f.write(bytes(text, 'utf-8'))
+        f.close()
+        self._sf = self.specfileClass.Specfile(self.fname, indexName)
+        self.assertEqual(self._sf.list(), "30")
+        self.assertEqual(self._sf.select('30.1').datacol(1)[0], 7)
+        self._sf = None
+        gc.collect()
+
+    def testSpecFileDataSourceSummary(self):
+        #"""Test the scan summary kept next to the data file"""
+        self.testSpecfileImport()
+        from PyMca5.PyMcaCore import SpecFileDataSource
+        def writeFile(command, mode="wb"):
+            text  = "#F \n"
+            text += "\n"
+            for i in range(3):
+                text += "#S %d  %s  m0 0 1 %d 0.1\n" % (i + 1, command, i + 1)
+                text += "#N 2\n"
+                text += "#L m0  C\n"
+                for j in range(10 * i + 2):
+                    text += "%d  %d\n" % (j, j * j)
+                text += "\n"
+            f = open(self.fname, mode)
+            if sys.version < '3.0':
+                f.write(text)
+            else:
+                f.write(bytes(text, 'utf-8'))
+            f.close()
+        oldSize = SpecFileDataSource.SCAN_INDEX_MIN_SIZE
+        SpecFileDataSource.SCAN_INDEX_MIN_SIZE = 0
+        try:
+            writeFile("ascan")
+            source = SpecFileDataSource.SpecFileDataSource(self.fname)
+            info = source.getSourceInfo()
+            self.assertEqual(info["KeyList"], ["1.1", "2.1", "3.1"])
+            self.assertEqual(info["NumPts"], [2, 12, 22])
+            self.assertTrue(info["Commands"][0].startswith("ascan"))
+            indexName = SpecFileDataSource.getScanIndexFileName(self.fname)
+            self.assertTrue(os.path.exists(indexName + ".json"),
+                            "Scan summary file not written")
+            source = None
+            gc.collect()
+
+            # file rewritten in place keeping the size
+            mtime = os.path.getmtime(self.fname)
+            size = os.path.getsize(self.fname)
+            writeFile("dscan", mode="r+b")
+            os.utime(self.fname, (mtime + 10, mtime + 10))
+            self.assertEqual(os.path.getsize(self.fname), size)
+            for i in range(2):
+                # first time from the file, then from the summary
+                source = SpecFileDataSource.SpecFileDataSource(self.fname)
+                info = source.getSourceInfo()
+                self.assertEqual(info["NumPts"], [2, 12, 22])
+                for command in info["Commands"]:
+                    self.assertTrue(command.startswith("dscan"),
+                                    "Obsolete command %s" % command)
+                source = None
+                gc.collect()
+        finally:
+            SpecFileDataSource.SCAN_INDEX_MIN_SIZE = oldSize
+
 def getSuite(auto=True):
     testSuite = unittest.TestSuite()
     if auto:
@@ -154,6 +268,8 @@ def getSuite(auto=True):
         testSuite.addTest(testSpecfile("testSpecfileReading"))
         testSuite.addTest(\
             testSpecfile("testSpecfileReadingCompatibleWithUserLocale"))
+        testSuite.addTest(testSpecfile("testSpecfileIndexFile"))
+        testSuite.addTest(testSpecfile("testSpecFileDataSourceSummary"))
     return testSuite
 
 def test(auto=False):
@@ -0,0 +1,119 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import numpy
+
+DEBUG = 0
+
+class testSpecfitFuns(unittest.TestCase):
+    def setUp(self):
+        self._random = numpy.random.RandomState(3)
+        self.x = numpy.linspace(0.5, 20.0, 2000)
+
+    def _getPeakTables(self, ncolumns, fwhm, nGroups=4):
+        tables = []
+        for i in range(nGroups):
+            n = self._random.randint(1, 6)
+            table = numpy.zeros((n, ncolumns))
+            table[:, 0] = self._random.uniform(10, 1000, n)
+            table[:, 1] = self._random.uniform(1, 19, n)
+            table[:, 2] = fwhm * self._random.uniform(0.8, 1.2, n)
+            tables.append(table)
+        groups = numpy.concatenate([numpy.zeros((len(table),), numpy.int32) + i\
+                                    for i, table in enumerate(tables)])
+        return tables, numpy.concatenate(tables), groups
+
+    def _check(self, expected, matrix, result, text):
+        scale = abs(expected).max()
+        delta = abs(matrix - expected).max() / scale
+        self.assertTrue(delta < 1.0e-10,
+                        "%s matrix differs by %g" % (text, delta))
+        delta = abs(result - expected.sum(axis=1)).max() / scale
+        self.assertTrue(delta < 1.0e-10,
+                        "%s sum differs by %g" % (text, delta))
+
+    def testHypermetGroups(self):
+        from PyMca5.PyMcaMath.fitting import SpecfitFuns
+        for tails in [15, 1, 3, 5, 9]:
+            for fwhm in [0.05, 0.15, 0.4]:
+                for shortTail in [(0.0, 0.5), (0.05, 0.3), (0.5, 2.0)]:
+                    for longTail in [(0.0, 10.), (0.02, 5.), (0.1, 50.)]:
+                        for step in [0.0, 1.0e-3, 1.0e-2]:
+                            tables, a, groups = self._getPeakTables(8, fwhm)
+                            for table in tables:
+                                table[:, 3:5] = shortTail
+                                table[:, 5:7] = longTail
+                                table[:, 7] = step
+                            a = numpy.concatenate(tables)
+                            # one call per peak family
+                            expected = numpy.array(\
+                                [SpecfitFuns.ahypermet(table, self.x, tails) \
+                                 for table in tables]).T
+                            matrix = SpecfitFuns.ahypermetgroups(a, groups,
+                                                self.x, tails, 1, len(tables))
+                            result = SpecfitFuns.ahypermetgroups(a, groups,
+                                                self.x, tails)
+                            self._check(expected, matrix, result,
+                                        "Hypermet tails %d" % tails)
+
+    def testPseudoVoigtGroups(self):
+        from PyMca5.PyMcaMath.fitting import SpecfitFuns
+        for fwhm in [0.05, 0.15, 0.4]:
+            for eta in [0.0, 0.3, 1.0]:
+                tables, a, groups = self._getPeakTables(4, fwhm)
+                for table in tables:
+                    table[:, 3] = eta
+                a = numpy.concatenate(tables)
+                expected = numpy.array([SpecfitFuns.apvoigt(table, self.x) \
+                                        for table in tables]).T
+                matrix = SpecfitFuns.apvoigtgroups(a, groups, self.x,
+                                                   1, len(tables))
+                result = SpecfitFuns.apvoigtgroups(a, groups, self.x)
+                self._check(expected, matrix, result,
+                            "Pseudo-Voigt eta %g" % eta)
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testSpecfitFuns))
+    else:
+        # use a predefined order
+        testSuite.addTest(testSpecfitFuns("testHypermetGroups"))
+        testSuite.addTest(testSpecfitFuns("testPseudoVoigtGroups"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,147 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2014 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import os
+import sys
+import threading
+import time
+import numpy
+
+try:
+    from PyMca5.PyMcaIO import sps
+except ImportError:
+    sps = None
+
+
+@unittest.skipIf(sps is None, "sps module not available")
+class testSps(unittest.TestCase):
+    def setUp(self):
+        """
+        create a shared memory array owned by this process
+        """
+        self._spec = "pymcatest%d" % os.getpid()
+        self._array = "MCA_DATA"
+        self._shared = sps.create(self._spec, self._array, 2, 16,
+                                  sps.DOUBLE, sps.IS_MCA)
+        sps.putdata(self._spec, self._array, numpy.zeros((2, 16)))
+
+    def tearDown(self):
+        """
+        delete the shared memory created by the test
+        """
+        self._shared = None
+        sps.cleanup()
+        self.assertFalse(self._spec in sps.getspeclist())
+
+    def _delayedUpdate(self, value, delay=0.1):
+        def update():
+            time.sleep(delay)
+            sps.putdata(self._spec, self._array,
+                        value * numpy.ones((2, 16)))
+        thread = threading.Thread(target=update)
+        thread.start()
+        return thread
+
+    def testDataView(self):
+        view = sps.getdataview(self._spec, self._array)
+        self.assertEqual(view.shape, (2, 16))
+        self.assertEqual(view.dtype, numpy.float64)
+        self.assertFalse(view.flags.writeable,
+                         "Shared memory view should be read-only")
+        self.assertTrue(numpy.all(view == 0))
+        # the view follows the shared memory contents
+        sps.putdata(self._spec, self._array, 5 * numpy.ones((2, 16)))
+        self.assertTrue(numpy.all(view == 5))
+        self.assertRaises(ValueError, view.__setitem__, (0, 0), 1.0)
+
+    def testWaitUpdateTimeout(self):
+        counter = sps.updatecounter(self._spec, self._array)
+        t0 = time.time()
+        counters = sps.waitupdate(self._spec, [self._array], [counter], 0.2)
+        elapsed = time.time() - t0
+        self.assertEqual(counters, [counter])
+        self.assertTrue(elapsed >= 0.19,
+                        "Returned after %f seconds without update" % elapsed)
+
+    def testWaitUpdate(self):
+        counter = sps.updatecounter(self._spec, self._array)
+        view = sps.getdataview(self._spec, self._array)
+        thread = self._delayedUpdate(3.0)
+        t0 = time.time()
+        counters = sps.waitupdate(self._spec, [self._array], [counter], 10.)
+        elapsed = time.time() - t0
+        thread.join()
+        self.assertNotEqual(counters[0], counter)
+        self.assertTrue(elapsed < 5.0,
+                        "Update not detected after %f seconds" % elapsed)
+        self.assertTrue(numpy.all(view == 3.0))
+
+    def testDataSource(self):
+        from PyMca5.PyMcaCore import SpsDataSource
+        source = SpsDataSource.SpsDataSource(self._spec, zerocopy=True)
+        self.assertTrue(self._array in source.getSourceInfo()['KeyList'])
+        dataObject = source.getDataObject(self._array)
+        # the data objects are not modified by spec
+        self.assertTrue(dataObject.data.flags.writeable)
+        rowObject = source.getDataObject(self._array,
+                                         selection={'rows': {'y': [1]}})
+        self.assertTrue(rowObject.y[0].flags.writeable)
+        self.assertEqual(source.waitForUpdate([self._array], 0.1), [])
+        thread = self._delayedUpdate(7.0)
+        updated = source.waitForUpdate([self._array], 10.)
+        thread.join()
+        self.assertEqual(updated, [self._array])
+        self.assertTrue(numpy.all(dataObject.data == 0.0))
+        self.assertTrue(numpy.all(rowObject.y[0] == 0.0))
+        dataObject = source.getDataObject(self._array)
+        self.assertTrue(numpy.all(dataObject.data == 7.0))
+        self.assertEqual(source.waitForUpdate([self._array], 0.1), [])
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testSps))
+    else:
+        # use a predefined order
+        testSuite.addTest(testSps("testDataView"))
+        testSuite.addTest(testSps("testWaitUpdateTimeout"))
+        testSuite.addTest(testSps("testWaitUpdate"))
+        testSuite.addTest(testSps("testDataSource"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,122 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import numpy
+
+DEBUG = 0
+
+class testStackROIBatch(unittest.TestCase):
+    def setUp(self):
+        self._random = numpy.random.RandomState(7)
+        self._config = {"ROI": {"roilist": ["Total", "Fe Ka", "Edge"],
+                                "roidict": {}}}
+        roidict = self._config["ROI"]["roidict"]
+        roidict["Total"] = {"type": "Channel", "from": 0, "to": 255}
+        roidict["Fe Ka"] = {"type": "Channel", "from": 40, "to": 52}
+        roidict["Edge"] = {"type": "Channel", "from": 50, "to": 255}
+
+    def _getExpected(self, data, x, xAtMinMax):
+        # one ROI at a time, as done by the original implementation
+        roiList = self._config["ROI"]["roilist"]
+        nRois = len(roiList)
+        nImages = 4 * nRois if xAtMinMax else 2 * nRois
+        expected = numpy.zeros((nImages,) + data.shape[:2])
+        spectra = data.astype(numpy.float64)
+        for j, roi in enumerate(roiList):
+            roiDict = self._config["ROI"]["roidict"][roi]
+            if roi == "ICR":
+                iXMin = 0
+                iXMax = data.shape[-1]
+            else:
+                iXMin = numpy.nonzero(x <= roiDict["from"])[0][-1]
+                iXMax = numpy.nonzero(x >= roiDict["to"])[0][0] + 1
+            tmpArray = spectra[:, :, iXMin:iXMax]
+            rawSum = tmpArray.sum(axis=-1)
+            expected[j] = rawSum
+            expected[j + nRois] = rawSum - 0.5 * \
+                    (tmpArray[:, :, 0] + tmpArray[:, :, -1]) * \
+                    (iXMax - iXMin + 1)
+            if xAtMinMax:
+                expected[j + 2 * nRois] = \
+                            numpy.argmax(tmpArray, axis=-1) + iXMin
+                expected[j + 3 * nRois] = \
+                            numpy.argmin(tmpArray, axis=-1) + iXMin
+        return expected
+
+    def testIntegerStack(self):
+        from PyMca5.PyMcaCore import StackROIBatch
+        x = numpy.arange(256.)
+        for dtype in [numpy.uint16, numpy.uint8]:
+            info = numpy.iinfo(dtype)
+            data = self._random.randint(info.max // 2, info.max + 1,
+                                        size=(5, 7, 256)).astype(dtype)
+            # flat spectra to check the first extreme channel is used
+            data[0, 0] = info.max
+            expected = self._getExpected(data, x, True)
+            for nThreads in [1, 2]:
+                worker = StackROIBatch.StackROIBatch()
+                result = worker.batchROIMultipleSpectra(x=x, y=data,
+                                        configuration=self._config,
+                                        xAtMinMax=True,
+                                        nThreads=nThreads)
+                self.assertEqual(len(result["names"]), 12)
+                delta = numpy.abs(result["images"] - expected).max()
+                self.assertTrue(delta < 1.0e-6,
+                        "%s stack differs by %g" % (dtype.__name__, delta))
+
+    def testFloatStackBlocks(self):
+        from PyMca5.PyMcaCore import StackROIBatch
+        x = numpy.linspace(0, 255, 256)
+        data = self._random.uniform(-5, 100, size=(3, 1201, 256))
+        expected = self._getExpected(data, x, False)
+        worker = StackROIBatch.StackROIBatch()
+        result = worker.batchROIMultipleSpectra(x=x, y=data,
+                                        configuration=self._config,
+                                        nThreads=2)
+        self.assertTrue(numpy.allclose(result["images"], expected))
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testStackROIBatch))
+    else:
+        # use a predefined order
+        testSuite.addTest(testStackROIBatch("testIntegerStack"))
+        testSuite.addTest(testStackROIBatch("testFloatStackBlocks"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,175 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import numpy
+
+DEBUG = 0
+
+class testTextTable(unittest.TestCase):
+    def setUp(self):
+        self._tmpDir = tempfile.mkdtemp(prefix="pymcatmp")
+        self._data = numpy.arange(60.).reshape(20, 3) * 1.5 - 7.0
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpDir)
+
+    def _writeFile(self, lines, eol="\n", name="table.txt"):
+        fname = os.path.join(self._tmpDir, name)
+        text = eol.join(lines) + eol
+        f = open(fname, "wb")
+        if sys.version < '3.0':
+            f.write(text)
+        else:
+            f.write(bytes(text, 'utf-8'))
+        f.close()
+        return fname
+
+    def _getLines(self, separator=" "):
+        lines = ["# a commented header", "", "#"]
+        for i, row in enumerate(self._data):
+            lines.append(separator.join(["%g" % x for x in row]))
+            if i % 7 == 3:
+                # blank and comment lines between values
+                lines.append("   ")
+                lines.append("# comment with numbers 1 2 3")
+                lines.append("")
+        lines.append("# last comment")
+        return lines
+
+    def _checkAllParsers(self, fname, expected, **kw):
+        from PyMca5.PyMcaIO import TextTable
+        cParser = TextTable._cParseTextTable
+        parsers = [None]
+        if cParser is not None:
+            parsers.append(cParser)
+        try:
+            for parser in parsers:
+                TextTable._cParseTextTable = parser
+                for chunksize in list(range(1, 11)) + [20, 33, None]:
+                    table = TextTable.readTable(fname, chunksize=chunksize,
+                                                **kw)
+                    self.assertEqual(table.shape, expected.shape,
+                        "Chunk size %s parser %s shape %s" % \
+                        (chunksize, parser, table.shape))
+                    self.assertTrue(numpy.allclose(table, expected),
+                        "Chunk size %s parser %s wrong values" % \
+                        (chunksize, parser))
+        finally:
+            TextTable._cParseTextTable = cParser
+
+    def testLineEndings(self):
+        for eol in ["\n", "\r\n", "\r"]:
+            fname = self._writeFile(self._getLines(), eol=eol)
+            self._checkAllParsers(fname, self._data)
+
+    def testSeparators(self):
+        for separator in ["\t", ",", ";", "  ", ", "]:
+            fname = self._writeFile(self._getLines(separator), eol="\r\n")
+            self._checkAllParsers(fname, self._data)
+
+    def testColumnsAndSkipRows(self):
+        lines = ["Label A  Label B  Label C"] + self._getLines()
+        fname = self._writeFile(lines, eol="\r\n")
+        self._checkAllParsers(fname, self._data[:, [2, 0]],
+                              columns=[2, 0], skiprows=1)
+
+    def testNonNumeric(self):
+        from PyMca5.PyMcaIO import TextTable
+        lines = self._getLines()
+        lines[10] = "1.0 a 3.0"
+        fname = self._writeFile(lines)
+        self.assertRaises(ValueError, TextTable.readTable, fname)
+
+    def testRaggedRows(self):
+        from PyMca5.PyMcaIO import TextTable
+        lines = self._getLines()
+        # the total number of values is still a multiple of the columns
+        lines[5] = lines[5] + " 7.0"
+        lines[12] = " ".join(lines[12].split()[:2])
+        fname = self._writeFile(lines, eol="\r\n")
+        cParser = TextTable._cParseTextTable
+        parsers = [None]
+        if cParser is not None:
+            parsers.append(cParser)
+        try:
+            for parser in parsers:
+                TextTable._cParseTextTable = parser
+                for chunksize in [7, None]:
+                    try:
+                        TextTable.readTable(fname, chunksize=chunksize)
+                    except ValueError:
+                        error = "%s" % sys.exc_info()[1]
+                    else:
+                        error = None
+                    self.assertTrue(error is not None,
+                                    "Ragged rows accepted by parser %s" % \
+                                    parser)
+                    self.assertTrue("4 values instead of 3" in error, error)
+        finally:
+            TextTable._cParseTextTable = cParser
+
+    def testTextImageStack(self):
+        from PyMca5.PyMcaIO import TextImageStack
+        filelist = []
+        for i in range(3):
+            self._data += 1
+            filelist.append(self._writeFile(self._getLines(), eol="\r\n",
+                                            name="image%02d.txt" % i))
+        stack = TextImageStack.TextImageStack(filelist)
+        self.assertEqual(stack.data.shape, (3, 20, 3))
+        self.assertTrue(numpy.allclose(stack.data[-1], self._data))
+        self.assertTrue(numpy.allclose(stack.data[0], self._data - 2))
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testTextTable))
+    else:
+        # use a predefined order
+        testSuite.addTest(testTextTable("testLineEndings"))
+        testSuite.addTest(testTextTable("testSeparators"))
+        testSuite.addTest(testTextTable("testColumnsAndSkipRows"))
+        testSuite.addTest(testTextTable("testNonNumeric"))
+        testSuite.addTest(testTextTable("testRaggedRows"))
+        testSuite.addTest(testTextTable("testTextImageStack"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
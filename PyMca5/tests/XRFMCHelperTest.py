@@ -0,0 +1,207 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+#############################################################################*/
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import sys
+import os
+import gc
+import shutil
+import tempfile
+
+DEBUG = 0
+
+# simulation output with the counts of one line after one and two
+# interactions
+XMSO_OUTPUT = """<?xml version="1.0"?>
+<xmimsim-results>
+  <fluorescence_line_counts symbol="Fe" atomic_number="26" total_counts="110.0">
+    <fluorescence_line type="KL3" energy="6.404" total_counts="110.0">
+      <counts interaction_number="1">100.0</counts>
+      <counts interaction_number="2">10.0</counts>
+    </fluorescence_line>
+  </fluorescence_line_counts>
+</xmimsim-results>
+"""
+
+# it writes the simulation output to the last argument and counts the runs
+FAKE_SIMULATOR = """#!%s
+import os
+import sys
+f = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "runs"), "a")
+f.write("run\\n")
+f.close()
+f = open(sys.argv[-1], "w")
+f.write(%r)
+f.close()
+"""
+
+class testXRFMCHelper(unittest.TestCase):
+    def setUp(self):
+        """
+        import the module and create the fake simulation program
+        """
+        try:
+            from PyMca5.PyMcaPhysics.xrf.XRFMC import XRFMCHelper
+            self._module = XRFMCHelper
+        except:
+            self._module = None
+        self._tmpDir = tempfile.mkdtemp(prefix="pymcaTest")
+        self._cacheDir = os.path.join(self._tmpDir, "cache")
+        binDir = os.path.join(self._tmpDir, "simulator")
+        os.mkdir(binDir)
+        self._executable = os.path.join(binDir, "xmimsim-pymca")
+        f = open(self._executable, "w")
+        f.write(FAKE_SIMULATOR % (sys.executable, XMSO_OUTPUT))
+        f.close()
+        os.chmod(self._executable, 0o755)
+        if self._module is not None:
+            self._maxSize = self._module.CACHE_MAX_SIZE
+
+    def tearDown(self):
+        """clean up any possible files"""
+        gc.collect()
+        if self._module is not None:
+            self._module.CACHE_MAX_SIZE = self._maxSize
+        shutil.rmtree(self._tmpDir, ignore_errors=True)
+
+    def _getConfiguration(self, thickness=0.1):
+        from PyMca5.PyMcaIO import ConfigDict
+        ddict = ConfigDict.ConfigDict()
+        # the fake simulation does not need a real fit result
+        ddict["result"] = {"chisq": 1.0, "groups": ["Fe K"]}
+        ddict["xrfmc"] = {"setup": {"layer": 1,
+                                    "histories": 100000,
+                                    "thickness": thickness}}
+        return ddict
+
+    def _getNumberOfRuns(self):
+        fname = os.path.join(os.path.dirname(self._executable), "runs")
+        if not os.path.exists(fname):
+            return 0
+        f = open(fname, "r")
+        n = len(f.readlines())
+        f.close()
+        return n
+
+    def _getCorrections(self, configuration, **kw):
+        return self._module.getXRFMCCorrectionFactors(configuration,
+                                        xmimsim_pymca=self._executable,
+                                        cacheDirectory=self._cacheDir,
+                                        **kw)
+
+    def testXRFMCHelperImport(self):
+        #"""Test successful import"""
+        self.assertTrue(self._module is not None,\
+                        "Unsuccessful XRFMCHelper import")
+
+    @unittest.skipIf(sys.platform == "win32",
+                     "Fake simulation program needs a POSIX shell")
+    def testXRFMCHelperCache(self):
+        #"""Test simulation results are reused"""
+        corrections = self._getCorrections(self._getConfiguration())
+        self.assertEqual(self._getNumberOfRuns(), 1)
+        self.assertAlmostEqual(corrections["Fe"]["Ka"]["correction_factor"][1],
+                               1.1)
+        if DEBUG:
+            print(corrections["Fe"]["Ka"])
+
+        # identical input
+        cached = self._getCorrections(self._getConfiguration())
+        self.assertEqual(self._getNumberOfRuns(), 1)
+        self.assertEqual(cached, corrections)
+
+        # different input
+        self._getCorrections(self._getConfiguration(thickness=0.2))
+        self.assertEqual(self._getNumberOfRuns(), 2)
+        self.assertEqual(len(os.listdir(self._cacheDir)), 4)
+
+        # the cache can be bypassed
+        self._getCorrections(self._getConfiguration(), cache=False)
+        self.assertEqual(self._getNumberOfRuns(), 3)
+
+        # the parsed output can be recovered from the simulation output
+        for fname in os.listdir(self._cacheDir):
+            if fname.endswith(".json"):
+                os.remove(os.path.join(self._cacheDir, fname))
+        cached = self._getCorrections(self._getConfiguration())
+        self.assertEqual(self._getNumberOfRuns(), 3)
+        self.assertEqual(cached, corrections)
+
+        # invalidation
+        self._module.clearCache(self._cacheDir)
+        self.assertEqual(len(os.listdir(self._cacheDir)), 0)
+        self._getCorrections(self._getConfiguration())
+        self.assertEqual(self._getNumberOfRuns(), 4)
+
+        # a changed simulation program invalidates the results
+        stat = os.stat(self._executable)
+        os.utime(self._executable, (stat.st_atime, stat.st_mtime + 10))
+        self._getCorrections(self._getConfiguration())
+        self.assertEqual(self._getNumberOfRuns(), 5)
+
+    @unittest.skipIf(sys.platform == "win32",
+                     "Fake simulation program needs a POSIX shell")
+    def testXRFMCHelperCacheSize(self):
+        #"""Test the cache size limit"""
+        self._getCorrections(self._getConfiguration(thickness=0.1))
+        entrySize = sum([os.path.getsize(os.path.join(self._cacheDir, x)) \
+                         for x in os.listdir(self._cacheDir)])
+        # room for two entries
+        self._module.CACHE_MAX_SIZE = 2 * entrySize
+        for thickness in [0.2, 0.3]:
+            self._getCorrections(self._getConfiguration(thickness=thickness))
+        self.assertEqual(len(os.listdir(self._cacheDir)), 4)
+        # the least recently used entry was removed
+        self._getCorrections(self._getConfiguration(thickness=0.3))
+        self.assertEqual(self._getNumberOfRuns(), 3)
+        self._getCorrections(self._getConfiguration(thickness=0.1))
+        self.assertEqual(self._getNumberOfRuns(), 4)
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testXRFMCHelper))
+    else:
+        # use a predefined order
+        testSuite.addTest(testXRFMCHelper("testXRFMCHelperImport"))
+        testSuite.addTest(testXRFMCHelper("testXRFMCHelperCache"))
+        testSuite.addTest(testXRFMCHelper("testXRFMCHelperCacheSize"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        DEBUG = 1
+    test()
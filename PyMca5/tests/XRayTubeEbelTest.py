@@ -0,0 +1,158 @@
+#/*##########################################################################
+#
+# The PyMca X-Ray Fluorescence Toolkit
+#
+# Copyright (c) 2004-2017 European Synchrotron Radiation Facility
+#
+# This file is part of the PyMca X-ray Fluorescence Toolkit developed at
+# the ESRF by the Software group.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+__author__ = "V. Armando Sole - ESRF Data Analysis"
+__contact__ = "sole@esrf.fr"
+__license__ = "MIT"
+__copyright__ = "European Synchrotron Radiation Facility, Grenoble, France"
+import unittest
+import numpy
+
+DEBUG = 0
+
+# values given by the energy by energy implementation
+ENERGIES = [3.0, 7.5, 12.0, 13.0, 13.1, 26.0, 60.0]
+CONTINUUM = [6.029258623095863e+05, 7.673857300231898e+10,
+             8.631107053533147e+10, 8.791610891933362e+10,
+             8.917840402757709e+10, 1.424612217715555e+11,
+             3.518381660872311e+10]
+CHARACTERISTIC = [[57.981, 3.033842580644800e+09, 'W KL2'],
+                  [59.3182, 5.275933306741716e+09, 'W KL3'],
+                  [66.9501, 5.890840667683866e+08, 'W KM2'],
+                  [67.244, 1.139509080749108e+09, 'W KM3']]
+WATER_TOTAL = [1.928364943516874e+02, 1.257778930335686e+01,
+               3.117331549172897e+00, 2.480362500182428e+00,
+               2.427339392715807e+00, 4.715980390813313e-01,
+               2.058710759738899e-01]
+LEAD_TOTAL = [1.964883247000000e+03, 2.682867435536218e+02,
+              8.245238001440822e+01, 6.745659019666137e+01,
+              1.599706227201916e+02, 4.380701824476755e+01,
+              5.019667000000000e+00]
+LEAD_PHOTO = [1.954600000000000e+03, 2.619674918440443e+02,
+              7.822780660669618e+01, 6.354127027871466e+01,
+              1.560858075017036e+02, 4.206977402937890e+01,
+              4.432300000000000e+00]
+
+class testXRayTubeEbel(unittest.TestCase):
+    def setUp(self):
+        from PyMca5.PyMcaPhysics.xrf import XRayTubeEbel
+        from PyMca5.PyMcaPhysics.xrf import Elements
+        self._material = "XRayTubeEbelTestFilter"
+        self._oldMaterial = Elements.Material.get(self._material, None)
+        XRayTubeEbel.clearCache()
+        self._kw = {"window": ["Be", 1.848, 0.0125],
+                    "alphae": 75.,
+                    "alphax": 15.,
+                    "filterlist": [["Al", 2.72, 0.005]]}
+        self._target = ["W", 19.3, 0.0002]
+
+    def tearDown(self):
+        from PyMca5.PyMcaPhysics.xrf import XRayTubeEbel
+        from PyMca5.PyMcaPhysics.xrf import Elements
+        if self._oldMaterial is None:
+            if self._material in Elements.Material:
+                del Elements.Material[self._material]
+        else:
+            Elements.Material[self._material] = self._oldMaterial
+        XRayTubeEbel.clearCache()
+
+    def _assertClose(self, result, expected, text):
+        result = numpy.array(result, dtype=numpy.float64)
+        expected = numpy.array(expected, dtype=numpy.float64)
+        self.assertTrue(numpy.allclose(result, expected,
+                                       rtol=1.0e-10, atol=0.0),
+                        "%s differs from the previous implementation" % text)
+
+    def testMassAttenuation(self):
+        from PyMca5.PyMcaPhysics.xrf import Elements
+        # energies below and above the Pb L3 edge
+        self._assertClose(Elements.getMaterialMassAttenuationCoefficients(\
+                            "Water", 1.0, ENERGIES)["total"],
+                          WATER_TOTAL, "Water attenuation")
+        lead = Elements.getelementmassattcoef("Pb", ENERGIES)
+        self._assertClose(lead["total"], LEAD_TOTAL, "Pb attenuation")
+        self._assertClose(lead["photo"], LEAD_PHOTO, "Pb photoelectric")
+        # all the energies at once or one by one
+        for i, energy in enumerate(ENERGIES):
+            self._assertClose(Elements.getelementmassattcoef("Pb",
+                                                    energy)["total"],
+                              [LEAD_TOTAL[i]], "Pb attenuation")
+
+    def testTubeSpectrum(self):
+        from PyMca5.PyMcaPhysics.xrf import XRayTubeEbel
+        continuum = XRayTubeEbel.continuumEbel(self._target, 80.0,
+                                               numpy.array(ENERGIES),
+                                               **self._kw)
+        self._assertClose(continuum, CONTINUUM, "Tube continuum")
+        lines = XRayTubeEbel.characteristicEbel(self._target, 80.0,
+                                                **self._kw)
+        self.assertEqual([line[2] for line in lines],
+                         [line[2] for line in CHARACTERISTIC])
+        self._assertClose([line[:2] for line in lines],
+                          [line[:2] for line in CHARACTERISTIC],
+                          "Tube lines")
+
+    def testCache(self):
+        from PyMca5.PyMcaPhysics.xrf import XRayTubeEbel
+        from PyMca5.PyMcaPhysics.xrf import Elements
+        Elements.Material[self._material] = {"Density": 2.72,
+                                             "Thickness": 0.005,
+                                             "CompoundList": ["Al"],
+                                             "CompoundFraction": [1.0],
+                                             "Comment": "Tube filter"}
+        self._kw["filterlist"] = [[self._material, 2.72, 0.005]]
+        first = XRayTubeEbel.generateLists(self._target, 40.0, **self._kw)
+        # the returned lists can be modified by the caller
+        first[1][:] = 0.0
+        second = XRayTubeEbel.generateLists(self._target, 40.0, **self._kw)
+        self.assertTrue(numpy.array(second[1]).max() > 0)
+        self._assertClose(second[0], first[0], "Cached energies")
+        # a new definition of the filter material is taken into account
+        Elements.Material[self._material]["CompoundList"] = ["Cu"]
+        third = XRayTubeEbel.generateLists(self._target, 40.0, **self._kw)
+        XRayTubeEbel.clearCache()
+        expected = XRayTubeEbel.generateLists(self._target, 40.0, **self._kw)
+        self._assertClose(third[1], expected[1], "Tube spectrum")
+        self.assertFalse(numpy.allclose(third[1], second[1]))
+
+def getSuite(auto=True):
+    testSuite = unittest.TestSuite()
+    if auto:
+        testSuite.addTest(\
+            unittest.TestLoader().loadTestsFromTestCase(testXRayTubeEbel))
+    else:
+        # use a predefined order
+        testSuite.addTest(testXRayTubeEbel("testMassAttenuation"))
+        testSuite.addTest(testXRayTubeEbel("testTubeSpectrum"))
+        testSuite.addTest(testXRayTubeEbel("testCache"))
+    return testSuite
+
+def test(auto=False):
+    unittest.TextTestRunner(verbosity=2).run(getSuite(auto=auto))
+
+if __name__ == '__main__':
+    test()
@@ -44,3 +44,24 @@
 from PyMca5.tests.PCAToolsTest import test as testPCATools
 from PyMca5.tests.SpecfileTest import test as testSpecfile
 from PyMca5.tests.specfilewrapperTest import test as testSpecfilewrapper
+from PyMca5.tests.SpsTest import test as testSps
+from PyMca5.tests.ColormapBenchmarkTest import test as testColormapBenchmark
+from PyMca5.tests.XRFMCHelperTest import test as testXRFMCHelper
+from PyMca5.tests.MapReadersTest import test as testMapReaders
+from PyMca5.tests.ArraySaveBenchmarkTest import test as testArraySaveBenchmark
+from PyMca5.tests.StackROIBatchTest import test as testStackROIBatch
+from PyMca5.tests.FastMatrixCorrectionTest import test as testFastMatrixCorrection
+from PyMca5.tests.TextTableTest import test as testTextTable
+from PyMca5.tests.ImagePyramidTest import test as testImagePyramid
+from PyMca5.tests.FitImageSinkTest import test as testFitImageSink
+from PyMca5.tests.MaskImageToolsTest import test as testMaskImageTools
+from PyMca5.tests.SpecfitFunsTest import test as testSpecfitFuns
+from PyMca5.tests.McaTheoryTest import test as testMcaTheory
+from PyMca5.tests.FitResultStoreTest import test as testFitResultStore
+from PyMca5.tests.XRayTubeEbelTest import test as testXRayTubeEbel
+from PyMca5.tests.FisxHelperTest import test as testFisxHelper
+from PyMca5.tests.PilatusCBFTest import test as testPilatusCBF
+from PyMca5.tests.ListModeStackTest import test as testListModeStack
+from PyMca5.tests.HDF5VirtualStackTest import test as testHDF5VirtualStack
+from PyMca5.tests.NexusDataSourceTest import test as testNexusDataSource
+from PyMca5.tests.Object3DCToolsTest import test as testObject3DCTools
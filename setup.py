@@ -170,6 +170,35 @@ def use_fisx():
 
     return False
 
+# check if OpenMP is to be used by the C extensions supporting it
+def use_openmp():
+    """
+    Check if OpenMP is requested from the command line or the environment.
+    """
+    if "WITH_OPENMP" in os.environ:
+        if os.environ["WITH_OPENMP"] in ["True", "1", 1]:
+            print("Use of OpenMP requested by environment")
+            return True
+
+    if ("--openmp" in sys.argv):
+        sys.argv.remove("--openmp")
+        os.environ["WITH_OPENMP"] = "True"
+        print("Use of OpenMP requested by command line")
+        return True
+
+    return False
+
+if use_openmp():
+    if sys.platform == 'win32':
+        OPENMP_COMPILE_ARGS = ['/openmp']
+        OPENMP_LINK_ARGS = []
+    else:
+        OPENMP_COMPILE_ARGS = ['-fopenmp']
+        OPENMP_LINK_ARGS = ['-fopenmp']
+else:
+    OPENMP_COMPILE_ARGS = []
+    OPENMP_LINK_ARGS = []
+
 if use_fisx():
     # fisx is expected to be an independent library and
     # ideally one would use git subtree to put it in third-party
@@ -321,6 +350,8 @@ def build_specfit(ext_modules):
     module  = Extension(name = 'PyMca5.PyMcaMath.fitting.SpecfitFuns',
                         sources = glob.glob('PyMca5/PyMcaMath/fitting/specfit/*.c'),
                         define_macros = define_macros,
+                        extra_compile_args = OPENMP_COMPILE_ARGS,
+                        extra_link_args = OPENMP_LINK_ARGS,
                         include_dirs = ['PyMca5/PyMcaMath/fitting/specfit',
                                          numpy.get_include()])
     ext_modules.append(module)
@@ -380,7 +411,9 @@ def build_Object3DCTools(ext_modules):
                         sources = glob.glob('PyMca5/Object3D/Object3DCTools/*.c'),
                         define_macros = define_macros,
                         libraries  = libraries,
-                        include_dirs = includes)
+                        include_dirs = includes,
+                        extra_compile_args = OPENMP_COMPILE_ARGS,
+                        extra_link_args = OPENMP_LINK_ARGS)
     ext_modules.append(module)
 
 
@@ -444,6 +477,8 @@ def build_plotting_ctools(ext_modules):
     else:
         extra_compile_args = []
         extra_link_args = []
+    extra_compile_args += OPENMP_COMPILE_ARGS
+    extra_link_args += OPENMP_LINK_ARGS
 
     module = Extension(name="PyMca5.PyMcaGraph.ctools._ctools",
                         sources=src,